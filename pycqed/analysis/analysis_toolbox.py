@@ -6,12 +6,14 @@ import os
 import time
 import datetime
 import warnings
+import numbers
 from collections import OrderedDict as od
 from matplotlib import pyplot as plt
 from matplotlib import colors
 import pandas as pd
 from uuid import getnode as get_mac
 from pycqed.init.config import setup_dict
+from pycqed.measurement.instrument_settings import read_instrument_settings
 from scipy.interpolate import griddata
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import h5py
@@ -98,19 +100,17 @@ def is_equal(ts0, ts1, or_equal=False):
     return (dstamp0+tstamp0) == (dstamp1+tstamp1)
 
 
-def return_last_n_timestamps(n, contains=''):
-    timestamps = []
-    for i in range(n):
-        if i == 0:
-            timestamp = latest_data(contains=contains,
-                                    return_timestamp=True)[0]
-            timestamps.append(timestamp)
-        else:
-            timestamps.append(latest_data(contains=contains,
-                              older_than=timestamps[-1],
-                              return_timestamp=True)[0])
-    return timestamps
+def _normalize_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    dstamp, tstamp = verify_timestamp(timestamp)
+    return dstamp+tstamp
+
 
+def return_last_n_timestamps(n, contains=''):
+    index = get_timestamp_index(datadir)
+    return [day+dirname[:6] for day, dirname in
+            index.find(contains=contains, limit=n, distinct_timestamps=True)]
 
 
 def latest_data(contains='', older_than=None, newer_than=None, or_equal=False,
@@ -130,49 +130,25 @@ def latest_data(contains='', older_than=None, newer_than=None, or_equal=False,
     this in: raise_exc = False, then a 'False' is returned.
     return_all = True: returns all the folders that satisfy
         the requirements (Cristian)
+
+    The measurement folders are looked up in the timestamp index of the
+    data directory (see TimestampIndex).
     '''
     if (folder is None):
         search_dir = datadir
     else:
         search_dir = folder
 
-    daydirs = os.listdir(search_dir)
-
-    if len(daydirs) == 0:
+    index = get_timestamp_index(search_dir)
+    if len(index) == 0:
         logging.warning('No data found in datadir')
         return None
 
-    daydirs.sort()
-
-    measdirs = []
-    i = len(daydirs)-1
-    while len(measdirs) == 0 and i >= 0:
-        daydir = daydirs[i]
-        all_measdirs = [d for d in os.listdir(
-            os.path.join(search_dir, daydir))]
-        all_measdirs.sort()
-
-        measdirs = []
-        for d in all_measdirs:
-            # this routine verifies that any output directory
-            # is a 'valid' directory
-            # (i.e, obeys the regular naming convention)
-            _timestamp = daydir + d[:6]
-            try:
-                dstamp, tstamp = verify_timestamp(_timestamp)
-            except:
-                continue
-            timestamp = dstamp+tstamp
-            if contains in d:
-                if older_than is not None:
-                    if not is_older(timestamp, older_than, or_equal=or_equal):
-                        continue
-                if newer_than is not None:
-                    if not is_older(newer_than, timestamp, or_equal=or_equal):
-                        continue
-                measdirs.append(d)
-
-        i -= 1
+    conditions = {'contains': contains,
+                  'older_than': _normalize_timestamp(older_than),
+                  'newer_than': _normalize_timestamp(newer_than),
+                  'or_equal': or_equal}
+    measdirs = index.find(limit=1, **conditions)
 
     if len(measdirs) == 0:
         if raise_exc is True:
@@ -180,10 +156,10 @@ def latest_data(contains='', older_than=None, newer_than=None, or_equal=False,
         else:
             return False
     else:
-        measdirs.sort()
+        daydir, measdir = measdirs[0]
         if return_all:
-            return search_dir, daydir, measdirs
-        measdir = measdirs[-1]
+            return search_dir, daydir, [d for day, d in index.find(
+                day=daydir, descending=False, **conditions)]
         if return_timestamp is False:
             return os.path.join(search_dir, daydir, measdir)
         else:
@@ -191,26 +167,26 @@ def latest_data(contains='', older_than=None, newer_than=None, or_equal=False,
                 search_dir, daydir, measdir)
 
 
-def data_from_time(timestamp, folder=None):
+def data_from_time(timestamp, folder=None, refresh=True):
     '''
     returns the full path of the data specified by its timestamp in the
     form YYYYmmddHHMMSS.
+    If refresh is False the timestamp index of the folder is not updated
+    first, e.g. when resolving many timestamps after a single update.
     '''
     if (folder is None):
         folder = datadir
-    daydirs = os.listdir(folder)
+    index = get_timestamp_index(folder, refresh=refresh)
 
-    if len(daydirs) == 0:
+    if len(index) == 0:
         raise Exception('No data in the data directory specified')
 
-    daydirs.sort()
     daystamp, tstamp = verify_timestamp(timestamp)
 
-    if not os.path.isdir(os.path.join(folder, daystamp)):
+    if not index.has_day(daystamp):
         raise KeyError("Requested day '%s' not found" % daystamp)
 
-    measdirs = [d for d in os.listdir(os.path.join(folder, daystamp))
-                if d[:6] == tstamp]
+    measdirs = [d for day, d in index.find(day=daystamp, timemark=tstamp)]
     if len(measdirs) == 0:
         raise KeyError("Requested data '%s_%s' not found"
                        % (daystamp, tstamp))
@@ -278,8 +254,9 @@ def get_data_from_timestamp_legacy(timestamps, param_names, TwoD=False, max_file
                     warnings.warn('This data file attribute does not exist or hasn''t been coded for extraction.')
 
             else:
-                if param.split('.')[0] in ma.data_file.get('Instrument settings',{}):
-                    data[param].append(ma.data_file['Instrument settings'][param.split('.')[0]].attrs[param.split('.')[1]])
+                instrument_settings = get_instrument_settings(ma.data_file)
+                if param.split('.')[0] in instrument_settings:
+                    data[param].append(instrument_settings[param.split('.')[0]][param.split('.')[1]])
                 elif param.split('.')[0] in ma.data_file.get('Analysis',{}):
                     temp = ma.data_file['Analysis']
                     for ii in range(len(param.split('.'))-1):
@@ -314,8 +291,9 @@ def get_data_from_ma_v1(ma, param_names):
                 warnings.warn('This data file attribute does not exist or hasn''t been coded for extraction.')
 
         else:
-            if param.split('.')[0] in ma.data_file.get('Instrument settings',{}):
-                data[param] = ma.data_file['Instrument settings'][param.split('.')[0]].attrs[param.split('.')[1]]
+            instrument_settings = get_instrument_settings(ma.data_file)
+            if param.split('.')[0] in instrument_settings:
+                data[param] = instrument_settings[param.split('.')[0]][param.split('.')[1]]
             elif param.split('.')[0] in ma.data_file.get('Analysis',{}):
                 temp = ma.data_file['Analysis']
                 for ii in range(len(param.split('.'))-1):
@@ -357,15 +335,16 @@ def get_data_from_ma_v2(ma, param_names, numeric_params=None):
 
             # tmp_var is a temporary fix!
             # should be removed at some point
+            instrument_settings = get_instrument_settings(ma.data_file)
             try:
-                tmp_var = ma.data_file['Instrument settings']['MC'].attrs['detector_function_name']
+                tmp_var = instrument_settings['MC']['detector_function_name']
             except:
                 tmp_var = None
             if tmp_var == 'TimeDomainDetector':
-                temp2 = ma.data_file['Instrument settings']['TD_Meas']
-                exec(('cal_zero = %s'%(temp2.attrs['cal_zero_points'])), locals())
-                exec(('cal_one = %s'%(temp2.attrs['cal_one_points'])), locals())
-                dofs = int(temp2.attrs['NoSegments']) - len(cal_zero) - len(cal_one)
+                temp2 = instrument_settings['TD_Meas']
+                exec(('cal_zero = %s'%(temp2['cal_zero_points'])), locals())
+                exec(('cal_one = %s'%(temp2['cal_one_points'])), locals())
+                dofs = int(temp2['NoSegments']) - len(cal_zero) - len(cal_one)
             else:
                 dofs = len(ma.sweep_points)
             dofs -= free_vars+1
@@ -390,8 +369,9 @@ def get_data_from_ma_v2(ma, param_names, numeric_params=None):
             #print 'boo9', data['amp']
 
         else:
-            if param.split('.')[0] in list(ma.data_file.get('Instrument settings',{}).keys()):
-                data[param] = ma.data_file['Instrument settings'][param.split('.')[0]].attrs[param.split('.')[1]]
+            instrument_settings = get_instrument_settings(ma.data_file)
+            if param.split('.')[0] in instrument_settings:
+                data[param] = instrument_settings[param.split('.')[0]][param.split('.')[1]]
             else:
                 extract_param=True
                 if param.split('.')[0] in list(ma.data_file.get('Analysis',{}).keys()):
@@ -546,6 +526,97 @@ def get_data_from_timestamp_list(timestamps,
     return out_data
 
 
+def get_data_from_timestamps(timestamps, param_names, nr_processes=None,
+                             return_dataframe=False, max_files=None,
+                             folder=None):
+    '''
+    Loads parameters and data columns of many measurements.
+
+    Faster alternative to get_data_from_timestamp_list: the files are opened
+    read-only with plain h5py (no MeasurementAnalysis, figures or analysis)
+    and are read in parallel in a process pool.
+
+    Args:
+        timestamps (list): timestamps of the measurements
+        param_names (list or dict): the parameters to extract, see
+            file_handling.extract_data_from_file for the supported names.
+            If a dict, the keys are used as column names and the values as
+            parameter names.
+        nr_processes (int): size of the process pool, defaults to the
+            number of cpus. If 1 the files are read in this process.
+        return_dataframe (bool): return a pandas DataFrame instead of a
+            dict.
+        max_files (int): only load the first max_files timestamps
+        folder (str): data directory, defaults to datadir
+
+    Returns:
+        data (OrderedDict or DataFrame): columnar data with a column
+            "timestamps" and a column per parameter, only containing the
+            measurements that could be read. Columns of scalars are numpy
+            arrays, other columns are lists.
+        errors (OrderedDict): timestamp -> error message of the
+            measurements that could not be found or read.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    if type(timestamps) is str:
+        timestamps = [timestamps]
+    if max_files is not None:
+        timestamps = timestamps[:max_files]
+    if type(param_names) is dict:
+        column_names = list(param_names.keys())
+        param_names = list(param_names.values())
+    else:
+        column_names = list(param_names)
+        param_names = list(param_names)
+
+    if folder is None:
+        folder = datadir
+    # the index is updated once, not for every timestamp
+    get_timestamp_index(folder)
+    errors = od()
+    filepaths = od()
+    for timestamp in timestamps:
+        try:
+            filepath = measurement_filename(data_from_time(
+                timestamp, folder=folder, refresh=False))
+            if filepath is None:
+                raise FileNotFoundError('No data file in folder')
+            filepaths[timestamp] = filepath
+        except Exception as e:
+            errors[timestamp] = '{}: {}'.format(type(e).__name__, e)
+
+    nr_files = len(filepaths)
+    if nr_processes == 1 or nr_files < 2:
+        results = list(map(extract_data_or_error, filepaths.values(),
+                           [param_names]*nr_files))
+    else:
+        nr_processes = nr_processes or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=nr_processes) as executor:
+            chunksize = max(1, nr_files // (4*nr_processes))
+            results = list(executor.map(
+                extract_data_or_error, filepaths.values(),
+                [param_names]*nr_files, chunksize=chunksize))
+
+    data = od([('timestamps', [])] + [(c, []) for c in column_names])
+    for timestamp, (file_data, error) in zip(filepaths, results):
+        if error is not None:
+            errors[timestamp] = error
+            continue
+        data['timestamps'].append(timestamp)
+        for column, param in zip(column_names, param_names):
+            data[column].append(file_data[param])
+
+    for column in column_names:
+        if all(isinstance(val, numbers.Number) and not isinstance(val, bool)
+               for val in data[column]):
+            data[column] = np.array(data[column], dtype=float)
+    errors = od((ts, errors[ts]) for ts in timestamps if ts in errors)
+
+    if return_dataframe:
+        data = pd.DataFrame(data)
+    return data, errors
+
+
 def convert_instr_str_list_to_numeric_array(string_list):
     return np.double(string_list[:])
 
@@ -583,10 +654,23 @@ def get_all_msmt_filepaths(folder, suffix='hdf5', pattern=''):
     return filepaths
 
 
+def get_instrument_settings(data_file):
+    '''
+    Returns the instrument settings saved in a datafile as a dict
+    {instrument name: {parameter name: value}} (see
+    pycqed.measurement.instrument_settings.read_instrument_settings), an
+    empty dict if the datafile contains no instrument settings.
+    '''
+    try:
+        return read_instrument_settings(data_file)
+    except KeyError:
+        return {}
+
+
 def get_instrument_setting(analysis_object, instrument_name, parameter):
-    instrument_settings = analysis_object.data_file['Instrument settings']
+    instrument_settings = read_instrument_settings(analysis_object.data_file)
     instrument = instrument_settings[instrument_name]
-    attr = instrument.attrs[parameter]
+    attr = instrument[parameter]
     return attr
 
 
@@ -596,13 +680,10 @@ def compare_instrument_settings_timestamp(timestamp_a, timestamp_b):
     Currently it only compares settings existing in object_a, this function can be improved to not care about the order of arguments.
     '''
 
-    h5mode = 'r+'
-    h5filepath = measurement_filename(get_folder(timestamp_a))
-    analysis_object_a = h5py.File(h5filepath, h5mode)
-    h5filepath = measurement_filename(get_folder(timestamp_b))
-    analysis_object_b = h5py.File(h5filepath, h5mode)
-    sets_a = analysis_object_a['Instrument settings']
-    sets_b = analysis_object_b['Instrument settings']
+    sets_a = read_instrument_settings(
+        measurement_filename(get_folder(timestamp_a)))
+    sets_b = read_instrument_settings(
+        measurement_filename(get_folder(timestamp_b)))
 
     for ins_key in list(sets_a.keys()):
         print()
@@ -613,20 +694,20 @@ def compare_instrument_settings_timestamp(timestamp_a, timestamp_b):
             ins_b = sets_b[ins_key]
             print('Instrument "%s" ' % ins_key)
             diffs_found = False
-            for par_key in list(ins_a.attrs.keys()):
+            for par_key in list(ins_a.keys()):
                 try:
-                    ins_b.attrs[par_key]
+                    ins_b[par_key]
                 except KeyError:
                     print('Instrument "%s" does have parameter "%s"' % (
                         ins_key, par_key))
 
-                if ins_a.attrs[par_key] == ins_b.attrs[par_key]:
+                if ins_a[par_key] == ins_b[par_key]:
                     pass
                 else:
                     print('    "%s" has a different value '\
                         ' "%s" for %s, "%s" for %s' % (
-                            par_key, ins_a.attrs[par_key], timestamp_a,
-                            ins_b.attrs[par_key],timestamp_b))
+                            par_key, ins_a[par_key], timestamp_a,
+                            ins_b[par_key],timestamp_b))
                     diffs_found = True
 
             if not diffs_found:
@@ -640,8 +721,8 @@ def compare_instrument_settings(analysis_object_a, analysis_object_b):
     Takes two analysis objects as input and prints the differences between the instrument settings.
     Currently it only compares settings existing in object_a, this function can be improved to not care about the order of arguments.
     '''
-    sets_a = analysis_object_a.data_file['Instrument settings']
-    sets_b = analysis_object_b.data_file['Instrument settings']
+    sets_a = read_instrument_settings(analysis_object_a.data_file)
+    sets_b = read_instrument_settings(analysis_object_b.data_file)
 
     for ins_key in list(sets_a.keys()):
         print()
@@ -652,20 +733,20 @@ def compare_instrument_settings(analysis_object_a, analysis_object_b):
             ins_b = sets_b[ins_key]
             print('Instrument "%s" ' % ins_key)
             diffs_found = False
-            for par_key in list(ins_a.attrs.keys()):
+            for par_key in list(ins_a.keys()):
                 try:
-                    ins_b.attrs[par_key]
+                    ins_b[par_key]
                 except KeyError:
                     print('Instrument "%s" does have parameter "%s"' % (
                         ins_key, par_key))
 
-                if ins_a.attrs[par_key] == ins_b.attrs[par_key]:
+                if ins_a[par_key] == ins_b[par_key]:
                     pass
                 else:
                     print('    "%s" has a different value '\
                         ' "%s" for a, "%s" for b' % (
-                            par_key, ins_a.attrs[par_key],
-                            ins_b.attrs[par_key]))
+                            par_key, ins_a[par_key],
+                            ins_b[par_key]))
                     diffs_found = True
 
             if not diffs_found:
@@ -677,39 +758,29 @@ def compare_instrument_settings(analysis_object_a, analysis_object_b):
 
 def get_timestamps_in_range(timestamp_start, timestamp_end=None,
                             label=None, exact_label_match=True):
+    '''
+    Returns the timestamps (YYYYmmdd_HHMMSS) of the measurements between
+    timestamp_start and timestamp_end (inclusive) in ascending order.
+
+    label (str or list): substring of the measurement folder name, if
+        exact_label_match is False a list of substrings that all have to
+        be in the name.
+    '''
     datetime_start = datetime_from_timestamp(timestamp_start)
     if timestamp_end is None:
         datetime_end = datetime.datetime.today()
     else:
         datetime_end = datetime_from_timestamp(timestamp_end)
-    days_delta = (datetime_end.date() - datetime_start.date()).days
-    all_timestamps = []
-    for day in reversed(list(range(days_delta+1))):
-        date = datetime_start + datetime.timedelta(days=day)
-        datemark = timestamp_from_datetime(date)[:8]
-        all_measdirs = [d for d in os.listdir(os.path.join(datadir, datemark))]
-
-        if exact_label_match:
-            all_measdirs = [x for x in all_measdirs if label in x]
-        else:
-            for each_label in label:
-                all_measdirs = [x for x in all_measdirs if each_label in x]
-        if (date.date() - datetime_start.date()).days == 0:
-            # Check if newer than starting timestamp
-            timemark_start = timemark_from_datetime(datetime_start)
-            all_measdirs = [dirname for dirname in all_measdirs if int(dirname[:6]) >=
-                                  int(timemark_start)]
-
-        if (date.date() - datetime_end.date()).days == 0:
-            # Check if older than ending timestamp
-            timemark_end = timemark_from_datetime(datetime_end)
-            all_measdirs = [dirname for dirname in all_measdirs if int(dirname[:6]) <=
-                                  int(timemark_end)]
-        timestamps = ['{}_{}'.format(datemark, dirname[:6]) for dirname in all_measdirs]
-        timestamps.reverse()
-        all_timestamps += timestamps
-    all_timestamps.reverse()  # Ensures the order of the timestamps is ascending
-    return all_timestamps
+    if exact_label_match:
+        labels = [label]
+    else:
+        labels = label
+    index = get_timestamp_index(datadir)
+    measdirs = index.find(
+        newer_than=datetime.datetime.strftime(datetime_start, '%Y%m%d%H%M%S'),
+        older_than=datetime.datetime.strftime(datetime_end, '%Y%m%d%H%M%S'),
+        or_equal=True, labels=labels, descending=False)
+    return ['{}_{}'.format(day, dirname[:6]) for day, dirname in measdirs]
 
 
 def get_mean_df(label, starting_timestamp, ending_timestamp,
@@ -5,6 +5,7 @@ from scipy import stats
 import h5py
 from matplotlib import pyplot as plt
 from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.analysis.tools.file_handling import memmap_dataset
 from pycqed.analysis import fitting_models as fit_mods
 import scipy.optimize as optimize
 import lmfit
@@ -35,11 +36,30 @@ class MeasurementAnalysis(object):
             self.run_default_analysis(TwoD=TwoD, **kw)
 
     def load_hdf5data(self, folder=None, file_only=False, **kw):
+        '''
+        Opens the datafile of the measurement in folder. The file is opened
+        read-only unless h5mode is specified, it is reopened for writing
+        when the analysis group is added (add_analysis_datagroup_to_file).
+
+        kw:
+            h5mode (str): mode of the h5py file
+            swmr (bool): read-only access to a running measurement
+            mmap (bool): memory-map the datasets read by get_values if
+                these are stored contiguously
+        '''
         if folder is None:
             folder = self.folder
         self.h5filepath = a_tools.measurement_filename(folder)
-        h5mode = kw.pop('h5mode', 'r+')
-        self.data_file = h5py.File(self.h5filepath, h5mode)
+        h5mode = kw.pop('h5mode', 'r')
+        self.mmap = kw.pop('mmap', False)
+        self._values_cache = {}
+        if kw.pop('swmr', False):
+            # read-only access to the file of a running measurement that
+            # is written in SWMR mode (see h5d.SWMRDataReader)
+            self.data_file = h5py.File(self.h5filepath, 'r',
+                                       libver='latest', swmr=True)
+        else:
+            self.data_file = h5py.File(self.h5filepath, h5mode)
         if not file_only:
             for k in list(self.data_file.keys()):
                 if type(self.data_file[k]) == h5py.Group:
@@ -144,20 +164,46 @@ class MeasurementAnalysis(object):
         return tuple(self.f + [self.figarray] + self.ax + [self.axarray])
 
     def get_values(self, key):
+        '''
+        Returns the values of a sweep parameter or value (a column of the
+        "Data" dataset) or of another dataset of the "Experimental Data"
+        group as float64 array.
+
+        Only the requested column is read from the file. The values are
+        cached, the returned arrays are read-only and shared between calls.
+        '''
+        try:
+            return self._values_cache[key]
+        except KeyError:
+            pass
         if key in self.get_key('sweep_parameter_names'):
             names = self.get_key('sweep_parameter_names')
 
             ind = names.index(key)
-            values = self.g['Data'].value[:, ind]
+            values = self._read_values(self.g['Data'], ind)
         elif key in self.get_key('value_names'):
             names = self.get_key('value_names')
             ind = (names.index(key) +
                    len(self.get_key('sweep_parameter_names')))
-            values = self.g['Data'].value[:, ind]
+            values = self._read_values(self.g['Data'], ind)
         else:
-            values = self.g[key].value
-        # Makes sure all data is np float64
-        return np.asarray(values, dtype=np.float64)
+            values = self._read_values(self.g[key])
+        # Makes sure all data is np float64 (the data can be stored e.g. as
+        # float32 or int16)
+        values = np.asarray(values, dtype=np.float64)
+        values.flags.writeable = False
+        self._values_cache[key] = values
+        return values
+
+    def _read_values(self, dset, column=None):
+        # If mmap is True float64 data that is stored contiguously is only
+        # read from disk when it is accessed
+        data = memmap_dataset(dset) if self.mmap else None
+        if data is None:
+            data = dset
+        if column is None:
+            return data[()]
+        return data[:, column]
 
     def get_key(self, key):
         '''
@@ -170,7 +216,7 @@ class MeasurementAnalysis(object):
             s = s.decode('utf-8')
         # If it is an array of value decodes individual entries
         if type(s) == np.ndarray:
-            s = [s.decode('utf-8') for s in s]
+            s = [s.decode('utf-8') if type(s) == bytes else s for s in s]
         return s
 
     def group_values(self, group_name):
@@ -181,7 +227,19 @@ class MeasurementAnalysis(object):
         group_values = self.g[group_name].value
         return np.asarray(group_values, dtype=np.float64)
 
+    def reopen_hdf5data_writable(self):
+        '''
+        Reopens a datafile that was opened read-only in read/write mode.
+        '''
+        if self.data_file.mode != 'r':
+            return
+        self.data_file.close()
+        self.data_file = h5py.File(self.h5filepath, 'r+')
+        if hasattr(self, 'g'):
+            self.g = self.data_file['Experimental Data']
+
     def add_analysis_datagroup_to_file(self, group_name='Analysis'):
+        self.reopen_hdf5data_writable()
         if group_name in self.data_file:
             self.analysis_group = self.data_file[group_name]
         else:
@@ -585,8 +643,8 @@ class OptimizationAnalysis(MeasurementAnalysis):
     def run_default_analysis(self, close_file=True, show=False, **kw):
         self.get_naming_and_values()
         try:
-            optimization_method = self.data_file['Instrument settings']\
-                ['MC'].attrs['optimization_method']
+            optimization_method = a_tools.get_instrument_settings(
+                self.data_file)['MC']['optimization_method']
         except:
             optimization_method = 'Numerical'
             # This is because the MC is no longer an instrument and thus
@@ -2601,8 +2659,8 @@ class touch_n_go_SSRO_Analysis(MeasurementAnalysis):
 
         shots_I_data = self.get_values(key='touch_n_go_I_shots')
         shots_Q_data = self.get_values(key='touch_n_go_Q_shots')
-        instrument_settings = self.data_file['Instrument settings']
-        threshold = instrument_settings['CBox'].attrs['signal_threshold_line0']
+        instrument_settings = a_tools.get_instrument_settings(self.data_file)
+        threshold = instrument_settings['CBox']['signal_threshold_line0']
         #plotting the histograms before rotation
         fig, axes = plt.subplots(figsize=(10,10))
         axes.hist(shots_I_data, bins=100, label = 'I',histtype='step',normed=1)
@@ -5359,8 +5417,8 @@ def fit_qubit_frequency(sweep_points, data, mode='dac',
     qubit_name = kw.pop('qubit_name', None)
     if qubit_name is not None and data_file is not None:
         try:
-            instrument_settings = data_file['Instrument settings']
-            qubit_attrs = instrument_settings[qubit_name].attrs
+            instrument_settings = a_tools.get_instrument_settings(data_file)
+            qubit_attrs = instrument_settings[qubit_name]
             print(qubit_attrs)
         except:
             print('Qubit instrument is not in data file')
@@ -1,4 +1,392 @@
 '''
-Currently empty should contain the filehandling tools portion of the
-analysis toolbox
-'''
\ No newline at end of file
+Filehandling tools portion of the analysis toolbox.
+
+Contains:
+- TimestampIndex, an on-disk (sqlite) index of the measurement folders in a
+  data directory used to look up data by timestamp and label.
+- extract_data_from_file, reads parameters and data columns from a
+  measurement file using plain h5py.
+- memmap_dataset, memory-maps contiguous datasets.
+'''
+import os
+import time
+import logging
+import sqlite3
+from collections import OrderedDict
+import numpy as np
+import h5py
+from pycqed.measurement.instrument_settings import read_instrument_settings
+
+# The datadir is organized as datadir/YYYYmmdd/HHMMSS_name/HHMMSS_name.hdf5
+INDEX_FILENAME = '.timestamp_index.sqlite'
+_SCHEMA_VERSION = 1
+# Directory modification times are not always reliable for changes made
+# within this many seconds (e.g. file systems with a coarse mtime
+# resolution), days modified that recently are rescanned.
+_MTIME_RESOLUTION = 2
+# New measurements are almost always added to the most recent days, only
+# these are checked for changes on every refresh. All days are checked at
+# most every FULL_REFRESH_INTERVAL seconds.
+NR_RECENT_DAYS = 3
+FULL_REFRESH_INTERVAL = 60
+
+
+class TimestampIndex:
+    '''
+    Index of the measurement folders in a data directory.
+
+    Maps timestamps to the day folder, measurement folder, measurement name
+    and data file path. The index is stored in a sqlite file in the data
+    directory and is refreshed incrementally: only day folders whose
+    modification time changed are rescanned. New measurements are also
+    added directly when a data file is created (see hdf5_data.Data).
+    Measurements copied into old day folders by hand are picked up by the
+    first full refresh, at most FULL_REFRESH_INTERVAL seconds later.
+
+    If the index cannot be stored in the data directory (e.g. read-only
+    access) an in-memory index is used.
+    '''
+
+    def __init__(self, datadir):
+        self.datadir = os.path.abspath(datadir)
+        self._full_refresh_time = 0
+        index_path = os.path.join(self.datadir, INDEX_FILENAME)
+        try:
+            self._conn = sqlite3.connect(index_path, timeout=30,
+                                         check_same_thread=False)
+            self._create_tables()
+        except sqlite3.Error as e:
+            logging.warning('Could not open timestamp index "{}" ({}), '
+                            'using an in-memory index.'.format(
+                                index_path, e))
+            self._conn = sqlite3.connect(':memory:',
+                                         check_same_thread=False)
+            self._create_tables()
+
+    def _create_tables(self):
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        with self._conn:
+            if version != _SCHEMA_VERSION:
+                self._conn.execute('DROP TABLE IF EXISTS measurements')
+                self._conn.execute('DROP TABLE IF EXISTS days')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS measurements ('
+                'day TEXT, dirname TEXT, timestamp TEXT, name TEXT, '
+                'filepath TEXT, PRIMARY KEY (day, dirname))')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS measurements_timestamp '
+                'ON measurements (timestamp, dirname)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS days ('
+                'day TEXT PRIMARY KEY, mtime REAL, scan_time REAL)')
+            self._conn.execute(
+                'PRAGMA user_version = {}'.format(_SCHEMA_VERSION))
+
+    def close(self):
+        self._conn.close()
+
+    def refresh(self, full=None):
+        '''
+        Updates the index with the day folders that were added, removed or
+        modified since the last refresh.
+
+        Args:
+            full (bool): if True all days are checked for modifications,
+                if False only the NR_RECENT_DAYS most recent days. By
+                default a full refresh is done every FULL_REFRESH_INTERVAL
+                seconds.
+        '''
+        if full is None:
+            full = (time.time() - self._full_refresh_time >
+                    FULL_REFRESH_INTERVAL)
+        if full:
+            self._full_refresh_time = time.time()
+        try:
+            days = {d for d in os.listdir(self.datadir) if _is_day(d)}
+        except FileNotFoundError:
+            days = set()
+        indexed = {day: (mtime, scan_time) for day, mtime, scan_time in
+                   self._conn.execute('SELECT * FROM days')}
+        if full:
+            days_to_check = days
+        else:
+            days_to_check = (days - set(indexed)) | set(
+                sorted(days)[-NR_RECENT_DAYS:])
+        with self._conn:
+            for day in set(indexed) - days:
+                self._conn.execute('DELETE FROM measurements WHERE day=?',
+                                   (day, ))
+                self._conn.execute('DELETE FROM days WHERE day=?', (day, ))
+            for day in days_to_check:
+                try:
+                    mtime = os.stat(os.path.join(self.datadir, day)).st_mtime
+                except OSError:
+                    continue
+                if day in indexed:
+                    old_mtime, scan_time = indexed[day]
+                    if (mtime == old_mtime and
+                            scan_time - mtime > _MTIME_RESOLUTION):
+                        continue
+                self._scan_day(day, mtime)
+
+    def _scan_day(self, day, mtime):
+        day_dir = os.path.join(self.datadir, day)
+        try:
+            dirnames = [d for d in os.listdir(day_dir) if _is_measdir(d)]
+        except OSError:
+            dirnames = []
+        self._conn.execute('DELETE FROM measurements WHERE day=?', (day, ))
+        self._conn.executemany(
+            'INSERT INTO measurements VALUES (?, ?, ?, ?, ?)',
+            [_make_row(day, d, os.path.join(day_dir, d, _data_filename(d)))
+             for d in dirnames])
+        self._conn.execute('INSERT OR REPLACE INTO days VALUES (?, ?, ?)',
+                           (day, mtime, time.time()))
+
+    def add(self, filepath):
+        '''
+        Adds the measurement that the data file "filepath" belongs to.
+        Files that are not in a datadir/YYYYmmdd/HHMMSS_name folder are
+        ignored.
+        '''
+        measdir = os.path.dirname(os.path.abspath(filepath))
+        day_dir, dirname = os.path.split(measdir)
+        datadir, day = os.path.split(day_dir)
+        if (datadir != self.datadir or not _is_day(day) or
+                not _is_measdir(dirname)):
+            return False
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?)',
+                _make_row(day, dirname, os.path.abspath(filepath)))
+        return True
+
+    def __len__(self):
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM measurements').fetchone()[0]
+
+    def has_day(self, day):
+        return self._conn.execute('SELECT 1 FROM days WHERE day=?',
+                                  (day, )).fetchone() is not None
+
+    def find(self, contains='', older_than=None, newer_than=None,
+             or_equal=False, day=None, timemark=None, labels=None,
+             descending=True, limit=None, distinct_timestamps=False):
+        '''
+        Returns a list of (day, dirname) of the measurements that match all
+        the given conditions, sorted by timestamp.
+
+        Args:
+            contains (str): substring of the measurement folder name
+            older_than, newer_than (str): timestamps in the form
+                YYYYmmddHHMMSS
+            or_equal (bool): if True older_than and newer_than include
+                measurements with an equal timestamp
+            day (str): day in the form YYYYmmdd
+            timemark (str): time in the form HHMMSS
+            labels (list): substrings that all have to be in the name
+            descending (bool): sort newest first
+            limit (int): max number of results
+            distinct_timestamps (bool): only return the last folder of
+                measurements with identical timestamps
+        '''
+        conditions = []
+        args = []
+        for label in [contains] + list(labels or []):
+            if label:
+                conditions.append('instr(dirname, ?) > 0')
+                args.append(label)
+        if older_than is not None:
+            conditions.append('timestamp {} ?'.format(
+                '<=' if or_equal else '<'))
+            args.append(older_than)
+        if newer_than is not None:
+            conditions.append('timestamp {} ?'.format(
+                '>=' if or_equal else '>'))
+            args.append(newer_than)
+        if day is not None:
+            conditions.append('day = ?')
+            args.append(day)
+        if timemark is not None:
+            conditions.append('substr(dirname, 1, 6) = ?')
+            args.append(timemark)
+
+        if distinct_timestamps:
+            query = 'SELECT day, MAX(dirname) FROM measurements'
+        else:
+            query = 'SELECT day, dirname FROM measurements'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        order = 'DESC' if descending else 'ASC'
+        if distinct_timestamps:
+            query += ' GROUP BY timestamp ORDER BY timestamp {}'.format(order)
+        else:
+            # equivalent to ordering by day and dirname
+            query += ' ORDER BY timestamp {0}, dirname {0}'.format(order)
+        if limit is not None:
+            query += ' LIMIT {:d}'.format(limit)
+        return self._conn.execute(query, args).fetchall()
+
+    def filepath(self, day, dirname):
+        row = self._conn.execute(
+            'SELECT filepath FROM measurements WHERE day=? AND dirname=?',
+            (day, dirname)).fetchone()
+        return None if row is None else row[0]
+
+
+def _is_day(name):
+    return len(name) == 8 and name.isdigit()
+
+
+def _is_measdir(name):
+    return len(name) >= 6 and name[:6].isdigit()
+
+
+def _data_filename(dirname):
+    # Same convention as a_tools.measurement_filename
+    if dirname[6:9] == '_X_':
+        return dirname[0:7]+dirname[9:]+'.hdf5'
+    return dirname+'.hdf5'
+
+
+def _make_row(day, dirname, filepath):
+    return (day, dirname, day+dirname[:6], dirname[7:], filepath)
+
+
+_indices = {}
+
+
+def get_timestamp_index(datadir, refresh=True):
+    '''
+    Returns the (refreshed) TimestampIndex of a data directory, index
+    objects are reused within a process.
+    '''
+    key = os.path.abspath(datadir)
+    if key not in _indices:
+        _indices[key] = TimestampIndex(key)
+    index = _indices[key]
+    if refresh:
+        index.refresh()
+    return index
+
+
+def memmap_dataset(dset):
+    '''
+    Returns a read-only numpy memmap of an h5py dataset, such that the data
+    is only read from disk when it is accessed. Returns None if the dataset
+    can not be memory-mapped, which is the case for datasets that are
+    chunked (e.g. resizable or compressed datasets), that have no storage
+    allocated or that are not of a numerical type.
+    '''
+    if (dset.chunks is not None or dset.dtype.kind not in 'biuf' or
+            getattr(dset, 'external', None)):
+        return None
+    offset = dset.id.get_offset()
+    if offset is None:
+        return None
+    return np.memmap(dset.file.filename, mode='r', dtype=dset.dtype,
+                     shape=dset.shape, offset=offset)
+
+
+def extract_data_from_file(filepath, param_names):
+    '''
+    Reads parameters from a measurement file, opened read-only.
+
+    Args:
+        filepath (str): path of the hdf5 file
+        param_names (list): the parameters to extract, supported are
+            - the name of a sweep parameter or value, returns that column
+              of "Experimental Data/Data"
+            - "sweep_points" and "measured_values" (or "all_data"), the
+              sweep and value columns in the same shape as in
+              MeasurementAnalysis
+            - dotted paths "instrument.parameter" of the instrument
+              settings, "group.subgroup.name" of the Analysis group or
+              the file, where name is an attribute or a dataset
+            - the name of an attribute or dataset of "Experimental Data"
+    Returns:
+        data (OrderedDict): parameter name -> value, None if the
+            parameter does not exist in the file
+    '''
+    data = OrderedDict()
+    with h5py.File(filepath, 'r') as f:
+        exp_data = f.get('Experimental Data', {})
+        if 'Data' in exp_data:
+            sweep_names = _decode(
+                exp_data.attrs.get('sweep_parameter_names', []))
+            value_names = _decode(exp_data.attrs.get('value_names', []))
+        else:
+            sweep_names, value_names = None, None
+        if ('Instrument settings' in f and
+                any('.' in param for param in param_names)):
+            instrument_settings = read_instrument_settings(f)
+        else:
+            instrument_settings = {}
+        for param in param_names:
+            data[param] = _extract_param(f, exp_data, sweep_names,
+                                         value_names, instrument_settings,
+                                         param)
+    return data
+
+
+def extract_data_or_error(filepath, param_names):
+    '''
+    Same as extract_data_from_file but returns (data, None) on success and
+    (None, error message) if the file cannot be read, such that a corrupted
+    file does not abort loading a batch of files in a process pool.
+    '''
+    try:
+        return extract_data_from_file(filepath, param_names), None
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+
+def _extract_param(f, exp_data, sweep_names, value_names,
+                   instrument_settings, param):
+    if sweep_names is not None:
+        nr_sweep = len(sweep_names)
+        dset = exp_data['Data']
+        if param in sweep_names:
+            return dset[:, sweep_names.index(param)]
+        elif param in value_names:
+            return dset[:, nr_sweep + value_names.index(param)]
+        elif param == 'sweep_points':
+            if nr_sweep == 1:
+                return dset[:, 0]
+            return dset[:, :nr_sweep].T
+        elif param in ('measured_values', 'all_data'):
+            return dset[:, nr_sweep:].T
+
+    if '.' in param:
+        path = param.split('.')
+        if path[0] in instrument_settings:
+            return _decode(instrument_settings[path[0]].get(path[1]))
+        elif path[0] in f.get('Analysis', {}):
+            group = f['Analysis']
+        else:
+            group = f
+        for name in path[:-1]:
+            if name not in group:
+                return None
+            group = group[name]
+        return _get_attr_or_dataset(group, path[-1])
+    return _get_attr_or_dataset(exp_data, param)
+
+
+def _get_attr_or_dataset(group, name):
+    if not isinstance(group, h5py.Group):
+        return None
+    if name in group.attrs:
+        return _decode(group.attrs[name])
+    elif name in group and isinstance(group[name], h5py.Dataset):
+        return _decode(group[name][()])
+    return None
+
+
+def _decode(value):
+    # converts byte types to strings because of h5py datasaving
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'SO':
+        return [_decode(v) for v in value]
+    return value
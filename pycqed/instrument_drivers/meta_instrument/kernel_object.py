@@ -7,6 +7,8 @@ from qcodes.instrument.parameter import ManualParameter
 
 from measurement.kernel_functions import kernel_generic, htilde_bounce, \
     htilde_skineffect, save_kernel, step_bounce, step_skineffect
+from pycqed.measurement.waveform_control.kernel_distortion_module import \
+    combine_kernels
 
 def bounce_kernel(amp=0.02,time=4,length=601):
     """
@@ -110,12 +112,10 @@ class Distortion(Instrument):
                             length=self.decay_length())
 
     def convolve_kernel(self, kernel_list, length=None):
-        if length is None:
-            length = max([len(k) for k in kernel_list])
-        total_kernel = kernel_list[0]
-        for k in kernel_list[1:]:
-            total_kernel = np.convolve(total_kernel, k)[:length]
-        return total_kernel
+        if len(kernel_list) == 1:
+            return kernel_list[0]
+        # FFT based equivalent of consecutive np.convolve calls
+        return combine_kernels(kernel_list, length=length)
 
     def get_corrections_kernel(self, kernel_list_before=None):
         kernel_list = [self.get_bounce_kernel(), self.get_skin_kernel(),
@@ -9,9 +9,9 @@ Bugs:
 '''
 
 from .SCPI import SCPI
+from .binblock import packWaveformData, unpackWaveformData
 
 import numpy as np
-import struct
 from qcodes import validators as vals
 
 
@@ -275,23 +275,14 @@ class QuTech_AWG_Module(SCPI):
             '*Sine100'
 
         Returns:
-            tuple containing lists: (waveform, marker1, marker2)
+            tuple containing arrays: (waveform, marker1, marker2)
 
         Compatibility:  5014, QWG
         '''
         self.write('wlist:waveform:data? "%s"' % name)
         binBlock = self.binBlockRead()
         # extract waveform and markers
-        waveformLen = len(binBlock)/5   # 5 bytes per record
-        waveform = []
-        marker1 = []
-        marker2 = []
-        for k in range(waveformLen):
-            (waveform[k], markers) = struct.unpack(binBlock, '<fB')
-            marker1[k] = markers & 0x01
-            marker2[k] = markers >> 1 & 0x01
-
-        return (waveform, marker1, marker2)
+        return unpackWaveformData(binBlock)
 
     def sendWaveformDataReal(self, name, waveform, marker1, marker2):
         """
@@ -321,29 +312,46 @@ class QuTech_AWG_Module(SCPI):
             'awg_transferRealDataWithMarkers', Author = Stefano Poletto,
             Compatibility = Tektronix AWG5014, AWG7102
         """
-
-        # parameter handling
-        if len(marker1) == 0 and len(marker2) == 0:  # no marker data
-            m = np.zeros(len(waveform))
-        else:
-            if (not((len(waveform) == len(marker1))
-                    and ((len(marker1) == len(marker2))))):
-                raise UserWarning('length mismatch between markers/waveform')
-            # prepare markers
-            m = marker1 + np.multiply(marker2, 2)
-            m = int(np.round(m[i], 0))
-
         # FIXME: check waveform amplitude and marker values (if paranoid)
-
-        # generate the binblock
-        binBlock = b''
-        for i in range(len(waveform)):
-            binBlock = binBlock + struct.pack('<fB', waveform[i], int(m[i]))
+        binBlock = self._packWaveformData(waveform, marker1, marker2)
 
         # write binblock
         hdr = 'wlist:waveform:data "{}",'.format(name)
         self.binBlockWrite(binBlock, hdr)
 
+    _packWaveformData = staticmethod(packWaveformData)
+
+    def upload_waveforms(self, waveforms, create=True):
+        """
+        Sends several waveforms to AWG memory, without waiting for the
+        AWG between the waveforms.
+
+        Args:
+            waveforms (dict): waveform name -> waveform (float[numpoints])
+                or a tuple (waveform, marker1, marker2), see
+                sendWaveformDataReal
+
+            create (bool): create the waveforms before sending the data, as
+                in createWaveformReal
+
+        Returns:
+            the response to '*OPC?' after all waveforms are sent
+        """
+        for name, wf in waveforms.items():
+            if isinstance(wf, tuple):
+                waveform, marker1, marker2 = wf
+            else:
+                waveform, marker1, marker2 = wf, [], []
+            binBlock = self._packWaveformData(waveform, marker1, marker2)
+            msg = self.buildBinBlockMessage(
+                binBlock, 'wlist:waveform:data "{}",'.format(name))
+            if create:
+                msg = ('wlist:waveform:new "%s",%d,real' % (
+                    name, len(waveform)) + self._terminator).encode() + msg
+            self._socket.sendall(msg)
+        # single round trip to wait until all data is processed
+        return self.getOperationComplete()
+
     def createWaveformReal(self, name, waveform, marker1, marker2):
         """
         Convenience function to create a waveform in the AWG and then send
@@ -8,14 +8,9 @@ import logging
 from qcodes.instrument.visa import VisaInstrument
 from qcodes.utils import validators as vals
 
-# cython drivers for encoding and decoding
-import pyximport
-pyximport.install(setup_args={"script_args": ["--compiler=msvc"],
-                              "include_dirs": np.get_include()},
-                  reload_support=True)
-
 from ._controlbox import defHeaders  # File containing bytestring commands
-from ._controlbox import codec as c
+# numpy encoder and decoder, replaces the cython codec.pyx
+from ._controlbox import numpy_codec as c
 
 
 class QuTech_ControlBox(VisaInstrument):
@@ -25,7 +20,7 @@ class QuTech_ControlBox(VisaInstrument):
     This is a direct port of the 'old' qtlab driver.
 
     Requirements:
-    defHeaders.py,  codec.pyx and working cython installation
+    defHeaders.py and numpy_codec.py
 
     TODO:
     - test streaming mode
@@ -10,6 +10,7 @@ Bugs:
 
 from qcodes import IPInstrument
 from qcodes import validators as vals
+from . import binblock
 
 """
 FIXME: we would like to be able to choose the base class separately, so the
@@ -116,47 +117,50 @@ class SCPI(IPInstrument):
     def binBlockWrite(self, binBlock, header):
         ''' write IEEE488.2 binblock
                 Input:
-                        binBlock    bytearray
+                        binBlock    bytes
                         header      string
         '''
+        self._socket.sendall(self.buildBinBlockMessage(binBlock, header))
+
+    def buildBinBlockMessage(self, binBlock, header):
+        ''' returns the bytes of a command consisting of the header,
+            the IEEE488.2 binblock and the line terminator
+        '''
         totHdr = header + SCPI.buildHeaderString(len(binBlock))
-        binMsg = totHdr.encode() + binBlock
-#       self.writeBinary(binMsg)
-        self._socket.send(binMsg)       # FIXME: hack
-        self.write('')                  # add a Line Terminator
+        return b''.join([totHdr.encode(), binBlock,
+                         self._terminator.encode()])
 
     def binBlockRead(self):
-        # FIXME: untested
         ''' read IEEE488.2 binblock
         '''
         # get and decode header
         headerA = self.readBinary(2)                        # consume '#N'
-        # FIXME: Matlab code
-        digitCnt = str2double(char(headerA(2)))
-        headerB = obj.readBinary(digitCnt)
-        byteCnt = str2double(char(headerB))
+        if headerA[:1] != b'#':
+            raise ValueError('Invalid binblock header {}'.format(headerA))
+        digitCnt = int(headerA[1:2])
+        headerB = self.readBinary(digitCnt)
+        byteCnt = int(headerB)
 
         # get binblock
-        binBlock = obj.readBinary(byteCnt)
-        self.readBinary(2)                                  # consume <CR><LF>
+        binBlock = self.readBinary(byteCnt)
+        # consume the line terminator (<LF> or <CR><LF>)
+        while self.readBinary(1) != b'\n':
+            pass
         return binBlock
 
-    @staticmethod
-    def buildHeaderString(byteCnt):
-        ''' generate IEEE488.2 binblock header
-        '''
-        byteCntStr = str(byteCnt)
-        digitCntStr = str(len(byteCntStr))
-        binHeaderStr = '#' + digitCntStr + byteCntStr
-        return binHeaderStr
-
-    @staticmethod
-    def getByteCntFromHeader(headerStr):
-        ''' decode IEEE488.2 binblock header
+    def readBinary(self, size):
+        ''' read exactly size bytes from the socket
         '''
-        # FIXME: old Matlab code
-        digitCnt = sscanf(headerStr, '#%1d')
-        formatString = sprintf('%%%dd', digitCnt)           # e.g. '%3d'
-        # byteCnt = sscanf(headerStr(3:end), formatString)        # NB: skip
-        # first '#N'
-        return byteCnt
+        data = bytearray(size)
+        view = memoryview(data)
+        nrRead = 0
+        while nrRead < size:
+            n = self._socket.recv_into(view[nrRead:], size - nrRead)
+            if n == 0:
+                raise ConnectionError('Connection closed while reading')
+            nrRead += n
+        return bytes(data)
+
+    buildHeaderString = staticmethod(binblock.buildHeaderString)
+
+    getByteCntFromHeader = staticmethod(binblock.getByteCntFromHeader)
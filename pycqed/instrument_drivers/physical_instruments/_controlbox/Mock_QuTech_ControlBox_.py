@@ -13,13 +13,8 @@ if qcpath not in sys.path:
 from qcodes.instrument.visa import VisaInstrument
 from qcodes.utils import validators as vals
 
-# cython drivers for encoding and decoding
-import pyximport
-pyximport.install(setup_args={"script_args": ["--compiler=msvc"],
-                              "include_dirs": np.get_include()},
-                  reload_support=True)
-
-from ._controlbox import codec as c
+# numpy encoder and decoder, replaces the cython codec.pyx
+from ._controlbox import numpy_codec as c
 from . import QuTech_ControlBoxdriver as qcb
 
 
@@ -0,0 +1,165 @@
+'''
+Encoder and decoder for the CBox v2 and v3 protocol using numpy.
+
+Drop-in replacement of codec.pyx that does not require a (msvc) compiler.
+Arrays of values are encoded and decoded in a vectorized way and the
+results are bit-exact with the cython codec.
+
+The protocol is described in the docstring of encode_byte().
+'''
+import numpy as np
+
+
+def create_message(cmd=None, data_bytes=bytes(), EOM=b"\x7F"):
+    '''
+    Input arguments:
+                  cmd         = None
+        bytes     data_bytes  = bytes()
+        bytes     EOM         = b'\x7F'
+
+    Creates bytes to send as a message.
+    Starts with a command, then adds the data bytes and ends with EOM.
+    '''
+    message = bytes()
+    if cmd is not None:
+        message += cmd
+    message += data_bytes
+    message += EOM
+    return message
+
+
+def encode_byte(value, data_bits_per_byte=7, expected_number_of_bytes=2):
+    '''
+    input arguments
+    int value                    : value to be encoded
+    int data_bits_per_byte       : specify bits/byte used in encoding
+    int expected_number_of_bytes : number of bytes expected by CBox
+
+    returns
+    bytes data_bytes             : the encoded value
+
+    From "250 MSPs Control Box Design Specification" version May 2015
+    by Jacob de Sterke
+
+    full_byte encoding:
+    In this mode each protocol byte contains 7 bits or the data to be
+    transferred.
+
+    |7|6|5|4|3|2|1|0|
+     | | > > > > > > > data bits
+     |
+     always 1
+
+    nibble_byte encoding:
+    In this mode each protocol byte contains only four bits (a nibble) of
+    the data to be transferred.
+    |7|6|5|4|3|2|1|0|
+    | | | | | > > >  data bits
+    | | > > > unused bits (should be set to zero for consistency)
+    |
+    always 1
+
+    Negative values are encoded in two's complement.
+    '''
+    return encode_array([value], data_bits_per_byte=data_bits_per_byte,
+                        bytes_per_value=expected_number_of_bytes)
+
+
+def encode_array(values, data_bits_per_byte=7, bytes_per_value=2):
+    '''
+    Input arguments
+        int*   values                      : array of values to be encoded
+        int    data_bits_per_byte = 7      : specify bits/byte used in encoding
+        int    bytes_per_value    = 2      : number of bytes expected per value
+
+    Encodes an array of values, every value is encoded in bytes_per_value
+    bytes with the most significant bits first (see encode_byte).
+    '''
+    values = np.asarray(values).astype(np.int64).reshape(-1, 1)
+    mask = (1 << data_bits_per_byte) - 1
+    shifts = data_bits_per_byte * np.arange(bytes_per_value-1, -1, -1,
+                                            dtype=np.int64)
+    data_bytes = ((values >> shifts) & mask) | 128
+    return data_bytes.astype(np.uint8).tobytes()
+
+
+def decode_message(data_bytes, data_bits_per_byte=7, bytes_per_value=2,
+                   signed_integer=True):
+    '''
+    Input arguments:
+        bytes     data_bytes         : message ending with the EOM byte
+        int       data_bits_per_byte : 7
+        int       bytes_per_value    : 2
+        bool      signed_integer     : True, if False the values are
+                                       decoded as unsigned integers
+
+    returns numpy array of type int
+
+    The last byte (EOM) is removed, trailing bytes that do not form a
+    complete value (e.g. the checksum) are ignored.
+    '''
+    message_bytes = np.frombuffer(data_bytes, dtype=np.uint8)[:-1]
+    message_length = len(message_bytes)//bytes_per_value
+    message_bytes = message_bytes[:message_length*bytes_per_value].reshape(
+        message_length, bytes_per_value)
+    mask = (1 << data_bits_per_byte) - 1
+
+    # Combine the data bits of the bytes of every value, the bytes per
+    # value is small so the loop is over the columns only.
+    values = np.zeros(message_length, dtype=int)
+    for i in range(bytes_per_value):
+        values <<= data_bits_per_byte
+        values |= message_bytes[:, i] & mask
+
+    if signed_integer:
+        # two's complement of data_bits_per_byte*bytes_per_value bits
+        nr_bits = data_bits_per_byte*bytes_per_value
+        values -= (values >> (nr_bits-1) & 1) << nr_bits
+    return values
+
+
+def decode_byte(data_bytes, data_bits_per_byte=7):
+    '''
+    Input arguments:
+        bytes     data_bytes
+        int       data_bits_per_byte : 7
+    returns
+        int       value
+
+    Inverse function of encode byte. Protocol is described in docstring
+    of encode_byte().
+    '''
+    return int(decode_message(bytes(data_bytes) + b'\x7F',
+                              data_bits_per_byte=data_bits_per_byte,
+                              bytes_per_value=len(data_bytes))[0])
+
+
+def decode_boolean_array(data_bytes, data_bits_per_byte=4):
+    '''
+    Used in the qubit state logging mode
+
+    Returns the data bits of all bytes except for the checksum and EOM,
+    the first half of the bits belongs to ch0 and the second half to ch1.
+    '''
+    nr_bytes = len(data_bytes)-2
+    raw_vals = np.unpackbits(
+        np.frombuffer(data_bytes, dtype=np.uint8)[:nr_bytes]).reshape(
+        nr_bytes, 8)
+    values = np.zeros(nr_bytes*4)
+    values[:nr_bytes*data_bits_per_byte] = raw_vals[
+        :, data_bits_per_byte:2*data_bits_per_byte].ravel()
+    ch0_values = values[:len(values)//2]
+    ch1_values = values[len(values)//2:]
+    return ch0_values, ch1_values
+
+
+def calculate_checksum(input_command):
+    '''
+    Input arguments
+        bytes input_command
+
+    Calculates checksum by taking the XOR of all bytes in input_command
+    '''
+    checksum = int(np.bitwise_xor.reduce(
+        np.frombuffer(input_command, dtype=np.uint8)))
+    return bytes([checksum | 128])
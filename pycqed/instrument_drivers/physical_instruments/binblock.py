@@ -0,0 +1,63 @@
+'''
+File:       binblock.py
+Purpose:    IEEE488.2 binblock headers and the waveform data of the QWG,
+            used by SCPI and QuTech_AWG_Module
+Usage:
+Notes:      does not depend on qcodes
+Bugs:
+'''
+
+import numpy as np
+
+# record of the binblock of waveform data: a float32 sample followed by a
+# byte with marker1 in bit 0 and marker2 in bit 1
+WAVEFORM_RECORD = np.dtype([('waveform', '<f4'), ('markers', 'u1')])
+
+
+def buildHeaderString(byteCnt):
+    ''' generate IEEE488.2 binblock header
+    '''
+    byteCntStr = str(byteCnt)
+    digitCntStr = str(len(byteCntStr))
+    binHeaderStr = '#' + digitCntStr + byteCntStr
+    return binHeaderStr
+
+
+def getByteCntFromHeader(headerStr):
+    ''' decode IEEE488.2 binblock header
+    '''
+    digitCnt = int(headerStr[1])
+    byteCnt = int(headerStr[2:2+digitCnt])
+    return byteCnt
+
+
+def packWaveformData(waveform, marker1, marker2):
+    '''
+    Returns the binblock data of a waveform and its markers
+    '''
+    # parameter handling
+    if len(marker1) == 0 and len(marker2) == 0:  # no marker data
+        m = 0
+    else:
+        if (not((len(waveform) == len(marker1))
+                and ((len(marker1) == len(marker2))))):
+            raise UserWarning('length mismatch between markers/waveform')
+        # prepare markers
+        m = np.round(np.add(marker1, np.multiply(marker2, 2)))
+
+    records = np.empty(len(waveform), dtype=WAVEFORM_RECORD)
+    records['waveform'] = waveform
+    records['markers'] = m
+    return records.tobytes()
+
+
+def unpackWaveformData(binBlock):
+    '''
+    Returns the waveform and markers in the binblock data, as arrays
+    (waveform, marker1, marker2)
+    '''
+    records = np.frombuffer(binBlock, dtype=WAVEFORM_RECORD)
+    waveform = records['waveform']
+    marker1 = records['markers'] & 0x01
+    marker2 = records['markers'] >> 1 & 0x01
+    return (waveform, marker1, marker2)
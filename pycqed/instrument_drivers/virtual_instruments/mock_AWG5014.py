@@ -0,0 +1,503 @@
+'''
+Mock of the Tektronix AWG5014 as used by the Pulsar.
+
+Implements the .awg file generation of the qcodes AWG5014 driver and keeps
+everything that is "sent" to the instrument in memory, this allows testing
+the sequence upload without hardware or a visa connection.
+'''
+import re
+import struct
+from io import BytesIO
+from time import localtime
+import numpy as np
+
+
+class MockParameter:
+    '''
+    Minimal stand-in for a qcodes parameter.
+    '''
+
+    def __init__(self, name, value=None):
+        self.name = name
+        self._value = value
+
+    def __call__(self, *args):
+        if len(args) == 0:
+            return self.get()
+        self.set(*args)
+
+    def get(self):
+        return self._value
+
+    def get_latest(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+
+class MockVisaHandle:
+    '''
+    Passes the raw messages to the mock AWG.
+    '''
+
+    def __init__(self, AWG):
+        self.AWG = AWG
+
+    def write_raw(self, message):
+        self.AWG.write_raw(message)
+
+
+class Mock_AWG5014:
+    '''
+    Records the .awg files sent and loaded instead of writing them to an
+    instrument.
+
+    The SCPI commands that edit the waveform list and the sequence table
+    (WLISt:WAVeform:..., SEQuence:...) are applied to the waveforms and the
+    sequence loaded from the last .awg file, invalid commands are stored in
+    the error queue as on the instrument.
+
+    Attributes:
+        files (dict): filename -> bytes of all files sent to the AWG
+        loaded_file (str): name of the last file loaded
+        waveforms (dict): waveform name -> packed waveform of the waveform
+            list
+        sequence (list): per sequence element a dict with the wait, loop,
+            jump and goto settings and per channel the waveform name
+        bytes_transferred (int): total nr of bytes sent, including the
+            SCPI header of the MMEMory:DATA command and the SCPI commands
+        nr_uploads (int): nr of files sent
+        timestamp (tuple): if not None, used as timestamp of the waveforms
+            in the .awg file, this makes the generated files reproducible
+    '''
+
+    AWG_FILE_FORMAT_HEAD = {
+        'SAMPLING_RATE': 'd',
+        'REPETITION_RATE': 'd',
+        'HOLD_REPETITION_RATE': 'h',
+        'CLOCK_SOURCE': 'h',
+        'REFERENCE_SOURCE': 'h',
+        'EXTERNAL_REFERENCE_TYPE': 'h',
+        'REFERENCE_CLOCK_FREQUENCY_SELECTION': 'h',
+        'REFERENCE_MULTIPLIER_RATE': 'h',
+        'DIVIDER_RATE': 'h',
+        'TRIGGER_SOURCE': 'h',
+        'INTERNAL_TRIGGER_RATE': 'd',
+        'TRIGGER_INPUT_IMPEDANCE': 'h',
+        'TRIGGER_INPUT_SLOPE': 'h',
+        'TRIGGER_INPUT_POLARITY': 'h',
+        'TRIGGER_INPUT_THRESHOLD': 'd',
+        'EVENT_INPUT_IMPEDANCE': 'h',
+        'EVENT_INPUT_POLARITY': 'h',
+        'EVENT_INPUT_THRESHOLD': 'd',
+        'JUMP_TIMING': 'h',
+        'INTERLEAVE': 'h',
+        'ZEROING': 'h',
+        'COUPLING': 'h',
+        'RUN_MODE': 'h',
+        'WAIT_VALUE': 'h',
+        'RUN_STATE': 'h',
+        'INTERLEAVE_ADJ_PHASE': 'd',
+        'INTERLEAVE_ADJ_AMPLITUDE': 'd',
+    }
+    AWG_FILE_FORMAT_CHANNEL = {
+        'OUTPUT_WAVEFORM_NAME_N': 's',
+        'CHANNEL_STATE_N': 'h',
+        'ANALOG_DIRECT_OUTPUT_N': 'h',
+        'ANALOG_FILTER_N': 'h',
+        'ANALOG_METHOD_N': 'h',
+        'ANALOG_AMPLITUDE_N': 'd',
+        'ANALOG_OFFSET_N': 'd',
+        'ANALOG_HIGH_N': 'd',
+        'ANALOG_LOW_N': 'd',
+        'MARKER1_SKEW_N': 'd',
+        'MARKER1_METHOD_N': 'h',
+        'MARKER1_AMPLITUDE_N': 'd',
+        'MARKER1_OFFSET_N': 'd',
+        'MARKER1_HIGH_N': 'd',
+        'MARKER1_LOW_N': 'd',
+        'MARKER2_SKEW_N': 'd',
+        'MARKER2_METHOD_N': 'h',
+        'MARKER2_AMPLITUDE_N': 'd',
+        'MARKER2_OFFSET_N': 'd',
+        'MARKER2_HIGH_N': 'd',
+        'MARKER2_LOW_N': 'd',
+        'DIGITAL_METHOD_N': 'h',
+        'DIGITAL_AMPLITUDE_N': 'd',
+        'DIGITAL_OFFSET_N': 'd',
+        'DIGITAL_HIGH_N': 'd',
+        'DIGITAL_LOW_N': 'd',
+        'EXTERNAL_ADD_N': 'h',
+        'PHASE_DELAY_INPUT_METHOD_N': 'h',
+        'PHASE_N': 'd',
+        'DELAY_IN_TIME_N': 'd',
+        'DELAY_IN_POINTS_N': 'd',
+        'CHANNEL_SKEW_N': 'd',
+        'DC_OUTPUT_LEVEL_N': 'd',
+    }
+
+    def __init__(self, name='AWG', num_channels=4, timestamp=None):
+        self.name = name
+        self.num_channels = num_channels
+        self.timestamp = timestamp
+        self.parameters = {}
+        self.add_parameter('timeout', 180)
+        self.add_parameter('clock_freq', 1e9)
+        for i in range(1, num_channels+1):
+            self.add_parameter('ch{}_offset'.format(i), 0.)
+            self.add_parameter('ch{}_amp'.format(i), 2.)
+            self.add_parameter('ch{}_state'.format(i), 0)
+        self.files = {}
+        self.loaded_file = None
+        self.waveforms = {}
+        self.sequence = []
+        self.errors = []
+        self.visa_handle = MockVisaHandle(self)
+        # (filename, size, data) of a file sent in several messages
+        self._receiving = None
+        self.bytes_transferred = 0
+        self.nr_uploads = 0
+        self.run_state = 'Idle'
+
+    def add_parameter(self, name, initial_value=None):
+        par = MockParameter(name, initial_value)
+        self.parameters[name] = par
+        setattr(self, name, par)
+
+    def get(self, name):
+        return self.parameters[name].get()
+
+    def set(self, name, value):
+        self.parameters[name].set(value)
+
+    def start(self):
+        self.run_state = 'Running'
+
+    def stop(self):
+        self.run_state = 'Idle'
+
+    def is_awg_ready(self):
+        return True
+
+    def delete_all_waveforms_from_list(self):
+        self.write('WLISt:WAVeform:DELete ALL')
+
+    def write(self, cmd):
+        self.bytes_transferred += len(cmd) + 1
+        if cmd == '*CLS':
+            self.errors = []
+            return
+        m = re.match(r'WLISt:WAVeform:DELete (ALL|"(.+)")$', cmd)
+        if m:
+            names = list(self.waveforms) if m.group(2) is None \
+                else [m.group(2)]
+            for name in names:
+                if self._check(name in self.waveforms, cmd):
+                    self._delete_waveform(name)
+            return
+        m = re.match(r'WLISt:WAVeform:DEFine "(.+)",(\d+),INTeger$', cmd)
+        if m:
+            if self._check(m.group(1) not in self.waveforms, cmd):
+                self.waveforms[m.group(1)] = np.zeros(int(m.group(2)),
+                                                      dtype=np.uint16)
+            return
+        m = re.match(r'SEQuence:LENGth (\d+)$', cmd)
+        if m:
+            length = int(m.group(1))
+            self.sequence = self.sequence[:length] + [
+                self._new_sequence_element()
+                for i in range(length - len(self.sequence))]
+            return
+        m = re.match(r'SEQuence:ELEMent(\d+):(.+) (.+)$', cmd)
+        if m and self._check(1 <= int(m.group(1)) <= len(self.sequence),
+                             cmd):
+            seq_el = self.sequence[int(m.group(1)) - 1]
+            setting, value = m.group(2), m.group(3)
+            if re.match(r'WAVeform\d$', setting):
+                name = value.strip('"')
+                if self._check(name in self.waveforms, cmd):
+                    seq_el['ch' + setting[-1]] = name
+            elif setting in ['TWAit', 'LOOP:COUNt', 'GOTO:INDex',
+                             'JTARget:INDex']:
+                key = {'TWAit': 'WAIT', 'LOOP:COUNt': 'LOOP',
+                       'GOTO:INDex': 'GOTO', 'JTARget:INDex': 'JUMP'}
+                seq_el[key[setting]] = int(value)
+            elif setting == 'GOTO:STATe':
+                # the index is set by GOTO:INDex
+                if value == '0':
+                    seq_el['GOTO'] = 0
+            elif setting == 'JTARget:TYPE':
+                if value in ['OFF', 'NEXT']:
+                    seq_el['JUMP'] = {'OFF': 0, 'NEXT': -1}[value]
+            else:
+                self._check(False, cmd)
+            return
+        self._check(False, cmd)
+
+    def write_raw(self, message):
+        self.bytes_transferred += len(message)
+        if self._receiving is None:
+            m = re.match(rb'MMEMory:DATA "(.+)",#(\d)', message)
+            if m:
+                i = m.end() + int(m.group(2))
+                self._receiving = (m.group(1).decode('ASCII'),
+                                   int(message[m.end():i]), bytearray())
+                message = message[i:]
+        if self._receiving is not None:
+            filename, size, data = self._receiving
+            data += message
+            if len(data) >= size:
+                self._receiving = None
+                if self._check(len(data) == size, filename):
+                    self.files[filename] = bytes(data)
+                    self.nr_uploads += 1
+            return
+        m = re.match(rb'WLISt:WAVeform:DATA "(.+)",#(\d)', message)
+        if not self._check(m is not None, message[:40]):
+            return
+        name = m.group(1).decode('ASCII')
+        i = m.end() + int(m.group(2))
+        data = np.frombuffer(message[i:], dtype='<u2')
+        if self._check(name in self.waveforms and
+                       len(data) == len(self.waveforms[name]), name):
+            self.waveforms[name] = data.astype(np.uint16)
+
+    def ask(self, cmd):
+        if cmd == 'SYSTem:ERRor:NEXT?':
+            if self.errors:
+                return self.errors.pop(0)
+            return '0,"No error"'
+        raise ValueError('Query "{}" is not supported'.format(cmd))
+
+    def _check(self, condition, cmd):
+        if not condition:
+            self.errors.append('-200,"Execution error; {}"'.format(cmd))
+        return condition
+
+    def _new_sequence_element(self):
+        return {'WAIT': 0, 'LOOP': 1, 'JUMP': 0, 'GOTO': 0}
+
+    def _delete_waveform(self, name):
+        del self.waveforms[name]
+        for seq_el in self.sequence:
+            for key in [k for k, v in seq_el.items() if v == name]:
+                del seq_el[key]
+
+    def sequence_table(self):
+        '''
+        Returns the sequence of the AWG with the waveform names replaced by
+        the waveform data, as read_sequence_table does for an .awg file.
+        '''
+        return _resolve_waveform_names(self.sequence, self.waveforms)
+
+    def generate_sequence_cfg(self):
+        return {'SAMPLING_RATE': self.get('clock_freq'),
+                'CLOCK_SOURCE': 1,
+                'REFERENCE_SOURCE': 1,
+                'EXTERNAL_REFERENCE_TYPE': 1,
+                'REFERENCE_CLOCK_FREQUENCY_SELECTION': 1,
+                'TRIGGER_SOURCE': 1,
+                'TRIGGER_INPUT_IMPEDANCE': 1,
+                'TRIGGER_INPUT_SLOPE': 1,
+                'TRIGGER_INPUT_POLARITY': 1,
+                'TRIGGER_INPUT_THRESHOLD': 1.4,
+                'EVENT_INPUT_IMPEDANCE': 2,
+                'EVENT_INPUT_POLARITY': 1,
+                'EVENT_INPUT_THRESHOLD': 1.4,
+                'JUMP_TIMING': 1,
+                'RUN_MODE': 4,
+                'RUN_STATE': 0}
+
+    def pack_waveform(self, wf, m1, m2):
+        '''
+        Packs a waveform and two markers into the 16-bit AWG integer format.
+        '''
+        if (not((len(wf) == len(m1)) and ((len(m1) == len(m2))))):
+            raise Exception('error: sizes of the waveforms do not match')
+        if np.min(wf) < -1 or np.max(wf) > 1:
+            raise TypeError('Waveform values out of bonds.' +
+                            ' Allowed values: -1 to 1 (inclusive)')
+        if not np.all(np.in1d(m1, np.array([0, 1]))):
+            raise TypeError('Marker 1 contains invalid values.' +
+                            ' Only 0 and 1 are allowed')
+        if not np.all(np.in1d(m2, np.array([0, 1]))):
+            raise TypeError('Marker 2 contains invalid values.' +
+                            ' Only 0 and 1 are allowed')
+
+        packed_wf = np.zeros(len(wf), dtype=np.uint16)
+        packed_wf += np.uint16(np.round(wf * 8191) + 8191 +
+                               np.round(16384 * m1) +
+                               np.round(32768 * m2))
+        return packed_wf
+
+    def _pack_record(self, name, value, dtype):
+        if len(dtype) == 1:
+            record_data = struct.pack('<' + dtype, value)
+        else:
+            if dtype[-1] == 's':
+                record_data = value.encode('ASCII')
+            else:
+                record_data = struct.pack('<' + dtype, *value)
+        record_name = name.encode('ASCII') + b'\x00'
+        size_struct = struct.pack('<II', len(record_name), len(record_data))
+        return size_struct + record_name + record_data
+
+    def generate_awg_file(self, packed_waveforms, wfname_l, nrep, trig_wait,
+                          goto_state, jump_to, channel_cfg,
+                          sequence_cfg=None,
+                          preservechannelsettings=False):
+        '''
+        Generates an .awg file, same arguments as the qcodes AWG5014 driver.
+        '''
+        if self.timestamp is None:
+            timetuple = tuple(
+                np.array(localtime())[[0, 1, 8, 2, 3, 4, 5, 6, 7]])
+        else:
+            timetuple = tuple(self.timestamp)
+
+        head_str = BytesIO()
+        head_str.write(self._pack_record('MAGIC', 5000, 'h') +
+                       self._pack_record('VERSION', 1, 'h'))
+        if sequence_cfg is None:
+            sequence_cfg = self.generate_sequence_cfg()
+        for k in list(sequence_cfg.keys()):
+            if k in self.AWG_FILE_FORMAT_HEAD:
+                head_str.write(self._pack_record(
+                    k, sequence_cfg[k], self.AWG_FILE_FORMAT_HEAD[k]))
+
+        ch_record_str = BytesIO()
+        for k in list(channel_cfg.keys()):
+            ch_k = k[:-1] + 'N'
+            if ch_k in self.AWG_FILE_FORMAT_CHANNEL:
+                ch_record_str.write(self._pack_record(
+                    k, channel_cfg[k], self.AWG_FILE_FORMAT_CHANNEL[ch_k]))
+
+        ii = 21
+        wf_record_str = BytesIO()
+        wlist = list(packed_waveforms.keys())
+        wlist.sort()
+        for wf in wlist:
+            wfdat = packed_waveforms[wf]
+            lenwfdat = len(wfdat)
+            wf_record_str.write(
+                self._pack_record('WAVEFORM_NAME_{}'.format(ii), wf + '\x00',
+                                  '{}s'.format(len(wf + '\x00'))) +
+                self._pack_record('WAVEFORM_TYPE_{}'.format(ii), 1, 'h') +
+                self._pack_record('WAVEFORM_LENGTH_{}'.format(ii),
+                                  lenwfdat, 'l') +
+                self._pack_record('WAVEFORM_TIMESTAMP_{}'.format(ii),
+                                  timetuple[:-1], '8H') +
+                self._pack_record('WAVEFORM_DATA_{}'.format(ii), wfdat,
+                                  '{}H'.format(lenwfdat)))
+            ii += 1
+
+        kk = 1
+        seq_record_str = BytesIO()
+        for segment in wfname_l.transpose():
+            seq_record_str.write(
+                self._pack_record('SEQUENCE_WAIT_{}'.format(kk),
+                                  trig_wait[kk - 1], 'h') +
+                self._pack_record('SEQUENCE_LOOP_{}'.format(kk),
+                                  int(nrep[kk - 1]), 'l') +
+                self._pack_record('SEQUENCE_JUMP_{}'.format(kk),
+                                  jump_to[kk - 1], 'h') +
+                self._pack_record('SEQUENCE_GOTO_{}'.format(kk),
+                                  goto_state[kk - 1], 'h'))
+            for wfname in segment:
+                if wfname is not None:
+                    ch = wfname[-1]
+                    seq_record_str.write(self._pack_record(
+                        'SEQUENCE_WAVEFORM_NAME_CH_' + ch + '_{}'.format(kk),
+                        wfname + '\x00', '{}s'.format(len(wfname + '\x00'))))
+            kk += 1
+
+        return (head_str.getvalue() + ch_record_str.getvalue() +
+                wf_record_str.getvalue() + seq_record_str.getvalue())
+
+    def send_awg_file(self, filename, awg_file, verbose=False):
+        name_str = 'MMEMory:DATA "{}",'.format(filename).encode('ASCII')
+        size_str = ('#' + str(len(str(len(awg_file)))) +
+                    str(len(awg_file))).encode('ASCII')
+        self.bytes_transferred += len(name_str + size_str) + len(awg_file)
+        self.nr_uploads += 1
+        self.files[filename] = awg_file
+
+    def load_awg_file(self, filename):
+        if filename not in self.files:
+            raise KeyError('File "{}" was not sent to the AWG'.format(
+                filename))
+        self.loaded_file = filename
+        self.waveforms, self.sequence = _read_waveforms_and_sequence(
+            self.files[filename])
+
+
+def read_awg_file(awg_file):
+    '''
+    Splits an .awg file into its records.
+
+    Returns:
+        records (dict): record name -> raw bytes of the record data, the
+            order of the records is preserved.
+    '''
+    records = {}
+    i = 0
+    while i < len(awg_file):
+        name_size, data_size = struct.unpack('<II', awg_file[i:i+8])
+        i += 8
+        name = awg_file[i:i+name_size-1].decode('ASCII')
+        i += name_size
+        records[name] = awg_file[i:i+data_size]
+        i += data_size
+    return records
+
+
+def read_sequence_table(awg_file):
+    '''
+    Returns the sequence table of an .awg file with the waveform names
+    replaced by the waveform data they refer to.
+
+    Returns:
+        sequence (list): per sequence element a dict with the wait, loop,
+            jump and goto settings and per channel the packed waveform
+            as an array of uint16.
+    '''
+    waveforms, sequence = _read_waveforms_and_sequence(awg_file)
+    return _resolve_waveform_names(sequence, waveforms)
+
+
+def _read_waveforms_and_sequence(awg_file):
+    records = read_awg_file(awg_file)
+    waveforms = {}
+    for name, data in records.items():
+        if name.startswith('WAVEFORM_NAME_'):
+            idx = name[len('WAVEFORM_NAME_'):]
+            waveforms[data.decode('ASCII').rstrip('\x00')] = np.frombuffer(
+                records['WAVEFORM_DATA_' + idx], dtype='<u2')
+
+    sequence = []
+    kk = 1
+    while 'SEQUENCE_WAIT_{}'.format(kk) in records:
+        seq_el = {}
+        for key, fmt in [('WAIT', '<h'), ('LOOP', '<l'), ('JUMP', '<h'),
+                         ('GOTO', '<h')]:
+            seq_el[key] = struct.unpack(
+                fmt, records['SEQUENCE_{}_{}'.format(key, kk)])[0]
+        sequence.append(seq_el)
+        kk += 1
+
+    prefix = 'SEQUENCE_WAVEFORM_NAME_CH_'
+    for name, data in records.items():
+        if name.startswith(prefix):
+            ch, kk = name[len(prefix):].split('_')
+            wfname = data.decode('ASCII').rstrip('\x00')
+            sequence[int(kk)-1]['ch' + ch] = wfname
+    return waveforms, sequence
+
+
+def _resolve_waveform_names(sequence, waveforms):
+    resolved = []
+    for seq_el in sequence:
+        resolved.append({key: waveforms[value] if key.startswith('ch')
+                         else value for key, value in seq_el.items()})
+    return resolved
@@ -6,13 +6,20 @@ Wolfgang Pfaff.
 Contains:
 - a data class (HDF5Data) which is essentially a wrapper of a h5py data
   object, adapted for usage with qcodes
+- a buffered writer used to write rows of data to a dataset in chunks and
+  a threaded version that writes from a separate writer thread
+- single-writer/multiple-reader (SWMR) support to read the data of a file
+  while it is written
 - name generators in the style of qtlab Data objects
-- functions to create standard data sets
+- functions to create standard data sets, e.g. the chunked and optionally
+  compressed dataset the measured data is written to
 """
 
 import os
 import logging
 import time
+import queue
+import threading
 import h5py
 import numpy as np
 from uuid import getnode as get_mac
@@ -22,11 +29,16 @@ try:
 except NameError:
     from pycqed.init.config import setup_dict
     mac = get_mac()
-    setup_name = setup_dict.mac_dict[str(mac)]
     logging.warning('Creating qc_config for datadir')
+    try:
+        setup_name = setup_dict.mac_dict[str(mac)]
+        datadir = setup_dict.data_dir_dict[setup_name]
+    except KeyError:
+        # Unknown setup (e.g. a test server), datadir has to be set by hand
+        datadir = None
     # logging.warning('Data directory set to:',
     #                 setup_dict.data_dir_dict[setup_name])
-    qc_config = {'datadir': setup_dict.data_dir_dict[setup_name]}
+    qc_config = {'datadir': datadir}
 
 
 class DateTimeGenerator:
@@ -35,7 +47,8 @@ class DateTimeGenerator:
     '''
 
     def __init__(self):
-        pass
+        # (datadir, datesubdir) -> time of the last second claimed
+        self._last_claimed = {}
 
     def create_data_dir(self, datadir, name=None, ts=None,
                         datesubdir=True, timesubdir=True):
@@ -51,52 +64,47 @@ class DateTimeGenerator:
 
         Output:
             The directory to place the new file in
-        '''
 
-        path = datadir
+        The timestamp HHMMSS of the time subdirectory is unique within the
+        day, as required to find data by its timestamp. Every second is
+        claimed by creating an empty marker directory .HHMMSS in the day
+        directory, os.mkdir fails if another process (or an earlier call)
+        claimed it, in which case the next second is tried. The search
+        starts after the last second claimed by this generator, such that
+        creating many directories in quick succession does not try all
+        seconds claimed before.
+        '''
         if ts is None:
             ts = time.localtime()
-        if datesubdir:
-            path = os.path.join(path, time.strftime('%Y%m%d', ts))
+        t = time.mktime(ts)
         if timesubdir:
+            t = max(t, self._last_claimed.get((datadir, datesubdir), t-1)+1)
+        while True:
+            ts = time.localtime(t)
+            path = datadir
+            if datesubdir:
+                path = os.path.join(path, time.strftime('%Y%m%d', ts))
+            os.makedirs(path, exist_ok=True)
             tsd = time.strftime('%H%M%S', ts)
-            timestamp_verified = False
-            counter = 0
-            # Verify if timestamp is unique by seeing if the folder exists
-            while not timestamp_verified:
-                counter += 1
-                try:
-                    measdirs = [d for d in os.listdir(path)
-                                if d[:6] == tsd]
-                    if len(measdirs) == 0:
-                        timestamp_verified = True
-                    else:
-                        # if timestamp not unique, add one second
-                        # This is quite a hack
-                        ts = time.localtime((time.mktime(ts)+1))
-                        tsd = time.strftime('%H%M%S', ts)
-                    if counter >= 3600:
-                        raise Exception()
-                except OSError as err:
-                    if 'cannot find the path specified' in str(err):
-                        timestamp_verified = True
-                    elif 'No such file or directory' in str(err):
-                        timestamp_verified = True
-                    else:
-                        raise err
-            if name is not None:
-                path = os.path.join(path, tsd+'_'+name)
-            else:
-                path = os.path.join(path, tsd)
-
-        return path, tsd
+            if not timesubdir:
+                return path, tsd
+            try:
+                os.mkdir(os.path.join(path, '.'+tsd))
+            except FileExistsError:
+                t += 1
+                continue
+            self._last_claimed[(datadir, datesubdir)] = t
+            dirname = tsd if name is None else tsd+'_'+name
+            os.mkdir(os.path.join(path, dirname))
+            return os.path.join(path, dirname), tsd
 
     def new_filename(self, data_obj):
         '''Return a new filename, based on name and timestamp.'''
         path, tstr = self.create_data_dir(qc_config['datadir'],
                                           name=data_obj._name,
                                           ts=data_obj._localtime)
-        filename = '%s_%s.hdf5' % (tstr, data_obj._name)
+        # the data file has the same name as the directory
+        filename = os.path.basename(path) + '.hdf5'
         return os.path.join(path, filename)
 
 
@@ -105,7 +113,8 @@ class Data(h5py.File):
     # _data_list = data.Data._data_list
     _filename_generator = DateTimeGenerator()
 
-    def __init__(self, name='None', filepath=None, *args, **kwargs):
+    def __init__(self, name='None', filepath=None, swmr=False, *args,
+                 **kwargs):
         """
         Creates an empty data set including the file, for which the currently
         set file name generator is used.
@@ -113,6 +122,10 @@ class Data(h5py.File):
         kwargs:
             name (string) : default is 'data' (%timemark is interpreted as
             its timemark)
+            swmr (bool) : if True the file is created with libver='latest'
+            such that it can be switched to single-writer/multiple-reader
+            mode (see start_swmr). Such files can not be read with HDF5
+            versions older than 1.10.
         """
         # FIXME: the name generation here is a bit nasty
         # name = data.Data._data_list.new_item_name(self, name)
@@ -133,8 +146,417 @@ class Data(h5py.File):
         self.folder, self._filename = os.path.split(self.filepath)
         if not os.path.isdir(self.folder):
             os.makedirs(self.folder)
-        super(Data, self).__init__(self.filepath, 'a')
+        if swmr:
+            super(Data, self).__init__(self.filepath, 'a', libver='latest')
+        else:
+            super(Data, self).__init__(self.filepath, 'a')
+        self.flush()
+        self._add_to_timestamp_index()
+
+    def stop_swmr(self, timeout=10):
+        '''
+        Ends SWMR mode by reopening the file, such that groups, datasets
+        and attributes can be created again. Objects of the file opened
+        before (e.g. datasets) are closed.
+
+        The file is reopened right away, this does not wait for the SWMR
+        readers: readers have to close the file once reader.finished is
+        True, the data written after reopening (e.g. the metadata saved by
+        MeasurementControl) is not written in SWMR mode and can not be read
+        safely. If the file can not be opened (e.g. it is locked by another
+        process) opening is retried for at most timeout seconds.
+        '''
+        self.close()
+        t0 = time.time()
+        while True:
+            try:
+                super(Data, self).__init__(self.filepath, 'a')
+                return
+            except OSError:
+                # the file is locked by a reader
+                if time.time() - t0 > timeout:
+                    raise
+                time.sleep(0.01)
+
+    def _add_to_timestamp_index(self):
+        '''
+        Adds the new measurement to the timestamp index of the datadir
+        used by the analysis toolbox to look up data.
+        '''
+        if qc_config['datadir'] is None:
+            return
+        try:
+            from pycqed.analysis.tools.file_handling import \
+                get_timestamp_index
+            get_timestamp_index(qc_config['datadir'],
+                                refresh=False).add(self.filepath)
+        except Exception as e:
+            logging.warning('Could not add "{}" to the timestamp index: '
+                            '{}'.format(self.filepath, e))
+
+
+def _row_counter_name(dset_name):
+    return dset_name + '_nr_rows'
+
+
+def start_swmr(dset):
+    '''
+    Switches the file of dset (created with libver='latest', see Data) to
+    single-writer/multiple-reader mode such that the data can be read
+    while it is written, see SWMRDataReader.
+
+    A dataset holding the number of rows of dset that are written and
+    whether writing finished is created next to dset. Readers use it to
+    ignore rows that are allocated but not written yet. No groups,
+    datasets or attributes can be created in SWMR mode.
+    '''
+    dset.parent.create_dataset(_row_counter_name(dset.name), data=[0, 0],
+                               dtype='i8')
+    dset.file.swmr_mode = True
+
+
+def publish_rows(dset, nr_rows, finished=False):
+    '''
+    Makes the first nr_rows of a dataset in SWMR mode visible to readers,
+    finished signals the readers that no more rows will be written.
+    '''
+    dset.flush()
+    row_counter = dset.parent[_row_counter_name(dset.name)]
+    row_counter[:] = [nr_rows, finished]
+    row_counter.flush()
+
+
+class SWMRDataReader:
+    '''
+    Read-only access to a dataset of rows in a file that is being written
+    in SWMR mode, e.g. the data of a running measurement
+    (MeasurementControl.swmr_datasaving):
+
+        with SWMRDataReader(filepath) as reader:
+            while not reader.finished:
+                data = reader.read()
+
+    read returns the rows written so far, the rows that are allocated but
+    not written yet are not returned. Files that are not written in SWMR
+    mode can be read as well, all rows are returned.
+    The file has to be closed once finished is True: the writer then
+    reopens the file without SWMR to save other data (see Data.stop_swmr),
+    which is not safe to read while it is written.
+    '''
+
+    def __init__(self, filepath, dataset='Experimental Data/Data'):
+        self.filepath = filepath
+        self.file = h5py.File(filepath, 'r', libver='latest', swmr=True)
+        self.dset = self.file[dataset]
+        self._row_counter = self.file.get(_row_counter_name(dataset))
+        self.column_names = [
+            n.decode('utf-8') if isinstance(n, bytes) else n
+            for n in self.dset.attrs.get('column_names', [])]
+
+    @property
+    def nr_rows(self):
+        '''
+        Number of rows written so far.
+        '''
+        self.dset.refresh()
+        if self._row_counter is None:
+            return self.dset.shape[0]
+        self._row_counter.refresh()
+        return min(int(self._row_counter[0]), self.dset.shape[0])
+
+    @property
+    def finished(self):
+        '''
+        True if the writer finished writing the dataset.
+        '''
+        if self._row_counter is None:
+            return True
+        self._row_counter.refresh()
+        return bool(self._row_counter[1])
+
+    def read(self, start=0):
+        '''
+        Returns the rows written so far, starting from row start.
+        '''
+        nr_rows = self.nr_rows
+        return self.dset[start:max(nr_rows, start)]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BufferedDataWriter:
+    '''
+    Writes rows of data to a resizable 2D h5py dataset in chunks.
+
+    Rows are collected in a numpy buffer and written to the dataset every
+    "buffer_size" rows or "flush_interval" seconds, whichever comes first,
+    and when the writer is closed. If the number of rows is known in
+    advance the dataset is allocated once, otherwise it is grown
+    geometrically. On close the dataset is trimmed to the rows written.
+    '''
+
+    def __init__(self, dset, nr_rows=None, buffer_size=100,
+                 flush_interval=1, swmr=False):
+        '''
+        Args:
+            dset (h5py.Dataset): resizable dataset of shape (n, nr_cols)
+            nr_rows (int): expected number of rows, if None (e.g. for
+                adaptive measurements) the dataset grows geometrically.
+            buffer_size (int): number of rows buffered before writing
+            flush_interval (float): max time (s) data stays in the buffer
+            swmr (bool): if True the written rows are published to the
+                readers of the file in SWMR mode (see start_swmr)
+        '''
+        self.dset = dset
+        self.nr_cols = dset.shape[1]
+        self.buffer_size = int(max(buffer_size, 1))
+        self.flush_interval = flush_interval
+
+        self._buffer = np.empty((self.buffer_size, self.nr_cols))
+        self._nr_buffered = 0
+        self._nr_flushed = dset.shape[0]
+        self._flush_time = time.time()
+        self.last_row = None
+        self.swmr = swmr
+
+        if nr_rows is not None:
+            self.allocate(nr_rows)
+
+    @property
+    def nr_rows(self):
+        '''
+        Number of rows written to the writer (including buffered rows).
+        '''
+        return self._nr_flushed + self._nr_buffered
+
+    def allocate(self, nr_rows):
+        '''
+        Resizes the dataset such that it can hold at least nr_rows.
+        '''
+        if nr_rows > self.dset.shape[0]:
+            self.dset.resize((nr_rows, self.nr_cols))
+
+    def append(self, row):
+        '''
+        Adds a single row of data, flushes if the buffer is full or if
+        the flush_interval has passed.
+        '''
+        self._buffer[self._nr_buffered] = row
+        # view on the buffer, stays valid until the next row is appended
+        self.last_row = self._buffer[self._nr_buffered]
+        self._nr_buffered += 1
+        if (self._nr_buffered == self.buffer_size or
+                time.time() - self._flush_time > self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the buffered rows to the dataset.
+        '''
+        if self._nr_buffered > 0:
+            start_idx = self._nr_flushed
+            stop_idx = start_idx + self._nr_buffered
+            if stop_idx > self.dset.shape[0]:
+                # Geometric growth when the number of rows is unknown
+                self.allocate(max(stop_idx, 2*self.dset.shape[0]))
+            self.dset[start_idx:stop_idx, :] = \
+                self._buffer[:self._nr_buffered]
+            self._nr_flushed = stop_idx
+            self._nr_buffered = 0
+            if self.swmr:
+                publish_rows(self.dset, stop_idx)
+        self._flush_time = time.time()
+
+    def close(self):
+        '''
+        Flushes the buffer and trims the dataset to the written rows.
+        '''
         self.flush()
+        if self.dset.shape[0] != self._nr_flushed:
+            self.dset.resize((self._nr_flushed, self.nr_cols))
+            if self.swmr:
+                self.dset.flush()
+
+
+class ThreadedDataWriter:
+    '''
+    Writes rows of data to a resizable 2D h5py dataset from a separate
+    writer thread, such that disk latency does not add to the time spent
+    acquiring data.
+
+    Rows are put in a bounded queue that is drained by the writer thread
+    into a BufferedDataWriter. When the queue is full append blocks until
+    the writer thread has caught up (back-pressure). Exceptions raised in
+    the writer thread are re-raised on the next call to append, flush or
+    close. Supports the same interface as the BufferedDataWriter.
+    '''
+    _FLUSH = 'flush'
+    _STOP = 'stop'
+
+    def __init__(self, dset, nr_rows=None, buffer_size=100,
+                 flush_interval=1, queue_size=10000, swmr=False):
+        '''
+        Args:
+            dset (h5py.Dataset): resizable dataset of shape (n, nr_cols)
+            nr_rows (int): expected number of rows, if None (e.g. for
+                adaptive measurements) the dataset grows geometrically.
+            buffer_size (int): number of rows buffered before writing
+            flush_interval (float): max time (s) data stays in the buffer
+            queue_size (int): max number of rows waiting in the queue
+            swmr (bool): if True the written rows are published to the
+                readers of the file in SWMR mode (see start_swmr)
+        '''
+        self.dset = dset
+        self.flush_interval = flush_interval
+        self._writer = BufferedDataWriter(
+            dset, nr_rows=nr_rows, buffer_size=buffer_size,
+            flush_interval=flush_interval, swmr=swmr)
+        self._nr_rows = self._writer.nr_rows
+        self.last_row = None
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._exception = None
+        self._failed = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='ThreadedDataWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def nr_rows(self):
+        '''
+        Number of rows written to the writer (including queued rows).
+        '''
+        return self._nr_rows
+
+    def append(self, row):
+        '''
+        Puts a single row of data in the write queue, blocks if the queue
+        is full.
+        '''
+        self._raise_writer_exception()
+        # copy, the caller is free to reuse the row
+        row = np.array(row, dtype=float)
+        self.last_row = row
+        self._nr_rows += 1
+        self._queue.put(row)
+
+    def flush(self):
+        '''
+        Blocks until all queued rows are written to the dataset.
+        '''
+        self._raise_writer_exception()
+        if self._thread.is_alive():
+            self._queue.put(self._FLUSH)
+            self._queue.join()
+        self._raise_writer_exception()
+
+    def close(self):
+        '''
+        Writes all queued rows, trims the dataset and stops the thread.
+        '''
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._raise_writer_exception()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._write(self._writer.flush)
+                continue
+            try:
+                if item is self._STOP:
+                    self._write(self._writer.close)
+                    return
+                elif item is self._FLUSH:
+                    self._write(self._writer.flush)
+                else:
+                    self._write(self._writer.append, item)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, func, *args):
+        # After a failure the queue is still drained to prevent deadlocks
+        if not self._failed:
+            try:
+                func(*args)
+            except Exception as e:
+                self._failed = True
+                self._exception = e
+
+    def _raise_writer_exception(self):
+        if self._exception is not None:
+            e, self._exception = self._exception, None
+            raise e
+
+
+# Compression filters of the data dataset as h5py create_dataset arguments.
+# The shuffle filter groups the bytes of the values, which improves the
+# compression of low-entropy data such as single-shot readout values.
+compression_filters = {
+    None: {},
+    'gzip': {'compression': 'gzip'},
+    'lzf': {'compression': 'lzf'},
+    'shuffle+gzip': {'compression': 'gzip', 'shuffle': True},
+    'shuffle+lzf': {'compression': 'lzf', 'shuffle': True},
+}
+
+# Size of the chunks chosen by auto_chunk_shape (bytes)
+default_chunk_size = 2**17
+
+
+def auto_chunk_shape(nr_rows, nr_cols, dtype, chunk_size=default_chunk_size):
+    '''
+    Returns the chunk shape (rows, nr_cols) of a dataset of rows of data,
+    chunks are about chunk_size bytes and not longer than the expected
+    number of rows (nr_rows, None if not known).
+    '''
+    chunk_rows = max(chunk_size // (nr_cols*np.dtype(dtype).itemsize), 1)
+    if nr_rows:
+        chunk_rows = min(chunk_rows, nr_rows)
+    return (int(chunk_rows), nr_cols)
+
+
+def create_data_dataset(group, name, nr_cols, nr_rows=None, dtype='f4',
+                        chunks=None, compression=None):
+    '''
+    Creates an empty resizable dataset of shape (0, nr_cols) to which rows
+    of data are appended.
+
+    Args:
+        group (h5py.Group): group to create the dataset in
+        name (str): name of the dataset
+        nr_cols (int): number of columns
+        nr_rows (int): expected number of rows, used to pick the chunk
+            shape, None if not known
+        dtype: data type of all columns, e.g. 'f8', 'f4' or 'i2' for raw
+            shots. Values are cast when written, integer types only
+            store integer values within their range.
+        chunks: None for the shape picked by auto_chunk_shape, the number
+            of rows per chunk or a chunk shape (rows, nr_cols)
+        compression (str): one of the compression_filters, None for no
+            compression
+    '''
+    if compression not in compression_filters:
+        raise ValueError('Compression "{}" not in {}'.format(
+            compression, list(compression_filters)))
+    if chunks is None:
+        chunks = auto_chunk_shape(nr_rows, nr_cols, dtype)
+    elif np.isscalar(chunks):
+        chunks = (int(chunks), nr_cols)
+    return group.create_dataset(name, (0, nr_cols), maxshape=(None, nr_cols),
+                                dtype=dtype, chunks=tuple(chunks),
+                                **compression_filters[compression])
 
 
 def encode_to_utf8(s):
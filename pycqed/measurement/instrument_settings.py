@@ -0,0 +1,238 @@
+'''
+Storage of the instrument settings that MeasurementControl saves for
+every run.
+
+The settings are stored in the 'Instrument settings' group of the datafile
+as a structured dataset 'settings' with one row per parameter:
+    instrument, parameter   names of the instrument and the parameter
+    type                    'float', 'int', 'bool', 'str', 'None' or 'repr'
+                            (other values, stored as str(value)), in diffs
+                            'removed' marks a parameter that was removed
+    value                   the value of float, int and bool parameters,
+                            NaN for other types
+    string_value            the value as string (repr for numbers)
+
+If only the differences with respect to an earlier run are stored the
+group has the attribute 'reference_file', the path of the datafile of that
+run relative to the folder of this datafile.
+Older datafiles store every parameter as a string attribute of a group per
+instrument. read_instrument_settings reads both formats.
+'''
+import os
+from collections import OrderedDict
+import h5py
+import numpy as np
+
+_str_dtype = h5py.special_dtype(vlen=str)
+settings_dtype = np.dtype([('instrument', _str_dtype),
+                           ('parameter', _str_dtype),
+                           ('type', _str_dtype),
+                           ('value', np.float64),
+                           ('string_value', _str_dtype)])
+
+
+def encode_value(value):
+    '''
+    Returns the (type, value, string_value) of a parameter value.
+    '''
+    if value is None:
+        return 'None', np.nan, ''
+    elif isinstance(value, (bool, np.bool_)):
+        return 'bool', float(value), repr(bool(value))
+    elif isinstance(value, (int, np.integer)):
+        return 'int', float(value), repr(int(value))
+    elif isinstance(value, (float, np.floating)):
+        return 'float', float(value), repr(float(value))
+    elif isinstance(value, str):
+        return 'str', np.nan, value
+    else:
+        return 'repr', np.nan, str(value)
+
+
+def decode_value(value_type, value, string_value):
+    '''
+    Inverse of encode_value, values of type 'repr' are returned as string.
+    '''
+    if value_type == 'None':
+        return None
+    elif value_type == 'bool':
+        return string_value == 'True'
+    elif value_type == 'int':
+        return int(string_value)
+    elif value_type == 'float':
+        return float(value)
+    return string_value
+
+
+def _to_str(s):
+    return s.decode('utf-8') if isinstance(s, bytes) else s
+
+
+class _RemovedParameter:
+    def __repr__(self):
+        return 'removed_parameter'
+
+
+# Marks parameters that are removed with respect to the reference settings
+removed_parameter = _RemovedParameter()
+
+
+def get_station_settings(station, update=False):
+    '''
+    Returns the settings of the components of a station as an OrderedDict
+    {instrument name: OrderedDict {parameter name: value}}, sorted by name.
+
+    If update is False the values are the latest values stored in the
+    parameters (get_latest), no instruments are queried. If update is True
+    the snapshot of every instrument is updated.
+    '''
+    settings = OrderedDict()
+    for ins_name, ins in sorted(station.components.items()):
+        if not update and hasattr(ins, 'parameters'):
+            pars = ((p_name, par.get_latest())
+                    for p_name, par in ins.parameters.items())
+        else:
+            par_snap = ins.snapshot(update=update)['parameters']
+            pars = ((p_name, p.get('value', ''))
+                    for p_name, p in par_snap.items())
+        settings[ins_name] = OrderedDict(sorted(pars))
+    return settings
+
+
+def diff_settings(settings, reference_settings):
+    '''
+    Returns the settings that differ from the reference_settings, removed
+    parameters are included with the value removed_parameter.
+    '''
+    diff = OrderedDict()
+    for ins_name in set(settings) | set(reference_settings):
+        pars = settings.get(ins_name, {})
+        ref_pars = reference_settings.get(ins_name, {})
+        ins_diff = OrderedDict()
+        for p_name, val in pars.items():
+            # compares the type and string value such that NaN equals NaN
+            if (p_name not in ref_pars or encode_value(val)[::2] !=
+                    encode_value(ref_pars[p_name])[::2]):
+                ins_diff[p_name] = val
+        for p_name in ref_pars:
+            if p_name not in pars:
+                ins_diff[p_name] = removed_parameter
+        if ins_diff:
+            diff[ins_name] = ins_diff
+    return OrderedDict(sorted(diff.items()))
+
+
+def write_instrument_settings(data_file, settings, reference_file=None):
+    '''
+    Writes the settings to the 'Instrument settings' group of data_file.
+    If reference_file (path of a datafile) is specified the settings should
+    only contain the differences with respect to that file.
+    '''
+    rows = []
+    for ins_name, pars in settings.items():
+        for p_name, val in pars.items():
+            if val is removed_parameter:
+                rows.append((ins_name, p_name, 'removed', np.nan, ''))
+            else:
+                rows.append((ins_name, p_name) + encode_value(val))
+    set_grp = data_file.create_group('Instrument settings')
+    set_grp.create_dataset('settings', data=np.array(rows,
+                                                     dtype=settings_dtype))
+    if reference_file is not None:
+        set_grp.attrs['reference_file'] = os.path.relpath(
+            reference_file, os.path.dirname(os.path.abspath(
+                data_file.filename)))
+    return set_grp
+
+
+def read_instrument_settings(data_file):
+    '''
+    Returns the full instrument settings saved in a datafile (h5py File or
+    filepath) as an OrderedDict {instrument name: OrderedDict {parameter
+    name: value}}. Settings stored as differences are applied to the
+    settings of the reference file.
+
+    Raises a KeyError if the file has no instrument settings.
+    '''
+    if isinstance(data_file, str):
+        with h5py.File(data_file, 'r') as f:
+            return read_instrument_settings(f)
+
+    set_grp = data_file['Instrument settings']
+    if 'settings' not in set_grp:
+        # String attributes per instrument (older datafiles)
+        return OrderedDict(
+            (ins_name, OrderedDict((p_name, _to_str(val)) for p_name, val
+                                   in set_grp[ins_name].attrs.items()))
+            for ins_name in set_grp.keys())
+
+    if 'reference_file' in set_grp.attrs:
+        reference_file = os.path.join(
+            os.path.dirname(os.path.abspath(data_file.filename)),
+            _to_str(set_grp.attrs['reference_file']))
+        settings = read_instrument_settings(reference_file)
+    else:
+        settings = OrderedDict()
+    for row in set_grp['settings'][()]:
+        ins_name, p_name, value_type, value, string_value = (
+            _to_str(row['instrument']), _to_str(row['parameter']),
+            _to_str(row['type']), row['value'], _to_str(row['string_value']))
+        if value_type == 'removed':
+            pars = settings.get(ins_name, {})
+            pars.pop(p_name, None)
+            if len(pars) == 0:
+                # all parameters removed, the instrument was removed
+                settings.pop(ins_name, None)
+        else:
+            pars = settings.setdefault(ins_name, OrderedDict())
+            pars[p_name] = decode_value(value_type, value, string_value)
+    if 'reference_file' in set_grp.attrs:
+        # sorted by name as written by get_station_settings
+        settings = OrderedDict(
+            (ins_name, OrderedDict(sorted(pars.items())))
+            for ins_name, pars in sorted(settings.items()))
+    return settings
+
+
+class SnapshotCache:
+    '''
+    Saves the instrument settings of a station for a series of runs.
+
+    The settings of the previous run are kept such that only the
+    differences with respect to the previous run have to be written
+    (diff=True). After max_diff_chain consecutive diffs the full settings
+    are written again, such that reading the settings of a file does not
+    require opening a long chain of files.
+    '''
+
+    def __init__(self, max_diff_chain=10):
+        self.max_diff_chain = max_diff_chain
+        self.reset()
+
+    def reset(self):
+        '''
+        Forgets the previous run, the next save writes the full settings.
+        '''
+        self.last_settings = None
+        self.last_filepath = None
+        self.diff_chain_length = 0
+
+    def save(self, data_file, station, update=False, diff=False):
+        '''
+        Writes the settings of the station to data_file (see
+        get_station_settings for update) and returns the settings.
+        '''
+        settings = get_station_settings(station, update=update)
+        if (diff and self.last_settings is not None and
+                self.diff_chain_length < self.max_diff_chain and
+                os.path.isfile(self.last_filepath)):
+            write_instrument_settings(
+                data_file, diff_settings(settings, self.last_settings),
+                reference_file=self.last_filepath)
+            self.diff_chain_length += 1
+        else:
+            write_instrument_settings(data_file, settings)
+            self.diff_chain_length = 0
+        self.last_settings = settings
+        self.last_filepath = os.path.abspath(data_file.filename)
+        return settings
@@ -0,0 +1,405 @@
+'''
+Live plotting of MeasurementControl.
+
+MeasurementControl keeps the data of a measurement in a LivePlotBuffer
+such that the plot monitor does not have to read the data back from the
+hdf5 file. The data is passed to a plot sink, the sink determines where
+the data is plotted:
+    NullPlotSink        does not plot, used by the headless backend
+    PngPlotSink         saves snapshots of the plots as png files
+    PyqtgraphPlotSink   plots in a pyqtgraph remote process, only the rows
+                        that were added since the last update are sent to
+                        the plotting process where append_curve_data adds
+                        them to the curves.
+
+This module is also imported in the (pyqtgraph) plotting process and on
+servers without a display. Qt (pyqtgraph, qcodes QtPlot) and matplotlib
+are therefore only imported when a sink that uses them is created.
+'''
+import os
+import time
+import numpy as np
+
+
+class LivePlotBuffer:
+    '''
+    Append buffer for rows of data.
+
+    The buffer grows geometrically such that appending a row takes
+    constant time on average, independent of the number of rows.
+    '''
+
+    def __init__(self, nr_cols, initial_size=1024):
+        self.nr_cols = nr_cols
+        self._data = np.empty((initial_size, nr_cols))
+        self.nr_rows = 0
+
+    @property
+    def data(self):
+        '''
+        View on the rows in the buffer, stays valid until rows are added.
+        '''
+        return self._data[:self.nr_rows]
+
+    def _reserve(self, nr_rows):
+        if nr_rows > len(self._data):
+            new_data = np.empty((max(nr_rows, 2*len(self._data)),
+                                 self.nr_cols))
+            new_data[:self.nr_rows] = self._data[:self.nr_rows]
+            self._data = new_data
+
+    def append(self, row):
+        '''
+        Adds a single row.
+        '''
+        self._reserve(self.nr_rows + 1)
+        self._data[self.nr_rows] = row
+        self.nr_rows += 1
+
+    def extend(self, rows):
+        '''
+        Adds a 2D array of rows.
+        '''
+        rows = np.asarray(rows)
+        self._reserve(self.nr_rows + len(rows))
+        self._data[self.nr_rows:self.nr_rows+len(rows)] = rows
+        self.nr_rows += len(rows)
+
+    def rows_since(self, start_row):
+        '''
+        Returns the rows added after the first start_row rows.
+        '''
+        return self._data[start_row:self.nr_rows]
+
+
+def append_curve_data(curve, x, y):
+    '''
+    Adds points to a pyqtgraph curve (PlotDataItem).
+
+    Executed in the plotting process, the data of the curve is kept in a
+    LivePlotBuffer attached to the curve such that only the new points
+    have to be sent by MeasurementControl.
+    '''
+    buffer = getattr(curve, '_live_plot_buffer', None)
+    if buffer is None:
+        buffer = LivePlotBuffer(2)
+        curve._live_plot_buffer = buffer
+    buffer.extend(np.column_stack([x, y]))
+    curve.setData(buffer.data[:, 0], buffer.data[:, 1])
+
+
+class PlotSink:
+    '''
+    Base class of the plot sinks of MeasurementControl.
+
+    MeasurementControl calls the initialize_* methods at the start of a
+    measurement and the update_* methods at most once every interval
+    seconds (and at the end of a measurement). The methods of the base
+    class do nothing.
+    '''
+
+    def __init__(self, name='MC', plot_theme=((60, 60, 60), 'w'),
+                 interval=2):
+        self.name = name
+        self.plot_theme = plot_theme
+        self.interval = interval  # s, minimal time between updates
+
+    def new_measurement(self, measurement_name, folder):
+        '''
+        Called at the start of a run, folder is the folder of the datafile.
+        '''
+        pass
+
+    def initialize_1D(self, xlabels, ylabels):
+        '''
+        Creates a curve for every combination of a ylabel (value) and a
+        xlabel (sweep parameter).
+        '''
+        pass
+
+    def update_1D(self, new_rows):
+        '''
+        Adds the data rows (sweep points followed by the values) that were
+        measured since the last update to the curves.
+        '''
+        pass
+
+    def initialize_2D(self, x, y, xlabel, ylabel, zlabels):
+        pass
+
+    def update_2D(self, z):
+        '''
+        z is an (len(y), len(x), len(zlabels)) array, not measured points
+        are NaN.
+        '''
+        pass
+
+    def initialize_adaptive(self, ylabels):
+        pass
+
+    def update_adaptive(self, y):
+        '''
+        y is an (iterations, len(ylabels)) array of all measured values.
+        '''
+        pass
+
+    def finish(self):
+        '''
+        Called at the end of a run, also if the measurement failed.
+        '''
+        pass
+
+    def new_plotmon_window(self, plot_theme=None, interval=None):
+        '''
+        Respawns the plotting windows, sinks without windows only update
+        the settings.
+        '''
+        if plot_theme is not None:
+            self.plot_theme = plot_theme
+        if interval is not None:
+            self.interval = interval
+
+
+class NullPlotSink(PlotSink):
+    '''
+    Discards all data, used by the headless backend.
+    '''
+    pass
+
+
+class PngPlotSink(PlotSink):
+    '''
+    Saves snapshots of the plot monitors as png files, at most once every
+    interval seconds and at the end of every run.
+
+    The files are saved in directory, or in the folder of the datafile if
+    directory is None, as <measurement_name>_<plot>.png where plot is
+    plotmon, plotmon_2D or plotmon_adaptive.
+    Uses the (non interactive) Agg backend of matplotlib, no display is
+    required.
+    '''
+
+    def __init__(self, name='MC', plot_theme=((60, 60, 60), 'w'),
+                 interval=10, directory=None, dpi=80):
+        super().__init__(name=name, plot_theme=plot_theme, interval=interval)
+        self.directory = directory
+        self.dpi = dpi
+        self.filenames = {}
+        self._plots = {}
+        self._time_last_save = 0
+
+    def new_measurement(self, measurement_name, folder):
+        self.measurement_name = measurement_name
+        self.folder = folder if self.directory is None else self.directory
+        self.filenames = {}
+        self._plots = {}
+        self._time_last_save = time.time()
+
+    def initialize_1D(self, xlabels, ylabels):
+        self._plots['plotmon'] = {'xlabels': xlabels, 'ylabels': ylabels,
+                                  'data': LivePlotBuffer(
+                                      len(xlabels)+len(ylabels))}
+
+    def update_1D(self, new_rows):
+        self._plots['plotmon']['data'].extend(new_rows)
+        self._save_if_due()
+
+    def initialize_2D(self, x, y, xlabel, ylabel, zlabels):
+        self._plots['plotmon_2D'] = {'x': x, 'y': y, 'xlabel': xlabel,
+                                     'ylabel': ylabel, 'zlabels': zlabels,
+                                     'z': None}
+
+    def update_2D(self, z):
+        self._plots['plotmon_2D']['z'] = z
+        self._save_if_due()
+
+    def initialize_adaptive(self, ylabels):
+        self._plots['plotmon_adaptive'] = {'ylabels': ylabels, 'y': None}
+
+    def update_adaptive(self, y):
+        self._plots['plotmon_adaptive']['y'] = y
+        self._save_if_due()
+
+    def finish(self):
+        self.save()
+
+    def _save_if_due(self):
+        if time.time() - self._time_last_save > self.interval:
+            self.save()
+
+    def save(self):
+        '''
+        Saves the current state of all plots.
+        '''
+        for plot_name, plot in self._plots.items():
+            filename = os.path.join(self.folder, '{}_{}.png'.format(
+                self.measurement_name, plot_name))
+            fig = getattr(self, '_figure_'+plot_name.split('_')[-1])(plot)
+            # Written to a temporary file first such that a viewer never
+            # reads a partially written snapshot
+            fig.savefig(filename+'.tmp', format='png', dpi=self.dpi,
+                        facecolor=self.plot_theme[1])
+            os.replace(filename+'.tmp', filename)
+            self.filenames[plot_name] = filename
+        self._time_last_save = time.time()
+
+    def _new_figure(self, nr_rows, nr_cols):
+        # matplotlib.figure is used instead of pyplot such that no
+        # interactive backend is loaded
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=(4*nr_cols, 3*nr_rows))
+        FigureCanvasAgg(fig)
+        axs = [[fig.add_subplot(nr_rows, nr_cols, i*nr_cols+j+1)
+                for j in range(nr_cols)] for i in range(nr_rows)]
+        return fig, axs
+
+    def _figure_plotmon(self, plot):
+        xlabels, ylabels = plot['xlabels'], plot['ylabels']
+        data = plot['data'].data
+        fig, axs = self._new_figure(len(ylabels), len(xlabels))
+        for i, ylabel in enumerate(ylabels):
+            for j, xlabel in enumerate(xlabels):
+                ax = axs[i][j]
+                ax.plot(data[:, j], data[:, len(xlabels)+i], 'o-',
+                        markersize=3, color=np.array(self.plot_theme[0])/255)
+                ax.set_xlabel(xlabel)
+                ax.set_ylabel(ylabel)
+        fig.tight_layout()
+        return fig
+
+    def _figure_2D(self, plot):
+        fig, axs = self._new_figure(1, len(plot['zlabels']))
+        for j, zlabel in enumerate(plot['zlabels']):
+            ax = axs[0][j]
+            if plot['z'] is not None:
+                im = ax.imshow(
+                    plot['z'][:, :, j], aspect='auto', origin='lower',
+                    interpolation='nearest', cmap='viridis',
+                    extent=[np.min(plot['x']), np.max(plot['x']),
+                            np.min(plot['y']), np.max(plot['y'])])
+                fig.colorbar(im, ax=ax, label=zlabel)
+            ax.set_xlabel(plot['xlabel'])
+            ax.set_ylabel(plot['ylabel'])
+        fig.tight_layout()
+        return fig
+
+    def _figure_adaptive(self, plot):
+        fig, axs = self._new_figure(len(plot['ylabels']), 1)
+        for j, ylabel in enumerate(plot['ylabels']):
+            ax = axs[j][0]
+            if plot['y'] is not None:
+                ax.plot(plot['y'][:, j], 'o', markersize=3,
+                        color=np.array(self.plot_theme[0])/255)
+            ax.set_xlabel('iteration')
+            ax.set_ylabel(ylabel)
+        fig.tight_layout()
+        return fig
+
+
+class PyqtgraphPlotSink(PlotSink):
+    '''
+    Plots in a pyqtgraph remote process:
+        self.win       : a direct pyqtgraph window used for 1D plots
+        self.QC_QtPlot : the qcodes pyqtgraph window used for 2D and
+                         adaptive plots
+
+    Starting the process takes a few seconds, it is started once when the
+    sink is created and not for every run.
+    '''
+
+    def __init__(self, name='MC', plot_theme=((60, 60, 60), 'w'),
+                 interval=2):
+        super().__init__(name=name, plot_theme=plot_theme, interval=interval)
+        import pyqtgraph as pg
+        import pyqtgraph.multiprocess as pgmp
+        pg.mkQApp()
+        self.proc = pgmp.QtProcess()  # pyqtgraph multiprocessing
+        self.rpg = self.proc._import('pyqtgraph')
+        # Used to send only new data points to the plotting process
+        self.rlive_plotting = self.proc._import(
+            'pycqed.measurement.live_plotting')
+        self.new_plotmon_window()
+
+    def new_plotmon_window(self, plot_theme=None, interval=None):
+        super().new_plotmon_window(plot_theme=plot_theme, interval=interval)
+        from qcodes.plots.pyqtgraph import QtPlot
+        self.win = self.rpg.GraphicsWindow(
+            title='Plot monitor of %s' % self.name)
+        self.win.setBackground(self.plot_theme[1])
+        self.QC_QtPlot = QtPlot(
+            windowTitle='QC-Plot monitor of %s' % self.name,
+            interval=self.interval)
+
+    def initialize_1D(self, xlabels, ylabels):
+        self.win.clear()  # clear out previous data
+        self.nr_sweep_funcs = len(xlabels)
+        self.curves = []
+        for ylab in ylabels:
+            for xlab in xlabels:
+                p = self.win.addPlot(pen=self.plot_theme[0])
+                b_ax = p.getAxis('bottom')
+                p.setLabel('bottom', xlab, pen=self.plot_theme[0])
+                b_ax.setPen(self.plot_theme[0])
+                l_ax = p.getAxis('left')
+                l_ax.setPen(self.plot_theme[0])
+                p.setLabel('left', ylab, pen=self.plot_theme[0])
+                c = p.plot(symbol='o', symbolSize=7, pen=self.plot_theme[0])
+                self.curves.append(c)
+            self.win.nextRow()
+
+    def update_1D(self, new_rows):
+        nr_values = new_rows.shape[1] - self.nr_sweep_funcs
+        i = 0
+        for y_ind in range(nr_values):
+            for x_ind in range(self.nr_sweep_funcs):
+                self.rlive_plotting.append_curve_data(
+                    self.curves[i], new_rows[:, x_ind],
+                    new_rows[:, self.nr_sweep_funcs+y_ind], _callSync='off')
+                i += 1
+
+    def initialize_2D(self, x, y, xlabel, ylabel, zlabels):
+        self.QC_QtPlot.clear()
+        for j, zlabel in enumerate(zlabels):
+            self.QC_QtPlot.add(x=x, y=y,
+                               z=np.full((len(y), len(x)), np.nan),
+                               xlabel=xlabel, ylabel=ylabel, zlabel=zlabel,
+                               subplot=j+1, cmap='viridis')
+
+    def update_2D(self, z):
+        for j in range(z.shape[2]):
+            self.QC_QtPlot.traces[j]['config']['z'] = z[:, :, j]
+        self.QC_QtPlot.update_plot()
+
+    def initialize_adaptive(self, ylabels):
+        self.QC_QtPlot.clear()
+        for j, ylabel in enumerate(ylabels):
+            self.QC_QtPlot.add(x=[0], y=[0], xlabel='iteration',
+                               ylabel=ylabel, subplot=j+1,
+                               symbol='o', symbolSize=5)
+
+    def update_adaptive(self, y):
+        for j in range(y.shape[1]):
+            self.QC_QtPlot.traces[j]['config']['x'] = range(len(y))
+            self.QC_QtPlot.traces[j]['config']['y'] = y[:, j]
+        self.QC_QtPlot.update_plot()
+
+
+plot_sinks = {'headless': NullPlotSink,
+              'png': PngPlotSink,
+              'pyqtgraph': PyqtgraphPlotSink}
+
+
+def create_plot_sink(backend, **kw):
+    '''
+    Returns a plot sink for the backend ('headless', 'png' or 'pyqtgraph'),
+    a PlotSink instance is returned as is. Keywords are passed to the sink.
+    '''
+    if isinstance(backend, PlotSink):
+        return backend
+    try:
+        sink_class = plot_sinks[backend]
+    except KeyError:
+        raise ValueError('Plot backend "{}" not recognized, use one of {}'
+                         .format(backend, sorted(plot_sinks)))
+    return sink_class(**kw)
@@ -2,7 +2,6 @@
 Module containing functions that wrap a QCodes parameter into a sweep or
 detector function
 '''
-import qcodes as qc
 from pycqed.measurement import sweep_functions as swf
 from pycqed.measurement import detector_functions as det
 import time
@@ -62,6 +61,9 @@ def wrap_func_to_det(func, name, value_names, units, control='soft',  **kw):
     return detector_function
 
 def wrap_par_remainder(par, remainder=1):
+    # qcodes is imported here such that MeasurementControl can be used
+    # without qcodes (e.g. in the headless tests)
+    import qcodes as qc
     new_par = qc.Parameter(name=par.name, label=par.label, units=par.units)
     def wrap_set(val):
         val = val % remainder
@@ -71,6 +73,7 @@ def wrap_par_remainder(par, remainder=1):
     return new_par
 
 def wrap_par_set_get(par):
+    import qcodes as qc
     new_par = qc.Parameter(name=par.name, label=par.label, units=par.units)
     def wrap_set(val):
         par.set(val)
@@ -3,13 +3,13 @@ import logging
 import time
 import sys
 import numpy as np
-import pyqtgraph as pg
-import pyqtgraph.multiprocess as pgmp
 from scipy.optimize import fmin_powell
 from pycqed.measurement import hdf5_data as h5d
+from pycqed.measurement.live_plotting import LivePlotBuffer, create_plot_sink
+from pycqed.measurement.profiling import SpanProfiler, histogram_bin_edges
+from pycqed.measurement.instrument_settings import SnapshotCache
 from pycqed.utilities import general
 from pycqed.utilities.general import dict_to_ordered_tuples
-from qcodes.plots.pyqtgraph import QtPlot
 
 # Used for auto qcodes parameter wrapping
 from pycqed.measurement import sweep_functions as swf
@@ -22,22 +22,61 @@ class MeasurementControl:
     '''
     New version of Measurement Control that allows for adaptively determining
     data points.
+
+    plot_backend determines where the live plots are shown:
+        'pyqtgraph' : plot monitor windows in a pyqtgraph remote process
+        'png'       : png snapshots saved next to the datafile
+        'headless'  : no plotting, Qt is not imported and no plotting
+                      process is started (e.g. for servers without display)
+    or a PlotSink instance (see pycqed.measurement.live_plotting).
     '''
     def __init__(self, name, plot_theme=((60, 60, 60), 'w'),
-                 plotting_interval=2, **kw):
+                 plotting_interval=2, data_buffer_size=100,
+                 data_flush_interval=1, threaded_datasaving=False,
+                 plot_backend='pyqtgraph', **kw):
         self.name = name
 
         self.verbose = True  # enables printing of the start message
-        # starting the process for the pyqtgraph plotting
-        # You do not want a new process to be created every time you start a
-        # run. This can be removed when I replace my custom process with the
-        # pyqtgraph one.
-        pg.mkQApp()
-        self.proc = pgmp.QtProcess()  # pyqtgraph multiprocessing
-        self.rpg = self.proc._import('pyqtgraph')
-        self.new_plotmon_window(plot_theme=plot_theme,
-                                interval=plotting_interval)
+        # The pyqtgraph sink starts its plotting process here such that a
+        # new process is not created every time you start a run.
+        self.plot_sink = create_plot_sink(plot_backend, name=name,
+                                          plot_theme=plot_theme,
+                                          interval=plotting_interval)
         self.live_plot_enabled = True
+        # If True the time spent in the parts of the measurement loop is
+        # recorded, see last_run_profile
+        self.profiler = SpanProfiler()
+        self.profiling_enabled = False
+        self._last_run_profile = {}
+
+        # Instrument settings are saved using the latest known values of the
+        # parameters unless snapshot_update is True (queries the
+        # instruments). If store_settings_diff is True only the settings
+        # that changed since the previous run are saved.
+        self.snapshot_cache = SnapshotCache()
+        self.snapshot_update = False
+        self.store_settings_diff = False
+
+        # Settings of the buffered writer used for soft measurements
+        self.data_buffer_size = data_buffer_size  # rows
+        self.data_flush_interval = data_flush_interval  # s
+        # If True data is written to disk from a separate thread
+        self.threaded_datasaving = threaded_datasaving
+        # If True the datafile is written in single-writer/multiple-reader
+        # mode such that the data can be read while measuring, see
+        # h5d.SWMRDataReader, readers have to close the file once the
+        # reader is finished
+        self.swmr_datasaving = False
+        self.data_writer = None
+        # Number of rows written by hard measurements to the preallocated
+        # dataset, None for other measurements
+        self.nr_hard_rows = None
+        # Storage of the "Experimental Data/Data" dataset, see
+        # h5d.create_data_dataset. Can be changed for a single run with
+        # the keyword arguments of run.
+        self.data_dtype = 'f4'
+        self.data_chunks = None  # chosen from the expected nr of rows
+        self.data_compression = None
 
     ##############################################
     # Functions used to control the measurements #
@@ -46,11 +85,18 @@ class MeasurementControl:
     def run(self, name=None, mode='1D', **kw):
         '''
         Core of the Measurement control.
+
+        The storage of the data of this run can be set with the keyword
+        arguments data_dtype (e.g. 'f4' or 'i2' for raw shots), data_chunks
+        and data_compression (e.g. 'shuffle+lzf'), see
+        h5d.create_data_dataset. The attributes of the same name are used
+        if these are not specified.
         '''
         self.set_measurement_name(name)
         self.print_measurement_start_msg()
         self.mode = mode
-        with h5d.Data(name=self.get_measurement_name()) as self.data_object:
+        with h5d.Data(name=self.get_measurement_name(),
+                      swmr=self.swmr_datasaving) as self.data_object:
             self.get_measurement_begintime()
             #Commented out because requires git shell interaction from python
             # self.get_git_hash()
@@ -58,29 +104,69 @@ class MeasurementControl:
             # (might want to overwrite again at the end)
             self.save_instrument_settings(self.data_object)
 
-            self.create_experimentaldata_dataset()
-            if self.mode == '1D':
-                self.measure()
-            elif self.mode == '2D':
-                self.measure_2D()
-            elif self.mode == 'adaptive':
-                self.measure_soft_adaptive()
-            else:
-                raise ValueError('mode %s not recognized' % self.mode)
+            self.create_experimentaldata_dataset(
+                dtype=kw.pop('data_dtype', self.data_dtype),
+                chunks=kw.pop('data_chunks', self.data_chunks),
+                compression=kw.pop('data_compression',
+                                   self.data_compression))
+            self.nr_hard_rows = None
+            # In memory copy of the data used by the plot monitors
+            self.plotmon_buffer = LivePlotBuffer(self.dset.shape[1])
+            self.plot_sink.new_measurement(self.get_measurement_name(),
+                                           self.data_object.folder)
+            self.profiler.reset()
+            self.profiler.enabled = self.profiling_enabled
+            try:
+                if self.mode == '1D':
+                    self.measure()
+                elif self.mode == '2D':
+                    self.measure_2D()
+                elif self.mode == 'adaptive':
+                    self.measure_soft_adaptive()
+                else:
+                    raise ValueError('mode %s not recognized' % self.mode)
+            finally:
+                # Ensures buffered data is saved if the measurement fails
+                if self.data_writer is not None:
+                    self.data_writer.close()
+                    self.data_writer = None
+                # Removes the preallocated rows that were not measured
+                if (self.nr_hard_rows is not None and
+                        self.dset.shape[0] != self.nr_hard_rows):
+                    self.dset.resize((self.nr_hard_rows, self.dset.shape[1]))
+                if self.data_object.swmr_mode:
+                    h5d.publish_rows(self.dset, self.dset.shape[0],
+                                     finished=True)
+                if self.live_plot_enabled:
+                    self.plot_sink.finish()
             result = self.dset[()]
+            if self.data_object.swmr_mode:
+                # Such that the metadata can be saved
+                self.data_object.stop_swmr()
+                self.dset = self.data_object['Experimental Data']['Data']
             self.save_MC_metadata(self.data_object) # timing labels etc
+            self._last_run_profile = self.profiler.profile()
+            if self.profiling_enabled:
+                self.save_MC_timing(self.data_object)
         return result
 
     def measure(self, *kw):
+        self.start_swmr()
         if self.live_plot_enabled:
             self.initialize_plot_monitor()
 
-        for sweep_function in self.sweep_functions:
-            sweep_function.prepare()
+        if self.sweep_functions[0].sweep_control == 'hard':
+            # Sets the sweep points of the hard sweep functions to the
+            # points of the first block before these are prepared
+            self.get_hard_sweep_blocks()
+        with self.profiler.span('sweep_prepare'):
+            for sweep_function in self.sweep_functions:
+                sweep_function.prepare()
 
         if (self.sweep_functions[0].sweep_control == 'soft' and
                 self.detector_function.detector_control == 'soft'):
-            self.detector_function.prepare()
+            with self.profiler.span('detector_prepare'):
+                self.detector_function.prepare()
             self.get_measurement_preparetime()
             self.measure_soft_static()
         elif (self.sweep_functions[0].sweep_control == 'soft' and
@@ -90,36 +176,16 @@ class MeasurementControl:
             data in chunks, the detector function needs to take care of
             going over all the sweep points by using all that are specified
             """
-            self.detector_function.prepare(
-                sweep_points=self.get_sweep_points())
+            with self.profiler.span('detector_prepare'):
+                self.detector_function.prepare(
+                    sweep_points=self.get_sweep_points())
             self.get_measurement_preparetime()
+            self.preallocate_hard_dataset(self.get_sweep_points())
             # self.complete gets updated in self.print_progress_static_hard
-            self.complete = False
             while not self.complete:
                 self.measure_hard()
         elif self.sweep_functions[0].sweep_control == 'hard':
-            self.iteration = 0
-            if len(self.sweep_functions) == 1:
-                self.detector_function.prepare(
-                    sweep_points=self.get_sweep_points())
-                self.get_measurement_preparetime()
-                self.measure_hard()
-            elif len(self.sweep_functions) == 2:
-                self.complete = False
-                self.get_measurement_preparetime()
-                for j in range(self.ylen):
-                    # added specifically for 2D hard sweeps
-                    if not self.complete:
-                        for i, sweep_function in enumerate(self.sweep_functions):
-                            x = self.get_sweep_points()[
-                                int(self.iteration*self.xlen)]
-                            if i != 0:
-                                sweep_function.set_parameter(x[i])
-                        self.detector_function.prepare(
-                            sweep_points=self.get_sweep_points()[0: self.xlen, 0])
-                        self.measure_hard()
-            else:
-                raise Exception('hard measurements have not been generalized to N-D yet')
+            self.measure_hard_sweeps()
         else:
             raise Exception('Sweep and Detector functions not of the same type.'
                             + 'Aborting measurement')
@@ -135,9 +201,11 @@ class MeasurementControl:
         return
 
     def measure_soft_static(self):
+        self.create_data_writer(nr_rows=len(self.sweep_points))
         for i, sweep_point in enumerate(self.sweep_points):
             self.measurement_function(sweep_point)
-            self.print_progress_static_soft_sweep(i)
+            with self.profiler.span('print_progress'):
+                self.print_progress_static_soft_sweep(i)
 
     def measure_soft_adaptive(self, method=None):
         '''
@@ -145,21 +213,33 @@ class MeasurementControl:
         specified in self.af_pars()
         '''
         self.save_optimization_settings()
+        self.start_swmr()
         adaptive_function = self.af_pars.pop('adaptive_function')
 
         self.initialize_plot_monitor()
         self.initialize_plot_monitor_adaptive()
-        for sweep_function in self.sweep_functions:
-            sweep_function.prepare()
-        self.detector_function.prepare()
+        if self.batch_evaluation:
+            optimization_function = self.batch_optimization_function
+        else:
+            optimization_function = self.optimization_function
+        # Hard sweeps are prepared for every batch of points
+        if not (self.batch_evaluation and
+                self.sweep_functions[0].sweep_control == 'hard'):
+            with self.profiler.span('sweep_prepare'):
+                for sweep_function in self.sweep_functions:
+                    sweep_function.prepare()
+            with self.profiler.span('detector_prepare'):
+                self.detector_function.prepare()
         self.get_measurement_preparetime()
+        # Number of points is not known, the dataset grows geometrically
+        self.create_data_writer()
 
         if adaptive_function == 'Powell':
             adaptive_function = fmin_powell
         if (isinstance(adaptive_function, types.FunctionType) or
                 isinstance(adaptive_function, np.ufunc)):
             try:
-                adaptive_function(self.optimization_function, **self.af_pars)
+                adaptive_function(optimization_function, **self.af_pars)
             except StopIteration:
                 print('Reached f_termination: %s' % (self.f_termination))
         else:
@@ -176,61 +256,164 @@ class MeasurementControl:
             self.endtime-self.begintime))
         return
 
+    def measure_hard_sweeps(self):
+        '''
+        Measures a sweep of one or more hard sweep functions, optionally
+        combined with (outer) soft sweep functions.
+
+        The sweep points are divided into blocks of consecutive points that
+        have the same soft sweep point (see get_hard_sweep_blocks). For
+        every block the soft sweep functions are set and the detector
+        acquires the data of the hard sweep points of the block. The hard
+        sweep functions are only prepared again (e.g. a sequence is
+        uploaded) if the hard sweep points differ from the previous block.
+        '''
+        self.preallocate_hard_dataset(self.hard_sweep_points)
+        nr_hard = self.nr_hard_sweep_functions
+        prepared_points = self.hard_sweep_blocks[0][2]
+        try:
+            for i, (start_idx, stop_idx, hard_points) in enumerate(
+                    self.hard_sweep_blocks):
+                # outer soft sweep points are set first, as in
+                # measurement_function
+                with self.profiler.span('set_parameter'):
+                    for j in range(len(self.sweep_functions)-1, nr_hard-1,
+                                   -1):
+                        self.sweep_functions[j].set_parameter(
+                            self.hard_sweep_points[start_idx, j])
+                if not np.array_equal(hard_points, prepared_points):
+                    self.set_hard_sweep_points(hard_points)
+                    with self.profiler.span('sweep_prepare'):
+                        for sweep_function in self.sweep_functions[:nr_hard]:
+                            sweep_function.prepare()
+                    prepared_points = hard_points
+                with self.profiler.span('detector_prepare'):
+                    self.detector_function.prepare(sweep_points=hard_points)
+                if i == 0:
+                    self.get_measurement_preparetime()
+                self.measure_hard()
+        finally:
+            if len(self.sweep_functions) > 1:
+                self.sweep_functions[0].sweep_points = self.hard_sweep_points
+
+    def get_hard_sweep_blocks(self):
+        '''
+        Divides the sweep points of a hard measurement in blocks that
+        are measured with a single hard acquisition.
+
+        The first sweep functions have to be hard sweep functions, the
+        remaining (outer) sweep functions have to be soft. A block consists
+        of consecutive sweep points with the same soft sweep point.
+
+        Sets:
+            self.nr_hard_sweep_functions
+            self.hard_sweep_points: all sweep points
+            self.hard_sweep_blocks: list of (start_idx, stop_idx,
+                hard_points) tuples, hard_points is a 1D array if there is
+                one hard sweep function and a (points x sweep functions)
+                array otherwise
+        '''
+        sweep_points = self.get_sweep_points()
+        controls = [s.sweep_control for s in self.sweep_functions]
+        nr_hard = controls.index('soft') if 'soft' in controls else \
+            len(controls)
+        if 'hard' in controls[nr_hard:]:
+            raise ValueError('Hard sweep functions have to be specified '
+                             'before the soft sweep functions.')
+        self.nr_hard_sweep_functions = nr_hard
+        self.hard_sweep_points = sweep_points
+        if len(self.sweep_functions) == 1:
+            self.hard_sweep_blocks = [(0, len(sweep_points), sweep_points)]
+            return self.hard_sweep_blocks
+
+        sweep_points = np.array(sweep_points).reshape(len(sweep_points), -1)
+        self.hard_sweep_points = sweep_points
+        soft_points = sweep_points[:, nr_hard:]
+        block_edges = [0] + list(np.nonzero(np.any(
+            soft_points[1:] != soft_points[:-1], axis=1))[0] + 1) + \
+            [len(sweep_points)]
+        self.hard_sweep_blocks = []
+        for start_idx, stop_idx in zip(block_edges[:-1], block_edges[1:]):
+            hard_points = sweep_points[start_idx:stop_idx, :nr_hard]
+            if nr_hard == 1:
+                hard_points = hard_points[:, 0]
+            self.hard_sweep_blocks.append((start_idx, stop_idx, hard_points))
+        self.set_hard_sweep_points(self.hard_sweep_blocks[0][2])
+        return self.hard_sweep_blocks
+
+    def set_hard_sweep_points(self, hard_points):
+        '''
+        Sets the sweep points of the hard sweep functions to the points
+        of a block. The first sweep function gets all hard sweep points
+        (such that it can upload a sequence for all hard sweep dimensions),
+        the other hard sweep functions their own column.
+        '''
+        if len(self.sweep_functions) == 1:
+            return
+        self.sweep_functions[0].sweep_points = hard_points
+        for i in range(1, self.nr_hard_sweep_functions):
+            self.sweep_functions[i].sweep_points = hard_points[:, i]
+
+    def preallocate_hard_dataset(self, sweep_points):
+        '''
+        Resizes the dataset to the number of sweep points and writes the
+        sweep points, the data of the hard measurement is written into the
+        preallocated rows by measure_hard.
+        '''
+        self.nr_hard_rows = 0
+        self.iteration = 0
+        self.complete = False
+        nr_points = len(sweep_points)
+        nr_sweep_funcs = len(self.sweep_functions)
+        self.dset.resize((nr_points, self.dset.shape[1]))
+        sweep_points = np.array(sweep_points)
+        # There are some cases where the sweep points are not specified
+        # (e.g. on-off seq), these are not saved
+        if sweep_points.size == nr_points*nr_sweep_funcs:
+            self.hard_sweep_rows = sweep_points.reshape(
+                nr_points, nr_sweep_funcs)
+            self.dset[:, :nr_sweep_funcs] = self.hard_sweep_rows
+        else:
+            self.hard_sweep_rows = np.zeros((0, nr_sweep_funcs))
+
     def measure_hard(self):
         '''
+        Acquires a chunk of data using the hard detector and writes it
+        into the next rows of the preallocated dataset.
+
         ToDo: integrate soft averaging into MC
         '''
         # note, checking after the data comes in is pointless in hard msmt
-        new_data = np.array(self.detector_function.get_values()).T
-
+        with self.profiler.span('get_values'):
+            new_data = np.array(self.detector_function.get_values()).T
         if len(np.shape(new_data)) == 1:
-            single_col = True
-            shape_new_data = (len(new_data), 1)
-        else:
-            single_col = False
-            shape_new_data = np.shape(new_data)
-
-        # resizing only for 1 set of new_data  now... needs to improve
-        shape_new_data = (shape_new_data[0], shape_new_data[1]+1)
-
-        datasetshape = self.dset.shape
-
-        self.iteration = datasetshape[0]/shape_new_data[0] + 1
-        start_idx = int(shape_new_data[0]*(self.iteration-1))
-        new_datasetshape = (shape_new_data[0]*self.iteration, datasetshape[1])
-        self.dset.resize(new_datasetshape)
-        len_new_data = shape_new_data[0]
-        if single_col:
-            self.dset[start_idx:,
-                      len(self.sweep_functions)] = new_data
-        else:
-            self.dset[start_idx:,
-                      len(self.sweep_functions):] = new_data
-
-        sweep_len = len(self.get_sweep_points().T)
-        # Only add sweep points if these make sense (i.e. same shape as new_data)
-        if sweep_len == len_new_data:  # 1D sweep
-            self.dset[:, 0] = self.get_sweep_points().T
-        else:
-            try:
-                if len(self.sweep_functions) != 1:
-                    relevant_swp_points = self.get_sweep_points()[
-                        start_idx:start_idx+len_new_data:]
-                    self.dset[start_idx:, 0:len(self.sweep_functions)] = \
-                        relevant_swp_points
-                else:
-                    self.dset[start_idx:, 0] = self.get_sweep_points()[
-                        start_idx:start_idx+len_new_data:].T
-            except Exception:
-                # There are some cases where the sweep points are not
-                # specified that you don't want to crash (e.g. on -off seq)
-                pass
-
-        self.update_plotmon()
-        if self.mode == '2D':
-            self.update_plotmon_2D_hard()
-            self.print_progress_static_hard()
-        else:
+            new_data = new_data.reshape(-1, 1)
+
+        start_idx = self.nr_hard_rows
+        stop_idx = start_idx + len(new_data)
+        if stop_idx > self.dset.shape[0]:
+            # the detector returned more data than there are sweep points
+            self.dset.resize((stop_idx, self.dset.shape[1]))
+        first_col = len(self.sweep_functions)
+        with self.profiler.span('hdf5_write'):
+            self.dset[start_idx:stop_idx,
+                      first_col:first_col+new_data.shape[1]] = new_data
+            if self.data_object.swmr_mode:
+                h5d.publish_rows(self.dset, stop_idx)
+        self.nr_hard_rows = stop_idx
+
+        new_rows = np.zeros((len(new_data), self.dset.shape[1]))
+        sweep_rows = self.hard_sweep_rows[start_idx:stop_idx]
+        new_rows[:len(sweep_rows), :first_col] = sweep_rows
+        new_rows[:, first_col:first_col+new_data.shape[1]] = new_data
+        self.plotmon_buffer.extend(new_rows)
+        self.iteration += 1
+
+        with self.profiler.span('plotmon_update'):
+            self.update_plotmon()
+            if self.mode == '2D':
+                self.update_plotmon_2D_hard()
+        with self.profiler.span('print_progress'):
             self.print_progress_static_hard()
 
         return new_data
@@ -244,35 +427,100 @@ class MeasurementControl:
             x = [x]
         if np.size(x) != len(self.sweep_functions):
             raise ValueError('size of x "%s" not equal to # sweep functions' % x)
-        for i, sweep_function in enumerate(self.sweep_functions[::-1]):
-            sweep_function.set_parameter(x[::-1][i])
-            # x[::-1] changes the order in which the parameters are set, so
-            # it is first the outer sweep point and then the inner.This
-            # is generally not important except for specifics: f.i. the phase
-            # of an agilent generator is reset to 0 when the frequency is set.
-
-        datasetshape = self.dset.shape
-        self.iteration = datasetshape[0] + 1
-
-        # TODO: REMOVE THIS ONLY FOR BENCHMARKING
-        # if self.iteration > 2:
-        #     print('Time of iteration: {:.4g}'.format(time.time()-self.it_time))
-        # self.it_time = time.time()
-
-        vals = self.detector_function.acquire_data_point()
-        # Resizing dataset and saving
-        new_datasetshape = (self.iteration, datasetshape[1])
-        self.dset.resize(new_datasetshape)
+        with self.profiler.span('set_parameter'):
+            for i, sweep_function in enumerate(self.sweep_functions[::-1]):
+                sweep_function.set_parameter(x[::-1][i])
+                # x[::-1] changes the order in which the parameters are set,
+                # so it is first the outer sweep point and then the inner.
+                # This is generally not important except for specifics: f.i.
+                # the phase of an agilent generator is reset to 0 when the
+                # frequency is set.
+
+        self.iteration = self.data_writer.nr_rows + 1
+
+        with self.profiler.span('acquire_data_point'):
+            vals = self.detector_function.acquire_data_point()
+        # Buffered saving, the writer takes care of resizing the dataset
         savable_data = np.append(x, vals)
-        self.dset[self.iteration-1, :] = savable_data
+        with self.profiler.span('hdf5_write'):
+            self.data_writer.append(savable_data)
+        self.plotmon_buffer.append(savable_data)
         # update plotmon
-        self.update_plotmon()
-        if self.mode == '2D':
-            self.update_plotmon_2D()
-        elif self.mode == 'adaptive':
+        with self.profiler.span('plotmon_update'):
+            self.update_plotmon()
+            if self.mode == '2D':
+                self.update_plotmon_2D()
+            elif self.mode == 'adaptive':
+                self.update_plotmon_adaptive()
+        return vals
+
+    def batch_measurement_function(self, X):
+        '''
+        Measures a batch of points, used in batch adaptive mode.
+
+        X is an array of shape (nr_points, nr_sweep_functions). If the
+        sweep functions and the detector are hard the batch is measured in
+        a single acquisition: the first sweep function gets all points
+        (e.g. to upload a sequence with one element per point), the other
+        sweep functions their own column. Otherwise the points are measured
+        one by one using the measurement_function.
+
+        Returns an array of shape (nr_points, nr_values).
+        '''
+        X = np.array(X, dtype=float).reshape(-1, len(self.sweep_functions))
+        if self.sweep_functions[0].sweep_control == 'soft':
+            return np.array([np.atleast_1d(self.measurement_function(x))
+                             for x in X])
+
+        if len(self.sweep_functions) == 1:
+            self.sweep_functions[0].sweep_points = X[:, 0]
+        else:
+            self.sweep_functions[0].sweep_points = X
+            for i in range(1, len(self.sweep_functions)):
+                self.sweep_functions[i].sweep_points = X[:, i]
+        with self.profiler.span('sweep_prepare'):
+            for sweep_function in self.sweep_functions:
+                sweep_function.prepare()
+        with self.profiler.span('detector_prepare'):
+            self.detector_function.prepare(
+                sweep_points=self.sweep_functions[0].sweep_points)
+        with self.profiler.span('get_values'):
+            vals = np.array(self.detector_function.get_values()).T.reshape(
+                len(X), -1)
+
+        new_rows = np.column_stack([X, vals])
+        with self.profiler.span('hdf5_write'):
+            for row in new_rows:
+                self.data_writer.append(row)
+        self.plotmon_buffer.extend(new_rows)
+        self.iteration = self.data_writer.nr_rows
+        with self.profiler.span('plotmon_update'):
+            self.update_plotmon()
             self.update_plotmon_adaptive()
         return vals
 
+    def batch_optimization_function(self, X):
+        '''
+        Batch version of the optimization_function, measures all points
+        of X (nr_points, nr_sweep_functions) and returns an array of
+        nr_points values. Uses the same "x_scale", "minimize",
+        "f_termination" and "par_idx" parameters.
+        '''
+        X = np.array(X, dtype=float)/np.array(self.x_scale, dtype=float)
+        vals = self.batch_measurement_function(X)[:, self.par_idx]
+        if self.minimize_optimization:
+            if (self.f_termination is not None and
+                    np.any(vals < self.f_termination)):
+                raise StopIteration()
+        else:
+            # when maximizing interrupt when larger than condition before
+            # inverting
+            if (self.f_termination is not None and
+                    np.any(vals > self.f_termination)):
+                raise StopIteration()
+            vals = np.multiply(-1, vals)
+        return vals
+
     def optimization_function(self, x):
         '''
         A wrapper around the measurement function.
@@ -318,6 +566,9 @@ class MeasurementControl:
         (Note better way to do is also overload the remove function and make
         sure all attributes are removed.
         '''
+        if self.data_writer is not None:
+            self.data_writer.close()
+            self.data_writer = None
         try:
             del(self.TwoD_array)
         except AttributeError:
@@ -392,59 +643,41 @@ class MeasurementControl:
     the 2D plotmon (which does a heatmap) and the adaptive plotmon.
     '''
     def initialize_plot_monitor(self):
-        self.win.clear()  # clear out previous data
-        self.curves = []
         xlabels = self.column_names[0:len(self.sweep_function_names)]
         ylabels = self.column_names[len(self.sweep_function_names):]
-        for ylab in ylabels:
-            for xlab in xlabels:
-                p = self.win.addPlot(pen=self.plot_theme[0])
-                b_ax = p.getAxis('bottom')
-                p.setLabel('bottom', xlab, pen=self.plot_theme[0])
-                b_ax.setPen(self.plot_theme[0])
-                l_ax = p.getAxis('left')
-                l_ax.setPen(self.plot_theme[0])
-                p.setLabel('left', ylab, pen=self.plot_theme[0])
-                c = p.plot(symbol='o', symbolSize=7, pen=self.plot_theme[0])
-                self.curves.append(c)
-            self.win.nextRow()
-        return self.win, self.curves
+        self.plot_sink.initialize_1D(xlabels, ylabels)
+        # number of rows sent to the plot sink
+        self.plotmon_rows_plotted = 0
 
     def update_plotmon(self, force_update=False):
+        '''
+        Sends the data points acquired since the last update to the
+        plot sink. The data is taken from the in memory plotmon_buffer,
+        the hdf5 file is not read.
+        '''
         if self.live_plot_enabled:
-            i = 0
             try:
                 time_since_last_mon_update = time.time() - self._mon_upd_time
             except:
                 self._mon_upd_time = time.time()
                 time_since_last_mon_update = 1e9
+            nr_rows = self.plotmon_buffer.nr_rows
             # Update always if just a few points otherwise wait for the refresh
             # timer
-            if (self.dset.shape[0] < 20 or time_since_last_mon_update >
-                    self.QC_QtPlot.interval or force_update):
-                nr_sweep_funcs = len(self.sweep_function_names)
-                for y_ind in range(len(self.detector_function.value_names)):
-                    for x_ind in range(nr_sweep_funcs):
-                        x = self.dset[:, x_ind]
-                        y = self.dset[:, nr_sweep_funcs+y_ind]
-                        self.curves[i].setData(x, y)
-                        i += 1
+            if ((nr_rows < 20 or time_since_last_mon_update >
+                    self.plot_sink.interval or force_update) and
+                    nr_rows > self.plotmon_rows_plotted):
+                self.plot_sink.update_1D(self.plotmon_buffer.rows_since(
+                    self.plotmon_rows_plotted))
+                self.plotmon_rows_plotted = nr_rows
                 self._mon_upd_time = time.time()
 
     def new_plotmon_window(self, plot_theme=None, interval=2):
         '''
-        respawns the pyqtgraph plotting window
-        Creates self.win       : a direct pyqtgraph window
-                self.QC_QtPlot : the qcodes pyqtgraph window
+        respawns the plotting windows of the plot sink
         '''
-        if plot_theme is not None:
-            self.plot_theme = plot_theme
-        self.win = self.rpg.GraphicsWindow(
-            title='Plot monitor of %s' % self.name)
-        self.win.setBackground(self.plot_theme[1])
-        self.QC_QtPlot = QtPlot(
-            windowTitle='QC-Plot monitor of %s' % self.name,
-            interval=interval)
+        self.plot_sink.new_plotmon_window(plot_theme=plot_theme,
+                                          interval=interval)
 
     def initialize_plot_monitor_2D(self):
         '''
@@ -459,84 +692,65 @@ class MeasurementControl:
         self.TwoD_array = np.empty(
             [n, m, len(self.detector_function.value_names)])
         self.TwoD_array[:] = np.NAN
-        self.QC_QtPlot.clear()
-        for j in range(len(self.detector_function.value_names)):
-            self.QC_QtPlot.add(x=self.sweep_pts_x,
-                               y=self.sweep_pts_y,
-                               z=self.TwoD_array[:, :, j],
-                               xlabel=self.column_names[0],
-                               ylabel=self.column_names[1],
-                               zlabel=self.column_names[2+j],
-                               subplot=j+1,
-                               cmap='viridis')
+        # number of rows of the plotmon_buffer added to the TwoD_array
+        self.TwoD_rows_plotted = 0
+        self.plot_sink.initialize_2D(
+            x=self.sweep_pts_x, y=self.sweep_pts_y,
+            xlabel=self.column_names[0], ylabel=self.column_names[1],
+            zlabels=self.column_names[2:])
 
     def update_plotmon_2D(self):
         '''
-        Adds latest measured value to the TwoD_array and sends it
-        to the QC_QtPlot.
+        Adds the values measured since the last update to the TwoD_array
+        and sends it to the plot sink.
         '''
         if self.live_plot_enabled:
-            i = self.iteration-1
-            x_ind = i % self.xlen
-            y_ind = i / self.xlen
-            for j in range(len(self.detector_function.value_names)):
-                z_ind = len(self.sweep_functions) + j
-                self.TwoD_array[y_ind, x_ind, j] = self.dset[i, z_ind]
-            self.QC_QtPlot.traces[j]['config']['z'] = self.TwoD_array[:, :, j]
-
             if (time.time() - self.time_last_2Dplot_update >
-                    self.QC_QtPlot.interval
+                    self.plot_sink.interval
                     or self.iteration == len(self.sweep_points)):
                 self.time_last_2Dplot_update = time.time()
-                self.QC_QtPlot.update_plot()
+                nr_rows = self.plotmon_buffer.nr_rows
+                idx = np.arange(self.TwoD_rows_plotted, nr_rows)
+                z_ind = len(self.sweep_functions)
+                self.TwoD_array[idx // self.xlen, idx % self.xlen, :] = \
+                    self.plotmon_buffer.rows_since(self.TwoD_rows_plotted)[
+                        :, z_ind:z_ind+self.TwoD_array.shape[2]]
+                self.TwoD_rows_plotted = nr_rows
+                self.plot_sink.update_2D(self.TwoD_array)
 
     def initialize_plot_monitor_adaptive(self):
         '''
-        Uses the Qcodes plotting windows for plotting adaptive plot updates
+        Initializes the plots of the measured values versus iteration
         '''
         self.time_last_ad_plot_update = time.time()
-        self.QC_QtPlot.clear()
-        for j in range(len(self.detector_function.value_names)):
-            self.QC_QtPlot.add(x=[0],
-                               y=[0],
-                               xlabel='iteration',
-                               ylabel=self.detector_function.value_names[j],
-                               subplot=j+1,
-                               symbol='o', symbolSize=5)
+        self.plot_sink.initialize_adaptive(self.detector_function.value_names)
 
     def update_plotmon_adaptive(self, force_update=False):
         if self.live_plot_enabled:
             if (time.time() - self.time_last_ad_plot_update >
-                    self.QC_QtPlot.interval or force_update):
-                for j in range(len(self.detector_function.value_names)):
-                    y_ind = len(self.sweep_functions) + j
-                    y = self.dset[:, y_ind]
-                    x = range(len(y))
-                    self.QC_QtPlot.traces[j]['config']['x'] = x
-                    self.QC_QtPlot.traces[j]['config']['y'] = y
-                    self.time_last_ad_plot_update = time.time()
-                    self.QC_QtPlot.update_plot()
+                    self.plot_sink.interval or force_update):
+                y_ind = len(self.sweep_functions)
+                self.plot_sink.update_adaptive(
+                    self.plotmon_buffer.data[:, y_ind:])
+                self.time_last_ad_plot_update = time.time()
 
     def update_plotmon_2D_hard(self):
         '''
         Adds latest datarow to the TwoD_array and send it
-        to the QC_QtPlot.
+        to the plot sink.
         Note that the plotmon only supports evenly spaced lattices.
         '''
         i = int(self.iteration-1)
         y_ind = i
-        for j in range(len(self.detector_function.value_names)):
-                z_ind = len(self.sweep_functions) + j
-                self.TwoD_array[y_ind, :, j] = self.dset[
-                    i*self.xlen:(i+1)*self.xlen, z_ind]
-                self.QC_QtPlot.traces[j]['config']['z'] = \
-                    self.TwoD_array[:, :, j]
+        z_ind = len(self.sweep_functions)
+        self.TwoD_array[y_ind, :, :] = self.plotmon_buffer.data[
+            i*self.xlen:(i+1)*self.xlen, z_ind:]
 
         if (time.time() - self.time_last_2Dplot_update >
-                self.QC_QtPlot.interval
+                self.plot_sink.interval
                 or self.iteration == len(self.sweep_points)):
             self.time_last_2Dplot_update = time.time()
-            self.QC_QtPlot.update_plot()
+            self.plot_sink.update_2D(self.TwoD_array)
 
     ##################################
     # Small helper/utility functions #
@@ -550,6 +764,44 @@ class MeasurementControl:
         '''
         return self.data_object
 
+    def start_swmr(self):
+        '''
+        Switches the datafile to SWMR mode if swmr_datasaving is True.
+        Called after the groups and attributes that are saved before the
+        measurement have been created.
+        '''
+        if self.swmr_datasaving and not self.data_object.swmr_mode:
+            h5d.start_swmr(self.dset)
+
+    def create_data_writer(self, nr_rows=None):
+        '''
+        Creates the writer used to save the data of soft measurements.
+        If threaded_datasaving is True the data is written to disk from a
+        separate thread such that disk latency does not add to the
+        acquisition time.
+        '''
+        if self.threaded_datasaving:
+            writer_class = h5d.ThreadedDataWriter
+        else:
+            writer_class = h5d.BufferedDataWriter
+        self.data_writer = writer_class(
+            self.dset, nr_rows=nr_rows, buffer_size=self.data_buffer_size,
+            flush_interval=self.data_flush_interval,
+            swmr=self.data_object.swmr_mode)
+        return self.data_writer
+
+    def get_nr_rows_acquired(self):
+        '''
+        Returns the number of datarows acquired, including rows that are
+        still buffered by the data_writer.
+        '''
+        if self.data_writer is not None:
+            return self.data_writer.nr_rows
+        elif self.nr_hard_rows is not None:
+            return self.nr_hard_rows
+        else:
+            return self.dset.shape[0]
+
     def get_column_names(self):
         self.column_names = []
         self.sweep_par_names = []
@@ -566,13 +818,28 @@ class MeasurementControl:
                 self.detector_function.value_units[i] + ')')
         return self.column_names
 
-    def create_experimentaldata_dataset(self):
+    def get_expected_nr_rows(self):
+        '''
+        Returns the number of rows the measurement is expected to have,
+        None if not known (adaptive measurements).
+        '''
+        if self.mode == 'adaptive' or not hasattr(self, 'sweep_points'):
+            return None
+        nr_rows = len(self.sweep_points)
+        if (self.mode == '2D' and np.size(self.sweep_points[0]) == 1 and
+                hasattr(self, 'sweep_points_2D')):
+            nr_rows *= len(self.sweep_points_2D)
+        return nr_rows
+
+    def create_experimentaldata_dataset(self, dtype='f4', chunks=None,
+                                        compression=None):
         data_group = self.data_object.create_group('Experimental Data')
-        self.dset = data_group.create_dataset(
-            'Data', (0, len(self.sweep_functions) +
+        self.dset = h5d.create_data_dataset(
+            data_group, 'Data',
+            nr_cols=(len(self.sweep_functions) +
                      len(self.detector_function.value_names)),
-            maxshape=(None, len(self.sweep_functions) +
-                      len(self.detector_function.value_names)))
+            nr_rows=self.get_expected_nr_rows(), dtype=dtype, chunks=chunks,
+            compression=compression)
         self.get_column_names()
         self.dset.attrs['column_names'] = h5d.encode_to_utf8(self.column_names)
         # Added to tell analysis how to extract the data
@@ -594,28 +861,22 @@ class MeasurementControl:
 
     def save_instrument_settings(self, data_object=None, *args):
         '''
-        uses QCodes station snapshot to save the last known value of any
-        parameter. Only saves the value and not the update time (which is
-        known in the snapshot)
+        Saves the last known value of the parameters of the instruments in
+        the station. Only saves the value and not the update time (which is
+        known in the snapshot).
+        The settings are stored as a structured dataset, use
+        pycqed.measurement.instrument_settings.read_instrument_settings to
+        read them.
         '''
         if data_object is None:
             data_object = self.data_object
         if not hasattr(self, 'station'):
-            logging.warning('No station object specified, could not save',
+            logging.warning('No station object specified, could not save'
                             ' instrument settings')
         else:
-            set_grp = data_object.create_group('Instrument settings')
-            inslist = dict_to_ordered_tuples(self.station.components)
-            for (iname, ins) in inslist:
-                instrument_grp = set_grp.create_group(iname)
-                par_snap = ins.snapshot()['parameters']
-                parameter_list = dict_to_ordered_tuples(par_snap)
-                for (p_name, p) in parameter_list:
-                    try:
-                        val = str(p['value'])
-                    except KeyError:
-                        val = ''
-                    instrument_grp.attrs[p_name] = str(val)
+            self.snapshot_cache.save(data_object, self.station,
+                                     update=self.snapshot_update,
+                                     diff=self.store_settings_diff)
 
     def save_MC_metadata(self, data_object=None, *args):
         '''
@@ -634,6 +895,39 @@ class MeasurementControl:
         set_grp.attrs['measurement_name'] = self.measurement_name
         set_grp.attrs['live_plot_enabled'] = self.live_plot_enabled
 
+    def save_MC_timing(self, data_object=None):
+        '''
+        Saves the profile of the last run (see last_run_profile), every
+        span is a subgroup with the statistics (s) as attributes and the
+        histogram of the durations as dataset.
+        '''
+        if data_object is None:
+            data_object = self.data_object
+        timing_grp = data_object.create_group('MC timing')
+        timing_grp.create_dataset('histogram_bin_edges',
+                                  data=histogram_bin_edges)
+        for name, span in sorted(self._last_run_profile.items()):
+            span_grp = timing_grp.create_group(name)
+            for key, val in span.items():
+                if key == 'histogram':
+                    span_grp.create_dataset(key, data=val)
+                else:
+                    span_grp.attrs[key] = val
+
+    def last_run_profile(self):
+        '''
+        Returns the time spent in the parts of the last run, requires
+        profiling_enabled to be True.
+
+        Returns a dict with per span (e.g. 'set_parameter',
+        'acquire_data_point', 'hdf5_write', 'plotmon_update') a dict with
+        the count, total, mean, std, min, max, median, p90 and p99 of the
+        durations (s) and a histogram of the durations (bin edges in
+        pycqed.measurement.profiling.histogram_bin_edges).
+        Use profiling.format_profile to print it as a table.
+        '''
+        return self._last_run_profile
+
 
 
     def print_progress_static_soft_sweep(self, i):
@@ -654,8 +948,8 @@ class MeasurementControl:
             print(progress_message, end=end_char)
 
     def print_progress_static_hard(self):
-        acquired_points = self.dset.shape[0]
-        total_nr_pts = len(self.get_sweep_points())
+        acquired_points = self.get_nr_rows_acquired()
+        total_nr_pts = self.dset.shape[0]
         if acquired_points == total_nr_pts:
             self.complete = True  # Note is self.complete ever used?
         elif acquired_points > total_nr_pts:
@@ -807,6 +1101,11 @@ class MeasurementControl:
                                     is smaller than this value
             "par_idx": 0            If a parameter returns multiple values,
                                     specifies which one to use.
+            "batch_evaluation": False  Bool, if True the adaptive function
+                                    passes an array of points and gets an
+                                    array of values (e.g. batch_nelder_mead),
+                                    hard sweeps are measured in one
+                                    acquisition per batch.
         Common keywords (used in python nelder_mead implementation):
             "x0":                   list of initial values
             "initial_step"
@@ -822,6 +1121,7 @@ class MeasurementControl:
         # Determines if the optimization will minimize or maximize
         self.minimize_optimization = self.af_pars.pop('minimize', True)
         self.f_termination = self.af_pars.pop('f_termination', None)
+        self.batch_evaluation = self.af_pars.pop('batch_evaluation', False)
         print(self.f_termination)
 
     def get_adaptive_function_parameters(self):
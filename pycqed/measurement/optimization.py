@@ -37,12 +37,60 @@ def nelder_mead(fun, x0,
     Adriaan Rol for use in PycQED.
     Reference: https://en.wikipedia.org/wiki/Nelder%E2%80%93Mead_method
     '''
+    def fun_list(xs):
+        return [fun(x) for x in xs]
+    return _nelder_mead(fun_list, x0, initial_step=initial_step,
+                        no_improve_thr=no_improve_thr,
+                        no_improv_break=no_improv_break, maxiter=maxiter,
+                        alpha=alpha, gamma=gamma, rho=rho, sigma=sigma,
+                        verbose=verbose)
+
+
+def batch_nelder_mead(fun, x0,
+                      initial_step=0.1,
+                      no_improve_thr=10e-6, no_improv_break=10,
+                      maxiter=0,
+                      alpha=1., gamma=2., rho=-0.5, sigma=0.5,
+                      verbose=False, speculative=False):
+    '''
+    Nelder-Mead that evaluates the points of the simplex in batches.
+
+    parameters:
+        fun (function): function to optimize, takes a 2D numpy array of
+            points (nr_points, len(x0)) and returns an array of nr_points
+            scores (e.g. MeasurementControl in batch adaptive mode).
+        speculative (bool): if True the reflection, expansion and
+            contraction points are evaluated in a single batch, such that
+            every iteration takes one batch at the cost of evaluating
+            points that are not used. If False only the initial simplex
+            and the shrink steps are batched.
+        For the other parameters see nelder_mead.
+
+    return: tuple (best parameter array, best score)
+
+    The points that are selected and therefore the result are identical
+    to those of nelder_mead.
+    '''
+    def fun_list(xs):
+        return list(fun(np.array(xs)))
+    return _nelder_mead(fun_list, x0, initial_step=initial_step,
+                        no_improve_thr=no_improve_thr,
+                        no_improv_break=no_improv_break, maxiter=maxiter,
+                        alpha=alpha, gamma=gamma, rho=rho, sigma=sigma,
+                        verbose=verbose, speculative=speculative)
+
+
+def _nelder_mead(fun_list, x0, initial_step, no_improve_thr,
+                 no_improv_break, maxiter, alpha, gamma, rho, sigma,
+                 verbose, speculative=False):
+    '''
+    Implementation of nelder_mead and batch_nelder_mead, fun_list takes a
+    list of points and returns a list of scores.
+    '''
     # init
     x0 = np.array(x0)  # ensures algorithm also accepts lists
     dim = len(x0)
-    prev_best = fun(x0)
     no_improv = 0
-    res = [[x0, prev_best]]
     if type(initial_step) is float:
         initial_step_matrix = np.eye(dim)*initial_step
     elif (type(initial_step) is list) or (type(initial_step) is np.ndarray):
@@ -53,11 +101,14 @@ def nelder_mead(fun, x0,
         raise TypeError('initial_step ({})must be list or np.array'.format(
                         type(initial_step)))
 
+    simplex = [x0]
     for i in range(dim):
         x = copy.copy(x0)
         x = x + initial_step_matrix[i]
-        score = fun(x)
-        res.append([x, score])
+        simplex.append(x)
+    scores = fun_list(simplex)
+    res = [[x, score] for x, score in zip(simplex, scores)]
+    prev_best = scores[0]
 
     # simplex iter
     iters = 0
@@ -95,7 +146,12 @@ def nelder_mead(fun, x0,
 
         # reflection
         xr = x0 + alpha*(x0 - res[-1][0])
-        rscore = fun(xr)
+        xe = x0 + gamma*(x0 - res[-1][0])
+        xc = x0 + rho*(x0 - res[-1][0])
+        if speculative:
+            rscore, escore, cscore = fun_list([xr, xe, xc])
+        else:
+            rscore, = fun_list([xr])
         if res[0][1] <= rscore < res[-2][1]:
             del res[-1]
             res.append([xr, rscore])
@@ -103,8 +159,8 @@ def nelder_mead(fun, x0,
 
         # expansion
         if rscore < res[0][1]:
-            xe = x0 + gamma*(x0 - res[-1][0])
-            escore = fun(xe)
+            if not speculative:
+                escore, = fun_list([xe])
             if escore < rscore:
                 del res[-1]
                 res.append([xe, escore])
@@ -115,8 +171,8 @@ def nelder_mead(fun, x0,
                 continue
 
         # contraction
-        xc = x0 + rho*(x0 - res[-1][0])
-        cscore = fun(xc)
+        if not speculative:
+            cscore, = fun_list([xc])
         if cscore < res[-1][1]:
             del res[-1]
             res.append([xc, cscore])
@@ -124,14 +180,10 @@ def nelder_mead(fun, x0,
 
         # reduction
         x1 = res[0][0]
-        nres = []
-        for tup in res:
-            redx = x1 + sigma*(tup[0] - x1)
-            score = fun(redx)
-            nres.append([redx, score])
-        res = nres
+        redxs = [x1 + sigma*(tup[0] - x1) for tup in res]
+        res = [[redx, score] for redx, score in zip(redxs, fun_list(redxs))]
 
     # once the loop is broken evaluate the final value one more time as
     # verification
-    fun(res[0][0])
+    fun_list([res[0][0]])
     return res[0]
@@ -0,0 +1,120 @@
+'''
+Span timing used to profile the measurement loop of MeasurementControl.
+
+Code is timed by wrapping it in a span:
+
+    with profiler.span('acquire_data_point'):
+        vals = detector_function.acquire_data_point()
+
+The duration of every span is recorded, profile() returns per span name
+the aggregate statistics and a histogram of the durations on a log scale.
+When the profiler is disabled span() returns a shared no-op context
+manager such that a span costs well below 1 us.
+'''
+import time
+import numpy as np
+
+# Edges of the duration histograms, 10 bins per decade from 100 ns to
+# 1000 s
+histogram_bin_edges = 10**np.linspace(-7, 3, 101)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('durations', 't_start')
+
+    def __init__(self, durations):
+        self.durations = durations
+
+    def __enter__(self):
+        self.t_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.durations.append(time.perf_counter() - self.t_start)
+        return False
+
+
+class SpanProfiler:
+    '''
+    Records the durations of named spans.
+    '''
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        '''
+        Removes all recorded durations.
+        '''
+        self._durations = {}
+
+    def span(self, name):
+        '''
+        Returns a context manager that records the time spent in the
+        with block under name.
+        '''
+        if not self.enabled:
+            return _null_span
+        try:
+            durations = self._durations[name]
+        except KeyError:
+            durations = self._durations[name] = []
+        return _Span(durations)
+
+    def durations(self, name):
+        '''
+        Returns an array of all recorded durations (s) of a span.
+        '''
+        return np.array(self._durations.get(name, []))
+
+    def profile(self):
+        '''
+        Returns a dict with per span name a dict containing:
+            count, total, mean, std, min, max, median, p90, p99 : (s)
+            histogram : number of spans per bin of histogram_bin_edges,
+                shorter and longer spans are counted in the first and last
+                bin.
+        '''
+        profile = {}
+        for name, durations in self._durations.items():
+            if len(durations) == 0:
+                continue
+            d = np.array(durations)
+            histogram, _ = np.histogram(
+                np.clip(d, histogram_bin_edges[0], histogram_bin_edges[-1]),
+                bins=histogram_bin_edges)
+            median, p90, p99 = np.percentile(d, [50, 90, 99])
+            profile[name] = {'count': len(d), 'total': np.sum(d),
+                             'mean': np.mean(d), 'std': np.std(d),
+                             'min': np.min(d), 'max': np.max(d),
+                             'median': median, 'p90': p90, 'p99': p99,
+                             'histogram': histogram}
+        return profile
+
+
+def format_profile(profile):
+    '''
+    Returns a table of a profile (see SpanProfiler.profile) sorted by the
+    total time per span.
+    '''
+    lines = ['{:<22} {:>8} {:>11} {:>11} {:>11} {:>11}'.format(
+        'span', 'count', 'total (s)', 'mean (us)', 'p99 (us)', 'max (us)')]
+    for name, p in sorted(profile.items(), key=lambda item: -item[1]['total']):
+        lines.append('{:<22} {:>8} {:>11.4f} {:>11.1f} {:>11.1f} {:>11.1f}'
+                     .format(name, p['count'], p['total'], 1e6*p['mean'],
+                             1e6*p['p99'], 1e6*p['max']))
+    return '\n'.join(lines)
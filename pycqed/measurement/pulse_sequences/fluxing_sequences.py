@@ -11,6 +11,7 @@ from ..waveform_control import element
 from ..waveform_control.element import calculate_time_corr
 from ..waveform_control import pulse
 from ..waveform_control import sequence
+from ..waveform_control import kernel_distortion_module as kdm
 from pycqed.measurement.pulse_sequences.standard_elements import multi_pulse_elt
 
 from importlib import reload
@@ -68,10 +69,9 @@ def single_pulse_seq(pulse_pars=None,
         preloaded_kernels_vec = preload_kernels_func(distortion_dict)
     else:
         preloaded_kernels = []
-    for i, el in enumerate(el_list):
-        if distortion_dict is not None:
-            el = distort_and_compensate(el, distortion_dict, preloaded_kernels_vec)
-            el_list[i] = el
+    if distortion_dict is not None:
+        distort_elements(el_list, distortion_dict, preloaded_kernels_vec)
+    for el in el_list:
         seq.append_element(el, trigger_wait=True)
     station.components['AWG'].stop()
     station.pulsar.program_awg(seq, *el_list, verbose=verbose)
@@ -129,10 +129,9 @@ def chevron_seq_length(lengths, mw_pulse_pars, RO_pars, flux_pulse_pars=None,
         el = multi_pulse_elt(i, station, pulse_list)
         el_list.append(el)
 
-    for i, el in enumerate(el_list):
-        if distortion_dict is not None:
-            el = distort_and_compensate(el, distortion_dict, preloaded_kernels_vec)
-            el_list[i] = el
+    if distortion_dict is not None:
+        distort_elements(el_list, distortion_dict, preloaded_kernels_vec)
+    for el in el_list:
         seq.append_element(el, trigger_wait=True)
     cal_points = 4
     RO_pars['pulse_delay'] = original_delay
@@ -197,10 +196,9 @@ def chevron_seq_amp(amps, mw_pulse_pars, RO_pars, flux_pulse_pars=None,
         el = multi_pulse_elt(i, station, pulse_list)
         el_list.append(el)
 
-    for i, el in enumerate(el_list):
-        if distortion_dict is not None:
-            el = distort_and_compensate(el, distortion_dict, preloaded_kernels_vec)
-            el_list[i] = el
+    if distortion_dict is not None:
+        distort_elements(el_list, distortion_dict, preloaded_kernels_vec)
+    for el in el_list:
         seq.append_element(el, trigger_wait=True)
     if upload:
         station.components['AWG'].stop()
@@ -222,16 +220,27 @@ def preload_kernels_func(distortion_dict):
 
 
 def distort_and_compensate(element, distortion_dict, preloaded_kernels):
-    t_vals, outputs_dict = element.waveforms()
-    # print(len(t_vals),t_vals[-1])
-    for ch in distortion_dict['ch_list']:
-        element._channels[ch]['distorted'] = True
-        length = len(outputs_dict[ch])
-        for kernelvec in preloaded_kernels[ch]:
-            outputs_dict[ch] = np.convolve(outputs_dict[ch], kernelvec)[:length]
+    return distort_elements([element], distortion_dict, preloaded_kernels)[0]
+
 
-        element.distorted_wfs[ch] = outputs_dict[ch][:len(t_vals)]
-    return element
+def distort_elements(el_list, distortion_dict, preloaded_kernels):
+    '''
+    Distorts the waveforms of the channels in distortion_dict['ch_list'] of
+    all elements with the preloaded kernels of these channels.
+
+    The kernels of a channel are combined into a single frequency response
+    and the waveforms of all elements are convolved with it in one batch.
+    '''
+    outputs = [el.waveforms() for el in el_list]
+    for ch in distortion_dict['ch_list']:
+        engine = kdm.get_distortion_engine(preloaded_kernels[ch])
+        distorted_wfs = engine.distort_list(
+            [outputs_dict[ch] for t_vals, outputs_dict in outputs])
+        for el, (t_vals, outputs_dict), wf in zip(el_list, outputs,
+                                                    distorted_wfs):
+            el._channels[ch]['distorted'] = True
+            el.distorted_wfs[ch] = wf[:len(t_vals)]
+    return el_list
 
 def get_pulse_dict_from_pars(pulse_pars):
     '''
@@ -460,7 +460,10 @@ def flatten_list(lis):
     Help function for using:create_experiment_list_pyGSTi
 
     """
-    from collections import Iterable
+    try:
+        from collections.abc import Iterable
+    except ImportError:  # python < 3.3
+        from collections import Iterable
     for item in lis:
         if isinstance(item, Iterable) and not isinstance(item, str):
             for x in flatten_list(item):
@@ -10,7 +10,7 @@ from ..waveform_control import element
 from ..waveform_control import pulse
 from ..waveform_control.pulse_library import MW_IQmod_pulse, SSB_DRAG_pulse, \
     Mux_DRAG_pulse, SquareFluxPulse
-from ..waveform_control.pulse import CosPulse, SquarePulse
+from ..waveform_control.pulse import CosPulse, SquarePulse, PulseSpec
 from pycqed.measurement.randomized_benchmarking import randomized_benchmarking as rb
 
 from importlib import reload
@@ -20,6 +20,13 @@ reload(pulse_library)
 
 reload(element)
 
+# Pulses added to every multi_pulse_elt
+_refpulses = [PulseSpec(SquarePulse, name='refpulse_0',
+                        channel='ch{}'.format(i+1), amplitude=0, length=1e-9)
+              for i in range(4)]
+_final_pulse = PulseSpec(SquarePulse, name='final_empty_pulse', channel='ch1',
+                         amplitude=0, length=1e-9)
+
 
 def multi_pulse_elt(i, station, pulse_list):
         '''
@@ -47,55 +54,57 @@ def multi_pulse_elt(i, station, pulse_list):
         el = element.Element(
             name='{}-pulse-elt_{}'.format(len(pulse_list), i),
             pulsar=station.pulsar)
-        for i in range(4):  # Exist to ensure there are no empty channels
-            el.add(pulse.SquarePulse(name='refpulse_0',
-                                     channel='ch{}'.format(i+1),
-                                     amplitude=0, length=1e-9))
+        for refpulse in _refpulses:
+            # Exist to ensure there are no empty channels
+            el.add(refpulse)
         # exists to ensure that channel is not high when waiting for trigger
-        last_pulse = el.add(pulse.SquarePulse(name='refpulse_0', channel='ch1',
-                                              amplitude=0, length=1e-9,),
-                            start=100e-9)
+        last_pulse = el.add(_refpulses[0], start=100e-9)
         for i, pulse_pars in enumerate(pulse_list):
             if pulse_pars['pulse_type'] == 'SSB_DRAG_pulse':
                 last_pulse = el.add(
-                    SSB_DRAG_pulse(name='pulse_{}'.format(i),
-                                   I_channel=pulse_pars['I_channel'],
-                                   Q_channel=pulse_pars['Q_channel'],
-                                   amplitude=pulse_pars['amplitude'],
-                                   sigma=pulse_pars['sigma'],
-                                   nr_sigma=pulse_pars['nr_sigma'],
-                                   motzoi=pulse_pars['motzoi'],
-                                   mod_frequency=pulse_pars['mod_frequency'],
-                                   phase=pulse_pars['phase'],
-                                   phi_skew=pulse_pars['phi_skew'],
-                                   alpha=pulse_pars['alpha']),
+                    PulseSpec(SSB_DRAG_pulse, name='pulse_{}'.format(i),
+                              I_channel=pulse_pars['I_channel'],
+                              Q_channel=pulse_pars['Q_channel'],
+                              amplitude=pulse_pars['amplitude'],
+                              sigma=pulse_pars['sigma'],
+                              nr_sigma=pulse_pars['nr_sigma'],
+                              motzoi=pulse_pars['motzoi'],
+                              mod_frequency=pulse_pars['mod_frequency'],
+                              phase=pulse_pars['phase'],
+                              phi_skew=pulse_pars['phi_skew'],
+                              alpha=pulse_pars['alpha']),
                     start=pulse_pars['pulse_delay'],
                     refpulse=last_pulse, refpoint='start')
             elif pulse_pars['pulse_type'] == 'Mux_DRAG_pulse':
                 # pulse_pars.pop('pulse_type')
-                last_pulse = el.add(Mux_DRAG_pulse(name='pulse_{}'.format(i),
-                                                   **pulse_pars),
+                last_pulse = el.add(PulseSpec(Mux_DRAG_pulse,
+                                              name='pulse_{}'.format(i),
+                                              **pulse_pars),
                                     start=pulse_pars['pulse_delay'],
                                     refpulse=last_pulse, refpoint='start')
             elif pulse_pars['pulse_type'] == 'CosPulse':
-                last_pulse = el.add(CosPulse(name='pulse_{}'.format(i),
-                                             **pulse_pars),
+                last_pulse = el.add(PulseSpec(CosPulse,
+                                              name='pulse_{}'.format(i),
+                                              **pulse_pars),
                                     start=pulse_pars['pulse_delay'],
                                     refpulse=last_pulse, refpoint='start')
             elif pulse_pars['pulse_type'] == 'SquarePulse':
-                last_pulse = el.add(SquarePulse(name='pulse_{}'.format(i),
-                                                **pulse_pars),
+                last_pulse = el.add(PulseSpec(SquarePulse,
+                                              name='pulse_{}'.format(i),
+                                              **pulse_pars),
                                     start=pulse_pars['pulse_delay'],
                                     refpulse=last_pulse, refpoint='start')
             elif pulse_pars['pulse_type'] == 'SquareFluxPulse':
-                last_pulse = el.add(SquareFluxPulse(name='pulse_{}'.format(i),
-                                                **pulse_pars),
+                last_pulse = el.add(PulseSpec(SquareFluxPulse,
+                                              name='pulse_{}'.format(i),
+                                              **pulse_pars),
                                     start=pulse_pars['pulse_delay'],
                                     refpulse=last_pulse, refpoint='start')
 
             elif pulse_pars['pulse_type'] == 'ModSquare':
-                last_pulse = el.add(MW_IQmod_pulse(name='pulse_{}'.format(i),
-                                                   **pulse_pars),
+                last_pulse = el.add(PulseSpec(MW_IQmod_pulse,
+                                              name='pulse_{}'.format(i),
+                                              **pulse_pars),
                                     start=pulse_pars['pulse_delay'],
                                     refpulse=last_pulse, refpoint='start')
 
@@ -105,8 +114,8 @@ def multi_pulse_elt(i, station, pulse_list):
                 # Does more than just call the function as it also adds the
                 # markers. Ideally we combine both in one function in pulselib
                 if pulse_pars['pulse_type'] == 'MW_IQmod_pulse_tek':
-                    last_pulse = el.add(MW_IQmod_pulse(
-                            name='RO_tone',
+                    last_pulse = el.add(PulseSpec(
+                            MW_IQmod_pulse, name='RO_tone',
                             I_channel=pulse_pars['I_channel'],
                             Q_channel=pulse_pars['Q_channel'],
                             length=pulse_pars['length'],
@@ -116,8 +125,8 @@ def multi_pulse_elt(i, station, pulse_list):
                         refpulse=last_pulse, refpoint='start',
                         fixed_point_freq=pulse_pars['fixed_point_frequency'])
                 elif pulse_pars['pulse_type'] == 'Gated_MW_RO_pulse':
-                    last_pulse=el.add(pulse.SquarePulse(
-                            name='RO_marker', amplitude=1,
+                    last_pulse=el.add(PulseSpec(
+                            SquarePulse, name='RO_marker', amplitude=1,
                             length=pulse_pars['length'],
                             channel=pulse_pars['RO_pulse_marker_channel']),
                         start=pulse_pars['pulse_delay'], refpulse=last_pulse,
@@ -125,8 +134,8 @@ def multi_pulse_elt(i, station, pulse_list):
                         fixed_point_freq=pulse_pars['fixed_point_frequency'])
                 elif pulse_pars['pulse_type'] == 'MW_IQmod_pulse_nontek':
                     #"adding a 0 amp pulse because the sequencer needs an element for timing
-                    last_pulse=el.add(pulse.SquarePulse(
-                            name='RO_marker', amplitude=0,
+                    last_pulse=el.add(PulseSpec(
+                            SquarePulse, name='RO_marker', amplitude=0,
                             length=pulse_pars['length'],
                             channel=pulse_pars['RO_pulse_marker_channel']),
                         start=pulse_pars['pulse_delay'], refpulse=last_pulse,
@@ -137,9 +146,9 @@ def multi_pulse_elt(i, station, pulse_list):
                     channels = pulse_pars['acq_marker_channel']
                     channels=list(channels.split(','))
                     for channel in channels:
-                        Acq_marker = pulse.SquarePulse(
-                            name='Acq-trigger', amplitude=1, length=20e-9,
-                            channel=channel)
+                        Acq_marker = PulseSpec(
+                            SquarePulse, name='Acq-trigger', amplitude=1,
+                            length=20e-9, channel=channel)
                         el.add(
                             Acq_marker, start=pulse_pars['acq_marker_delay'],
                             refpulse=last_pulse, refpoint='start')
@@ -155,9 +164,7 @@ def multi_pulse_elt(i, station, pulse_list):
                     pulse_pars['pulse_type']))
 
         # This pulse ensures that the sequence always ends at zero amp
-        last_pulse = el.add(pulse.SquarePulse(name='final_empty_pulse',
-                                              channel='ch1',
-                                              amplitude=0, length=1e-9),
-                            refpulse=last_pulse, refpoint='end')
+        last_pulse = el.add(_final_pulse, refpulse=last_pulse,
+                            refpoint='end')
 
         return el
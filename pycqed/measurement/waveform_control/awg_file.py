@@ -0,0 +1,201 @@
+'''
+Streaming writer of the .awg sequence files of the Tektronix AWG5014.
+
+AWG5014.generate_awg_file builds the complete file in memory from a dict of
+all packed waveforms. The AWGFileWriter writes the same file record by
+record to a file-like object (e.g. a file, a socket or an AWGFileUpload)
+and accesses the packed waveforms one at a time while they are written,
+such that they can be computed on access. The record headers and the size
+of the file are computed from the waveform names and lengths.
+'''
+import struct
+from time import localtime
+import numpy as np
+
+# the waveforms in the file are numbered from this index
+FIRST_WAVEFORM_INDEX = 21
+
+
+def pack_record(name, value, dtype):
+    '''
+    Packs a record of the .awg file, the value is packed with the struct
+    format dtype (little endian), or encoded as string if dtype ends in 's'.
+    '''
+    if len(dtype) == 1:
+        record_data = struct.pack('<' + dtype, value)
+    else:
+        if dtype[-1] == 's':
+            record_data = value.encode('ASCII')
+        else:
+            record_data = struct.pack('<' + dtype, *value)
+    return record_header(name, len(record_data)) + record_data
+
+
+def record_header(name, data_size):
+    '''
+    Returns the sizes and the name of a record, which precede its data.
+    '''
+    record_name = name.encode('ASCII') + b'\x00'
+    return struct.pack('<II', len(record_name), data_size) + record_name
+
+
+class AWGFileWriter:
+    '''
+    Writes an .awg file byte-identical to the one AWG5014.generate_awg_file
+    returns (with the channel settings as given, i.e. without preserving
+    the settings of the instrument).
+
+    Args:
+        packed_waveforms (Mapping): waveform name -> packed waveform
+            (uint16), the waveforms are accessed one at a time in order of
+            their names while written
+        wfname_l, nrep, trig_wait, goto_state, jump_to: sequence table, see
+            generate_awg_file
+        channel_cfg (dict): channel settings
+        sequence_cfg (dict): settings of the AWG, as returned by
+            AWG.generate_sequence_cfg
+        format_head (dict): record name -> struct format of the AWG
+            settings (AWG.AWG_FILE_FORMAT_HEAD)
+        format_channel (dict): as format_head for the channel settings
+            with the channel number replaced by N
+            (AWG.AWG_FILE_FORMAT_CHANNEL)
+        timestamp (tuple): date and time of the waveforms, as
+            generate_awg_file, None uses the current time
+    '''
+
+    def __init__(self, packed_waveforms, wfname_l, nrep, trig_wait,
+                 goto_state, jump_to, channel_cfg, sequence_cfg,
+                 format_head, format_channel, timestamp=None):
+        self.packed_waveforms = packed_waveforms
+        if timestamp is None:
+            timestamp = tuple(
+                np.array(localtime())[[0, 1, 8, 2, 3, 4, 5, 6, 7]])
+        self._timestamp = tuple(timestamp)[:8]
+
+        settings = [pack_record('MAGIC', 5000, 'h'),
+                    pack_record('VERSION', 1, 'h')]
+        for k in sequence_cfg:
+            if k in format_head:
+                settings.append(pack_record(k, sequence_cfg[k],
+                                            format_head[k]))
+        for k in channel_cfg:
+            ch_k = k[:-1] + 'N'
+            if ch_k in format_channel:
+                settings.append(pack_record(k, channel_cfg[k],
+                                            format_channel[ch_k]))
+        self._settings = b''.join(settings)
+
+        sequence = []
+        for kk, segment in enumerate(np.array(wfname_l).transpose(), 1):
+            sequence += [
+                pack_record('SEQUENCE_WAIT_{}'.format(kk),
+                            trig_wait[kk - 1], 'h'),
+                pack_record('SEQUENCE_LOOP_{}'.format(kk),
+                            int(nrep[kk - 1]), 'l'),
+                pack_record('SEQUENCE_JUMP_{}'.format(kk),
+                            jump_to[kk - 1], 'h'),
+                pack_record('SEQUENCE_GOTO_{}'.format(kk),
+                            goto_state[kk - 1], 'h')]
+            for wfname in segment:
+                if wfname is not None:
+                    ch = wfname[-1]
+                    sequence.append(pack_record(
+                        'SEQUENCE_WAVEFORM_NAME_CH_' + ch + '_{}'.format(kk),
+                        wfname + '\x00', '{}s'.format(len(wfname + '\x00'))))
+        self._sequence = b''.join(sequence)
+
+    def _waveform_head(self, ii, wfname, nr_samples):
+        # the records of a waveform up to the header of its data
+        return (pack_record('WAVEFORM_NAME_{}'.format(ii), wfname + '\x00',
+                            '{}s'.format(len(wfname + '\x00'))) +
+                pack_record('WAVEFORM_TYPE_{}'.format(ii), 1, 'h') +
+                pack_record('WAVEFORM_LENGTH_{}'.format(ii), nr_samples,
+                            'l') +
+                pack_record('WAVEFORM_TIMESTAMP_{}'.format(ii),
+                            self._timestamp, '8H') +
+                record_header('WAVEFORM_DATA_{}'.format(ii), 2*nr_samples))
+
+    def size(self, waveform_lengths=None):
+        '''
+        Returns the size of the file in bytes.
+
+        Args:
+            waveform_lengths (dict): waveform name -> nr of samples, if None
+                the lengths of the packed waveforms are used
+        '''
+        size = len(self._settings) + len(self._sequence)
+        for ii, wfname in enumerate(sorted(self.packed_waveforms),
+                                    FIRST_WAVEFORM_INDEX):
+            if waveform_lengths is None:
+                nr_samples = len(self.packed_waveforms[wfname])
+            else:
+                nr_samples = waveform_lengths[wfname]
+            size += len(self._waveform_head(ii, wfname, nr_samples)) + \
+                2*nr_samples
+        return size
+
+    def write(self, f):
+        '''
+        Writes the file to the file-like object f, returns the number of
+        bytes written.
+        '''
+        f.write(self._settings)
+        size = len(self._settings)
+        for ii, wfname in enumerate(sorted(self.packed_waveforms),
+                                    FIRST_WAVEFORM_INDEX):
+            wfdat = np.ascontiguousarray(self.packed_waveforms[wfname],
+                                         dtype='<u2')
+            head = self._waveform_head(ii, wfname, len(wfdat))
+            f.write(head)
+            f.write(memoryview(wfdat).cast('B'))
+            size += len(head) + wfdat.nbytes
+        f.write(self._sequence)
+        return size + len(self._sequence)
+
+
+class AWGFileUpload:
+    '''
+    File-like object that sends a file of known size to the AWG
+    (MMEMory:DATA) through its visa handle while it is written, in chunks
+    of chunk_size bytes. The connection to the AWG has to accept a message
+    in parts, e.g. a socket connection.
+
+    Usage:
+        with AWGFileUpload(AWG, filename, writer.size()) as f:
+            writer.write(f)
+    '''
+
+    def __init__(self, AWG, filename, size, chunk_size=2**20):
+        self.visa_handle = AWG.visa_handle
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.bytes_written = 0
+        self._buffer = bytearray('MMEMory:DATA "{}",#{}{}'.format(
+            filename, len(str(size)), size).encode('ASCII'))
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        self._buffer += data
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self.visa_handle.write_raw(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        if self.bytes_written != self.size:
+            raise ValueError('{} bytes written to "{}", expected {}'.format(
+                self.bytes_written, self.filename, self.size))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
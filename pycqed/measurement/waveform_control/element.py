@@ -7,6 +7,7 @@ import numpy as np
 from copy import deepcopy
 import pprint
 from . import pulsar
+from .waveform_cache import waveform_cache, pulse_hash
 import logging
 
 
@@ -35,6 +36,8 @@ class Element:
         self.pulses = {}
         self._channels = {}
         self._last_added_pulse = None
+        # timing of the pulses, see compile
+        self._compiled = None
 
         if self.pulsar is not None:
             self.clock = self.pulsar.clock
@@ -67,25 +70,14 @@ class Element:
         if self.ignore_offset_correction:
             return 0
         else:
-            t0s = []
-            for p in self.pulses:
-                for c in self.pulses[p].channels:
-                    t0s.append(self.pulses[p].t0() -
-                               self._channels[c]['delay'])
-
-            return min(t0s)
+            return self._compiled_value('offset')
 
     def ideal_length(self):
         """
         Returns the nominal length of the element before taking into account
         the discretization using the clock.
         """
-        ts = []
-        for p in self.pulses:
-            for c in self.pulses[p].channels:
-                ts.append(self.pulse_end_time(p, c))
-
-        return max(ts)
+        return self._compiled_value('ideal_length')
 
     def length(self):
         """
@@ -97,18 +89,7 @@ class Element:
         """
         Returns the number of samples the elements occupies.
         """
-        ends = []
-        for p in self.pulses:
-            for c in self.pulses[p].channels:
-                ends.append(self.pulse_end_sample(p, c))
-
-        samples = max(ends)+1
-        if samples < self.min_samples:
-            samples = self.min_samples
-        else:
-            while(samples % self.granularity > 0):
-                samples += 1
-        return samples
+        return self._compiled_value('samples')
 
     def real_time(self, t, channel):
         """
@@ -160,6 +141,84 @@ class Element:
             #     # a few time so I leave the exception here
             # return time_corr
 
+    ###############
+    # compilation #
+    ###############
+
+    def _timing_key(self):
+        # everything the start and end samples of the pulses depend on
+        return (self.clock, self.granularity, self.min_samples,
+                self.ignore_offset_correction,
+                tuple((c, chan['delay'])
+                      for c, chan in self._channels.items()),
+                tuple((name, p._t0, p.length, tuple(p.channels))
+                      for name, p in self.pulses.items()))
+
+    def compile(self):
+        """
+        Computes the start and end samples of every pulse on every channel
+        at once. The result is kept until a pulse is added or its timing
+        changes (or the clock, granularity, channel delays, ...).
+
+        Returns a dict with
+            pulses (list)       : (pulse name, indices of its channels in
+                                  the arrays below) in order of addition
+            channels (list)     : channel of every pulse/channel pair
+            start_samples, end_samples (arrays): first and last sample of
+                                  every pulse/channel pair
+            offset, ideal_length, samples: see the methods with these names,
+                                  None if the element has no pulses
+        """
+        key = self._timing_key()
+        if self._compiled is not None and self._compiled['key'] == key:
+            return self._compiled
+
+        pulses, channels, t0s, ends, lengths = [], [], [], [], []
+        for name, p in self.pulses.items():
+            idxs = list(range(len(channels), len(channels)+len(p.channels)))
+            pulses.append((name, idxs))
+            for c in p.channels:
+                channels.append(c)
+                t0s.append(p.t0())
+                ends.append(p.end())
+                lengths.append(p.length)
+        delays = np.array([self._channels[c]['delay'] for c in channels],
+                          dtype=float)
+        t0s = np.array(t0s, dtype=float) - delays
+        ends = np.array(ends, dtype=float) - delays
+
+        offset = ideal_length = samples = None
+        if self.ignore_offset_correction:
+            offset = 0
+        elif len(channels) > 0:
+            offset = float(t0s.min())
+        if offset is not None:
+            start_samples = ((t0s - offset)*self.clock + 0.5).astype(int)
+            end_samples = (start_samples - 1 + (
+                np.array(lengths, dtype=float)*self.clock + 0.5).astype(int))
+        else:
+            start_samples = end_samples = np.zeros(0, dtype=int)
+        if len(channels) > 0:
+            ideal_length = float((ends - offset).max())
+            samples = int(end_samples.max()) + 1
+            if samples < self.min_samples:
+                samples = self.min_samples
+            else:
+                samples += -samples % self.granularity
+
+        self._compiled = {'key': key, 'pulses': pulses, 'channels': channels,
+                          'start_samples': start_samples,
+                          'end_samples': end_samples, 'offset': offset,
+                          'ideal_length': ideal_length, 'samples': samples}
+        return self._compiled
+
+    def _compiled_value(self, name):
+        value = self.compile()[name]
+        if value is None:
+            raise ValueError('Element "{}" contains no pulses'.format(
+                self.name))
+        return value
+
     def shift_all_pulses(self, dt):
         '''
         Shifts all pulses by a time dt, this is used for correcting the phase
@@ -204,6 +263,9 @@ class Element:
         Function adds a pulse to the element, there are several options to set
         where in the element the pulse is added.
 
+        pulse (PulseSpec or Pulse): a new pulse is created from a PulseSpec,
+                              Pulse objects are deep-copied such that they
+                              can be modified afterwards
         name (str)          : name used for referencing the pulse in the
                               element, if not specified generates one based on
                               the default pulse name
@@ -219,7 +281,12 @@ class Element:
                                   this pulse is at a multiple of 1/fixed_point_freq
 
         '''
-        pulse = deepcopy(pulse)
+        # not isinstance(pulse, PulseSpec), the sequence modules reload the
+        # pulse module
+        if type(pulse).__name__ == 'PulseSpec':
+            pulse = pulse.create()
+        else:
+            pulse = deepcopy(pulse)
         if name is None:
             name = self._auto_pulse_name(pulse.name)
 
@@ -328,39 +395,78 @@ class Element:
             self.pulses[pname].stop_offset
 
     # computing the numerical waveform
-    def ideal_waveforms(self):
-        wfs = {}
-        tvals = np.arange(self.samples())/self.clock
-
-        for c in self._channels:
-            wfs[c] = np.zeros(self.samples()) + self._channels[c]['offset']
-        # we first compute the ideal function values
-        for p in self.pulses:
-            psamples = self.pulse_samples(p)
-
+    def _render_key(self, compiled):
+        # None if the rendered waveforms can not be reused
+        if not waveform_cache.enabled:
+            return None
+        pulse_hashes = tuple(pulse_hash(p) for p in self.pulses.values())
+        if None in pulse_hashes:
+            return None
+        return (compiled['key'], self.global_time, self.time_offset,
+                tuple(chan['offset'] for chan in self._channels.values()),
+                pulse_hashes)
+
+    def _render(self, compiled):
+        """
+        Renders the ideal waveforms of all channels into one array of
+        shape (channels, samples).
+        """
+        samples = compiled['samples']
+        tvals = np.arange(samples)/self.clock
+        rows = {c: i for i, c in enumerate(self._channels)}
+        wfs = np.zeros((len(rows), samples))
+        wfs += np.array([[chan['offset']] for chan in
+                         self._channels.values()], dtype=float)
+
+        starts = compiled['start_samples'].tolist()
+        stops = (compiled['end_samples'] + 1).tolist()
+        channels = compiled['channels']
+        for p, idxs in compiled['pulses']:
+            pulse = self.pulses[p]
             if not self.global_time:
-                pulse_tvals = tvals.copy()[:psamples]
-                pulsewfs = self.pulses[p].get_wfs(pulse_tvals)
+                pulse_tvals = tvals[:self.pulse_samples(p)].copy()
+                pulsewfs = waveform_cache.get_wfs(pulse, pulse_tvals,
+                                                  self.clock)
             else:
                 chan_tvals = {}
-
-                for c in self.pulses[p].channels:
-                    idx0 = self.pulse_start_sample(p, c)
-                    idx1 = self.pulse_end_sample(p, c) + 1
-                    c_tvals = np.round(tvals.copy()[idx0:idx1] +
-                                       self.channel_delay(c) +
-                                       self.time_offset,
-                                       pulsar.SIGNIFICANT_DIGITS)
-                    chan_tvals[c] = c_tvals
-
-                pulsewfs = self.pulses[p].get_wfs(chan_tvals)
-            for c in self.pulses[p].channels:
-                idx0 = self.pulse_start_sample(p, c)
-                idx1 = self.pulse_end_sample(p, c) + 1
-                wfs[c][idx0:idx1] += pulsewfs[c]
-
+                for i in idxs:
+                    c = channels[i]
+                    chan_tvals[c] = np.round(
+                        tvals[starts[i]:stops[i]] + self.channel_delay(c) +
+                        self.time_offset, pulsar.SIGNIFICANT_DIGITS)
+                pulsewfs = waveform_cache.get_wfs(pulse, chan_tvals,
+                                                  self.clock)
+            for i in idxs:
+                c = channels[i]
+                wfs[rows[c], starts[i]:stops[i]] += pulsewfs[c]
         return tvals, wfs
 
+    def ideal_waveforms(self):
+        """
+        Returns the time values and a dict with the ideal waveform of every
+        channel (rows of one array). The rendered waveforms are kept in the
+        waveform cache and rendered again only if a pulse or the element
+        changed, or they were removed from the cache.
+        """
+        compiled = self.compile()
+        self._compiled_value('samples')
+        render_key = self._render_key(compiled)
+        wfs = None
+        if render_key is not None:
+            # kept in the waveform cache rather than in the element, such
+            # that the memory used is bounded for long sequences
+            render_key = ('element', render_key)
+            wfs = waveform_cache.get_array(render_key)
+        if wfs is None:
+            tvals, wfs = self._render(compiled)
+            if render_key is not None:
+                waveform_cache.store_array(render_key, wfs)
+        else:
+            tvals = np.arange(wfs.shape[1])/self.clock
+        # copies, the caller is free to modify the waveforms
+        wfs = wfs.copy()
+        return tvals, {c: wfs[i] for i, c in enumerate(self._channels)}
+
     def waveforms(self):
         """
         Returns the waveforms for all used channels.
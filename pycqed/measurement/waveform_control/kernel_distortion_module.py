@@ -1,3 +1,4 @@
+import hashlib
 import numpy as np
 
 def kernel_matrix_from_file(path, max_len=-1):
@@ -31,3 +32,173 @@ def kernel_from_list(kernel_path_list, max_len=-1):
     for m in matrices[1:]:
         kernel = np.dot(m, kernel)
     return kernel
+
+
+def _next_fast_len(n):
+    """
+    Smallest 5-smooth number >= n, FFT's of these sizes are fast.
+    """
+    try:
+        from scipy.fftpack import next_fast_len
+        return next_fast_len(int(n))
+    except ImportError:
+        return 2**int(np.ceil(np.log2(n)))
+
+
+def fft_convolve(a, b):
+    """
+    Full linear convolution of two 1D arrays using the FFT, equivalent to
+    np.convolve(a, b).
+    """
+    n = len(a) + len(b) - 1
+    nfft = _next_fast_len(n)
+    return np.fft.irfft(np.fft.rfft(a, nfft) * np.fft.rfft(b, nfft),
+                        nfft)[:n]
+
+
+def combine_kernels(kernel_list, length=None):
+    """
+    Combines a list of kernels into a single kernel by convolving them.
+
+    Equivalent to consecutively convolving the kernels and truncating the
+    result to length samples after every convolution, the truncation does
+    not affect the first length samples as the kernels are causal.
+    If length is None the length of the longest kernel is used.
+    """
+    if length is None:
+        length = max([len(k) for k in kernel_list])
+    total_kernel = np.asarray(kernel_list[0], dtype=float)[:length]
+    for k in kernel_list[1:]:
+        total_kernel = fft_convolve(total_kernel,
+                                    np.asarray(k, dtype=float)[:length])
+        total_kernel = total_kernel[:length]
+    return total_kernel
+
+
+class DistortionEngine:
+    """
+    Applies a list of distortion kernels to waveforms.
+
+    The waveforms are convolved with the kernels, keeping the first
+    len(waveform) samples, i.e.
+
+        for kernel in kernel_list:
+            wf = np.convolve(wf, kernel)[:len(wf)]
+
+    All kernels are combined once into a single kernel of which the
+    frequency response is cached. The waveforms, stacked in a 2D array,
+    are convolved with it in a single batch using overlap-add FFT
+    convolution.
+    """
+
+    def __init__(self, kernel_list, min_block_size=1024):
+        """
+        Args:
+            kernel_list (list): the kernels (1D arrays) in the order in
+                which they are applied
+            min_block_size (int): minimum number of samples of the
+                waveform blocks of the overlap-add convolution
+        """
+        self.kernel_list = [np.asarray(k, dtype=float) for k in kernel_list]
+        self.min_block_size = min_block_size
+        self._kernels = {}
+        self._responses = {}
+
+    def combined_kernel(self, length):
+        """
+        Returns the combined kernel, truncated to length samples.
+        """
+        length = min(length, sum(len(k) for k in self.kernel_list) -
+                     len(self.kernel_list) + 1)
+        if length not in self._kernels:
+            self._kernels[length] = combine_kernels(self.kernel_list, length)
+        return self._kernels[length]
+
+    def frequency_response(self, length):
+        """
+        Returns the cached frequency response of the combined kernel for
+        waveforms of length samples.
+
+        returns:
+            response (array): rfft of the combined kernel
+            nfft (int): size of the FFT's
+            block_size (int): number of waveform samples per block
+        """
+        if length not in self._responses:
+            kernel = self.combined_kernel(length)
+            nr_taps = len(kernel)
+            nfft = _next_fast_len(max(2*nr_taps, self.min_block_size +
+                                      nr_taps - 1))
+            if length + nr_taps - 1 <= nfft:
+                # the waveforms fit in a single block
+                nfft = _next_fast_len(length + nr_taps - 1)
+            block_size = nfft - nr_taps + 1
+            self._responses[length] = (np.fft.rfft(kernel, nfft), nfft,
+                                       block_size)
+        return self._responses[length]
+
+    def distort(self, waveforms):
+        """
+        Distorts a waveform or a 2D array of waveforms (one per row).
+        Returns an array of the same shape.
+        """
+        waveforms = np.asarray(waveforms, dtype=float)
+        single_wf = waveforms.ndim == 1
+        waveforms = np.atleast_2d(waveforms)
+        nr_wfs, length = waveforms.shape
+        if length == 0 or nr_wfs == 0 or len(self.kernel_list) == 0:
+            return waveforms[0] if single_wf else waveforms.copy()
+        response, nfft, block_size = self.frequency_response(length)
+        nr_blocks = -(-length // block_size)
+
+        blocks = np.zeros((nr_wfs, nr_blocks*block_size))
+        blocks[:, :length] = waveforms
+        blocks = blocks.reshape(nr_wfs, nr_blocks, block_size)
+        conv_blocks = np.fft.irfft(np.fft.rfft(blocks, nfft, axis=-1) *
+                                   response, nfft, axis=-1)
+
+        # overlap-add, the samples beyond length are not needed
+        output = np.zeros((nr_wfs, nr_blocks*block_size + nfft))
+        for i in range(nr_blocks):
+            output[:, i*block_size:i*block_size+nfft] += conv_blocks[:, i]
+        output = output[:, :length]
+        return output[0] if single_wf else output
+
+    def distort_list(self, waveform_list):
+        """
+        Distorts a list of waveforms of possibly different lengths in a
+        single batch, returns a list of distorted waveforms.
+        """
+        if len(waveform_list) == 0:
+            return []
+        length = max(len(wf) for wf in waveform_list)
+        waveforms = np.zeros((len(waveform_list), length))
+        for i, wf in enumerate(waveform_list):
+            waveforms[i, :len(wf)] = wf
+        # the convolution is causal, the zero padding does not affect the
+        # samples of the shorter waveforms
+        distorted = self.distort(waveforms)
+        return [distorted[i, :len(wf)] for i, wf in
+                enumerate(waveform_list)]
+
+
+_engine_cache = {}
+
+
+def get_distortion_engine(kernel_list):
+    """
+    Returns a DistortionEngine for the kernels, engines are cached based
+    on the content of the kernels such that the frequency response is only
+    calculated once for kernels that are reloaded from file.
+    """
+    h = hashlib.sha1()
+    for k in kernel_list:
+        k = np.ascontiguousarray(k, dtype=float)
+        h.update(str(k.shape).encode())
+        h.update(k.tobytes())
+    key = h.hexdigest()
+    if key not in _engine_cache:
+        if len(_engine_cache) >= 16:
+            _engine_cache.clear()
+        _engine_cache[key] = DistortionEngine(kernel_list)
+    return _engine_cache[key]
@@ -8,9 +8,18 @@
 # TODO in principle that could be generalized for other
 # sequencing hardware i guess
 
+import io
+import os
 import time
+import pickle
+import hashlib
+import importlib
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import logging
+from .awg_file import AWGFileWriter, AWGFileUpload
 
 # some pulses use rounding when determining the correct sample at which to
 # insert a particular value. this might require correct rounding -- the pulses
@@ -34,9 +43,14 @@ class Pulsar:
                    'ch3', 'ch3_marker1', 'ch3_marker2',
                    'ch3', 'ch3_marker1', 'ch3_marker2']
     AWG_sequence_cfg = {}
+    # upload only the changed waveforms and the sequence table if possible,
+    # see program_awg
+    incremental_upload = False
 
     def __init__(self):
         self.channels = {}
+        # waveforms on the AWG after the last upload, see program_awg
+        self._awg_manifest = None
 
     # channel handling
     def define_channel(self, id, name, type, delay, offset,
@@ -178,6 +192,15 @@ class Pulsar:
 
     def delete_all_waveforms(self):
         self.AWG.delete_all_waveforms_from_list()
+        self.invalidate_awg_manifest()
+
+    def invalidate_awg_manifest(self):
+        """
+        Forgets which waveforms are on the AWG, the next program_awg does a
+        full upload. Required if the waveforms or the sequence of the AWG
+        are changed other than by program_awg.
+        """
+        self._awg_manifest = None
 
     def program_awg(self, sequence, *elements, **kw):
         """
@@ -185,6 +208,38 @@ class Pulsar:
         AND sequence information (i.e. nr of repetitions, event jumps etc)
         Advantage is that it's much faster, since sequence information is sent
         to the AWG in a single file.
+
+        Byte-identical waveforms of a channel (e.g. empty marker channels or
+        repeated readout pulses) are only uploaded once and shared by all
+        elements that use them, unless deduplicate=False is passed.
+        Statistics of the deduplication are stored in
+        self.dedup_statistics.
+
+        The waveforms of the elements are computed and packed in this
+        process, or in parallel in 'processes' worker processes (None uses
+        all cpus), see pack_elements_parallel.
+
+        With incremental=True (default self.incremental_upload) the names
+        and content hashes of the waveforms on the AWG are remembered. If
+        the waveforms of the previous upload are still on the AWG, only
+        the new and changed waveforms are sent, followed by the sequence
+        table, instead of the full .awg file. The full .awg file is
+        uploaded if there was no previous upload, the AWG or its channel
+        settings changed, or the AWG reports an error. Returns the .awg
+        file, or None after an incremental upload. Statistics of the upload
+        are stored in self.upload_statistics.
+
+        With stream=True the .awg file is sent to the AWG while it is
+        written (see AWGFileWriter and AWGFileUpload) and not returned. The
+        packed waveforms are not kept in memory but computed again while
+        they are written, i.e. the waveforms of every element are computed
+        twice (unless the rendered waveforms are still in the waveform
+        cache). The waveforms are then packed in this process, as
+        pack_elements_parallel returns the packed waveforms of all elements
+        at once. The file is sent as a single MMEMory:DATA
+        command in several write_raw calls, which requires a connection to
+        the AWG that sends the data as is, e.g. a socket connection that
+        does not end every write with a termination character.
         """
         old_timeout = self.AWG.timeout()
         self.AWG.timeout(max(180, old_timeout))
@@ -193,11 +248,27 @@ class Pulsar:
         debug = kw.pop('debug', False)
         channels = kw.pop('channels', 'all')
         loop = kw.pop('loop', True)
+        deduplicate = kw.pop('deduplicate', True)
+        processes = kw.pop('processes', 1)
+        incremental = kw.pop('incremental', self.incremental_upload)
+        stream = kw.pop('stream', False)
+        if stream and processes != 1:
+            logging.warning('The waveforms of a streamed .awg file are '
+                            'packed in this process, not in worker '
+                            'processes (processes={}).'.format(processes))
+            processes = 1
         allow_non_zero_first_point_on_trigger_wait = \
             kw.pop('allow_first_zero', False)
-        elt_cnt = len(elements)
         chan_ids = self.get_used_channel_ids()
         packed_waveforms = {}
+        # maps the waveform name of every element/channel to the name of the
+        # uploaded waveform with identical content
+        shared_wfnames = {}
+        wf_hashes = {}
+        # content hash of every waveform in packed_waveforms
+        wf_digests = {}
+        nr_waveforms = 0
+        bytes_saved = 0
 
         # Store offset settings to restore them after upload the seq
         # Note that this is the AWG setting offset, as distinct from the
@@ -207,62 +278,66 @@ class Pulsar:
 
         elements_with_non_zero_first_points = []
 
+        # determine which channels we actually want to upload
+        chan_groups = OrderedDict()
+        for id in chan_ids:
+            if channels != 'all' and not any(
+                    self.channels[c]['id'][:3] == id for c in channels):
+                continue
+            chan_groups[id] = self.get_channel_names_by_id(id)
+
         # order the waveforms according to physical AWG channels and
         # make empty sequences where necessary
-        for i, element in enumerate(elements):
-            if verbose:
-                print("%d / %d: %s (%d samples)... " % \
-                    (i+1, elt_cnt, element.name, element.samples()))
-                print("Generate/upload '%s' (%d samples)... " \
-                    % (element.name, element.samples()), end=' ')
-            _t0 = time.time()
-
-            tvals, wfs = element.normalized_waveforms()
-            '''
-            channels_to_print=['MW_Imod']
-            for i in channels_to_print:
-                if len(np.where(wfs[i]>0)[0]) !=0:
-                    print i, np.where(wfs[i]>0)
-            '''
-            for id in chan_ids:
+        _t0 = time.time()
+        if processes == 1:
+            packed_elements = self._pack_elements(elements, chan_groups,
+                                                  verbose)
+        else:
+            packed_elements = pack_elements_parallel(
+                elements, chan_groups, pack_awg5014_waveform, processes)
+        if stream:
+            packed_waveforms = _PackedWaveforms(elements, chan_groups,
+                                                self.AWG.pack_waveform)
+        for i, (element, (packed_wfs, non_zero_first_point)) in enumerate(
+                zip(elements, packed_elements)):
+            if non_zero_first_point:
+                elements_with_non_zero_first_points.append(element.name)
+            for id, packed_wf in packed_wfs.items():
                 wfname = element.name + '_%s' % id
-
-                # determine if we actually want to upload this channel
-                upload = False
-                if channels == 'all':
-                    upload = True
-                else:
-                    for c in channels:
-                        if self.channels[c]['id'][:3] == id:
-                            upload = True
-                    if not upload:
+                nr_waveforms += 1
+                wf_digest = hashlib.sha1(packed_wf.tobytes()).digest()
+                if deduplicate:
+                    # waveforms are only shared within a channel as the
+                    # .awg file derives the channel from the waveform name
+                    shared_wfnames[wfname] = wf_hashes.setdefault(
+                        (id, wf_digest), wfname)
+                    if shared_wfnames[wfname] != wfname:
+                        bytes_saved += packed_wf.nbytes
                         continue
-
-                chan_wfs = {id: None,
-                            id+'_marker1': None,
-                            id+'_marker2': None}
-                grp = self.get_channel_names_by_id(id)
-
-                for sid in grp:
-                    if grp[sid] != None and grp[sid] in wfs:
-                        chan_wfs[sid] = wfs[grp[sid]]
-                        if chan_wfs[sid][0] != 0.:
-                            elements_with_non_zero_first_points.append(
-                                element.name)
-                    else:
-                        chan_wfs[sid] = np.zeros(element.samples())
-
-                # Create wform files
-                packed_waveforms[wfname] = self.AWG.pack_waveform(
-                    chan_wfs[id],
-                    chan_wfs[id+'_marker1'],
-                    chan_wfs[id+'_marker2'])
+                if stream:
+                    packed_waveforms.add(wfname, i, id, len(packed_wf))
+                else:
+                    packed_waveforms[wfname] = packed_wf
+                wf_digests[wfname] = wf_digest
 
         _t = time.time() - _t0
 
         if verbose:
             print("finished in %.2f seconds." % _t)
 
+        nr_unique_waveforms = len(packed_waveforms)
+        self.dedup_statistics = {
+            'nr_waveforms': nr_waveforms,
+            'nr_unique_waveforms': nr_unique_waveforms,
+            'dedup_ratio': (nr_waveforms / nr_unique_waveforms
+                            if nr_unique_waveforms else 1.),
+            'bytes_saved': bytes_saved}
+        if deduplicate:
+            print("Deduplicated waveforms: %d unique of %d (ratio %.2f), "
+                  "%d bytes saved" % (nr_unique_waveforms, nr_waveforms,
+                                      self.dedup_statistics['dedup_ratio'],
+                                      bytes_saved))
+
         # sequence programming
         _t0 = time.time()
         if sequence.element_count() > 8000:
@@ -301,7 +376,8 @@ class Pulsar:
             el_wfnames = []
             # add all wf names of channel
             for elt in sequence.elements:
-                el_wfnames.append(elt['wfname'] + '_%s' % id)
+                wfname = elt['wfname'] + '_%s' % id
+                el_wfnames.append(shared_wfnames.get(wfname, wfname))
                 #  should the name include id nr?
             wfname_l.append(el_wfnames)
 
@@ -360,15 +436,47 @@ class Pulsar:
                                             nrep_l, wait_l, goto_l,
                                             logic_jump_l)
 
-        filename = sequence.name+'_FILE.AWG'
-
-        awg_file = self.AWG.generate_awg_file(
-            packed_waveforms,
-            np.array(wfname_l),
-            nrep_l, wait_l, goto_l, logic_jump_l,
-            self.get_awg_channel_cfg())
-        self.AWG.send_awg_file(filename, awg_file)
-        self.AWG.load_awg_file(filename)
+        channel_cfg = self.get_awg_channel_cfg()
+        manifest = {'AWG': self.AWG, 'chan_ids': chan_ids,
+                    'channel_cfg': channel_cfg, 'waveforms': wf_digests}
+        awg_file = None
+        incremental = incremental and self._manifest_matches(manifest)
+        if incremental:
+            try:
+                nr_uploaded = self._upload_incremental(
+                    packed_waveforms, wf_digests, wfname_l, nrep_l, wait_l,
+                    goto_l, logic_jump_l)
+            except Exception as e:
+                logging.warning('Incremental upload failed ({}), uploading '
+                                'the full sequence'.format(e))
+                incremental = False
+        # only valid again after a successful upload
+        self._awg_manifest = None
+        if not incremental:
+            filename = sequence.name+'_FILE.AWG'
+            if stream:
+                writer = AWGFileWriter(
+                    packed_waveforms, np.array(wfname_l),
+                    nrep_l, wait_l, goto_l, logic_jump_l, channel_cfg,
+                    self.AWG.generate_sequence_cfg(),
+                    self.AWG.AWG_FILE_FORMAT_HEAD,
+                    self.AWG.AWG_FILE_FORMAT_CHANNEL,
+                    getattr(self.AWG, 'timestamp', None))
+                with AWGFileUpload(self.AWG, filename, writer.size(
+                        packed_waveforms.lengths)) as f:
+                    writer.write(f)
+            else:
+                awg_file = self.AWG.generate_awg_file(
+                    packed_waveforms,
+                    np.array(wfname_l),
+                    nrep_l, wait_l, goto_l, logic_jump_l,
+                    channel_cfg)
+                self.AWG.send_awg_file(filename, awg_file)
+            self.AWG.load_awg_file(filename)
+            nr_uploaded = len(packed_waveforms)
+        self.upload_statistics = {'incremental': incremental,
+                                  'nr_uploaded_waveforms': nr_uploaded}
+        self._awg_manifest = manifest
         self.AWG.timeout(old_timeout)
 
         time.sleep(.1)
@@ -384,6 +492,87 @@ class Pulsar:
         print(" finished in %.2f seconds." % _t)
         return awg_file
 
+    def _pack_elements(self, elements, chan_groups, verbose=False):
+        """
+        Yields the packed waveforms of the elements, see
+        pack_element_waveforms.
+        """
+        for i, element in enumerate(elements):
+            if verbose:
+                print("%d / %d: %s (%d samples)... " %
+                      (i+1, len(elements), element.name, element.samples()))
+                print("Generate/upload '%s' (%d samples)... "
+                      % (element.name, element.samples()), end=' ')
+            yield pack_element_waveforms(element, chan_groups,
+                                         self.AWG.pack_waveform)
+
+    def _manifest_matches(self, manifest):
+        """
+        True if the waveforms of the last upload can be updated
+        incrementally to upload the sequence of the given manifest.
+        """
+        old = self._awg_manifest
+        return (old is not None and self.AWG_type == 'regular' and
+                old['AWG'] is manifest['AWG'] and
+                old['chan_ids'] == manifest['chan_ids'] and
+                old['channel_cfg'] == manifest['channel_cfg'])
+
+    def _upload_incremental(self, packed_waveforms, wf_digests, wfname_l,
+                            nrep_l, wait_l, goto_l, logic_jump_l):
+        """
+        Sends the waveforms that are not on the AWG according to the
+        manifest of the last upload, rewrites the sequence table and
+        deletes the waveforms that are not used anymore.
+        Returns the number of waveforms sent.
+        """
+        AWG = self.AWG
+        old_digests = self._awg_manifest['waveforms']
+        AWG.stop()
+        AWG.write('*CLS')
+        nr_uploaded = 0
+        for wfname in sorted(packed_waveforms):
+            if old_digests.get(wfname) == wf_digests[wfname]:
+                continue
+            if wfname in old_digests:
+                AWG.write('WLISt:WAVeform:DELete "{}"'.format(wfname))
+            packed_wf = packed_waveforms[wfname]
+            AWG.write('WLISt:WAVeform:DEFine "{}",{},INTeger'.format(
+                wfname, len(packed_wf)))
+            data = packed_wf.astype('<u2').tobytes()
+            header = 'WLISt:WAVeform:DATA "{}",#{}{}'.format(
+                wfname, len(str(len(data))), len(data))
+            AWG.visa_handle.write_raw(header.encode('ASCII') + data)
+            nr_uploaded += 1
+
+        # clears the sequence table
+        AWG.write('SEQuence:LENGth 0')
+        AWG.write('SEQuence:LENGth {}'.format(len(nrep_l)))
+        for i in range(len(nrep_l)):
+            el = 'SEQuence:ELEMent{}:'.format(i+1)
+            for ch_wfnames in wfname_l:
+                wfname = ch_wfnames[i]
+                AWG.write(el + 'WAVeform{} "{}"'.format(wfname[-1], wfname))
+            AWG.write(el + 'TWAit {}'.format(wait_l[i]))
+            AWG.write(el + 'LOOP:COUNt {}'.format(int(nrep_l[i])))
+            if goto_l[i]:
+                AWG.write(el + 'GOTO:STATe 1')
+                AWG.write(el + 'GOTO:INDex {}'.format(goto_l[i]))
+            else:
+                AWG.write(el + 'GOTO:STATe 0')
+            if logic_jump_l[i]:
+                AWG.write(el + 'JTARget:TYPE INDex')
+                AWG.write(el + 'JTARget:INDex {}'.format(logic_jump_l[i]))
+            else:
+                AWG.write(el + 'JTARget:TYPE OFF')
+
+        for wfname in sorted(set(old_digests) - set(packed_waveforms)):
+            AWG.write('WLISt:WAVeform:DELete "{}"'.format(wfname))
+
+        error = AWG.ask('SYSTem:ERRor:NEXT?')
+        if not error.startswith('0'):
+            raise RuntimeError('AWG error: {}'.format(error))
+        return nr_uploaded
+
     def check_sequence_consistency(self, packed_waveforms,
                                    wfname_l,
                                    nrep_l, wait_l, goto_l, logic_jump_l):
@@ -412,6 +601,7 @@ class Pulsar:
             Function to load an AWG sequence from its internal hard drive
             No possibility for jump statements
             """
+            self.invalidate_awg_manifest()
             old_timeout = self.AWG.timeout()
             self.AWG.timeout(max(180, old_timeout))
             channels = kw.pop('channels', 'all')
@@ -457,3 +647,244 @@ class Pulsar:
                 chan_dict['high'] = ch_amp/2
 
         return self.channels, offsets
+
+
+def pack_awg5014_waveform(wf, m1, m2):
+    """
+    Packs a waveform and two markers into the 16-bit integer format of the
+    AWG5014, as AWG5014.pack_waveform does. Used by the worker processes of
+    pack_elements_parallel, to which the instrument can not be sent.
+    """
+    if (not((len(wf) == len(m1)) and ((len(m1) == len(m2))))):
+        raise Exception('error: sizes of the waveforms do not match')
+    if np.min(wf) < -1 or np.max(wf) > 1:
+        raise TypeError('Waveform values out of bonds.' +
+                        ' Allowed values: -1 to 1 (inclusive)')
+    if not np.all(np.in1d(m1, np.array([0, 1]))):
+        raise TypeError('Marker 1 contains invalid values.' +
+                        ' Only 0 and 1 are allowed')
+    if not np.all(np.in1d(m2, np.array([0, 1]))):
+        raise TypeError('Marker 2 contains invalid values.' +
+                        ' Only 0 and 1 are allowed')
+
+    packed_wf = np.zeros(len(wf), dtype=np.uint16)
+    packed_wf += np.uint16(np.round(wf * 8191) + 8191 +
+                           np.round(16384 * m1) +
+                           np.round(32768 * m2))
+    return packed_wf
+
+
+def pack_element_waveforms(element, chan_groups, pack_waveform):
+    """
+    Computes the normalized waveforms of an element and packs them per AWG
+    channel.
+
+    Args:
+        element (Element)
+        chan_groups (dict): {channel id: {subchannel id: channel name or
+            None}} of the AWG channels to pack, as returned by
+            Pulsar.get_channel_names_by_id
+        pack_waveform (function): packs a waveform and two markers, e.g.
+            AWG.pack_waveform
+    Returns:
+        packed_wfs (OrderedDict): {channel id: packed waveform}
+        non_zero_first_point (bool): True if a waveform of the element does
+            not start at zero
+    """
+    tvals, wfs = element.normalized_waveforms()
+    packed_wfs = OrderedDict()
+    non_zero_first_point = False
+    for id, grp in chan_groups.items():
+        chan_wfs = {}
+        for sid in [id, id+'_marker1', id+'_marker2']:
+            if grp.get(sid) is not None and grp[sid] in wfs:
+                chan_wfs[sid] = wfs[grp[sid]]
+                if chan_wfs[sid][0] != 0.:
+                    non_zero_first_point = True
+            else:
+                chan_wfs[sid] = np.zeros(element.samples())
+        packed_wfs[id] = pack_waveform(chan_wfs[id],
+                                       chan_wfs[id+'_marker1'],
+                                       chan_wfs[id+'_marker2'])
+    return packed_wfs, non_zero_first_point
+
+
+class _PackedWaveforms(Mapping):
+    """
+    The packed waveforms of elements (waveform name -> packed waveform),
+    computed when accessed. The packed waveforms of the element accessed
+    last are kept, such that every element is computed once if the
+    waveforms are accessed in order of their names, as the .awg file is
+    written.
+    """
+
+    def __init__(self, elements, chan_groups, pack_waveform):
+        self.elements = elements
+        self.chan_groups = chan_groups
+        self.pack_waveform = pack_waveform
+        # waveform name -> nr of samples
+        self.lengths = {}
+        # waveform name -> (index of the element, channel id)
+        self._sources = {}
+        self._last = (None, None)
+
+    def add(self, wfname, element_idx, id, nr_samples):
+        self._sources[wfname] = (element_idx, id)
+        self.lengths[wfname] = nr_samples
+
+    def __getitem__(self, wfname):
+        i, id = self._sources[wfname]
+        if self._last[0] != i:
+            element = self.elements[i]
+            self._last = (i, pack_element_waveforms(
+                element, self.chan_groups, self.pack_waveform)[0])
+        return self._last[1][id]
+
+    def __iter__(self):
+        return iter(self._sources)
+
+    def __len__(self):
+        return len(self._sources)
+
+
+# module of the Element class, not imported here as it imports this module
+_ELEMENT_MODULE = __name__.rsplit('.', 1)[0] + '.element'
+
+
+def _class_by_name(module, qualname):
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _reconstruct(module, qualname, state):
+    # unpickles the objects reduced by _ElementPickler
+    cls = _class_by_name(module, qualname)
+    obj = cls.__new__(cls)
+    obj.__dict__.update(state)
+    return obj
+
+
+class _ElementPickler(pickle.Pickler):
+    """
+    Pickles the elements sent to the worker processes of
+    pack_elements_parallel. The sequence modules reload the pulse modules,
+    which leaves pulses and elements of classes that are not the classes in
+    their module anymore, these are pickled by the name of their class.
+    Elements are pickled without the pulsar, which holds the AWG.
+    """
+
+    def reducer_override(self, obj):
+        cls = type(obj)
+        if isinstance(obj, type) or not hasattr(obj, '__dict__'):
+            return NotImplemented
+        state = obj.__dict__
+        if any(c.__name__ == 'Element' and c.__module__ == _ELEMENT_MODULE
+               for c in cls.__mro__):
+            state = state.copy()
+            state['pulsar'] = None
+        elif '<locals>' in cls.__qualname__:
+            return NotImplemented
+        else:
+            try:
+                if _class_by_name(cls.__module__, cls.__qualname__) is cls:
+                    return NotImplemented
+            except (ImportError, AttributeError):
+                return NotImplemented
+        return (_reconstruct, (cls.__module__, cls.__qualname__, state))
+
+
+def _dumps_elements(elements):
+    f = io.BytesIO()
+    _ElementPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(elements)
+    return f.getvalue()
+
+
+def _pack_elements_worker(elements, offsets, chan_groups, pack_waveform,
+                          shm_name):
+    # Runs in a worker process, writes the packed waveforms of the elements
+    # (pickled by _dumps_elements) to the shared memory block at the given
+    # offsets (in samples).
+    from multiprocessing import shared_memory
+    elements = pickle.loads(elements)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buf = np.ndarray((shm.size//2, ), dtype=np.uint16, buffer=shm.buf)
+        non_zero_first_points = []
+        for element, offset in zip(elements, offsets):
+            packed_wfs, non_zero_first_point = pack_element_waveforms(
+                element, chan_groups, pack_waveform)
+            for packed_wf in packed_wfs.values():
+                if len(packed_wf) != element.samples():
+                    raise ValueError('Packed waveform of "{}" has {} samples'
+                                     ', expected {}'.format(
+                                         element.name, len(packed_wf),
+                                         element.samples()))
+                buf[offset:offset+len(packed_wf)] = packed_wf
+                offset += len(packed_wf)
+            non_zero_first_points.append(non_zero_first_point)
+        del buf
+    finally:
+        shm.close()
+    return non_zero_first_points
+
+
+def pack_elements_parallel(elements, chan_groups,
+                           pack_waveform=pack_awg5014_waveform,
+                           processes=None, chunks_per_process=4):
+    """
+    Computes and packs the waveforms of the elements in a pool of worker
+    processes, returns a list with (packed_wfs, non_zero_first_point) of
+    every element as pack_element_waveforms does.
+
+    The elements are pickled and sent to the workers in chunks, the workers
+    pack the waveforms with pack_waveform and write them to a block of
+    shared memory, such that the packed waveforms themselves do not have to
+    be pickled.
+
+    Args:
+        elements (list of Element)
+        chan_groups (dict): see pack_element_waveforms
+        pack_waveform (function): packs a waveform and two markers, has
+            to be picklable, i.e. a module level function and not a method
+            of the instrument
+        processes (int): number of worker processes, None uses all cpus
+        chunks_per_process (int): the elements are split in this number of
+            chunks per process to balance the load
+    """
+    from multiprocessing import shared_memory
+    elements = list(elements)
+    nr_channels = len(chan_groups)
+    offsets = np.concatenate(
+        [[0], np.cumsum([el.samples()*nr_channels for el in elements])])
+    shm = shared_memory.SharedMemory(create=True,
+                                     size=max(2*int(offsets[-1]), 1))
+    processes = processes or os.cpu_count()
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            nr_chunks = processes*chunks_per_process
+            bounds = np.linspace(0, len(elements),
+                                 nr_chunks+1).astype(int)
+            futures = [executor.submit(
+                _pack_elements_worker, _dumps_elements(elements[i0:i1]),
+                offsets[i0:i1].tolist(), chan_groups, pack_waveform, shm.name)
+                for i0, i1 in zip(bounds[:-1], bounds[1:]) if i1 > i0]
+            non_zero_first_points = [
+                non_zero for future in futures for non_zero in
+                future.result()]
+
+        buf = np.ndarray((shm.size//2, ), dtype=np.uint16, buffer=shm.buf)
+        packed_elements = []
+        for i, element in enumerate(elements):
+            offset = int(offsets[i])
+            packed_wfs = OrderedDict()
+            for id in chan_groups:
+                packed_wfs[id] = buf[offset:offset+element.samples()].copy()
+                offset += element.samples()
+            packed_elements.append((packed_wfs, non_zero_first_points[i]))
+        del buf
+    finally:
+        shm.close()
+        shm.unlink()
+    return packed_elements
@@ -17,6 +17,62 @@ def cp(pulse, *arg, **kw):
     return pulse_copy(*arg, **kw)
 
 
+class PulseSpec:
+    """
+    Immutable specification of a pulse: the pulse class and the arguments
+    to create it with, stored as a tuple of (name, value) pairs.
+
+    Specs can be shared between elements and sequences. Element.add creates
+    a new pulse from the spec instead of deep-copying a pulse object. Use
+    with_ to get a spec with some arguments changed, e.g.
+        X180 = PulseSpec(SSB_DRAG_pulse, name='X180', I_channel='ch1',
+                         Q_channel='ch2', amplitude=0.5, sigma=5e-9)
+        X90 = X180.with_(name='X90', amplitude=0.25)
+    Lists are stored as tuples, such that the pulses created from a spec do
+    not share mutable arguments.
+    """
+    __slots__ = ('pulse_class', 'pars')
+
+    def __init__(self, pulse_class, **pars):
+        object.__setattr__(self, 'pulse_class', pulse_class)
+        object.__setattr__(self, 'pars', tuple(sorted(
+            (k, tuple(v) if isinstance(v, list) else v)
+            for k, v in pars.items())))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PulseSpec is immutable, use with_')
+
+    def __getitem__(self, key):
+        return dict(self.pars)[key]
+
+    def __eq__(self, other):
+        return (isinstance(other, PulseSpec) and
+                self.pulse_class is other.pulse_class and
+                self.pars == other.pars)
+
+    def __hash__(self):
+        return hash((self.pulse_class, self.pars))
+
+    def __repr__(self):
+        return 'PulseSpec({}, {})'.format(
+            self.pulse_class.__name__,
+            ', '.join('{}={!r}'.format(k, v) for k, v in self.pars))
+
+    def with_(self, **kw):
+        """
+        Returns a new spec with the arguments in kw changed.
+        """
+        pars = dict(self.pars)
+        pars.update(kw)
+        return PulseSpec(self.pulse_class, **pars)
+
+    def create(self):
+        """
+        Returns a new pulse object.
+        """
+        return self.pulse_class(**dict(self.pars))
+
+
 class Pulse:
     """
     A generic pulse. The idea is that a certain implementation of a pulse
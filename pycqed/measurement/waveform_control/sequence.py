@@ -14,15 +14,43 @@ class Sequence:
     they are available lies with the Pulsar. N.B. this means that
     Sequence.elements does not contain instances of the Element class, only
     names and meta-data.
+
+    The position of every element is kept in a name -> index dict such
+    that looking up elements by name does not scale with the length of the
+    sequence.
     """
 
     def __init__(self, name):
         self.name = name
 
         self.elements = []
+        self._element_indices = {}
 
         self.djump_table = None
 
+    def _update_element_indices(self, start_idx=0):
+        for i in range(start_idx, len(self.elements)):
+            self._element_indices[self.elements[i]['name']] = i
+
+    def _get_element_indices(self):
+        # self.elements is public and can be modified directly, in that
+        # case the indices are rebuilt.
+        if len(self._element_indices) != len(self.elements):
+            self._element_indices = {}
+            self._update_element_indices()
+        return self._element_indices
+
+    def _insert_element_spec(self, elt, pos=None):
+        indices = self._get_element_indices()
+        if pos is None or pos >= len(self.elements):
+            pos = len(self.elements)
+        elif pos < 0:
+            pos = max(len(self.elements) + pos, 0)
+        self.elements.insert(pos, elt)
+        indices[elt['name']] = pos
+        if pos < len(self.elements) - 1:
+            self._update_element_indices(pos + 1)
+
     def _make_element_spec(self, name, wfname, repetitions, goto_target,
                            jump_target, trigger_wait):
 
@@ -40,21 +68,27 @@ class Sequence:
                        goto_target=None, jump_target=None, trigger_wait=False,
                        **kw):
 
-        for elt in self.elements:
-            if elt['name'] == name:
-                print('insert_element')
-                print(name)
-                print('Sequence names must be unique. Not added.')
-                return False
+        if self.has_element(name):
+            print('insert_element')
+            print(name)
+            print('Sequence names must be unique. Not added.')
+            return False
 
         elt = self._make_element_spec(name, wfname, repetitions, goto_target,
             jump_target, trigger_wait)
 
-        if pos == None:
-            pos = len(self.elements)
-        self.elements.insert(pos, elt)
+        self._insert_element_spec(elt, pos)
         return True
 
+    def remove_element(self, name):
+        '''
+        Removes the element with the given name from the sequence.
+        '''
+        idx = self.element_index(name, start_idx=0)
+        del self.elements[idx]
+        del self._element_indices[name]
+        self._update_element_indices(idx)
+
     def append(self, name, wfname, **kw):
         '''
         Takes name wfname and other arguments as input. Does not take an element as input
@@ -64,9 +98,20 @@ class Sequence:
     def element_count(self):
         return len(self.elements)
 
+    def has_element(self, name):
+        return name in self._get_element_indices()
+
     def element_index(self, name, start_idx=1):
-        names = [self.elements[i]['name'] for i in range(len(self.elements))]
-        return names.index(name)+start_idx
+        indices = self._get_element_indices()
+        idx = indices.get(name)
+        if idx is None or self.elements[idx]['name'] != name:
+            # elements were modified directly, rebuild the indices
+            self._element_indices = {}
+            self._update_element_indices()
+            idx = self._element_indices.get(name)
+            if idx is None:
+                raise ValueError('{} is not in sequence'.format(name))
+        return idx+start_idx
 
     def set_djump(self, state):
         if state is True:
@@ -97,13 +142,10 @@ class Sequence:
         insertable_elt = self._make_element_spec(name, wfname, repetitions,
                                                  goto_target, jump_target,
                                                  trigger_wait)
-        for elt in self.elements:
-            if elt['name'] == insertable_elt['name']:
-                print('append_element')
-                print(element.name)
-                print('Sequence names must be unique. Not added.')
-                return False
-        if pos is None:
-            pos = len(self.elements)
-        self.elements.insert(pos, insertable_elt)
+        if self.has_element(insertable_elt['name']):
+            print('append_element')
+            print(element.name)
+            print('Sequence names must be unique. Not added.')
+            return False
+        self._insert_element_spec(insertable_elt, pos)
         return True
@@ -0,0 +1,176 @@
+# Content addressed cache for the waveforms of pulses.
+#
+# Calibration loops regenerate near identical elements many times, the
+# waveform of a pulse only depends on its class, its parameters, the channel
+# and the time values it is evaluated at. This module caches the waveforms
+# using a hash of these properties as key. The rendered waveforms of
+# elements are kept in the same cache (see Element.ideal_waveforms), such
+# that a single memory budget applies to both.
+
+import hashlib
+import numbers
+from collections import OrderedDict
+import numpy as np
+
+# Attributes of a pulse that do not affect the waveform. The start time
+# (_t0) is accounted for by the time values.
+_IGNORED_ATTRIBUTES = ('name', '_t0', '_clock')
+
+
+class WaveformCache:
+    """
+    Least recently used cache for pulse waveforms with a memory budget.
+
+    Cached waveforms are read-only arrays, modifying them raises a
+    ValueError rather than silently changing the waveforms of other
+    elements.
+    """
+
+    def __init__(self, max_bytes=256e6, enabled=True):
+        """
+        Args:
+            max_bytes (float): memory budget of the cache in bytes, the
+                least recently used waveforms are removed when exceeded.
+            enabled (bool): if False all lookups are a miss and nothing
+                gets stored.
+        """
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._wfs = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._wfs)
+
+    def clear(self):
+        """
+        Removes all waveforms and resets the hit/miss counters.
+        """
+        self._wfs.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def statistics(self):
+        """
+        Returns a dict with the hits, misses, hit rate, number of cached
+        waveforms and the memory used.
+        """
+        nr_lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits/nr_lookups if nr_lookups else 0.,
+                'nr_waveforms': len(self._wfs),
+                'nbytes': self.nbytes}
+
+    def get_wfs(self, pulse, tvals, clock):
+        """
+        Returns the waveforms of a pulse as a dict of read-only arrays,
+        equivalent to pulse.get_wfs(tvals).
+
+        Args:
+            pulse (Pulse): the pulse to get the waveforms of
+            tvals (array or dict): time values, either one array for all
+                channels or a dict with an array per channel.
+            clock (float): sample rate used to generate the time values
+        """
+        pulse_key = None
+        if self.enabled:
+            pulse_key = pulse_hash(pulse)
+        if pulse_key is None:
+            return pulse.get_wfs(tvals)
+
+        keys = {}
+        for c in pulse.channels:
+            c_tvals = tvals[c] if isinstance(tvals, dict) else tvals
+            keys[c] = (pulse_key, c, clock, len(c_tvals),
+                       hashlib.sha1(np.ascontiguousarray(
+                           c_tvals, dtype=float)).hexdigest())
+
+        if all(key in self._wfs for key in keys.values()):
+            self.hits += 1
+            wfs = {}
+            for c, key in keys.items():
+                self._wfs.move_to_end(key)
+                wfs[c] = self._wfs[key]
+            return wfs
+
+        self.misses += 1
+        wfs = pulse.get_wfs(tvals)
+        for c, key in keys.items():
+            wfs[c] = np.array(wfs[c], dtype=float)
+            wfs[c].flags.writeable = False
+            self._store(key, wfs[c])
+        return wfs
+
+    def get_array(self, key):
+        """
+        Returns the read-only array stored under key by store_array, or
+        None if it is not (or no longer) in the cache.
+        """
+        if not self.enabled:
+            return None
+        if key not in self._wfs:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._wfs.move_to_end(key)
+        return self._wfs[key]
+
+    def store_array(self, key, array):
+        """
+        Stores an array (e.g. the rendered waveforms of an element) under a
+        key, the array is made read-only and counts towards max_bytes.
+        """
+        if self.enabled:
+            array.flags.writeable = False
+            self._store(key, array)
+
+    def _store(self, key, wf):
+        if wf.nbytes > self.max_bytes:
+            return
+        old_wf = self._wfs.pop(key, None)
+        if old_wf is not None:
+            self.nbytes -= old_wf.nbytes
+        self._wfs[key] = wf
+        self.nbytes += wf.nbytes
+        while self.nbytes > self.max_bytes:
+            _, removed_wf = self._wfs.popitem(last=False)
+            self.nbytes -= removed_wf.nbytes
+
+
+def pulse_hash(pulse):
+    """
+    Returns a hash of the class and the parameters of a pulse.
+    Returns None if the pulse has parameters that cannot be hashed reliably
+    (e.g. other objects), such pulses are never cached.
+    """
+    try:
+        pars = tuple((k, _hashable(v)) for k, v in sorted(vars(pulse).items())
+                     if k not in _IGNORED_ATTRIBUTES)
+    except TypeError:
+        return None
+    cls = type(pulse)
+    return hashlib.sha1(repr((cls.__module__, cls.__qualname__, pars)).encode(
+        'utf-8')).hexdigest()
+
+
+def _hashable(value):
+    if value is None or isinstance(value, (str, bool, numbers.Number)):
+        return value
+    elif isinstance(value, np.ndarray):
+        return ('ndarray', value.dtype.str, value.shape,
+                hashlib.sha1(np.ascontiguousarray(value)).hexdigest())
+    elif isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_hashable(v) for v in value))
+    elif isinstance(value, dict):
+        return ('dict', tuple(sorted((repr(k), _hashable(v))
+                                     for k, v in value.items())))
+    else:
+        raise TypeError('Cannot hash value of type {}'.format(type(value)))
+
+
+# Process wide cache used by the Element
+waveform_cache = WaveformCache()
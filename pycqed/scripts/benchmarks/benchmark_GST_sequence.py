@@ -0,0 +1,74 @@
+'''
+Benchmark of building a gate set tomography sequence.
+
+Builds the elements of a 4000 element GST sequence (the first 4000 gate
+sequences of GST_5prim_L_128_N_4615.txt) with GST_from_textfile, without
+computing the waveforms or uploading. multi_pulse_elt adds the pulses as
+PulseSpecs, for comparison the legacy build creates a pulse object for
+every PulseSpec, which Element.add then deep-copies.
+No AWG is required.
+
+Usage:
+    python benchmark_GST_sequence.py [nr_elements]
+'''
+import os
+import sys
+import shutil
+import tempfile
+import time
+from pycqed.measurement.waveform_control import element
+from pycqed.measurement.pulse_sequences import gate_set_tomography as gst
+from pycqed.tests.test_pulsar import MockStation, pulse_pars, RO_pars
+
+GST_file = os.path.join(
+    os.path.dirname(gst.__file__), '_pygsti_Gatesequences',
+    'five_primitives', 'GST_5prim_L_128_N_4615.txt')
+
+
+def write_GST_file(filename, nr_elements):
+    with open(GST_file) as f:
+        lines = f.read().split('\n')
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines[:nr_elements+1]) + '\n')
+
+
+def build_GST_sequence(filename):
+    t0 = time.time()
+    seq, el_list = gst.GST_from_textfile(pulse_pars, RO_pars, filename,
+                                         upload=False)
+    return time.time() - t0, el_list
+
+
+if __name__ == '__main__':
+    nr_elements = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    gst.station = MockStation()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp_dir, 'GST.txt')
+        write_GST_file(filename, nr_elements)
+
+        t_spec, el_list = build_GST_sequence(filename)
+        nr_pulses = sum(len(el.pulses) for el in el_list)
+
+        add = element.Element.add
+
+        def legacy_add(self, pulse, *args, **kw):
+            if type(pulse).__name__ == 'PulseSpec':
+                pulse = pulse.create()
+            return add(self, pulse, *args, **kw)
+        element.Element.add = legacy_add
+        try:
+            t_legacy, legacy_el_list = build_GST_sequence(filename)
+        finally:
+            element.Element.add = add
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    for el, legacy_el in zip(el_list, legacy_el_list):
+        assert el.samples() == legacy_el.samples()
+    print('{} elements, {} pulses'.format(len(el_list), nr_pulses))
+    print('PulseSpec:  {:.2f} s ({:.1f} us/pulse)'.format(
+        t_spec, 1e6*t_spec/nr_pulses))
+    print('deepcopy:   {:.2f} s ({:.1f} us/pulse)'.format(
+        t_legacy, 1e6*t_legacy/nr_pulses))
+    print('Speedup: {:.1f}x'.format(t_legacy/t_spec))
@@ -0,0 +1,83 @@
+'''
+Benchmark of the memory used to create and send an .awg file.
+
+Programs a randomized benchmarking sequence on a mock AWG5014, once with
+the .awg file generated in memory (generate_awg_file) and once streamed
+to the AWG while it is written (program_awg(stream=True)), and reports the
+peak of the memory allocated during program_awg (tracemalloc) and its
+time. The data sent to the AWG is not kept, only its hash, which is used
+to check that both files are byte-identical. The elements keep their
+rendered waveforms, unless streamed.
+No AWG is required.
+
+Usage:
+    python benchmark_awg_file_streaming.py [nr_seeds]
+'''
+import sys
+import time
+import hashlib
+import tracemalloc
+import numpy as np
+from pycqed.measurement.waveform_control.waveform_cache import waveform_cache
+from pycqed.measurement.pulse_sequences import single_qubit_tek_seq_elts as sqs
+from pycqed.tests.test_pulsar import MockStation, pulse_pars, RO_pars
+
+
+class HashingVisaHandle:
+    '''
+    Keeps only the hash of the messages sent to the AWG.
+    '''
+
+    def __init__(self):
+        self.sha1 = hashlib.sha1()
+
+    def write_raw(self, message):
+        self.sha1.update(message)
+
+
+def send_awg_file(AWG, filename, awg_file):
+    AWG.visa_handle.write_raw('MMEMory:DATA "{}",#{}{}'.format(
+        filename, len(str(len(awg_file))), len(awg_file)).encode('ASCII') +
+        awg_file)
+
+
+def program_awg(stream):
+    station = MockStation()
+    AWG = station.AWG
+    AWG.visa_handle = HashingVisaHandle()
+    AWG.send_awg_file = lambda filename, awg_file: send_awg_file(
+        AWG, filename, awg_file)
+    AWG.load_awg_file = lambda filename: None
+    sqs.station = station
+    np.random.seed(0)
+    seq, el_list = sqs.Randomized_Benchmarking_seq(
+        pulse_pars, RO_pars, nr_cliffords=[1, 10, 50, 100, 200],
+        nr_seeds=nr_seeds, upload=False)
+    waveform_cache.clear()
+    tracemalloc.start()
+    t0 = time.time()
+    awg_file = station.pulsar.program_awg(seq, *el_list, deduplicate=False,
+                                          stream=stream)
+    t = time.time() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    size = None if awg_file is None else len(awg_file)
+    return t, peak, AWG.visa_handle.sha1.digest(), size
+
+
+if __name__ == '__main__':
+    nr_seeds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    results = {}
+    for name, stream in [('in memory', False), ('streamed', True)]:
+        results[name] = program_awg(stream)
+    assert results['streamed'][2] == results['in memory'][2]
+
+    size = results['in memory'][3]
+    print('{} elements, {:.1f} MB .awg file'.format(
+        5*nr_seeds, size/2**20))
+    print('{:>10} {:>16} {:>12} {:>10}'.format(
+        '', 'peak memory (MB)', 'x file size', 'time (s)'))
+    for name in ['in memory', 'streamed']:
+        t, peak = results[name][:2]
+        print('{:>10} {:>16.1f} {:>12.1f} {:>10.2f}'.format(
+            name, peak/2**20, peak/size, t))
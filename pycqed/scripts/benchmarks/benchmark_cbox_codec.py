@@ -0,0 +1,83 @@
+'''
+Microbenchmark of decoding CBox integration log messages.
+
+Compares numpy_codec.decode_message to the legacy python decode_message of
+QuTech_ControlBoxdriver.py. The driver cannot be imported without an
+instrument connection, its loop is reproduced below (with the decode_byte
+it relies on) to time it.
+
+Usage:
+    python benchmark_cbox_codec.py
+'''
+import time
+import numpy as np
+from pycqed.instrument_drivers.physical_instruments._controlbox import \
+    numpy_codec as c
+
+
+def legacy_decode_byte(data_bytes, data_bits_per_byte=7,
+                       signed_integer=False):
+    mask = (1 << data_bits_per_byte) - 1
+    value = 0
+    nr_bits = data_bits_per_byte*len(data_bytes)
+    for byte in data_bytes:
+        value = (value << data_bits_per_byte) | (byte & mask)
+    if signed_integer and value & (1 << (nr_bits-1)):
+        value -= 1 << nr_bits
+    return value
+
+
+def legacy_decode_message(data_bytes, data_bits_per_byte=7,
+                          bytes_per_value=2, signed_integer=False):
+    '''
+    QuTech_ControlBox.decode_message
+    '''
+    message_bytes = bytearray(data_bytes[:-2])
+    if type(data_bits_per_byte) == int:
+        data_bits_per_byte = [data_bits_per_byte]
+    if type(bytes_per_value) == int:
+        bytes_per_value = [bytes_per_value]
+    if type(signed_integer) == bool:
+        signed_integer = [signed_integer]*len(bytes_per_value)
+
+    bytes_per_iteration = sum(bytes_per_value)
+    message_length = len(message_bytes)//bytes_per_iteration
+    values = np.zeros([message_length, len(bytes_per_value)])
+    cum_bytes_per_val = np.cumsum(bytes_per_value)
+
+    for i in range(message_length):
+        iteration_bytes = message_bytes[i*bytes_per_iteration:
+                                        (i+1)*bytes_per_iteration]
+        for j in range(len(bytes_per_value)):
+            if j == 0:
+                byte_val = iteration_bytes[:(cum_bytes_per_val[j])]
+            else:
+                byte_val = iteration_bytes[(cum_bytes_per_val[j-1]):
+                                           (cum_bytes_per_val[j])]
+            values[i, j] = legacy_decode_byte(
+                byte_val, data_bits_per_byte=data_bits_per_byte[j],
+                signed_integer=signed_integer[j])
+    return values
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>12} {:>12} {:>10}'.format(
+        'samples', 'legacy (s)', 'numpy (s)', 'speedup'))
+    for nr_samples in [1000, 10000, 100000, 1000000]:
+        values = np.random.randint(-2**27, 2**27, nr_samples)
+        data_bytes = c.encode_array(values, 7, 4)
+        message = c.create_message(
+            data_bytes=data_bytes + c.calculate_checksum(data_bytes))
+
+        t0 = time.time()
+        decoded_legacy = legacy_decode_message(message, 7, 4,
+                                               signed_integer=True)
+        t_legacy = time.time() - t0
+
+        t0 = time.time()
+        decoded = c.decode_message(message, 7, 4)
+        t_numpy = time.time() - t0
+
+        assert np.array_equal(decoded_legacy[:, 0], decoded)
+        print('{:>10} {:>12.4f} {:>12.4f} {:>10.0f}'.format(
+            nr_samples, t_legacy, t_numpy, t_legacy/t_numpy))
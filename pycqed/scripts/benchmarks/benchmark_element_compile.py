@@ -0,0 +1,145 @@
+'''
+Benchmark of computing the waveforms of an Element.
+
+Builds an element with 200 pulses (DRAG pulses, square pulses and
+markers) on 8 channels with different delays and reports the time of the
+timing queries (samples, offset and ideal_length) and of computing the
+waveforms for the first time and again, for the compiled Element and for
+the legacy implementation, which loops over all pulses and channels in
+every call. The waveform cache is cleared before the first computation.
+
+Usage:
+    python benchmark_element_compile.py [nr_pulses]
+'''
+import sys
+import time
+import numpy as np
+from pycqed.measurement.waveform_control import element
+from pycqed.measurement.waveform_control import pulse
+from pycqed.measurement.waveform_control import pulsar
+from pycqed.measurement.waveform_control import pulse_library as pl
+from pycqed.measurement.waveform_control.waveform_cache import waveform_cache
+
+
+class Legacy_Element(element.Element):
+    def offset(self):
+        if self.ignore_offset_correction:
+            return 0
+        t0s = []
+        for p in self.pulses:
+            for c in self.pulses[p].channels:
+                t0s.append(self.pulses[p].t0() - self._channels[c]['delay'])
+        return min(t0s)
+
+    def ideal_length(self):
+        ts = []
+        for p in self.pulses:
+            for c in self.pulses[p].channels:
+                ts.append(self.pulse_end_time(p, c))
+        return max(ts)
+
+    def samples(self):
+        ends = []
+        for p in self.pulses:
+            for c in self.pulses[p].channels:
+                ends.append(self.pulse_end_sample(p, c))
+        samples = max(ends)+1
+        if samples < self.min_samples:
+            samples = self.min_samples
+        else:
+            while(samples % self.granularity > 0):
+                samples += 1
+        return samples
+
+    def ideal_waveforms(self):
+        wfs = {}
+        tvals = np.arange(self.samples())/self.clock
+        for c in self._channels:
+            wfs[c] = np.zeros(self.samples()) + self._channels[c]['offset']
+        for p in self.pulses:
+            chan_tvals = {}
+            for c in self.pulses[p].channels:
+                idx0 = self.pulse_start_sample(p, c)
+                idx1 = self.pulse_end_sample(p, c) + 1
+                chan_tvals[c] = np.round(tvals.copy()[idx0:idx1] +
+                                         self.channel_delay(c) +
+                                         self.time_offset,
+                                         pulsar.SIGNIFICANT_DIGITS)
+            pulsewfs = waveform_cache.get_wfs(self.pulses[p], chan_tvals,
+                                              self.clock)
+            for c in self.pulses[p].channels:
+                idx0 = self.pulse_start_sample(p, c)
+                idx1 = self.pulse_end_sample(p, c) + 1
+                wfs[c][idx0:idx1] += pulsewfs[c]
+        return tvals, wfs
+
+
+def build_element(element_class, nr_pulses=200, seed=0):
+    rng = np.random.RandomState(seed)
+    el = element_class('benchmark')
+    for i in range(4):
+        el.define_channel('ch{}'.format(i+1), delay=i*2e-9)
+        el.define_channel('ch{}_marker1'.format(i+1), type='marker',
+                          high=2, low=0, delay=i*5e-9)
+    last = None
+    for i in range(nr_pulses):
+        kind = i % 4
+        if kind < 2:
+            ch = 2*kind + 1
+            p = pl.SSB_DRAG_pulse(
+                name='drag', I_channel='ch{}'.format(ch),
+                Q_channel='ch{}'.format(ch+1), sigma=5e-9, motzoi=0.1,
+                amplitude=rng.uniform(0, 0.5), mod_frequency=-50e6)
+        elif kind == 2:
+            p = pulse.SquarePulse(channel='ch{}'.format(rng.randint(1, 5)),
+                                  amplitude=rng.uniform(-0.5, 0.5),
+                                  length=rng.randint(10, 100)*1e-9)
+        else:
+            p = pulse.SquarePulse(
+                channel='ch{}_marker1'.format(rng.randint(1, 5)),
+                amplitude=1, length=20e-9)
+        last = el.add(p, start=rng.randint(0, 20)*1e-9, refpulse=last,
+                      refpoint='start' if kind == 3 else 'end')
+    return el
+
+
+def benchmark(element_class, nr_pulses, nr_repetitions=10):
+    el = build_element(element_class, nr_pulses)
+    waveform_cache.clear()
+
+    t0 = time.time()
+    for i in range(nr_repetitions):
+        el.samples()
+        el.offset()
+        el.ideal_length()
+    t_timing = (time.time() - t0)/nr_repetitions
+
+    t0 = time.time()
+    tvals, wfs = el.normalized_waveforms()
+    t_first = time.time() - t0
+
+    t0 = time.time()
+    for i in range(nr_repetitions):
+        el.normalized_waveforms()
+    t_again = (time.time() - t0)/nr_repetitions
+    return t_timing, t_first, t_again, wfs
+
+
+if __name__ == '__main__':
+    nr_pulses = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    results = {}
+    for name, element_class in [('legacy', Legacy_Element),
+                                ('compiled', element.Element)]:
+        results[name] = benchmark(element_class, nr_pulses)
+    for c, wf in results['legacy'][3].items():
+        assert np.array_equal(wf, results['compiled'][3][c])
+
+    print('{} pulses on 8 channels'.format(nr_pulses))
+    print('{:>10} {:>12} {:>12} {:>12}'.format(
+        '', 'timing (ms)', 'first (ms)', 'again (ms)'))
+    for name in ['legacy', 'compiled']:
+        print('{:>10} {:>12.2f} {:>12.2f} {:>12.2f}'.format(
+            name, *[1e3*t for t in results[name][:3]]))
+    print('Speedup: timing {:.0f}x, first {:.1f}x, again {:.0f}x'.format(
+        *[l/c for l, c in zip(results['legacy'][:3],
+                              results['compiled'][:3])]))
@@ -0,0 +1,65 @@
+'''
+Benchmark of the datasaving of soft sweeps in MeasurementControl.
+
+Compares the number of points per second that can be saved using the
+(old) resize-and-write-per-row approach to the h5d.BufferedDataWriter.
+The data is generated using the Dummy_Detector_Soft.
+
+Usage:
+    python benchmark_hdf5_writer.py
+'''
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from pycqed.measurement import hdf5_data as h5d
+from pycqed.measurement import detector_functions as det
+
+
+def per_row_path(dset, detector, sweep_points):
+    for x in sweep_points:
+        vals = detector.acquire_data_point()
+        iteration = dset.shape[0] + 1
+        dset.resize((iteration, dset.shape[1]))
+        dset[iteration-1, :] = np.append(x, vals)
+
+
+def buffered_path(dset, detector, sweep_points):
+    writer = h5d.BufferedDataWriter(dset, nr_rows=len(sweep_points))
+    try:
+        for x in sweep_points:
+            vals = detector.acquire_data_point()
+            writer.append(np.append(x, vals))
+    finally:
+        writer.close()
+
+
+def benchmark(write_function, nr_points, tmp_dir):
+    detector = det.Dummy_Detector_Soft()
+    sweep_points = np.arange(nr_points)
+    fp = os.path.join(tmp_dir, '%s_%d.hdf5' % (write_function.__name__,
+                                               nr_points))
+    with h5d.Data(name='benchmark', filepath=fp) as data_object:
+        dset = data_object.create_dataset(
+            'Data', (0, 1 + len(detector.value_names)),
+            maxshape=(None, 1 + len(detector.value_names)))
+        t0 = time.time()
+        write_function(dset, detector, sweep_points)
+        data_object.flush()
+        t1 = time.time()
+    return nr_points/(t1-t0), os.path.getsize(fp)
+
+
+if __name__ == '__main__':
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print('{:>8} {:>14} {:>14} {:>8}'.format(
+            'points', 'per row (pt/s)', 'buffer (pt/s)', 'speedup'))
+        for nr_points in [1000, 10000, 50000]:
+            rate_row, size_row = benchmark(per_row_path, nr_points, tmp_dir)
+            rate_buf, size_buf = benchmark(buffered_path, nr_points, tmp_dir)
+            print('{:>8} {:>14.0f} {:>14.0f} {:>8.1f}'.format(
+                nr_points, rate_row, rate_buf, rate_buf/rate_row))
+    finally:
+        shutil.rmtree(tmp_dir)
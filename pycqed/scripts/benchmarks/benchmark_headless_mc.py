@@ -0,0 +1,71 @@
+'''
+Benchmark of the startup cost of MeasurementControl per plot backend.
+
+Every backend is measured in a fresh python process such that the import
+times are not hidden by modules that were already imported. Reported are
+the time to import measurement_control, the time to create a
+MeasurementControl (for pyqtgraph this starts the plotting process), the
+time of the first run (a soft sweep of 100 points) and the peak memory
+(RSS) of the process.
+
+Usage:
+    python benchmark_headless_mc.py
+'''
+import sys
+import json
+import subprocess
+
+backend_code = '''
+import json
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+t0 = time.time()
+from pycqed.measurement import measurement_control as mc
+from pycqed.measurement import hdf5_data as h5d
+from pycqed.measurement import sweep_functions as swf
+from pycqed.measurement import detector_functions as det
+t_import = time.time() - t0
+h5d.qc_config['datadir'] = tempfile.mkdtemp()
+t0 = time.time()
+MC = mc.MeasurementControl('MC_benchmark', plot_backend=sys.argv[1])
+t_init = time.time() - t0
+MC.verbose = False
+MC.set_sweep_function(swf.None_Sweep())
+MC.set_sweep_points(np.arange(100))
+MC.set_detector_function(det.Dummy_Detector_Soft())
+t0 = time.time()
+MC.run('headless_benchmark')
+t_run = time.time() - t0
+print(json.dumps({'import': t_import, 'init': t_init, 'run': t_run,
+                  'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+'''
+
+
+def measure_backend(backend):
+    '''
+    Returns the timings (s) and peak RSS (kB) of the backend, None if the
+    backend is not available (e.g. pyqtgraph is not installed).
+    '''
+    try:
+        output = subprocess.check_output(
+            [sys.executable, '-c', backend_code, backend],
+            stderr=subprocess.DEVNULL)
+    except subprocess.CalledProcessError:
+        return None
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>11} {:>11} {:>14} {:>10}'.format(
+        'backend', 'import (s)', 'init (s)', 'first run (s)', 'RSS (MB)'))
+    for backend in ['headless', 'png', 'pyqtgraph']:
+        result = measure_backend(backend)
+        if result is None:
+            print('{:>10} {:>11}'.format(backend, 'unavailable'))
+            continue
+        print('{:>10} {:>11.3f} {:>11.3f} {:>14.3f} {:>10.1f}'.format(
+            backend, result['import'], result['init'], result['run'],
+            result['rss']/1024))
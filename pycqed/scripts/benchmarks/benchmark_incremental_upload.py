@@ -0,0 +1,55 @@
+'''
+Benchmark of incremental sequence uploads to the AWG5014.
+
+Uploads a Rabi sequence to a mock AWG5014, changes a single amplitude, as
+after a calibration, and uploads the sequence again, once in full (.awg
+file) and once incrementally (only the changed waveforms and the sequence
+table). Reported are the bytes sent to the AWG and the time of the upload.
+No AWG is required.
+
+Usage:
+    python benchmark_incremental_upload.py [nr_amplitudes]
+'''
+import sys
+import time
+import numpy as np
+from pycqed.measurement.pulse_sequences import single_qubit_tek_seq_elts as sqs
+from pycqed.tests.test_pulsar import MockStation, pulse_pars, RO_pars
+
+
+def upload_changed_rabi(amps, incremental):
+    station = MockStation()
+    station.pulsar.incremental_upload = incremental
+    sqs.station = station
+    sqs.Rabi_seq(amps, pulse_pars, RO_pars)
+    amps = amps.copy()
+    amps[len(amps)//2] *= 1.05
+    station.AWG.bytes_transferred = 0
+    t0 = time.time()
+    sqs.Rabi_seq(amps, pulse_pars, RO_pars)
+    return (time.time() - t0, station.AWG.bytes_transferred,
+            station.pulsar.upload_statistics, station.AWG.sequence_table())
+
+
+if __name__ == '__main__':
+    nr_amps = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    amps = np.linspace(0, 0.5, nr_amps)
+    results = {}
+    for name, incremental in [('full', False), ('incremental', True)]:
+        results[name] = upload_changed_rabi(amps, incremental)
+    assert results['incremental'][2]['incremental']
+    for seq_el, ref_seq_el in zip(results['incremental'][3],
+                                  results['full'][3]):
+        for key in ref_seq_el:
+            assert np.array_equal(seq_el[key], ref_seq_el[key])
+
+    print('Rabi sequence of {} elements, 1 amplitude changed'.format(
+        nr_amps))
+    print('{:>12} {:>10} {:>12} {:>10}'.format(
+        '', 'waveforms', 'bytes sent', 'time (s)'))
+    for name in ['full', 'incremental']:
+        t, nr_bytes, stats, seq = results[name]
+        print('{:>12} {:>10} {:>12} {:>10.2f}'.format(
+            name, stats['nr_uploaded_waveforms'], nr_bytes, t))
+    print('Bytes sent: {:.0f}x less'.format(
+        results['full'][1]/results['incremental'][1]))
@@ -0,0 +1,131 @@
+'''
+Benchmark of the pre-distortion of flux pulses.
+
+Generates a chevron sequence of 500 elements (fluxing_sequences
+.chevron_seq_length) and distorts the flux channel with a 20000 sample
+decay kernel and a 3000 sample decay kernel, once by consecutive
+np.convolve calls per element (the original distort_and_compensate) and
+once with fluxing_sequences.distort_elements, which convolves all
+elements in a single batch using the cached frequency response of the
+combined kernel.
+No AWG is required.
+
+Usage:
+    python benchmark_kernel_distortion.py
+'''
+import time
+import numpy as np
+from pycqed.measurement.waveform_control.pulsar import Pulsar
+from pycqed.measurement.waveform_control import kernel_distortion_module as kdm
+from pycqed.measurement.pulse_sequences import fluxing_sequences as fsqs
+from pycqed.instrument_drivers.virtual_instruments.mock_AWG5014 import \
+    Mock_AWG5014
+
+nr_elements = 500
+
+
+class FakeStation:
+    def __init__(self):
+        self.pulsar = Pulsar()
+        self.pulsar.AWG = Mock_AWG5014()
+        for i in range(4):
+            self.pulsar.define_channel(
+                id='ch{}'.format(i+1), name='ch{}'.format(i+1),
+                type='analog', high=1, low=-1, offset=0.0, delay=0,
+                active=True)
+            for j in range(2):
+                self.pulsar.define_channel(
+                    id='ch{}_marker{}'.format(i+1, j+1),
+                    name='ch{}_marker{}'.format(i+1, j+1),
+                    type='marker', high=2.0, low=0, offset=0., delay=0,
+                    active=True)
+        self.components = {'AWG': self.pulsar.AWG}
+
+
+mw_pulse_pars = {'I_channel': 'ch1', 'Q_channel': 'ch2',
+                 'amplitude': 0.5, 'amp90_scale': 0.5,
+                 'sigma': 5e-9, 'nr_sigma': 4, 'motzoi': 0.1,
+                 'mod_frequency': -50e6, 'phase': 0, 'phi_skew': 0,
+                 'alpha': 1, 'pulse_delay': 30e-9,
+                 'pulse_type': 'SSB_DRAG_pulse'}
+
+RO_pars = {'I_channel': 'ch3', 'Q_channel': 'ch3',
+           'RO_pulse_marker_channel': 'ch3_marker1',
+           'amplitude': 0.1, 'length': 300e-9, 'pulse_delay': 20e-9,
+           'mod_frequency': 25e6, 'fixed_point_frequency': 50e6,
+           'acq_marker_delay': 0, 'acq_marker_channel': 'ch1_marker1',
+           'phase': 0, 'pulse_type': 'MW_IQmod_pulse_tek'}
+
+flux_pulse_pars = {'pulse_type': 'SquarePulse', 'pulse_delay': .1e-6,
+                   'channel': 'ch4', 'amplitude': 0.5, 'length': .1e-6}
+
+
+def decay_kernel(amp=1., tau=11000, length=20000):
+    # same as kernel_object.decay_kernel
+    t_kernel = np.arange(length)
+    decay_kernel_step = 1 + amp*np.exp(-t_kernel/tau)
+    decay_kernel = np.zeros(decay_kernel_step.shape)
+    decay_kernel[0] = decay_kernel_step[0]
+    decay_kernel[1:] = decay_kernel_step[1:]-decay_kernel_step[:-1]
+    return decay_kernel
+
+
+def legacy_distort_and_compensate(element, distortion_dict,
+                                  preloaded_kernels):
+    t_vals, outputs_dict = element.waveforms()
+    for ch in distortion_dict['ch_list']:
+        element._channels[ch]['distorted'] = True
+        length = len(outputs_dict[ch])
+        for kernelvec in preloaded_kernels[ch]:
+            outputs_dict[ch] = np.convolve(outputs_dict[ch],
+                                           kernelvec)[:length]
+        element.distorted_wfs[ch] = outputs_dict[ch][:len(t_vals)]
+    return element
+
+
+def reset_distortion(el_list, ch):
+    for el in el_list:
+        el._channels[ch]['distorted'] = False
+        el.distorted_wfs.pop(ch, None)
+
+
+if __name__ == '__main__':
+    fsqs.station = FakeStation()
+    lengths = 10e-9 + np.arange(nr_elements)*1e-9
+    seq, el_list = fsqs.chevron_seq_length(
+        lengths, mw_pulse_pars, RO_pars, flux_pulse_pars=flux_pulse_pars,
+        distortion_dict={'ch_list': []}, upload=False, return_seq=True)
+    el_list = el_list[:nr_elements]
+    distortion_dict = {'ch_list': ['ch4']}
+    kernels = {'ch4': [decay_kernel(),
+                       decay_kernel(amp=-0.1, tau=500, length=3000)]}
+    nr_samples = len(el_list[-1].waveforms()[0])
+    print('{} elements of up to {} samples'.format(nr_elements, nr_samples))
+
+    t0 = time.time()
+    for el in el_list:
+        el.waveforms()
+    t_wfs = time.time() - t0
+    print('Generating waveforms:          {:.2f} s'.format(t_wfs))
+
+    t0 = time.time()
+    for el in el_list:
+        legacy_distort_and_compensate(el, distortion_dict, kernels)
+    t_legacy = time.time() - t0
+    legacy_wfs = [el.distorted_wfs['ch4'] for el in el_list]
+    print('Consecutive np.convolve:       {:.2f} s'.format(t_legacy))
+
+    for label in ['Batch FFT (first call):', 'Batch FFT (cached kernel):']:
+        reset_distortion(el_list, 'ch4')
+        t0 = time.time()
+        fsqs.distort_elements(el_list, distortion_dict, kernels)
+        t_fft = time.time() - t0
+        print('{:<30} {:.2f} s, speedup {:.0f}x ({:.0f}x without '
+              'generating the waveforms)'.format(
+                  label, t_fft, t_legacy/t_fft,
+                  (t_legacy-t_wfs)/max(t_fft-t_wfs, 1e-9)))
+
+    max_diff = max(np.max(np.abs(el.distorted_wfs['ch4'] - wf))
+                   for el, wf in zip(el_list, legacy_wfs))
+    print('Maximum difference: {:.1e}'.format(max_diff))
+    kdm._engine_cache.clear()
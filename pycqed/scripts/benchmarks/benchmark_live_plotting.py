@@ -0,0 +1,76 @@
+'''
+Benchmark of the live plotting overhead of MeasurementControl.
+
+Runs soft sweeps of 100 to 100k points with a detector that returns
+immediately and reports the time per point with live plotting disabled,
+with the incremental plot monitor (only the new points are sent to the
+plotting process) and with the original plot monitor that reads back the
+full columns from the hdf5 file at every update.
+The plotting interval is set to 0.1 s to show the effect of many updates.
+
+Usage:
+    python benchmark_live_plotting.py
+'''
+import time
+import tempfile
+import numpy as np
+from pycqed.measurement import hdf5_data as h5d
+from pycqed.measurement import sweep_functions as swf
+from pycqed.measurement import detector_functions as det
+from pycqed.measurement.measurement_control import MeasurementControl
+
+
+class Legacy_Plotmon_MC(MeasurementControl):
+    '''
+    MeasurementControl with the update_plotmon from before the data was
+    kept in memory.
+    '''
+    def update_plotmon(self, force_update=False):
+        if self.live_plot_enabled:
+            i = 0
+            try:
+                time_since_last_mon_update = time.time() - self._mon_upd_time
+            except:
+                self._mon_upd_time = time.time()
+                time_since_last_mon_update = 1e9
+            nr_rows = self.get_nr_rows_acquired()
+            if (nr_rows < 20 or time_since_last_mon_update >
+                    self.plot_sink.interval or force_update):
+                if self.data_writer is not None:
+                    self.data_writer.flush()
+                nr_sweep_funcs = len(self.sweep_function_names)
+                for y_ind in range(len(self.detector_function.value_names)):
+                    for x_ind in range(nr_sweep_funcs):
+                        x = self.dset[:nr_rows, x_ind]
+                        y = self.dset[:nr_rows, nr_sweep_funcs+y_ind]
+                        self.plot_sink.curves[i].setData(x, y)
+                        i += 1
+                self._mon_upd_time = time.time()
+
+
+def time_per_point(MC, nr_points, live_plot_enabled):
+    MC.live_plot_enabled = live_plot_enabled
+    MC.set_sweep_function(swf.None_Sweep())
+    MC.set_sweep_points(np.arange(nr_points))
+    MC.set_detector_function(det.Dummy_Detector_Soft())
+    t0 = time.time()
+    MC.run('live_plotting_benchmark')
+    return (time.time() - t0)/nr_points
+
+
+if __name__ == '__main__':
+    h5d.qc_config['datadir'] = tempfile.mkdtemp()
+    MC = MeasurementControl('MC_benchmark', plotting_interval=0.1)
+    MC.verbose = False
+    legacy_MC = Legacy_Plotmon_MC('MC_legacy_benchmark',
+                                  plotting_interval=0.1)
+    legacy_MC.verbose = False
+
+    print('{:>8} {:>14} {:>14} {:>14}'.format(
+        'points', 'no plot (us)', 'buffer (us)', 'hdf5 (us)'))
+    for nr_points in [100, 1000, 10000, 100000]:
+        t_none = time_per_point(MC, nr_points, False)
+        t_buffer = time_per_point(MC, nr_points, True)
+        t_legacy = time_per_point(legacy_MC, nr_points, True)
+        print('{:>8} {:>14.1f} {:>14.1f} {:>14.1f}'.format(
+            nr_points, 1e6*t_none, 1e6*t_buffer, 1e6*t_legacy))
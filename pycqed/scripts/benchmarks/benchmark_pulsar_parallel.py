@@ -0,0 +1,49 @@
+'''
+Benchmark of computing and packing the waveforms of a sequence in parallel.
+
+Builds a randomized benchmarking sequence and programs it on a mock
+AWG5014 (the .awg file is created but not uploaded), once with the
+waveforms computed and packed in this process and once in worker
+processes. The waveform cache is cleared before every run and both .awg
+files are checked to be byte-identical.
+No AWG is required.
+
+Usage:
+    python benchmark_pulsar_parallel.py [nr_seeds] [processes]
+'''
+import os
+import sys
+import time
+import numpy as np
+from pycqed.measurement.waveform_control.waveform_cache import waveform_cache
+from pycqed.measurement.pulse_sequences import single_qubit_tek_seq_elts as sqs
+from pycqed.tests.test_pulsar import MockStation, pulse_pars, RO_pars
+
+
+def program_awg(station, seq, el_list, processes):
+    waveform_cache.clear()
+    t0 = time.time()
+    awg_file = station.pulsar.program_awg(seq, *el_list, processes=processes)
+    return time.time() - t0, awg_file
+
+
+if __name__ == '__main__':
+    nr_seeds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    station = MockStation()
+    sqs.station = station
+    np.random.seed(0)
+    seq, el_list = sqs.Randomized_Benchmarking_seq(
+        pulse_pars, RO_pars, nr_cliffords=[1, 10, 50, 100, 200],
+        nr_seeds=nr_seeds, upload=False)
+
+    t_serial, awg_file = program_awg(station, seq, el_list, 1)
+    t_parallel, awg_file_parallel = program_awg(station, seq, el_list,
+                                                processes)
+    assert awg_file_parallel == awg_file
+
+    print('{} elements, {:.1f} MB .awg file, {} cpus'.format(
+        len(el_list), len(awg_file)/2**20, os.cpu_count()))
+    print('serial:             {:.2f} s'.format(t_serial))
+    print('{:>2} processes:       {:.2f} s'.format(processes, t_parallel))
+    print('Speedup: {:.1f}x'.format(t_serial/t_parallel))
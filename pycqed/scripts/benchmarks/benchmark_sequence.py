@@ -0,0 +1,44 @@
+'''
+Scaling benchmark of building and indexing a Sequence.
+
+For sequences of 100 to 8000 elements every element is appended and its
+index is looked up (as Pulsar.program_awg does for the goto and jump
+targets). The time per element should be constant, i.e. the total time
+scales linearly with the length of the sequence. The legacy lookup, which
+rebuilds the list of names on every call, is shown for comparison.
+
+Usage:
+    python benchmark_sequence.py
+'''
+import time
+from pycqed.measurement.waveform_control.sequence import Sequence
+
+
+def legacy_element_index(seq, name, start_idx=1):
+    names = [seq.elements[i]['name'] for i in range(len(seq.elements))]
+    return names.index(name)+start_idx
+
+
+def build_and_index(nr_elements, element_index):
+    t0 = time.time()
+    seq = Sequence('benchmark')
+    for i in range(nr_elements):
+        seq.append('el{}'.format(i), wfname='el{}'.format(i),
+                   trigger_wait=True, goto_target='el0')
+    for elt in seq.elements:
+        element_index(seq, elt['goto_target'])
+        element_index(seq, elt['name'])
+    return time.time() - t0
+
+
+if __name__ == '__main__':
+    print('{:>8} {:>12} {:>14} {:>12} {:>14}'.format(
+        'elements', 'dict (s)', 'dict (us/el)', 'legacy (s)',
+        'legacy (us/el)'))
+    for nr_elements in [100, 500, 1000, 2000, 4000, 8000]:
+        t_dict = build_and_index(
+            nr_elements, lambda seq, name: seq.element_index(name))
+        t_legacy = build_and_index(nr_elements, legacy_element_index)
+        print('{:>8} {:>12.4f} {:>14.2f} {:>12.4f} {:>14.2f}'.format(
+            nr_elements, t_dict, 1e6*t_dict/nr_elements,
+            t_legacy, 1e6*t_legacy/nr_elements))
@@ -0,0 +1,81 @@
+'''
+Benchmark of the storage layout of large single-shot datasets.
+
+Synthetic single-shot data (shot index and the integrated I and Q values
+of two gaussian blobs, as returned by the integration logging detectors)
+is written to the "Experimental Data/Data" dataset as created by
+h5d.create_data_dataset, in blocks as done by MeasurementControl for hard
+detectors. For every dtype and compression filter the file size, the
+write throughput and the throughput of reading a single column (as done by
+MeasurementAnalysis.get_values) are reported. Throughputs are in MB/s of
+float64 data, the size the data has in memory.
+
+Usage:
+    python benchmark_shot_data_storage.py [nr_shots]
+'''
+import os
+import sys
+import shutil
+import tempfile
+import time
+import h5py
+import numpy as np
+from pycqed.measurement import hdf5_data as h5d
+
+layouts = [('f8', None), ('f4', None), ('f4', 'lzf'), ('f4', 'shuffle+lzf'),
+           ('f4', 'gzip'), ('i2', None), ('i2', 'lzf'), ('i2', 'shuffle+lzf'),
+           ('i2', 'shuffle+gzip')]
+
+
+def synthetic_shots(nr_shots, seed=0):
+    '''
+    Returns rows (shot index, I, Q) of integrated ADC values of a qubit
+    prepared in 0 or 1.
+    '''
+    rng = np.random.RandomState(seed)
+    states = rng.randint(2, size=nr_shots)
+    centers = np.array([[-900., 300.], [700., -500.]])
+    IQ = np.round(centers[states] + rng.normal(0, 250, (nr_shots, 2)))
+    return np.column_stack([np.arange(nr_shots) % 2**15, IQ])
+
+
+def benchmark(data, dtype, compression, tmp_dir, block_size=2**16):
+    fp = os.path.join(tmp_dir, '{}_{}.hdf5'.format(dtype, compression))
+    t0 = time.time()
+    with h5py.File(fp, 'w') as f:
+        dset = h5d.create_data_dataset(
+            f.create_group('Experimental Data'), 'Data', data.shape[1],
+            nr_rows=len(data), dtype=dtype, compression=compression)
+        dset.resize(data.shape)
+        for start in range(0, len(data), block_size):
+            dset[start:start+block_size] = data[start:start+block_size]
+    t_write = time.time() - t0
+
+    t0 = time.time()
+    with h5py.File(fp, 'r') as f:
+        column = np.asarray(f['Experimental Data']['Data'][:, 1],
+                            dtype=np.float64)
+    t_read = time.time() - t0
+    assert np.array_equal(column, data[:, 1])
+    return os.path.getsize(fp), data.nbytes/t_write, column.nbytes/t_read
+
+
+if __name__ == '__main__':
+    nr_shots = int(sys.argv[1]) if len(sys.argv) > 1 else 2*10**6
+    data = synthetic_shots(nr_shots)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print('{} shots, {:.1f} MB as float64'.format(nr_shots,
+                                                      data.nbytes/2**20))
+        print('{:>6} {:>13} {:>10} {:>8} {:>14} {:>13}'.format(
+            'dtype', 'compression', 'size (MB)', 'ratio', 'write (MB/s)',
+            'read (MB/s)'))
+        for dtype, compression in layouts:
+            size, write_rate, read_rate = benchmark(data, dtype, compression,
+                                                    tmp_dir)
+            print('{:>6} {:>13} {:>10.1f} {:>8.1f} {:>14.0f} {:>13.0f}'
+                  .format(dtype, str(compression), size/2**20,
+                          data.nbytes/size, write_rate/2**20,
+                          read_rate/2**20))
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,167 @@
+'''
+Benchmark of loading large single-shot files in MeasurementAnalysis.
+
+Writes a synthetic single-shot readout file (shot index, I and Q of
+alternating shots without and with a pi pulse) in the format of
+MeasurementControl, once as contiguous float64 dataset and once as the
+chunked float32 dataset MeasurementControl creates. Every variant is run
+in a fresh python process, reported are the time to load the shots as
+done by SSRO_Analysis (get_values of I and Q), the increase of the peak
+memory (RSS) of the process over the RSS after the imports and the time of
+the full SSRO_Analysis.
+
+The variants are
+    legacy  : get_values reads the full dataset for every key (the
+              previous implementation)
+    default : get_values reads and caches single columns
+    mmap    : as default, contiguous float64 datasets are memory-mapped
+              (the mapped pages of the file count towards the RSS but are
+              not allocated)
+
+Usage:
+    python benchmark_ssro_loading.py [nr_shots]
+'''
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+import h5py
+import numpy as np
+from pycqed.measurement import hdf5_data as h5d
+
+variant_code = '''
+import json
+import resource
+import sys
+import time
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.analysis import measurement_analysis as ma
+
+
+def legacy_get_values(self, key):
+    if key in self.get_key('sweep_parameter_names'):
+        ind = self.get_key('sweep_parameter_names').index(key)
+        values = self.g['Data'][()][:, ind]
+    elif key in self.get_key('value_names'):
+        ind = (self.get_key('value_names').index(key) +
+               len(self.get_key('sweep_parameter_names')))
+        values = self.g['Data'][()][:, ind]
+    else:
+        values = self.g[key][()]
+    return np.asarray(values, dtype=np.float64)
+
+
+def peak_rss(reset=False):
+    # peak RSS in kB, on linux the peak is reset such that the memory used
+    # by the imports is not included
+    try:
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+variant, folder = sys.argv[1:3]
+kw = {'mmap': True} if variant == 'mmap' else {}
+if variant == 'legacy':
+    # SSRO_Analysis calls super(self.__class__, self), it can not be
+    # subclassed
+    ma.MeasurementAnalysis.get_values = legacy_get_values
+
+rss_import = peak_rss(reset=True)
+t0 = time.time()
+a = ma.MeasurementAnalysis(folder=folder, auto=False, **kw)
+shots_I_0, shots_I_1 = a_tools.zigzag(a.get_values('I'))
+shots_Q_0, shots_Q_1 = a_tools.zigzag(a.get_values('Q'))
+mean = np.mean(shots_I_0) + np.mean(shots_Q_1)
+t_load = time.time() - t0
+rss_load = peak_rss()
+a.finish()
+
+t0 = time.time()
+try:
+    ma.SSRO_Analysis(folder=folder, close_fig=True, no_fits=True, **kw)
+    t_analysis = time.time() - t0
+except Exception as e:
+    t_analysis = '{}: {}'.format(type(e).__name__, e)
+print(json.dumps({'load': t_load, 'rss_import': rss_import,
+                  'rss_load': rss_load,
+                  'analysis': t_analysis,
+                  'rss': peak_rss()}))
+'''
+
+
+def make_shots_file(datadir, dirname, nr_shots, chunked):
+    '''
+    Writes a file of nr_shots alternating 0 and 1 shots, returns its folder.
+    '''
+    folder = os.path.join(datadir, '20170101', dirname)
+    os.makedirs(folder)
+    rng = np.random.RandomState(0)
+    states = np.arange(nr_shots) % 2
+    IQ = (np.array([[-0.9, 0.3], [0.7, -0.5]])[states] +
+          rng.normal(0, 0.25, (nr_shots, 2)))
+    data = np.column_stack([np.arange(nr_shots), IQ])
+    with h5py.File(os.path.join(folder, dirname + '.hdf5'), 'w') as f:
+        exp_data = f.create_group('Experimental Data')
+        if chunked:
+            dset = h5d.create_data_dataset(exp_data, 'Data', 3,
+                                           nr_rows=nr_shots)
+            dset.resize(data.shape)
+            dset[()] = data
+        else:
+            exp_data.create_dataset('Data', data=data)
+        exp_data.attrs['datasaving_format'] = b'Version 2'
+        exp_data.attrs['sweep_parameter_names'] = [b'shot']
+        exp_data.attrs['sweep_parameter_units'] = [b'#']
+        exp_data.attrs['value_names'] = [b'I', b'Q']
+        exp_data.attrs['value_units'] = [b'V', b'V']
+    return folder
+
+
+def measure_variant(variant, folder):
+    output = subprocess.check_output(
+        [sys.executable, '-c', variant_code, variant, folder],
+        stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    nr_shots = int(sys.argv[1]) if len(sys.argv) > 1 else 10**7
+    datadir = tempfile.mkdtemp()
+    try:
+        print('{} shots'.format(nr_shots))
+        print('{:>12} {:>8} {:>9} {:>14} {:>12} {:>14}'.format(
+            'file', 'variant', 'load (s)', 'RSS load (MB)', 'SSRO (s)',
+            'RSS SSRO (MB)'))
+        errors = set()
+        for file_type, chunked in [('contiguous', False), ('chunked', True)]:
+            folder = make_shots_file(datadir, '120000_' + file_type,
+                                     nr_shots, chunked)
+            for variant in ['legacy', 'default', 'mmap']:
+                r = measure_variant(variant, folder)
+                if isinstance(r['analysis'], str):
+                    t_analysis = 'failed'
+                    errors.add(r['analysis'])
+                else:
+                    t_analysis = '{:.2f}'.format(r['analysis'])
+                print('{:>12} {:>8} {:>9.2f} {:>14.0f} {:>12} {:>14.0f}'
+                      .format(file_type, variant, r['load'],
+                              (r['rss_load'] - r['rss_import'])/1024,
+                              t_analysis,
+                              (r['rss'] - r['rss_import'])/1024))
+        for error in errors:
+            print('SSRO_Analysis failed: ' + error)
+    finally:
+        shutil.rmtree(datadir)
@@ -0,0 +1,126 @@
+'''
+Benchmark of data lookups in a large data directory.
+
+Creates a synthetic data directory of 100k measurement folders (500 days
+of 200 measurements) and compares the time of a_tools.latest_data,
+data_from_time and return_last_n_timestamps using the timestamp index to
+the legacy directory walks.
+
+Usage:
+    python benchmark_timestamp_index.py
+'''
+import os
+import shutil
+import tempfile
+import time
+import datetime
+from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.analysis.tools.file_handling import TimestampIndex
+
+nr_days = 500
+nr_meas_per_day = 200
+
+
+def legacy_latest_data(search_dir, contains='', older_than=None):
+    daydirs = sorted(os.listdir(search_dir))
+    measdirs = []
+    i = len(daydirs)-1
+    while len(measdirs) == 0 and i >= 0:
+        daydir = daydirs[i]
+        measdirs = []
+        for d in sorted(os.listdir(os.path.join(search_dir, daydir))):
+            try:
+                dstamp, tstamp = a_tools.verify_timestamp(daydir + d[:6])
+            except Exception:
+                continue
+            if contains in d:
+                if older_than is not None and not a_tools.is_older(
+                        dstamp+tstamp, older_than):
+                    continue
+                measdirs.append(d)
+        i -= 1
+    return daydir+measdirs[-1][:6], os.path.join(search_dir, daydir,
+                                                 measdirs[-1])
+
+
+def legacy_data_from_time(folder, timestamp):
+    daydirs = os.listdir(folder)
+    daydirs.sort()
+    daystamp, tstamp = a_tools.verify_timestamp(timestamp)
+    measdirs = [d for d in os.listdir(os.path.join(folder, daystamp))
+                if d[:6] == tstamp]
+    return os.path.join(folder, daystamp, measdirs[0])
+
+
+def legacy_return_last_n_timestamps(folder, n, contains=''):
+    timestamps = [legacy_latest_data(folder, contains)[0]]
+    for i in range(n-1):
+        timestamps.append(legacy_latest_data(
+            folder, contains, older_than=timestamps[-1])[0])
+    return timestamps
+
+
+def make_datadir(datadir):
+    day0 = datetime.date(2015, 1, 1)
+    for i in range(nr_days):
+        day = (day0 + datetime.timedelta(days=i)).strftime('%Y%m%d')
+        for j in range(nr_meas_per_day):
+            label = 'Rabi' if j % 50 == 0 else 'Ramsey'
+            os.makedirs(os.path.join(datadir, day, '{:02d}{:02d}{:02d}_{}'.format(
+                j // 3600, (j // 60) % 60, j % 60, label)))
+
+
+def timeit(f, *args, nr_reps=5, **kw):
+    t0 = time.time()
+    for i in range(nr_reps):
+        result = f(*args, **kw)
+    return (time.time()-t0)/nr_reps, result
+
+
+if __name__ == '__main__':
+    datadir = tempfile.mkdtemp()
+    a_tools.datadir = datadir
+    try:
+        t0 = time.time()
+        make_datadir(datadir)
+        print('Created {} folders in {:.1f} s'.format(
+            nr_days*nr_meas_per_day, time.time()-t0))
+
+        # folders modified within the mtime resolution are always rescanned
+        time.sleep(2.5)
+
+        t0 = time.time()
+        index = TimestampIndex(datadir)
+        index.refresh()
+        print('Initial index build: {:.2f} s'.format(time.time()-t0))
+        t_refresh, _ = timeit(index.refresh, full=True)
+        print('Full refresh without changes: {:.4f} s'.format(t_refresh))
+        t_refresh, _ = timeit(index.refresh)
+        print('Refresh without changes: {:.4f} s'.format(t_refresh))
+        a_tools.latest_data()  # opens the index
+
+        ts = '20150601_000140'
+        cases = [
+            ('latest_data()',
+             (legacy_latest_data, datadir), (a_tools.latest_data, ),
+             {}),
+            ("latest_data('Rabi', older_than)",
+             (legacy_latest_data, datadir, 'Rabi', '20150601000000'),
+             (a_tools.latest_data, 'Rabi'),
+             {'older_than': '20150601000000'}),
+            ('data_from_time',
+             (legacy_data_from_time, datadir, ts),
+             (a_tools.data_from_time, ts), {}),
+            ("return_last_n_timestamps(20, 'Rabi')",
+             (legacy_return_last_n_timestamps, datadir, 20, 'Rabi'),
+             (a_tools.return_last_n_timestamps, 20, 'Rabi'), {}),
+        ]
+        print('{:>38} {:>12} {:>12} {:>8}'.format(
+            'lookup', 'legacy (s)', 'index (s)', 'speedup'))
+        for name, legacy_args, index_args, kw in cases:
+            t_legacy, _ = timeit(*legacy_args, nr_reps=1)
+            t_index, _ = timeit(*index_args, **kw)
+            print('{:>38} {:>12.4f} {:>12.4f} {:>8.0f}'.format(
+                name, t_legacy, t_index, t_legacy/t_index))
+    finally:
+        shutil.rmtree(datadir)
@@ -0,0 +1,72 @@
+'''
+Benchmark of loading parameters from many measurement files.
+
+Creates a synthetic data directory of 500 measurements in the format of
+MeasurementControl and loads a few instrument settings, a fit result and
+a data column of all of them with a_tools.get_data_from_timestamps, in
+this process and in process pools of increasing size.
+
+Usage:
+    python benchmark_timestamp_loader.py
+'''
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing
+import h5py
+import numpy as np
+from pycqed.analysis import analysis_toolbox as a_tools
+
+nr_files = 500
+nr_points = 4000
+nr_instruments = 20
+nr_params_per_instrument = 50
+
+
+def make_data_dir(datadir):
+    timestamps = []
+    for i in range(nr_files):
+        timestamp = '20160101_{:02d}{:02d}{:02d}'.format(
+            i // 3600, (i // 60) % 60, i % 60)
+        dirname = timestamp[9:] + '_T1_qubit'
+        folder = os.path.join(datadir, '20160101', dirname)
+        os.makedirs(folder)
+        with h5py.File(os.path.join(folder, dirname+'.hdf5'), 'w') as f:
+            exp_data = f.create_group('Experimental Data')
+            exp_data.create_dataset('Data', data=np.random.rand(nr_points, 3))
+            exp_data.attrs['sweep_parameter_names'] = [b'time']
+            exp_data.attrs['value_names'] = [b'I', b'Q']
+            settings = f.create_group('Instrument settings')
+            for j in range(nr_instruments):
+                instr = settings.create_group('instr{}'.format(j))
+                for k in range(nr_params_per_instrument):
+                    instr.attrs['par{}'.format(k)] = str(np.random.rand())
+            f.create_group('Analysis').create_group(
+                'Fit').attrs['T1'] = np.random.rand()
+        timestamps.append(timestamp)
+    return timestamps
+
+
+if __name__ == '__main__':
+    datadir = tempfile.mkdtemp()
+    old_datadir = a_tools.datadir
+    a_tools.datadir = datadir
+    try:
+        timestamps = make_data_dir(datadir)
+        param_names = ['instr0.par0', 'instr19.par49', 'Fit.T1', 'I']
+        # warm up the timestamp index and the file system cache
+        a_tools.get_data_from_timestamps(timestamps, param_names,
+                                         nr_processes=1)
+        print('Loading {} files'.format(nr_files))
+        for nr_processes in [1, 2, 4, multiprocessing.cpu_count()]:
+            t0 = time.time()
+            data, errors = a_tools.get_data_from_timestamps(
+                timestamps, param_names, nr_processes=nr_processes)
+            t = time.time() - t0
+            assert len(data['timestamps']) == nr_files and not errors
+            print('{:>3} processes: {:.3f} s, {:.2f} ms per file'.format(
+                nr_processes, t, 1e3*t/nr_files))
+    finally:
+        a_tools.datadir = old_datadir
+        shutil.rmtree(datadir)
@@ -0,0 +1,114 @@
+'''
+Benchmark of the waveform cache used by Element.ideal_waveforms.
+
+Builds (generates all waveforms of) a randomized benchmarking sequence of
+100 seeds x 20 lengths twice and reports the speedup of the second build
+with respect to the first and to a build without the cache.
+No AWG is required.
+
+Usage:
+    python benchmark_waveform_cache.py
+'''
+import time
+import numpy as np
+from pycqed.measurement.waveform_control.pulsar import Pulsar
+from pycqed.measurement.waveform_control.waveform_cache import waveform_cache
+from pycqed.measurement.pulse_sequences import single_qubit_tek_seq_elts as sqs
+
+
+class FakeParameter:
+    def __init__(self, value):
+        self.value = value
+
+    def get_latest(self):
+        return self.value
+
+
+class FakeAWG:
+    '''
+    Holds only the parameters used by Pulsar.update_channel_settings.
+    '''
+    def __init__(self):
+        for i in range(4):
+            setattr(self, 'ch{}_offset'.format(i+1), FakeParameter(0.))
+            setattr(self, 'ch{}_amp'.format(i+1), FakeParameter(2.))
+
+    def get(self, par):
+        return getattr(self, par).get_latest()
+
+
+class FakeStation:
+    def __init__(self):
+        self.pulsar = Pulsar()
+        self.pulsar.AWG = FakeAWG()
+        for i in range(4):
+            self.pulsar.define_channel(
+                id='ch{}'.format(i+1), name='ch{}'.format(i+1),
+                type='analog', high=1, low=-1, offset=0.0, delay=0,
+                active=True)
+            for j in range(2):
+                self.pulsar.define_channel(
+                    id='ch{}_marker{}'.format(i+1, j+1),
+                    name='ch{}_marker{}'.format(i+1, j+1),
+                    type='marker', high=2.0, low=0, offset=0., delay=0,
+                    active=True)
+        self.components = {}
+
+
+pulse_pars = {'I_channel': 'ch1', 'Q_channel': 'ch2',
+              'amplitude': 0.5, 'amp90_scale': 0.5,
+              'sigma': 5e-9, 'nr_sigma': 4, 'motzoi': 0.1,
+              'mod_frequency': -50e6, 'phase': 0, 'phi_skew': 0,
+              'alpha': 1, 'pulse_delay': 30e-9,
+              'pulse_type': 'SSB_DRAG_pulse'}
+
+RO_pars = {'I_channel': 'ch3', 'Q_channel': 'ch4',
+           'RO_pulse_marker_channel': 'ch3_marker1',
+           'amplitude': 0.1, 'length': 300e-9, 'pulse_delay': 20e-9,
+           'mod_frequency': 25e6, 'fixed_point_frequency': 50e6,
+           'acq_marker_delay': 0, 'acq_marker_channel': 'ch1_marker1',
+           'phase': 0, 'pulse_type': 'MW_IQmod_pulse_tek'}
+
+
+def build_RB_sequence(nr_seeds=100, nr_lengths=20):
+    '''
+    Generates the RB sequence and all its waveforms.
+    '''
+    nr_cliffords = np.arange(1, nr_lengths+1)
+    seq, el_list = sqs.Randomized_Benchmarking_seq(
+        pulse_pars, RO_pars, nr_cliffords=nr_cliffords, nr_seeds=nr_seeds,
+        upload=False)
+    for el in el_list:
+        el.normalized_waveforms()
+    return seq, el_list
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    sqs.station = FakeStation()
+
+    waveform_cache.enabled = False
+    t0 = time.time()
+    build_RB_sequence()
+    t_no_cache = time.time() - t0
+
+    waveform_cache.enabled = True
+    waveform_cache.clear()
+    t0 = time.time()
+    build_RB_sequence()
+    t_first = time.time() - t0
+    stats_first = waveform_cache.statistics()
+
+    t0 = time.time()
+    build_RB_sequence()
+    t_second = time.time() - t0
+    stats = waveform_cache.statistics()
+
+    print('No cache:      {:.2f} s'.format(t_no_cache))
+    print('First build:   {:.2f} s (hit rate {:.2f})'.format(
+        t_first, stats_first['hit_rate']))
+    print('Second build:  {:.2f} s'.format(t_second))
+    print('Speedup second build: {:.1f}x vs first, {:.1f}x vs no cache'.format(
+        t_first/t_second, t_no_cache/t_second))
+    print('Cache: {nr_waveforms} waveforms, {nbytes:.0f} bytes, '
+          '{hits} hits, {misses} misses'.format(**stats))
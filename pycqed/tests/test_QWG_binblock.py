@@ -0,0 +1,234 @@
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from unittest import TestCase, skipIf
+
+from pycqed.instrument_drivers.physical_instruments import binblock
+
+try:
+    from pycqed.instrument_drivers.physical_instruments.QuTech_AWG_Module \
+        import QuTech_AWG_Module
+except ImportError:  # qcodes is not installed
+    QuTech_AWG_Module = None
+
+
+class FakeSCPIServer:
+    '''
+    Minimal QWG on a local socket. Stores the waveforms sent to it,
+    validates the binblock headers and keeps track of the number of
+    queries (round trips) and bytes received.
+    '''
+    def __init__(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        self.waveform_lengths = {}
+        self.waveforms = {}
+        self.errors = []
+        self.nr_queries = 0
+        self.bytes_received = 0
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.close()
+
+    def _serve(self):
+        conn, addr = self._server.accept()
+        self._conn = conn
+        self._buffer = b''
+        try:
+            while True:
+                line = self._read_until(b'\n')
+                if line is None:
+                    break
+                self._handle(line)
+        except Exception as e:
+            self.errors.append(repr(e))
+        finally:
+            conn.close()
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            data = self._conn.recv(1 << 20)
+            if not data:
+                return None
+            self.bytes_received += len(data)
+            self._buffer += data
+        result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return result
+
+    def _read_until(self, sep):
+        while sep not in self._buffer:
+            data = self._conn.recv(1 << 20)
+            if not data:
+                return None
+            self.bytes_received += len(data)
+            self._buffer += data
+        result, self._buffer = self._buffer.split(sep, 1)
+        return result
+
+    def _handle(self, line):
+        data_cmd = b'wlist:waveform:data "'
+        if line.startswith(data_cmd) and b'",#' in line:
+            # the binblock can contain newlines, line is only the start
+            name, rest = line[len(data_cmd):].split(b'",#', 1)
+            self._buffer = rest + b'\n' + self._buffer
+            self._receive_binblock(name.decode())
+            return
+        cmd = line.decode().strip()
+        if cmd.endswith('?') or '? ' in cmd:
+            self.nr_queries += 1
+        if cmd == '*IDN?':
+            self._conn.sendall(b'QuTech,QWG,0,0.1\n')
+        elif cmd == '*OPC?':
+            self._conn.sendall(b'1\n')
+        elif cmd.startswith('wlist:waveform:new'):
+            name, length, wf_type = cmd.split(' ', 1)[1].split(',')
+            self.waveform_lengths[name.strip('"')] = int(length)
+        elif cmd.startswith('wlist:waveform:data?'):
+            binblock = self.waveforms[cmd.split(' ', 1)[1].strip('"')]
+            length = str(len(binblock))
+            self._conn.sendall('#{}{}'.format(len(length), length).encode() +
+                               binblock + b'\n')
+
+    def _receive_binblock(self, name):
+        digit_cnt = int(self._read(1))
+        byte_cnt_str = self._read(digit_cnt)
+        if len(byte_cnt_str.strip()) != digit_cnt:
+            self.errors.append('Invalid header for {}'.format(name))
+        byte_cnt = int(byte_cnt_str)
+        if byte_cnt % 5 != 0:
+            self.errors.append('Invalid data length for {}'.format(name))
+        if name not in self.waveform_lengths:
+            self.errors.append('Waveform {} does not exist'.format(name))
+        elif self.waveform_lengths[name]*5 != byte_cnt:
+            self.errors.append('Length mismatch for {}'.format(name))
+        self.waveforms[name] = self._read(byte_cnt)
+        if self._read(1) != b'\n':
+            self.errors.append('Missing terminator after {}'.format(name))
+
+
+def reference_binblock(waveform, marker1, marker2):
+    # per sample packing of the original sendWaveformDataReal
+    m = np.add(marker1, np.multiply(marker2, 2))
+    return b''.join(struct.pack('<fB', w, int(mi))
+                    for w, mi in zip(waveform, m))
+
+
+class TestWaveformData(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.waveform = rng.uniform(-1, 1, 1001)
+        self.marker1 = rng.randint(0, 2, 1001)
+        self.marker2 = rng.randint(0, 2, 1001)
+
+    def test_pack_waveform_data(self):
+        binBlock = binblock.packWaveformData(self.waveform, self.marker1,
+                                             self.marker2)
+        self.assertEqual(binBlock, reference_binblock(
+            self.waveform, self.marker1, self.marker2))
+        self.assertEqual(binblock.WAVEFORM_RECORD.itemsize, 5)
+        self.assertEqual(len(binBlock), 5*1001)
+        # without markers
+        self.assertEqual(
+            binblock.packWaveformData(self.waveform, [], []),
+            reference_binblock(self.waveform, np.zeros(1001),
+                               np.zeros(1001)))
+        with self.assertRaises(UserWarning):
+            binblock.packWaveformData(self.waveform, self.marker1[:5],
+                                      self.marker2)
+
+    def test_unpack_waveform_data(self):
+        waveform, marker1, marker2 = binblock.unpackWaveformData(
+            reference_binblock(self.waveform, self.marker1, self.marker2))
+        np.testing.assert_array_equal(waveform,
+                                      self.waveform.astype(np.float32))
+        np.testing.assert_array_equal(marker1, self.marker1)
+        np.testing.assert_array_equal(marker2, self.marker2)
+
+    def test_header(self):
+        for byteCnt in [0, 5, 12345, 5*10**8]:
+            header = binblock.buildHeaderString(byteCnt)
+            self.assertEqual(binblock.getByteCntFromHeader(header), byteCnt)
+        self.assertEqual(binblock.buildHeaderString(5005), '#45005')
+        self.assertEqual(binblock.getByteCntFromHeader('#45005'), 5005)
+        # the data following the header is ignored
+        self.assertEqual(binblock.getByteCntFromHeader('#210\x00\x01'), 10)
+
+
+@skipIf(QuTech_AWG_Module is None, 'requires qcodes')
+class TestQWGBinBlock(TestCase):
+    def setUp(self):
+        self.server = FakeSCPIServer()
+        self.qwg = QuTech_AWG_Module('QWG_binblock', address='127.0.0.1',
+                                     port=self.server.port)
+        self.rng = np.random.RandomState(0)
+
+    def tearDown(self):
+        self.qwg.close()
+        self.server.close()
+
+    def random_waveform(self, length):
+        return (self.rng.uniform(-1, 1, length),
+                self.rng.randint(0, 2, length),
+                self.rng.randint(0, 2, length))
+
+    def test_create_waveform(self):
+        waveform, marker1, marker2 = self.random_waveform(1001)
+        self.qwg.createWaveformReal('wf', waveform, marker1, marker2)
+        self.qwg.createWaveformReal('no_markers', waveform, [], [])
+        self.qwg.getOperationComplete()
+        self.assertEqual(self.server.errors, [])
+        self.assertEqual(self.server.waveforms['wf'],
+                         reference_binblock(waveform, marker1, marker2))
+        self.assertEqual(self.server.waveforms['no_markers'],
+                         reference_binblock(waveform, np.zeros(1001),
+                                            np.zeros(1001)))
+
+    def test_length_mismatch(self):
+        waveform, marker1, marker2 = self.random_waveform(10)
+        with self.assertRaises(UserWarning):
+            self.qwg.sendWaveformDataReal('wf', waveform, marker1[:5],
+                                          marker2)
+
+    def test_get_waveform_data(self):
+        waveform, marker1, marker2 = self.random_waveform(2000)
+        self.qwg.createWaveformReal('wf', waveform, marker1, marker2)
+        wf_read, m1_read, m2_read = self.qwg.getWaveformData('wf')
+        np.testing.assert_array_equal(wf_read, waveform.astype(np.float32))
+        np.testing.assert_array_equal(m1_read, marker1)
+        np.testing.assert_array_equal(m2_read, marker2)
+        self.assertEqual(self.server.errors, [])
+
+    def test_upload_waveforms(self):
+        waveforms = {'wf{}'.format(i): self.random_waveform(500+i)
+                     for i in range(20)}
+        waveforms['no_markers'] = self.rng.uniform(-1, 1, 100)
+        nr_queries = self.server.nr_queries
+        self.assertEqual(self.qwg.upload_waveforms(waveforms), '1')
+        # a single round trip for all waveforms
+        self.assertEqual(self.server.nr_queries - nr_queries, 1)
+        self.assertEqual(self.server.errors, [])
+        for name, wf in waveforms.items():
+            if name == 'no_markers':
+                wf = (wf, np.zeros(len(wf)), np.zeros(len(wf)))
+            self.assertEqual(self.server.waveforms[name],
+                             reference_binblock(*wf))
+
+    def test_upload_throughput(self):
+        nr_samples = int(1e6)
+        waveforms = {'ch{}'.format(i): self.random_waveform(nr_samples)
+                     for i in range(4)}
+        bytes_received = self.server.bytes_received
+        t0 = time.time()
+        self.qwg.upload_waveforms(waveforms)
+        t = time.time() - t0
+        nr_bytes = self.server.bytes_received - bytes_received
+        self.assertGreater(nr_bytes, 4*5*nr_samples)
+        self.assertEqual(self.server.errors, [])
+        # packing per sample with struct runs at ~1 MB/s
+        self.assertGreater(nr_bytes/t/1e6, 10)
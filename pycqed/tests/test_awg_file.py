@@ -0,0 +1,150 @@
+import io
+import os
+import numpy as np
+from unittest import TestCase
+
+from pycqed.measurement.waveform_control import element
+from pycqed.measurement.waveform_control import pulse
+from pycqed.measurement.waveform_control import pulse_library as pl
+from pycqed.measurement.waveform_control.sequence import Sequence
+from pycqed.measurement.waveform_control.awg_file import (
+    AWGFileWriter, AWGFileUpload)
+from pycqed.measurement.pulse_sequences import single_qubit_tek_seq_elts as sqs
+from pycqed.instrument_drivers.virtual_instruments.mock_AWG5014 import (
+    Mock_AWG5014)
+from pycqed.tests.test_pulsar import MockStation, pulse_pars, RO_pars
+
+# .awg file of make_golden_sequence, as generated by
+# Mock_AWG5014.generate_awg_file before the streaming writer was added
+golden_file = os.path.join(os.path.dirname(__file__), 'files',
+                           'golden_sequence.awg')
+
+
+def make_golden_sequence(pulsar):
+    '''
+    Short sequence of which the order of the elements differs from the
+    order of their names, with repetitions, goto and jump targets, a
+    repeated element and waveforms shared between elements.
+    '''
+    seq = Sequence('golden')
+    el_list = []
+    for i, name in enumerate(['el10', 'el2', 'el1_b']):
+        el = element.Element(name, pulsar=pulsar, min_samples=0)
+        last = el.add(pulse.SquarePulse(channel='ch1_marker1', amplitude=1,
+                                        length=20e-9))
+        last = el.add(pl.SSB_DRAG_pulse(
+            name='drag', I_channel='ch1', Q_channel='ch2',
+            amplitude=0.2*(i % 2 + 1), sigma=5e-9, motzoi=0.1,
+            mod_frequency=-50e6), start=10e-9, refpulse=last)
+        el.add(pulse.CosPulse('ch3', frequency=25e6, amplitude=0.3,
+                              length=80e-9), start=5e-9, refpulse=last)
+        el_list.append(el)
+    seq.append_element(el_list[0], trigger_wait=True)
+    seq.append_element(el_list[1], repetitions=3)
+    seq.append_element(el_list[2], goto_target='el10', jump_target='el2')
+    seq.append('el2_again', wfname='el2', trigger_wait=True)
+    return seq, el_list
+
+
+class TestAWGFileWriter(TestCase):
+    def setUp(self):
+        self.AWG = Mock_AWG5014(timestamp=(2016, 1, 4, 1, 12, 0, 0, 0, 0))
+        rng = np.random.RandomState(0)
+        self.packed_waveforms = {}
+        wfname_l = []
+        for ch in range(1, 5):
+            ch_wfnames = []
+            for i in [3, 12, 1, 7]:
+                wfname = 'el{}_ch{}'.format(i, ch)
+                self.packed_waveforms[wfname] = rng.randint(
+                    0, 2**16, size=4*i, dtype=np.uint16)
+                ch_wfnames.append(wfname)
+            wfname_l.append(ch_wfnames)
+        self.sequence = (np.array(wfname_l), [1, 2, 65536, 1],
+                         [1, 0, 0, 1], [0, 0, 0, 1], [0, 3, 0, 0],
+                         {'ANALOG_AMPLITUDE_1': 2., 'ANALOG_OFFSET_1': 0.,
+                          'MARKER1_HIGH_1': 2., 'CHANNEL_STATE_1': 1,
+                          'NOT_A_SETTING_1': 0})
+        self.awg_file = self.AWG.generate_awg_file(self.packed_waveforms,
+                                                   *self.sequence)
+
+    def make_writer(self):
+        return AWGFileWriter(
+            self.packed_waveforms, *self.sequence,
+            sequence_cfg=self.AWG.generate_sequence_cfg(),
+            format_head=self.AWG.AWG_FILE_FORMAT_HEAD,
+            format_channel=self.AWG.AWG_FILE_FORMAT_CHANNEL,
+            timestamp=self.AWG.timestamp)
+
+    def test_identical_to_generate_awg_file(self):
+        writer = self.make_writer()
+        f = io.BytesIO()
+        self.assertEqual(writer.write(f), len(self.awg_file))
+        self.assertEqual(f.getvalue(), self.awg_file)
+        self.assertEqual(writer.size(), len(self.awg_file))
+        lengths = {wfname: len(wf) for wfname, wf in
+                   self.packed_waveforms.items()}
+        self.assertEqual(writer.size(lengths), len(self.awg_file))
+
+    def test_upload_in_chunks(self):
+        AWG = Mock_AWG5014()
+        AWG.send_awg_file('test.awg', self.awg_file)
+        bytes_transferred = AWG.bytes_transferred
+        AWG.files = {}
+
+        writer = self.make_writer()
+        with AWGFileUpload(AWG, 'test.awg', writer.size(),
+                           chunk_size=100) as f:
+            writer.write(f)
+        self.assertEqual(AWG.files['test.awg'], self.awg_file)
+        self.assertEqual(AWG.bytes_transferred, 2*bytes_transferred)
+        self.assertEqual(AWG.errors, [])
+        self.assertEqual(AWG.nr_uploads, 2)
+
+        with self.assertRaises(ValueError):
+            with AWGFileUpload(AWG, 'test.awg', 10) as f:
+                f.write(b'123')
+
+
+class TestStreamingUpload(TestCase):
+    def setUp(self):
+        self.station = MockStation()
+        sqs.station = self.station
+        with open(golden_file, 'rb') as f:
+            self.golden = f.read()
+
+    def test_golden_file(self):
+        pulsar, AWG = self.station.pulsar, self.station.AWG
+        seq, el_list = make_golden_sequence(pulsar)
+        awg_file = pulsar.program_awg(seq, *el_list)
+        self.assertEqual(awg_file, self.golden)
+        bytes_transferred = AWG.bytes_transferred
+
+        AWG.files = {}
+        self.assertIsNone(pulsar.program_awg(seq, *el_list, stream=True))
+        self.assertEqual(AWG.files['golden_FILE.AWG'], self.golden)
+        self.assertEqual(AWG.loaded_file, 'golden_FILE.AWG')
+        self.assertEqual(AWG.bytes_transferred, 2*bytes_transferred)
+
+    def test_stream_identical_to_awg_file(self):
+        pulsar, AWG = self.station.pulsar, self.station.AWG
+        np.random.seed(0)
+        seq, el_list = sqs.Randomized_Benchmarking_seq(
+            pulse_pars, RO_pars, nr_cliffords=[1, 5, 20], nr_seeds=4,
+            upload=False)
+        filename = seq.name + '_FILE.AWG'
+        for deduplicate in [True, False]:
+            awg_file = pulsar.program_awg(seq, *el_list,
+                                          deduplicate=deduplicate)
+            stats = pulsar.dedup_statistics
+            pulsar.program_awg(seq, *el_list, deduplicate=deduplicate,
+                               stream=True)
+            self.assertEqual(AWG.files[filename], awg_file)
+            self.assertEqual(pulsar.dedup_statistics, stats)
+
+    def test_stream_packs_in_this_process(self):
+        pulsar, AWG = self.station.pulsar, self.station.AWG
+        seq, el_list = make_golden_sequence(pulsar)
+        with self.assertLogs(level='WARNING'):
+            pulsar.program_awg(seq, *el_list, stream=True, processes=2)
+        self.assertEqual(AWG.files['golden_FILE.AWG'], self.golden)
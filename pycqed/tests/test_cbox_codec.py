@@ -0,0 +1,154 @@
+import time
+import numpy as np
+from unittest import TestCase
+
+from pycqed.instrument_drivers.physical_instruments._controlbox import \
+    numpy_codec as c
+
+
+def reference_encode_byte(value, data_bits_per_byte=7,
+                          expected_number_of_bytes=2):
+    '''
+    Value by value implementation of codec.pyx encode_byte.
+    '''
+    mask = (1 << data_bits_per_byte) - 1
+    data_byte_array = bytearray(expected_number_of_bytes)
+    for i in range(expected_number_of_bytes):
+        byte_val = (value >> (data_bits_per_byte*i)) & mask
+        data_byte_array[expected_number_of_bytes-(i+1)] = byte_val | 128
+    return bytes(data_byte_array)
+
+
+def reference_decode_byte(data_bytes, data_bits_per_byte=7):
+    '''
+    Value by value implementation of codec.pyx decode_byte.
+    '''
+    mask = (1 << data_bits_per_byte) - 1
+    value = 0
+    len_db = len(data_bytes)
+    nr_bits_m1 = data_bits_per_byte*len_db-1
+    for i in range(len_db):
+        value |= (mask & data_bytes[len_db-1-i]) << (data_bits_per_byte*i)
+    if value & (1 << nr_bits_m1):
+        value &= ~(1 << nr_bits_m1)
+        value = value - 2**nr_bits_m1
+    return value
+
+
+def bytes_to_binary(bytestring):
+    return ''.join('{:08b}'.format(n) for n in bytestring)
+
+
+class TestNumpyCodec(TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def random_widths(self):
+        '''
+        Yields random data_bits_per_byte, bytes_per_value combinations.
+        '''
+        for i in range(100):
+            yield (self.rng.choice([4, 7]), self.rng.randint(1, 5))
+
+    def test_known_values(self):
+        self.assertEqual(bytes_to_binary(c.encode_byte(128, 7)),
+                         '1000000110000000')
+        self.assertEqual(bytes_to_binary(c.encode_byte(128, 4)),
+                         '1000100010000000')
+        encoded = c.encode_byte(546815, 4, 6)
+        self.assertEqual(type(encoded), bytes)
+        self.assertEqual(len(encoded), 6)
+        self.assertEqual(c.decode_byte(encoded, 4), 546815)
+        self.assertEqual(c.decode_byte(c.encode_byte(-235, 7, 4), 7), -235)
+
+    def test_encode_equals_reference(self):
+        for data_bits_per_byte, bytes_per_value in self.random_widths():
+            nr_bits = data_bits_per_byte*bytes_per_value
+            values = self.rng.randint(-2**(nr_bits-1), 2**nr_bits, 20)
+            reference = b''.join(
+                reference_encode_byte(int(v), data_bits_per_byte,
+                                      bytes_per_value) for v in values)
+            self.assertEqual(c.encode_array(values, data_bits_per_byte,
+                                            bytes_per_value), reference)
+            self.assertEqual(c.encode_byte(int(values[0]), data_bits_per_byte,
+                                           bytes_per_value), reference[
+                                               :bytes_per_value])
+
+    def test_decode_equals_reference(self):
+        for data_bits_per_byte, bytes_per_value in self.random_widths():
+            # any data byte, including the ones with unused bits set
+            message_bytes = bytes(self.rng.randint(128, 256, 21).astype(
+                np.uint8))
+            message = message_bytes + b'\x7F'
+            nr_values = len(message_bytes)//bytes_per_value
+            reference = [reference_decode_byte(
+                message_bytes[i*bytes_per_value:(i+1)*bytes_per_value],
+                data_bits_per_byte) for i in range(nr_values)]
+            decoded = c.decode_message(message, data_bits_per_byte,
+                                       bytes_per_value)
+            self.assertEqual(decoded.dtype, np.dtype(int))
+            np.testing.assert_array_equal(decoded, reference)
+
+    def test_round_trip_signed(self):
+        for data_bits_per_byte, bytes_per_value in self.random_widths():
+            nr_bits = data_bits_per_byte*bytes_per_value
+            values = self.rng.randint(-2**(nr_bits-1), 2**(nr_bits-1), 50)
+            message = c.create_message(data_bytes=c.encode_array(
+                values, data_bits_per_byte, bytes_per_value))
+            np.testing.assert_array_equal(
+                c.decode_message(message, data_bits_per_byte,
+                                 bytes_per_value), values)
+
+    def test_round_trip_unsigned(self):
+        for data_bits_per_byte, bytes_per_value in self.random_widths():
+            nr_bits = data_bits_per_byte*bytes_per_value
+            values = self.rng.randint(0, 2**nr_bits, 50)
+            message = c.create_message(data_bytes=c.encode_array(
+                values, data_bits_per_byte, bytes_per_value))
+            np.testing.assert_array_equal(
+                c.decode_message(message, data_bits_per_byte,
+                                 bytes_per_value, signed_integer=False),
+                values)
+
+    def test_checksum_and_eom_are_ignored(self):
+        values = np.arange(-10, 10)
+        data_bytes = c.encode_array(values, 7, 4)
+        checksum = c.calculate_checksum(data_bytes)
+        message = c.create_message(data_bytes=data_bytes + checksum)
+        np.testing.assert_array_equal(c.decode_message(message, 7, 4),
+                                      values)
+
+    def test_create_message(self):
+        self.assertEqual(c.create_message(b'\x4F'), b'\x4F\x7F')
+        self.assertEqual(c.create_message(b'\x4F', b'\x81\x82', b'\x78'),
+                         b'\x4F\x81\x82\x78')
+        self.assertEqual(c.create_message(data_bytes=b'\x81'), b'\x81\x7F')
+
+    def test_calculate_checksum(self):
+        for i in range(20):
+            message = bytes(self.rng.randint(0, 256, i).astype(np.uint8))
+            checksum = 0
+            for byte in message:
+                checksum ^= byte
+            self.assertEqual(c.calculate_checksum(message),
+                             bytes([checksum | 128]))
+
+    def test_decode_boolean_array(self):
+        ch0 = self.rng.randint(0, 2, 40)
+        ch1 = self.rng.randint(0, 2, 40)
+        bits = np.concatenate([ch0, ch1]).reshape(-1, 4)
+        message = bytes([128 + int(''.join(str(b) for b in nibble), 2)
+                         for nibble in bits]) + b'\x80\x7F'
+        ch0_dec, ch1_dec = c.decode_boolean_array(message)
+        np.testing.assert_array_equal(ch0_dec, ch0)
+        np.testing.assert_array_equal(ch1_dec, ch1)
+
+    def test_decode_integration_log_speed(self):
+        # 1M samples of an integration log (2 channels, 4 bytes per value)
+        values = self.rng.randint(-2**27, 2**27, 1000000)
+        message = c.create_message(data_bytes=c.encode_array(values, 7, 4))
+        t0 = time.time()
+        decoded = c.decode_message(message, 7, 4)
+        t_decode = time.time() - t0
+        np.testing.assert_array_equal(decoded, values)
+        self.assertLess(t_decode, 1)
@@ -0,0 +1,253 @@
+import numpy as np
+from copy import deepcopy
+from unittest import TestCase
+
+from pycqed.measurement.waveform_control import element
+from pycqed.measurement.waveform_control import pulse
+from pycqed.measurement.waveform_control import pulsar
+from pycqed.measurement.waveform_control import pulse_library as pl
+from pycqed.measurement.waveform_control.waveform_cache import waveform_cache
+
+channels = ['ch{}'.format(i+1) for i in range(8)]
+
+
+def make_random_element(seed, nr_pulses=40, **kw):
+    rng = np.random.RandomState(seed)
+    el = element.Element('el{}'.format(seed), **kw)
+    for i, ch in enumerate(channels):
+        el.define_channel(ch, delay=rng.choice([0, 1e-9, 7.5e-9, 20e-9]),
+                          offset=rng.choice([0, 0.01, -0.02]))
+    last = None
+    for i in range(nr_pulses):
+        I_ch, Q_ch = rng.choice(channels, 2, replace=False)
+        kind = rng.randint(3)
+        if kind == 0:
+            p = pulse.SquarePulse(channel=I_ch, amplitude=rng.uniform(-1, 1),
+                                  length=rng.randint(1, 200)*1e-9)
+        elif kind == 1:
+            p = pulse.CosPulse(I_ch, frequency=rng.uniform(1e6, 100e6),
+                               amplitude=0.3, length=rng.uniform(5e-9, 1e-7))
+        else:
+            p = pl.SSB_DRAG_pulse(name='drag', I_channel=I_ch,
+                                  Q_channel=Q_ch,
+                                  amplitude=rng.uniform(0, 0.5), sigma=5e-9,
+                                  motzoi=0.1, mod_frequency=-50e6)
+        last = el.add(p, start=rng.uniform(-50e-9, 50e-9), refpulse=last,
+                      refpoint=rng.choice(['start', 'center', 'end']))
+    return el
+
+
+def reference_timing(el):
+    '''
+    Offset, ideal length, number of samples and start sample of every
+    pulse/channel as computed by the Element before compilation.
+    '''
+    offset = 0
+    if not el.ignore_offset_correction:
+        offset = min(el.pulses[p].t0() - el._channels[c]['delay']
+                     for p in el.pulses for c in el.pulses[p].channels)
+    start_samples = {}
+    ideal_length = None
+    ends = []
+    for p in el.pulses:
+        for c in el.pulses[p].channels:
+            t = el.pulses[p].t0() - el._channels[c]['delay'] - offset
+            start_samples[p, c] = int(t*el.clock + 0.5)
+            ends.append(start_samples[p, c] +
+                        int(el.pulses[p].length*el.clock + 0.5) - 1)
+            end_t = el.pulses[p].end() - el._channels[c]['delay'] - offset
+            if ideal_length is None or end_t > ideal_length:
+                ideal_length = end_t
+    samples = max(ends)+1
+    if samples < el.min_samples:
+        samples = el.min_samples
+    else:
+        while(samples % el.granularity > 0):
+            samples += 1
+    return offset, ideal_length, samples, start_samples
+
+
+def reference_ideal_waveforms(el):
+    offset, ideal_length, samples, start_samples = reference_timing(el)
+    wfs = {}
+    tvals = np.arange(samples)/el.clock
+    for c in el._channels:
+        wfs[c] = np.zeros(samples) + el._channels[c]['offset']
+    for p in el.pulses:
+        psamples = int(el.pulses[p].length*el.clock + 0.5)
+        if not el.global_time:
+            pulsewfs = el.pulses[p].get_wfs(tvals.copy()[:psamples])
+        else:
+            chan_tvals = {}
+            for c in el.pulses[p].channels:
+                idx0 = start_samples[p, c]
+                chan_tvals[c] = np.round(
+                    tvals.copy()[idx0:idx0+psamples] +
+                    el._channels[c]['delay'] + el.time_offset,
+                    pulsar.SIGNIFICANT_DIGITS)
+            pulsewfs = el.pulses[p].get_wfs(chan_tvals)
+        for c in el.pulses[p].channels:
+            idx0 = start_samples[p, c]
+            wfs[c][idx0:idx0+psamples] += pulsewfs[c]
+    return tvals, wfs
+
+
+class TestElementCompilation(TestCase):
+    def assert_equivalent(self, el):
+        offset, ideal_length, samples, start_samples = reference_timing(el)
+        self.assertEqual(el.offset(), offset)
+        self.assertEqual(el.ideal_length(), ideal_length)
+        self.assertEqual(el.samples(), samples)
+        for (p, c), start in start_samples.items():
+            self.assertEqual(el.pulse_start_sample(p, c), start)
+
+        tvals_ref, wfs_ref = reference_ideal_waveforms(el)
+        tvals, wfs = el.ideal_waveforms()
+        np.testing.assert_array_equal(tvals, tvals_ref)
+        self.assertEqual(list(wfs), list(wfs_ref))
+        for c in wfs_ref:
+            np.testing.assert_array_equal(wfs[c], wfs_ref[c])
+
+    def test_equivalent_to_reference(self):
+        for seed in range(5):
+            self.assert_equivalent(make_random_element(seed))
+
+    def test_element_settings(self):
+        self.assert_equivalent(make_random_element(
+            0, nr_pulses=3, min_samples=5000))
+        self.assert_equivalent(make_random_element(1, granularity=80,
+                                                   min_samples=0))
+        self.assert_equivalent(make_random_element(2, global_time=False))
+        self.assert_equivalent(make_random_element(3, time_offset=1e-6))
+        el = make_random_element(4)
+        el.shift_all_pulses(10e-9)
+        self.assert_equivalent(el)
+
+    def test_fixed_point(self):
+        el = element.Element('fixed_point')
+        for ch in channels:
+            el.define_channel(ch, delay=5e-9)
+        last = el.add(pulse.SquarePulse(channel='ch3', amplitude=0.2,
+                                        length=130e-9))
+        last = el.add(pl.SSB_DRAG_pulse(name='drag', I_channel='ch1',
+                                        Q_channel='ch2', amplitude=0.5,
+                                        sigma=5e-9, mod_frequency=-50e6),
+                      start=7e-9, refpulse=last)
+        el.add(pulse.SquarePulse(channel='ch1', amplitude=0.1,
+                                 length=300e-9),
+               start=10e-9, refpulse=last, fixed_point_freq=50e6)
+        self.assertTrue(el.ignore_offset_correction)
+        self.assert_equivalent(el)
+
+    def test_recompiled_when_pulses_change(self):
+        el = make_random_element(6, nr_pulses=10)
+        samples = el.samples()
+        compiled = el.compile()
+        self.assertIs(el.compile(), compiled)
+        el.add(pulse.SquarePulse(channel='ch2', amplitude=0.5,
+                                 length=1e-6), refpulse=el._last_added_pulse)
+        self.assertGreater(el.samples(), samples)
+        self.assert_equivalent(el)
+        # pulses changed in place
+        el.pulses[el._last_added_pulse].length = 2e-6
+        self.assert_equivalent(el)
+        el.pulses[el._last_added_pulse].amplitude = -0.5
+        self.assert_equivalent(el)
+        el.define_channel('ch2', delay=30e-9)
+        self.assert_equivalent(el)
+
+    def test_waveforms_rendered_once(self):
+        el = make_random_element(7)
+        tvals, wfs = el.ideal_waveforms()
+        hits, misses = waveform_cache.hits, waveform_cache.misses
+        for c in wfs:
+            wfs[c][:] = 10
+        tvals, wfs = el.ideal_waveforms()
+        # a single lookup of the rendered waveforms, none per pulse
+        self.assertEqual(waveform_cache.hits, hits+1)
+        self.assertEqual(waveform_cache.misses, misses)
+        # the returned waveforms are copies
+        for c in wfs:
+            self.assertFalse(np.any(wfs[c] == 10))
+
+    def test_no_pulses(self):
+        el = element.Element('empty')
+        el.define_channel('ch1')
+        with self.assertRaises(ValueError):
+            el.samples()
+        el.ignore_offset_correction = True
+        self.assertEqual(el.offset(), 0)
+
+
+class TestPulseSpec(TestCase):
+    def setUp(self):
+        self.X180 = pulse.PulseSpec(
+            pl.SSB_DRAG_pulse, name='X180', I_channel='ch1',
+            Q_channel='ch2', amplitude=0.5, sigma=5e-9, motzoi=0.1,
+            mod_frequency=-50e6)
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.X180.pars = ()
+        X90 = self.X180.with_(name='X90', amplitude=0.25)
+        self.assertEqual(X90['amplitude'], 0.25)
+        self.assertEqual(self.X180['amplitude'], 0.5)
+        self.assertEqual(X90.with_(name='X180', amplitude=0.5), self.X180)
+        self.assertEqual(len({self.X180, X90, X90.with_()}), 2)
+        # lists are stored as tuples
+        spec = pulse.PulseSpec(pulse.SquarePulse, channels=['ch1', 'ch2'])
+        self.assertEqual(spec['channels'], ('ch1', 'ch2'))
+
+    def test_shared_between_elements(self):
+        elements = []
+        for i in range(2):
+            el = element.Element('el{}'.format(i))
+            for ch in channels:
+                el.define_channel(ch)
+            last = None
+            for j in range(i+2):
+                last = el.add(self.X180, start=10e-9, refpulse=last)
+            elements.append(el)
+        # every element has its own pulse objects
+        self.assertIsNot(elements[0].pulses['X180-0'],
+                         elements[1].pulses['X180-0'])
+        self.assertEqual(elements[0].pulses['X180-1'].t0(),
+                         elements[1].pulses['X180-1'].t0())
+        self.assertNotEqual(elements[0].pulses['X180-0'].t0(),
+                            elements[0].pulses['X180-1'].t0())
+
+    def test_equivalent_to_pulse_objects(self):
+        el_spec = element.Element('spec')
+        el_pulse = element.Element('pulse')
+        for el in [el_spec, el_pulse]:
+            for ch in channels:
+                el.define_channel(ch, delay=2e-9)
+        square = pulse.PulseSpec(pulse.SquarePulse, channel='ch3',
+                                 amplitude=0.2, length=40e-9)
+        last_spec = last_pulse = None
+        for spec in [self.X180, square, self.X180.with_(phase=90), square]:
+            last_spec = el_spec.add(spec, start=5e-9, refpulse=last_spec)
+            last_pulse = el_pulse.add(spec.create(), start=5e-9,
+                                      refpulse=last_pulse)
+        self.assertEqual(list(el_spec.pulses), list(el_pulse.pulses))
+        tvals, wfs_spec = el_spec.normalized_waveforms()
+        tvals, wfs_pulse = el_pulse.normalized_waveforms()
+        for c in channels:
+            np.testing.assert_array_equal(wfs_spec[c], wfs_pulse[c])
+
+
+class TestElementCopy(TestCase):
+    def test_deepcopy_local_pulse_class(self):
+        class LocalPulse(pulse.SquarePulse):
+            pass
+
+        el = element.Element('el')
+        el.define_channel('ch1')
+        el.add(LocalPulse(channel='ch1', amplitude=0.5, length=20e-9),
+               name='local')
+        el_copy = deepcopy(el)
+        self.assertIsInstance(el_copy.pulses['local'], LocalPulse)
+        self.assertIsNot(el_copy.pulses['local'], el.pulses['local'])
+        tvals, wfs = el.normalized_waveforms()
+        tvals, wfs_copy = el_copy.normalized_waveforms()
+        np.testing.assert_array_equal(wfs_copy['ch1'], wfs['ch1'])
@@ -0,0 +1,422 @@
+import os
+import shutil
+import tempfile
+import time
+import glob
+import multiprocessing
+import h5py
+import numpy as np
+from unittest import TestCase
+
+from pycqed.measurement import hdf5_data as h5d
+from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.measurement import sweep_functions as swf
+from pycqed.measurement import detector_functions as det
+from pycqed.measurement import measurement_control
+
+
+class TestDataDataset(TestCase):
+    def test_auto_chunk_shape(self):
+        self.assertEqual(h5d.auto_chunk_shape(None, 4, 'f8'), (4096, 4))
+        self.assertEqual(h5d.auto_chunk_shape(None, 4, 'i2'), (16384, 4))
+        self.assertEqual(h5d.auto_chunk_shape(100, 4, 'f8'), (100, 4))
+        self.assertEqual(h5d.auto_chunk_shape(None, 10**6, 'f8'), (1, 10**6))
+
+
+class TestBufferedDataWriter(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_object = h5d.Data(
+            name='test_writer',
+            filepath=os.path.join(self.tmp_dir, 'test_writer.hdf5'))
+        self.dset = self.data_object.create_dataset(
+            'Data', (0, 3), maxshape=(None, 3))
+
+    def tearDown(self):
+        self.data_object.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_preallocates_known_length(self):
+        writer = h5d.BufferedDataWriter(self.dset, nr_rows=50,
+                                        buffer_size=10)
+        self.assertEqual(self.dset.shape, (50, 3))
+        for i in range(50):
+            writer.append([i, 2*i, 3*i])
+            self.assertEqual(writer.nr_rows, i+1)
+        # The dataset is never resized while writing
+        self.assertEqual(self.dset.shape, (50, 3))
+        writer.close()
+        np.testing.assert_array_equal(self.dset[:, 0], np.arange(50))
+        np.testing.assert_array_equal(self.dset[:, 2], 3*np.arange(50))
+
+    def test_flushes_every_buffer_size_rows(self):
+        writer = h5d.BufferedDataWriter(self.dset, nr_rows=20,
+                                        buffer_size=5, flush_interval=1e9)
+        for i in range(4):
+            writer.append([1, 1, 1])
+        self.assertEqual(np.sum(self.dset[:, 0]), 0)
+        writer.append([1, 1, 1])
+        self.assertEqual(np.sum(self.dset[:, 0]), 5)
+
+    def test_flushes_after_flush_interval(self):
+        writer = h5d.BufferedDataWriter(self.dset, nr_rows=20,
+                                        buffer_size=100, flush_interval=0.01)
+        writer.append([1, 1, 1])
+        time.sleep(0.02)
+        writer.append([1, 1, 1])
+        self.assertEqual(np.sum(self.dset[:, 0]), 2)
+
+    def test_geometric_growth(self):
+        writer = h5d.BufferedDataWriter(self.dset, buffer_size=4)
+        sizes = set()
+        for i in range(100):
+            writer.append([i, i, i])
+            sizes.add(self.dset.shape[0])
+        # number of resize operations grows logarithmically
+        self.assertLess(len(sizes), 10)
+        writer.close()
+        self.assertEqual(self.dset.shape, (100, 3))
+        np.testing.assert_array_equal(self.dset[:, 1], np.arange(100))
+
+    def test_close_trims_to_written_rows(self):
+        writer = h5d.BufferedDataWriter(self.dset, nr_rows=1000)
+        try:
+            for i in range(1000):
+                if i == 42:
+                    raise KeyboardInterrupt
+                writer.append([i, i, i])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.close()
+        self.assertEqual(self.dset.shape, (42, 3))
+        np.testing.assert_array_equal(self.dset[:, 0], np.arange(42))
+
+    def test_last_row(self):
+        writer = h5d.BufferedDataWriter(self.dset, buffer_size=2)
+        for i in range(5):
+            writer.append([i, -i, 0])
+            np.testing.assert_array_equal(writer.last_row, [i, -i, 0])
+
+
+class SlowDataset:
+    '''
+    Wraps a dataset to simulate a slow file system, every write or resize
+    takes "latency" seconds.
+    '''
+    def __init__(self, dset, latency):
+        self.dset = dset
+        self.latency = latency
+
+    @property
+    def shape(self):
+        return self.dset.shape
+
+    def resize(self, shape):
+        time.sleep(self.latency)
+        self.dset.resize(shape)
+
+    def __getitem__(self, key):
+        return self.dset[key]
+
+    def __setitem__(self, key, val):
+        time.sleep(self.latency)
+        self.dset[key] = val
+
+
+class TestThreadedDataWriter(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_object = h5d.Data(
+            name='test_writer',
+            filepath=os.path.join(self.tmp_dir, 'test_writer.hdf5'))
+        self.dset = self.data_object.create_dataset(
+            'Data', (0, 3), maxshape=(None, 3))
+
+    def tearDown(self):
+        self.data_object.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def acquire(self, writer, nr_points):
+        '''
+        Returns the time spent "acquiring" nr_points.
+        '''
+        t0 = time.time()
+        for i in range(nr_points):
+            writer.append([i, 2*i, 3*i])
+        return time.time() - t0
+
+    def test_writes_all_rows(self):
+        writer = h5d.ThreadedDataWriter(self.dset, nr_rows=100,
+                                        buffer_size=7)
+        self.acquire(writer, 100)
+        self.assertEqual(writer.nr_rows, 100)
+        writer.close()
+        np.testing.assert_array_equal(self.dset[:, 0], np.arange(100))
+        np.testing.assert_array_equal(self.dset[:, 2], 3*np.arange(100))
+
+    def test_acquisition_independent_of_write_latency(self):
+        nr_points = 40
+        latency = 0.01
+        slow_dset = SlowDataset(self.dset, latency)
+        writer = h5d.BufferedDataWriter(slow_dset, nr_rows=nr_points,
+                                        buffer_size=1)
+        t_sync = self.acquire(writer, nr_points)
+        writer.close()
+        self.assertGreater(t_sync, nr_points*latency)
+
+        self.dset.resize((0, 3))
+        writer = h5d.ThreadedDataWriter(slow_dset, nr_rows=nr_points,
+                                        buffer_size=1)
+        t_threaded = self.acquire(writer, nr_points)
+        writer.close()
+        self.assertLess(t_threaded, 0.2*nr_points*latency)
+        np.testing.assert_array_equal(self.dset[:, 1],
+                                      2*np.arange(nr_points))
+
+    def test_flush_writes_queued_rows(self):
+        slow_dset = SlowDataset(self.dset, 0.005)
+        writer = h5d.ThreadedDataWriter(slow_dset, nr_rows=10,
+                                        buffer_size=1)
+        self.acquire(writer, 10)
+        writer.flush()
+        np.testing.assert_array_equal(self.dset[:, 0], np.arange(10))
+        writer.close()
+
+    def test_back_pressure(self):
+        nr_points = 20
+        latency = 0.01
+        slow_dset = SlowDataset(self.dset, latency)
+        writer = h5d.ThreadedDataWriter(slow_dset, nr_rows=nr_points,
+                                        buffer_size=1, queue_size=2)
+        t_acq = self.acquire(writer, nr_points)
+        writer.close()
+        # append blocks once the queue is full
+        self.assertGreater(t_acq, (nr_points-5)*latency)
+        self.assertEqual(self.dset.shape, (nr_points, 3))
+
+    def test_close_on_interrupt(self):
+        writer = h5d.ThreadedDataWriter(self.dset, nr_rows=1000)
+        try:
+            for i in range(1000):
+                if i == 42:
+                    raise KeyboardInterrupt
+                writer.append([i, i, i])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.close()
+        self.assertEqual(self.dset.shape, (42, 3))
+        np.testing.assert_array_equal(self.dset[:, 0], np.arange(42))
+
+    def test_writer_exception_is_raised(self):
+        # a row that does not fit the dataset raises in the writer thread
+        writer = h5d.ThreadedDataWriter(self.dset, buffer_size=1)
+        writer.append([1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            writer.flush()
+        writer.close()
+
+
+def _create_data_dirs(args):
+    datadir, nr_dirs = args
+    generator = h5d.DateTimeGenerator()
+    return [generator.create_data_dir(datadir, name='stress')[0]
+            for i in range(nr_dirs)]
+
+
+class TestDateTimeGenerator(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.ts = time.localtime()
+        self.day_dir = os.path.join(self.datadir,
+                                    time.strftime('%Y%m%d', self.ts))
+        self.tsd = time.strftime('%H%M%S', self.ts)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_layout(self):
+        generator = h5d.DateTimeGenerator()
+        path, tsd = generator.create_data_dir(self.datadir, name='Rabi',
+                                              ts=self.ts)
+        self.assertEqual(tsd, self.tsd)
+        self.assertEqual(path, os.path.join(self.day_dir, tsd+'_Rabi'))
+        self.assertTrue(os.path.isdir(path))
+        path, tsd = generator.create_data_dir(self.datadir, ts=self.ts)
+        self.assertEqual(path, os.path.join(self.day_dir, tsd))
+
+    def test_unique_timestamps(self):
+        generator = h5d.DateTimeGenerator()
+        paths = [generator.create_data_dir(
+            self.datadir, name=['Rabi', 'T1'][i % 2], ts=self.ts)[0]
+            for i in range(20)]
+        self.assertEqual(sorted(paths), paths)
+        self.assertEqual(os.path.basename(paths[0]), self.tsd+'_Rabi')
+        # timestamp and name as read by the analysis
+        timestamps = []
+        for i, path in enumerate(paths):
+            day, dirname = path.split(os.sep)[-2:]
+            self.assertEqual(dirname[7:], ['Rabi', 'T1'][i % 2])
+            timestamps.append(day + dirname[:6])
+        self.assertEqual(len(set(timestamps)), 20)
+        # the next free second is used
+        self.assertEqual(time.mktime(time.strptime(timestamps[1],
+                                                   '%Y%m%d%H%M%S')),
+                         time.mktime(self.ts)+1)
+
+    def test_data_from_time(self):
+        old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = self.datadir
+        try:
+            folders = []
+            for i in range(3):
+                data_object = h5d.Data(name='Rabi')
+                data_object.close()
+                folders.append(data_object.folder)
+        finally:
+            h5d.qc_config['datadir'] = old_datadir
+        for folder in folders:
+            day, dirname = folder.split(os.sep)[-2:]
+            self.assertEqual(
+                a_tools.data_from_time(day+dirname[:6], folder=self.datadir),
+                folder)
+
+    def test_data_filename(self):
+        old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = self.datadir
+        try:
+            for i in range(2):
+                data_object = h5d.Data(name='Rabi')
+                data_object.close()
+                self.assertEqual(
+                    data_object._filename,
+                    os.path.basename(data_object.folder)+'.hdf5')
+        finally:
+            h5d.qc_config['datadir'] = old_datadir
+
+    def test_concurrent_processes(self):
+        nr_processes, nr_dirs = 8, 1250
+        with multiprocessing.Pool(nr_processes) as pool:
+            paths = pool.map(_create_data_dirs,
+                             [(self.datadir, nr_dirs)] * nr_processes)
+        all_paths = [p for process_paths in paths for p in process_paths]
+        self.assertEqual(len(all_paths), nr_processes*nr_dirs)
+        self.assertEqual(len(set(all_paths)), nr_processes*nr_dirs)
+        # without the .HHMMSS markers of the claimed seconds
+        self.assertEqual(
+            sum(len([d for d in os.listdir(os.path.join(self.datadir, day))
+                     if not d.startswith('.')])
+                for day in os.listdir(self.datadir)),
+            nr_processes*nr_dirs)
+        for process_paths in paths:
+            self.assertEqual(sorted(process_paths), process_paths)
+        timestamps = {p.split(os.sep)[-2] + os.path.basename(p)[:6]
+                      for p in all_paths}
+        self.assertEqual(len(timestamps), nr_processes*nr_dirs)
+
+def _swmr_writer(datadir, nr_points):
+    h5d.qc_config['datadir'] = datadir
+    MC = measurement_control.MeasurementControl(
+        'MC', plot_backend='headless', data_buffer_size=5)
+    MC.verbose = False
+    MC.swmr_datasaving = True
+    MC.set_sweep_function(swf.None_Sweep())
+    MC.set_sweep_points(np.arange(nr_points))
+    MC.set_detector_function(det.Dummy_Detector_Soft(delay=0.005))
+    MC.run('swmr')
+
+
+def _swmr_reader(datadir, nr_points, results, timeout=60):
+    # Opening the file fails until the writer switched to SWMR mode
+    t0 = time.time()
+    reader = None
+    while reader is None:
+        if time.time() - t0 > timeout:
+            raise RuntimeError('Could not open the file of the writer')
+        filepaths = glob.glob(os.path.join(datadir, '*', '*', '*.hdf5'))
+        try:
+            reader = h5d.SWMRDataReader(filepaths[0])
+        except (IndexError, OSError, KeyError):
+            time.sleep(0.001)
+    nr_rows_read = []
+    with reader:
+        finished = False
+        while not finished:
+            if time.time() - t0 > timeout:
+                break
+            finished = reader.finished
+            data = reader.read()
+            nr_rows_read.append(len(data))
+            x = np.arange(len(data))/15.
+            expected = np.column_stack([np.arange(len(data)),
+                                        np.sin(x/np.pi), np.cos(x/np.pi)])
+            if not np.allclose(data, expected, atol=1e-6):
+                results.put(('corrupted', len(data)))
+                return
+            time.sleep(0.01)
+    results.put(('ok', nr_rows_read))
+
+
+class TestSWMR(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_reader_only_sees_written_rows(self):
+        filepath = os.path.join(self.datadir, 'swmr.hdf5')
+        with h5d.Data(name='swmr', filepath=filepath, swmr=True) as data:
+            dset = h5d.create_data_dataset(data, 'Data', 2, nr_rows=100)
+            dset.attrs['column_names'] = h5d.encode_to_utf8(['x', 'y'])
+            h5d.start_swmr(dset)
+            writer = h5d.BufferedDataWriter(dset, nr_rows=100,
+                                            buffer_size=10, swmr=True)
+            with h5d.SWMRDataReader(filepath, dataset='Data') as reader:
+                self.assertEqual(reader.column_names, ['x', 'y'])
+                self.assertEqual(reader.read().shape, (0, 2))
+                for i in range(25):
+                    writer.append([i, 2*i])
+                # the allocated rows are not returned
+                self.assertEqual(dset.shape[0], 100)
+                np.testing.assert_array_equal(
+                    reader.read(), [[i, 2*i] for i in range(20)])
+                np.testing.assert_array_equal(reader.read(start=18)[:, 0],
+                                              [18, 19])
+                writer.close()
+                self.assertEqual(reader.nr_rows, 25)
+                self.assertEqual(reader.read().shape, (25, 2))
+                self.assertFalse(reader.finished)
+                h5d.publish_rows(dset, 25, finished=True)
+                self.assertTrue(reader.finished)
+            data.stop_swmr()
+            data.create_group('Analysis')
+        with h5py.File(filepath, 'r') as f:
+            self.assertEqual(f['Data'].shape, (25, 2))
+            self.assertIn('Analysis', f)
+
+    def test_MC_writer_and_reader_processes(self):
+        nr_points = 200
+        results = multiprocessing.Queue()
+        writer = multiprocessing.Process(target=_swmr_writer,
+                                         args=(self.datadir, nr_points))
+        reader = multiprocessing.Process(
+            target=_swmr_reader, args=(self.datadir, nr_points, results))
+        reader.start()
+        writer.start()
+        writer.join(60)
+        status, nr_rows_read = results.get(timeout=60)
+        reader.join(60)
+        self.assertEqual(writer.exitcode, 0)
+        self.assertEqual(status, 'ok')
+        # the data grows monotonically and the reader saw partial data
+        self.assertEqual(nr_rows_read, sorted(nr_rows_read))
+        self.assertEqual(nr_rows_read[-1], nr_points)
+        self.assertGreater(len(set(nr_rows_read)), 2)
+
+        filepath, = glob.glob(os.path.join(self.datadir, '*', '*', '*.hdf5'))
+        with h5py.File(filepath, 'r') as f:
+            self.assertEqual(f['Experimental Data']['Data'].shape,
+                             (nr_points, 3))
+            self.assertIn('MC settings', f)
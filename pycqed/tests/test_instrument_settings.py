@@ -0,0 +1,202 @@
+import io
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+import h5py
+import numpy as np
+from unittest import TestCase
+
+from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.analysis.tools.file_handling import extract_data_from_file
+from pycqed.measurement import hdf5_data as h5d
+from pycqed.measurement import sweep_functions as swf
+from pycqed.measurement import detector_functions as det
+from pycqed.measurement import measurement_control
+from pycqed.measurement import instrument_settings as ins_set
+
+
+class Fake_Parameter:
+    def __init__(self, value):
+        self.value = value
+        self.nr_gets = 0
+
+    def get(self):
+        self.nr_gets += 1
+        return self.value
+
+    def get_latest(self):
+        return self.value
+
+
+class Fake_Instrument:
+    def __init__(self, **pars):
+        self.parameters = {p_name: Fake_Parameter(val)
+                           for p_name, val in pars.items()}
+
+    def snapshot(self, update=False):
+        return {'parameters': {
+            p_name: {'value': par.get() if update else par.value}
+            for p_name, par in self.parameters.items()}}
+
+
+def fake_station():
+    return SimpleNamespace(components={
+        'qubit': Fake_Instrument(f_qubit=5.123456789e9, nr_averages=1024,
+                                 on=True, name='q0', T1=None),
+        'AWG': Fake_Instrument(clock_freq=1e9, channels=[1, 2, 3, 4],
+                               amplitude=np.float64(0.5))})
+
+
+class TestInstrumentSettings(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.nr_files = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def new_file(self):
+        self.nr_files += 1
+        folder = os.path.join(self.datadir, 'day', str(self.nr_files))
+        os.makedirs(folder)
+        return h5py.File(os.path.join(folder, 'file.hdf5'), 'w')
+
+    def save(self, cache, station, **kw):
+        with self.new_file() as f:
+            cache.save(f, station, **kw)
+            return f.filename
+
+    def test_typed_round_trip(self):
+        station = fake_station()
+        filename = self.save(ins_set.SnapshotCache(), station)
+        settings = ins_set.read_instrument_settings(filename)
+        self.assertEqual(list(settings), ['AWG', 'qubit'])
+        self.assertEqual(settings['qubit'], {
+            'f_qubit': 5.123456789e9, 'nr_averages': 1024, 'on': True,
+            'name': 'q0', 'T1': None})
+        self.assertEqual(type(settings['qubit']['nr_averages']), int)
+        self.assertEqual(type(settings['qubit']['on']), bool)
+        self.assertEqual(settings['AWG']['amplitude'], 0.5)
+        # other types are stored as strings, as in the old format
+        self.assertEqual(settings['AWG']['channels'], '[1, 2, 3, 4]')
+        with h5py.File(filename, 'r') as f:
+            dset = f['Instrument settings']['settings']
+            self.assertEqual(dset.shape, (8, ))
+            self.assertEqual(dset.dtype['value'], np.float64)
+
+    def test_no_instrument_queries(self):
+        station = fake_station()
+        self.save(ins_set.SnapshotCache(), station)
+        pars = station.components['qubit'].parameters
+        self.assertEqual(pars['f_qubit'].nr_gets, 0)
+        self.save(ins_set.SnapshotCache(), station, update=True)
+        self.assertEqual(pars['f_qubit'].nr_gets, 1)
+
+    def test_diff(self):
+        station = fake_station()
+        cache = ins_set.SnapshotCache()
+        first = self.save(cache, station, diff=True)
+        pars = station.components['qubit'].parameters
+        pars['f_qubit'].value = 5.2e9
+        pars['flux'] = Fake_Parameter(0.1)
+        del pars['T1']
+        del station.components['AWG']
+        second = self.save(cache, station, diff=True)
+        third = self.save(cache, station, diff=True)
+
+        expected = ins_set.get_station_settings(station)
+        for filename in [second, third]:
+            self.assertEqual(ins_set.read_instrument_settings(filename),
+                             expected)
+        with h5py.File(second, 'r') as f:
+            set_grp = f['Instrument settings']
+            self.assertEqual(
+                os.path.normpath(os.path.join(
+                    os.path.dirname(second),
+                    set_grp.attrs['reference_file'])), first)
+            # f_qubit, flux, T1 and the 3 parameters of the AWG
+            self.assertEqual(len(set_grp['settings']), 6)
+        with h5py.File(third, 'r') as f:
+            self.assertEqual(len(f['Instrument settings']['settings']), 0)
+        # the first file is unchanged
+        self.assertEqual(ins_set.read_instrument_settings(first)['AWG'][
+            'clock_freq'], 1e9)
+
+    def test_max_diff_chain(self):
+        station = fake_station()
+        cache = ins_set.SnapshotCache(max_diff_chain=2)
+        filenames = [self.save(cache, station, diff=True) for i in range(5)]
+        has_reference = []
+        for filename in filenames:
+            with h5py.File(filename, 'r') as f:
+                has_reference.append(
+                    'reference_file' in f['Instrument settings'].attrs)
+        self.assertEqual(has_reference, [False, True, True, False, True])
+
+    def test_read_old_format(self):
+        with self.new_file() as f:
+            qubit_grp = f.create_group('Instrument settings').create_group(
+                'qubit')
+            qubit_grp.attrs['f_qubit'] = '5000000000.0'
+            qubit_grp.attrs['name'] = 'q0'
+            filename = f.filename
+        settings = ins_set.read_instrument_settings(filename)
+        self.assertEqual(settings, {'qubit': {'f_qubit': '5000000000.0',
+                                              'name': 'q0'}})
+
+    def test_compare_instrument_settings(self):
+        station = fake_station()
+        cache = ins_set.SnapshotCache()
+        first = self.save(cache, station)
+        station.components['qubit'].parameters['f_qubit'].value = 5.2e9
+        second = self.save(cache, station, diff=True)
+        with h5py.File(first, 'r') as f_a, h5py.File(second, 'r') as f_b:
+            output = io.StringIO()
+            with redirect_stdout(output):
+                a_tools.compare_instrument_settings(
+                    SimpleNamespace(data_file=f_a),
+                    SimpleNamespace(data_file=f_b))
+        lines = output.getvalue().splitlines()
+        self.assertIn('    "f_qubit" has a different value  "5123456789.0" '
+                      'for a, "5200000000.0" for b', lines)
+        self.assertEqual(lines.count('    No differences found'), 1)
+        self.assertEqual(extract_data_from_file(
+            second, ['qubit.f_qubit', 'AWG.clock_freq']),
+            {'qubit.f_qubit': 5.2e9, 'AWG.clock_freq': 1e9})
+
+
+class TestMCInstrumentSettings(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.datadir = tempfile.mkdtemp()
+        cls.old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = cls.datadir
+
+    @classmethod
+    def tearDownClass(cls):
+        h5d.qc_config['datadir'] = cls.old_datadir
+        shutil.rmtree(cls.datadir)
+
+    def test_MC_saves_diffs(self):
+        MC = measurement_control.MeasurementControl(
+            'MC', plot_backend='headless')
+        MC.verbose = False
+        MC.station = fake_station()
+        MC.store_settings_diff = True
+        filenames = []
+        for f_qubit in [5e9, 5.1e9]:
+            MC.station.components['qubit'].parameters['f_qubit'].value = \
+                f_qubit
+            MC.set_sweep_function(swf.None_Sweep())
+            MC.set_sweep_points(np.arange(3))
+            MC.set_detector_function(det.Dummy_Detector_Soft())
+            MC.run('settings_diff')
+            filenames.append(MC.data_object.filepath)
+        with h5py.File(filenames[1], 'r') as f:
+            self.assertIn('reference_file', f['Instrument settings'].attrs)
+            self.assertEqual(len(f['Instrument settings']['settings']), 1)
+            self.assertEqual(
+                a_tools.get_instrument_settings(f)['qubit']['f_qubit'],
+                5.1e9)
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from unittest import TestCase
+
+from pycqed.measurement.waveform_control import kernel_distortion_module as kdm
+from pycqed.measurement.pulse_sequences import fluxing_sequences as fsqs
+from pycqed.tests import test_pulsar
+
+
+def decay_kernel(amp=1., tau=11000, length=20000):
+    # same as kernel_object.decay_kernel
+    t_kernel = np.arange(length)
+    decay_kernel_step = 1 + amp*np.exp(-t_kernel/tau)
+    decay_kernel = np.zeros(decay_kernel_step.shape)
+    decay_kernel[0] = decay_kernel_step[0]
+    decay_kernel[1:] = decay_kernel_step[1:]-decay_kernel_step[:-1]
+    return decay_kernel
+
+
+def reference_distort(waveform, kernel_list):
+    '''
+    Consecutive convolution as in the original distort_and_compensate.
+    '''
+    length = len(waveform)
+    for kernelvec in kernel_list:
+        waveform = np.convolve(waveform, kernelvec)[:length]
+    return waveform
+
+
+class TestDistortionEngine(TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        short_kernel = self.rng.rand(601)
+        self.kernel_lists = [
+            [decay_kernel()],
+            [short_kernel / np.sum(short_kernel)],
+            [short_kernel / np.sum(short_kernel), decay_kernel(),
+             decay_kernel(amp=-0.1, tau=500, length=3000)]]
+
+    def test_equivalent_to_np_convolve(self):
+        for kernel_list in self.kernel_lists:
+            engine = kdm.DistortionEngine(kernel_list)
+            for length in [1, 100, 2999, 20000, 45000]:
+                waveforms = self.rng.uniform(-1, 1, (3, length))
+                distorted = engine.distort(waveforms)
+                self.assertEqual(distorted.shape, waveforms.shape)
+                for wf, dist_wf in zip(waveforms, distorted):
+                    np.testing.assert_allclose(
+                        dist_wf, reference_distort(wf, kernel_list),
+                        rtol=0, atol=1e-9)
+                np.testing.assert_allclose(
+                    engine.distort(waveforms[0]), distorted[0],
+                    rtol=0, atol=1e-9)
+
+    def test_distort_list(self):
+        kernel_list = self.kernel_lists[2]
+        engine = kdm.DistortionEngine(kernel_list)
+        waveforms = [self.rng.uniform(-1, 1, length)
+                     for length in [5000, 120, 8000, 0]]
+        for wf, dist_wf in zip(waveforms, engine.distort_list(waveforms)):
+            self.assertEqual(len(dist_wf), len(wf))
+            if len(wf) == 0:
+                continue
+            np.testing.assert_allclose(
+                dist_wf, reference_distort(wf, kernel_list),
+                rtol=0, atol=1e-9)
+        self.assertEqual(engine.distort_list([]), [])
+        # without kernels the waveforms are not changed
+        np.testing.assert_array_equal(
+            kdm.DistortionEngine([]).distort(waveforms[0]), waveforms[0])
+
+    def test_combine_kernels(self):
+        kernel_list = self.kernel_lists[2]
+        for length in [None, 100, 25000]:
+            combined = kdm.combine_kernels(kernel_list, length)
+            reference = kernel_list[0]
+            for k in kernel_list[1:]:
+                reference = np.convolve(reference, k)[:length or 20000]
+            self.assertEqual(len(combined), len(reference))
+            np.testing.assert_allclose(combined, reference, rtol=0,
+                                       atol=1e-9)
+
+    def test_engine_cache(self):
+        kernel_list = self.kernel_lists[0]
+        engine = kdm.get_distortion_engine(kernel_list)
+        self.assertIs(kdm.get_distortion_engine(
+            [k.copy() for k in kernel_list]), engine)
+        self.assertIsNot(kdm.get_distortion_engine(self.kernel_lists[1]),
+                         engine)
+
+
+class TestDistortChevronSequence(TestCase):
+    def setUp(self):
+        self.station = test_pulsar.MockStation()
+        fsqs.station = self.station
+        self.kernel_dir = tempfile.mkdtemp()
+        self.old_kernel_dir_path = fsqs.kernel_dir_path
+        fsqs.kernel_dir_path = self.kernel_dir + '/'
+        self.kernels = [decay_kernel(),
+                        decay_kernel(amp=-0.1, tau=500, length=3000)]
+        for i, kernel in enumerate(self.kernels):
+            np.savetxt(os.path.join(self.kernel_dir, 'k{}.txt'.format(i)),
+                       kernel)
+        self.distortion_dict = {'ch_list': ['ch4'],
+                                'ch4': ['k0.txt', 'k1.txt']}
+
+    def tearDown(self):
+        fsqs.kernel_dir_path = self.old_kernel_dir_path
+        shutil.rmtree(self.kernel_dir)
+
+    def chevron_seq(self, distortion_dict):
+        flux_pulse_pars = {'pulse_type': 'SquarePulse', 'pulse_delay': .1e-6,
+                           'channel': 'ch4', 'amplitude': 0.5,
+                           'length': .1e-6}
+        return fsqs.chevron_seq_length(
+            np.arange(10e-9, 200e-9, 20e-9), test_pulsar.pulse_pars,
+            dict(test_pulsar.RO_pars), flux_pulse_pars=flux_pulse_pars,
+            distortion_dict=distortion_dict, upload=False, return_seq=True)
+
+    def test_equivalent_to_consecutive_convolution(self):
+        seq, el_list = self.chevron_seq(self.distortion_dict)
+        seq_ref, el_list_ref = self.chevron_seq({'ch_list': []})
+        kernels = [np.loadtxt(os.path.join(self.kernel_dir, k))
+                   for k in self.distortion_dict['ch4']]
+        nr_distorted = 0
+        for el, el_ref in zip(el_list, el_list_ref):
+            tvals, wfs = el_ref.waveforms()
+            if not el._channels['ch4']['distorted']:
+                continue
+            nr_distorted += 1
+            np.testing.assert_allclose(
+                el.distorted_wfs['ch4'], reference_distort(wfs['ch4'],
+                                                           kernels),
+                rtol=0, atol=1e-9)
+        self.assertEqual(nr_distorted, 10)
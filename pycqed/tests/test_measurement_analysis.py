@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+from unittest import TestCase
+
+from pycqed.analysis import measurement_analysis as ma
+from pycqed.analysis.tools.file_handling import memmap_dataset
+from pycqed.tests.test_timestamp_loader import make_MC_file
+
+
+class TestGetValues(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.filepath = make_MC_file(self.datadir, '20170101_120000',
+                                     'get_values', nr_points=101)
+        self.folder = os.path.dirname(self.filepath)
+        self.x = np.linspace(0, 1, 101)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_read_only_by_default(self):
+        a = ma.MeasurementAnalysis(folder=self.folder, auto=False)
+        try:
+            self.assertEqual(a.data_file.mode, 'r')
+            np.testing.assert_array_equal(a.get_values('Q'), np.sin(self.x))
+            # reopened for writing when the analysis group is needed
+            a.add_analysis_datagroup_to_file()
+            self.assertEqual(a.data_file.mode, 'r+')
+            a.add_dataset_to_analysisgroup('fit', np.arange(3))
+            np.testing.assert_array_equal(a.get_values('I'), self.x**2)
+        finally:
+            a.finish()
+        with h5py.File(self.filepath, 'r') as f:
+            np.testing.assert_array_equal(f['Analysis']['fit'], np.arange(3))
+
+    def test_values_are_cached(self):
+        a = ma.MeasurementAnalysis(folder=self.folder, auto=False)
+        try:
+            values = a.get_values('amp')
+            self.assertEqual(values.dtype, np.float64)
+            self.assertIs(a.get_values('amp'), values)
+            with self.assertRaises(ValueError):
+                values[0] = 1
+            self.assertEqual(a.get_values('Data').shape, (101, 3))
+        finally:
+            a.finish()
+
+    def test_mmap(self):
+        a = ma.MeasurementAnalysis(folder=self.folder, auto=False, mmap=True)
+        try:
+            self.assertIsInstance(memmap_dataset(a.g['Data']), np.memmap)
+            values = a.get_values('I')
+            np.testing.assert_array_equal(values, self.x**2)
+            # a view on the memory-mapped file, not a copy
+            self.assertFalse(values.flags.owndata)
+        finally:
+            a.finish()
+
+    def test_mmap_chunked_dataset(self):
+        with h5py.File(self.filepath, 'r+') as f:
+            data = f['Experimental Data']['Data'][()]
+            del f['Experimental Data']['Data']
+            f['Experimental Data'].create_dataset(
+                'Data', data=data, chunks=(10, 3), compression='gzip')
+        a = ma.MeasurementAnalysis(folder=self.folder, auto=False, mmap=True)
+        try:
+            self.assertIsNone(memmap_dataset(a.g['Data']))
+            np.testing.assert_array_equal(a.get_values('I'), self.x**2)
+        finally:
+            a.finish()
@@ -0,0 +1,553 @@
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import timeit
+import h5py
+import numpy as np
+from unittest import TestCase
+
+from pycqed.measurement import hdf5_data as h5d
+from pycqed.measurement import sweep_functions as swf
+from pycqed.measurement import detector_functions as det
+from pycqed.measurement import measurement_control
+from pycqed.analysis import measurement_analysis as ma
+from pycqed.measurement.live_plotting import PlotSink
+from pycqed.measurement.profiling import SpanProfiler
+from pycqed.measurement.optimization import nelder_mead, batch_nelder_mead
+
+
+class Upload_Counting_Hard_Sweep(swf.Hard_Sweep):
+    '''
+    Hard sweep function that counts how often a sequence is uploaded.
+    '''
+    def __init__(self, name='Upload_Counting_Hard_Sweep'):
+        super().__init__()
+        self.name = name
+        self.parameter_name = name
+        self.unit = 'a.u.'
+        self.uploaded_sweep_points = []
+
+    def prepare(self, **kw):
+        self.uploaded_sweep_points.append(np.copy(self.sweep_points))
+
+
+class Recording_Soft_Sweep(swf.Soft_Sweep):
+    def __init__(self, name='Recording_Soft_Sweep'):
+        super().__init__()
+        self.name = name
+        self.parameter_name = name
+        self.unit = 'a.u.'
+        self.set_values = []
+
+    def set_parameter(self, val):
+        self.set_values.append(val)
+
+
+class Recording_Plot_Sink(PlotSink):
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.calls = []
+        self.rows_1D = []
+        self.last_2D = None
+
+    def new_measurement(self, measurement_name, folder):
+        self.calls.append('new_measurement')
+
+    def initialize_1D(self, xlabels, ylabels):
+        self.calls.append('initialize_1D')
+        self.labels_1D = xlabels, ylabels
+
+    def update_1D(self, new_rows):
+        self.rows_1D.append(np.copy(new_rows))
+
+    def initialize_2D(self, x, y, xlabel, ylabel, zlabels):
+        self.calls.append('initialize_2D')
+
+    def update_2D(self, z):
+        self.last_2D = np.copy(z)
+
+    def finish(self):
+        self.calls.append('finish')
+
+
+class Counting_Detector_Hard(det.Dummy_Detector_Hard):
+    def __init__(self):
+        super().__init__()
+        self.prepared_sweep_points = []
+
+    def prepare(self, sweep_points=None):
+        self.prepared_sweep_points.append(np.copy(sweep_points))
+
+
+class Quadratic_Detector(det.Detector_Function):
+    '''
+    Detector of a quadratic cost function of the sweep points that counts
+    the number of acquisitions. As a hard detector it returns the cost of
+    all sweep points it is prepared for in a single acquisition.
+    '''
+    def __init__(self, sweep_functions, detector_control='hard',
+                 optimum=(0.3, -0.7)):
+        super().__init__()
+        self.detector_control = detector_control
+        self.sweep_functions = sweep_functions
+        self.value_names = ['cost']
+        self.value_units = ['a.u.']
+        self.optimum = np.array(optimum)
+        self.nr_acquisitions = 0
+
+    def cost(self, x):
+        return np.sum((np.array(x) - self.optimum)**2, axis=-1)
+
+    def prepare(self, sweep_points=None):
+        self.sweep_points = sweep_points
+
+    def get_values(self):
+        self.nr_acquisitions += 1
+        return self.cost(self.sweep_points)
+
+    def acquire_data_point(self, **kw):
+        self.nr_acquisitions += 1
+        return self.cost([s.value for s in self.sweep_functions])
+
+
+class Value_Soft_Sweep(swf.Soft_Sweep):
+    def __init__(self):
+        super().__init__()
+        self.name = 'Value_Soft_Sweep'
+        self.parameter_name = 'x'
+        self.unit = 'a.u.'
+
+    def set_parameter(self, val):
+        self.value = val
+
+
+class Shots_Detector_Hard(det.Detector_Function):
+    '''
+    Hard detector returning integer single-shot values of two channels.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.detector_control = 'hard'
+        self.value_names = ['I', 'Q']
+        self.value_units = ['a.u.', 'a.u.']
+
+    def prepare(self, sweep_points=None):
+        self.sweep_points = sweep_points
+
+    def get_values(self):
+        rng = np.random.RandomState(0)
+        self.shots = np.round(rng.normal(
+            500, 100, (2, len(self.sweep_points))))
+        return self.shots
+
+
+# Dummy_Detector_Hard returns 100 points
+dummy_data = np.array([np.sin(np.arange(0, 10, .1) / np.pi),
+                       np.cos(np.arange(0, 10, .1) / np.pi)]).T
+
+
+class TestHardSweeps(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.datadir = tempfile.mkdtemp()
+        cls.old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = cls.datadir
+        cls.MC = measurement_control.MeasurementControl(
+            'MC', plot_backend='headless')
+        cls.MC.verbose = False
+
+    @classmethod
+    def tearDownClass(cls):
+        h5d.qc_config['datadir'] = cls.old_datadir
+        shutil.rmtree(cls.datadir)
+
+    def test_1D_hard(self):
+        sweep_function = Upload_Counting_Hard_Sweep()
+        detector = Counting_Detector_Hard()
+        sweep_points = np.linspace(0, 1, 100)
+        self.MC.set_sweep_function(sweep_function)
+        self.MC.set_sweep_points(sweep_points)
+        self.MC.set_detector_function(detector)
+        data = self.MC.run('1D_hard')
+        self.assertEqual(data.shape, (100, 3))
+        np.testing.assert_array_almost_equal(data[:, 0], sweep_points)
+        np.testing.assert_array_almost_equal(data[:, 1:], dummy_data)
+        self.assertEqual(len(sweep_function.uploaded_sweep_points), 1)
+        np.testing.assert_array_equal(detector.prepared_sweep_points[0],
+                                      sweep_points)
+
+    def test_ND_hard_with_outer_soft(self):
+        hard_swfs = [Upload_Counting_Hard_Sweep('length'),
+                     Upload_Counting_Hard_Sweep('seed')]
+        soft_swf = Recording_Soft_Sweep('frequency')
+        detector = Counting_Detector_Hard()
+        lengths = np.arange(10)
+        seeds = np.arange(10)
+        frequencies = [4e9, 5e9, 6e9]
+        # the first sweep function is the fastest
+        grid = np.array([[l, s, f] for f in frequencies for s in seeds
+                         for l in lengths])
+        self.MC.set_sweep_functions(hard_swfs + [soft_swf])
+        self.MC.set_sweep_points(grid)
+        self.MC.set_detector_function(detector)
+        data = self.MC.run('ND_hard')
+
+        self.assertEqual(data.shape, (300, 5))
+        np.testing.assert_array_equal(data[:, :3], grid)
+        np.testing.assert_array_almost_equal(data[:, 3:],
+                                             np.tile(dummy_data, (3, 1)))
+        self.assertEqual(soft_swf.set_values, frequencies)
+        # the inner hard sweep is the same for every frequency and is only
+        # uploaded once
+        self.assertEqual(len(hard_swfs[0].uploaded_sweep_points), 1)
+        np.testing.assert_array_equal(
+            hard_swfs[0].uploaded_sweep_points[0], grid[:100, :2])
+        np.testing.assert_array_equal(
+            hard_swfs[1].uploaded_sweep_points[0], grid[:100, 1])
+        self.assertEqual(len(detector.prepared_sweep_points), 3)
+        # the full sweep points are restored after the measurement
+        np.testing.assert_array_equal(self.MC.get_sweep_points(), grid)
+
+    def test_reupload_if_hard_sweep_changes(self):
+        hard_swf = Upload_Counting_Hard_Sweep()
+        soft_swf = Recording_Soft_Sweep()
+        detector = Counting_Detector_Hard()
+        x = np.arange(100)
+        grid = np.concatenate([
+            np.column_stack([x, np.zeros(100)]),
+            np.column_stack([x, np.ones(100)]),
+            np.column_stack([2*x, 2*np.ones(100)])])
+        self.MC.set_sweep_functions([hard_swf, soft_swf])
+        self.MC.set_sweep_points(grid)
+        self.MC.set_detector_function(detector)
+        data = self.MC.run('hard_reupload')
+        self.assertEqual(data.shape, (300, 4))
+        self.assertEqual(len(hard_swf.uploaded_sweep_points), 2)
+        np.testing.assert_array_equal(hard_swf.uploaded_sweep_points[1], 2*x)
+
+    def test_2D_hard(self):
+        hard_swf = Upload_Counting_Hard_Sweep()
+        soft_swf = Recording_Soft_Sweep()
+        detector = Counting_Detector_Hard()
+        self.MC.set_sweep_function(hard_swf)
+        self.MC.set_sweep_points(np.arange(100))
+        self.MC.set_sweep_function_2D(soft_swf)
+        self.MC.set_sweep_points_2D(np.linspace(0, 1, 5))
+        self.MC.set_detector_function(detector)
+        self.MC.run_2D('2D_hard')
+        self.assertEqual(len(hard_swf.uploaded_sweep_points), 1)
+        np.testing.assert_array_equal(hard_swf.uploaded_sweep_points[0],
+                                      np.arange(100))
+        np.testing.assert_array_equal(soft_swf.set_values,
+                                      np.linspace(0, 1, 5))
+
+    def test_hard_after_soft_raises(self):
+        self.MC.set_sweep_functions([Upload_Counting_Hard_Sweep(),
+                                     Recording_Soft_Sweep(),
+                                     Upload_Counting_Hard_Sweep()])
+        self.MC.set_sweep_points(np.zeros((10, 3)))
+        self.MC.set_detector_function(Counting_Detector_Hard())
+        with self.assertRaises(ValueError):
+            self.MC.run('hard_after_soft')
+
+
+class TestPlotSinks(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.datadir = tempfile.mkdtemp()
+        cls.old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = cls.datadir
+
+    @classmethod
+    def tearDownClass(cls):
+        h5d.qc_config['datadir'] = cls.old_datadir
+        shutil.rmtree(cls.datadir)
+
+    def setup_soft_2D(self, MC, xlen=7, ylen=4):
+        MC.set_sweep_function(swf.None_Sweep())
+        MC.set_sweep_points(np.arange(xlen))
+        MC.set_sweep_function_2D(swf.None_Sweep())
+        MC.set_sweep_points_2D(np.arange(ylen))
+        MC.set_detector_function(det.Dummy_Detector_Soft())
+
+    def test_headless_does_not_import_qt(self):
+        code = ('import sys\n'
+                'from pycqed.measurement import measurement_control as mc\n'
+                'mc.MeasurementControl("MC", plot_backend="headless")\n'
+                'qt_modules = [m for m in sys.modules if m.split(".")[0] in '
+                '("pyqtgraph", "PyQt4", "PyQt5", "PySide")]\n'
+                'print(qt_modules)\n')
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         stderr=subprocess.DEVNULL)
+        self.assertEqual(output.decode().strip().splitlines()[-1], '[]')
+
+    def test_unknown_backend_raises(self):
+        with self.assertRaises(ValueError):
+            measurement_control.MeasurementControl('MC', plot_backend='tk')
+
+    def test_sink_receives_all_rows_once(self):
+        sink = Recording_Plot_Sink(interval=0)
+        MC = measurement_control.MeasurementControl('MC', plot_backend=sink)
+        MC.verbose = False
+        self.setup_soft_2D(MC)
+        data = MC.run('plot_sink_2D', mode='2D')
+        self.assertEqual(sink.calls, ['new_measurement', 'initialize_2D',
+                                      'initialize_1D', 'finish'])
+        self.assertEqual(sink.labels_1D[1], ['I (mV)', 'Q (mV)'])
+        np.testing.assert_array_almost_equal(
+            np.concatenate(sink.rows_1D), data)
+        np.testing.assert_array_almost_equal(
+            sink.last_2D, data[:, 2:].reshape(4, 7, 2))
+
+    def test_live_plot_disabled(self):
+        sink = Recording_Plot_Sink()
+        MC = measurement_control.MeasurementControl('MC', plot_backend=sink)
+        MC.verbose = False
+        MC.live_plot_enabled = False
+        MC.set_sweep_function(swf.None_Sweep())
+        MC.set_sweep_points(np.arange(5))
+        MC.set_detector_function(det.Dummy_Detector_Soft())
+        MC.run('live_plot_disabled')
+        self.assertEqual(sink.calls, ['new_measurement'])
+        self.assertEqual(sink.rows_1D, [])
+
+    def test_png_snapshots(self):
+        MC = measurement_control.MeasurementControl('MC', plot_backend='png')
+        MC.verbose = False
+        self.setup_soft_2D(MC)
+        MC.run('png_snapshots', mode='2D')
+        self.assertEqual(sorted(MC.plot_sink.filenames),
+                         ['plotmon', 'plotmon_2D'])
+        for filename in MC.plot_sink.filenames.values():
+            self.assertEqual(os.path.dirname(filename),
+                             MC.data_object.folder)
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+
+
+class TestBatchAdaptive(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.datadir = tempfile.mkdtemp()
+        cls.old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = cls.datadir
+        cls.MC = measurement_control.MeasurementControl(
+            'MC', plot_backend='headless')
+        cls.MC.verbose = False
+
+    @classmethod
+    def tearDownClass(cls):
+        h5d.qc_config['datadir'] = cls.old_datadir
+        shutil.rmtree(cls.datadir)
+
+    def run_adaptive(self, sweep_functions, detector, af_pars):
+        self.MC.set_sweep_functions(sweep_functions)
+        self.MC.set_detector_function(detector)
+        self.MC.set_adaptive_function_parameters(dict(
+            x0=[0, 0], initial_step=[0.5, 0.5], no_improv_break=20,
+            maxiter=200, **af_pars))
+        return self.MC.run('batch_adaptive', mode='adaptive')
+
+    def test_hard_batches_single_acquisition(self):
+        hard_swfs = [Upload_Counting_Hard_Sweep('x'),
+                     Upload_Counting_Hard_Sweep('y')]
+        detector = Quadratic_Detector(hard_swfs)
+        data = self.run_adaptive(
+            hard_swfs, detector, {'adaptive_function': batch_nelder_mead,
+                                  'batch_evaluation': True,
+                                  'speculative': True})
+        best = data[np.argmin(data[:, 2])]
+        np.testing.assert_array_almost_equal(best[:2], detector.optimum,
+                                             decimal=3)
+        np.testing.assert_array_almost_equal(data[:, 2],
+                                             detector.cost(data[:, :2]))
+        # one upload and acquisition for every batch of points
+        self.assertEqual(len(hard_swfs[0].uploaded_sweep_points),
+                         detector.nr_acquisitions)
+        self.assertEqual(sum(len(p) for p in
+                             hard_swfs[0].uploaded_sweep_points), len(data))
+        self.assertLess(detector.nr_acquisitions, len(data)/2)
+
+    def test_soft_batches_equal_serial(self):
+        soft_swfs = [Value_Soft_Sweep(), Value_Soft_Sweep()]
+        serial_data = self.run_adaptive(
+            soft_swfs, Quadratic_Detector(soft_swfs, 'soft'),
+            {'adaptive_function': nelder_mead})
+        batch_data = self.run_adaptive(
+            soft_swfs, Quadratic_Detector(soft_swfs, 'soft'),
+            {'adaptive_function': batch_nelder_mead,
+             'batch_evaluation': True})
+        np.testing.assert_array_equal(batch_data, serial_data)
+
+    def test_f_termination(self):
+        hard_swfs = [Upload_Counting_Hard_Sweep('x'),
+                     Upload_Counting_Hard_Sweep('y')]
+        detector = Quadratic_Detector(hard_swfs)
+        data = self.run_adaptive(
+            hard_swfs, detector, {'adaptive_function': batch_nelder_mead,
+                                  'batch_evaluation': True,
+                                  'f_termination': 0.1})
+        self.assertLess(np.min(data[:, 2]), 0.1)
+        self.assertGreater(np.min(data[:-1, 2]), 0.1)
+
+
+class TestProfiling(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.datadir = tempfile.mkdtemp()
+        cls.old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = cls.datadir
+        cls.MC = measurement_control.MeasurementControl(
+            'MC', plot_backend='headless')
+        cls.MC.verbose = False
+
+    @classmethod
+    def tearDownClass(cls):
+        h5d.qc_config['datadir'] = cls.old_datadir
+        shutil.rmtree(cls.datadir)
+
+    def tearDown(self):
+        self.MC.profiling_enabled = False
+
+    def test_soft_profile(self):
+        self.MC.profiling_enabled = True
+        self.MC.set_sweep_function(swf.None_Sweep())
+        self.MC.set_sweep_points(np.arange(50))
+        self.MC.set_detector_function(det.Dummy_Detector_Soft())
+        self.MC.run('soft_profile')
+        profile = self.MC.last_run_profile()
+        for name in ['set_parameter', 'acquire_data_point', 'hdf5_write',
+                     'plotmon_update', 'print_progress']:
+            self.assertEqual(profile[name]['count'], 50)
+            self.assertEqual(np.sum(profile[name]['histogram']), 50)
+            self.assertLessEqual(profile[name]['min'],
+                                 profile[name]['median'])
+            self.assertLessEqual(profile[name]['p99'], profile[name]['max'])
+        self.assertEqual(profile['sweep_prepare']['count'], 1)
+        self.assertEqual(profile['detector_prepare']['count'], 1)
+
+        with h5py.File(self.MC.data_object.filepath, 'r') as f:
+            timing_grp = f['MC timing']
+            self.assertEqual(timing_grp['acquire_data_point'].attrs['count'],
+                             50)
+            self.assertAlmostEqual(
+                timing_grp['hdf5_write'].attrs['total'],
+                profile['hdf5_write']['total'])
+            self.assertEqual(
+                len(timing_grp['set_parameter']['histogram']),
+                len(timing_grp['histogram_bin_edges']) - 1)
+
+    def test_hard_profile(self):
+        self.MC.profiling_enabled = True
+        self.MC.set_sweep_function(Upload_Counting_Hard_Sweep())
+        self.MC.set_sweep_points(np.arange(100))
+        self.MC.set_detector_function(Counting_Detector_Hard())
+        self.MC.run('hard_profile')
+        profile = self.MC.last_run_profile()
+        self.assertEqual(profile['get_values']['count'], 1)
+        self.assertEqual(profile['hdf5_write']['count'], 1)
+        self.assertNotIn('acquire_data_point', profile)
+
+    def test_disabled(self):
+        self.MC.set_sweep_function(swf.None_Sweep())
+        self.MC.set_sweep_points(np.arange(5))
+        self.MC.set_detector_function(det.Dummy_Detector_Soft())
+        self.MC.run('profiling_disabled')
+        self.assertEqual(self.MC.last_run_profile(), {})
+        with h5py.File(self.MC.data_object.filepath, 'r') as f:
+            self.assertNotIn('MC timing', f)
+
+    def test_disabled_span_overhead(self):
+        profiler = SpanProfiler(enabled=False)
+        nr_spans = 100000
+        t_span = min(timeit.repeat(
+            "with profiler.span('set_parameter'): pass",
+            globals={'profiler': profiler}, number=nr_spans,
+            repeat=5))/nr_spans
+        self.assertLess(t_span, 1e-6)
+
+
+class TestDataStorage(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.datadir = tempfile.mkdtemp()
+        cls.old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = cls.datadir
+        cls.MC = measurement_control.MeasurementControl(
+            'MC', plot_backend='headless')
+        cls.MC.verbose = False
+
+    @classmethod
+    def tearDownClass(cls):
+        h5d.qc_config['datadir'] = cls.old_datadir
+        shutil.rmtree(cls.datadir)
+
+    def test_default_layout(self):
+        self.MC.set_sweep_function(swf.None_Sweep())
+        self.MC.set_sweep_points(np.arange(50))
+        self.MC.set_detector_function(det.Dummy_Detector_Soft())
+        self.MC.run('default_layout')
+        with h5py.File(self.MC.data_object.filepath, 'r') as f:
+            dset = f['Experimental Data']['Data']
+            self.assertEqual(dset.dtype, np.float32)
+            self.assertEqual(dset.chunks, (50, 3))
+            self.assertIsNone(dset.compression)
+
+    def test_compressed_shots(self):
+        self.MC.set_sweep_function(Upload_Counting_Hard_Sweep())
+        self.MC.set_sweep_points(np.arange(30000))
+        detector = Shots_Detector_Hard()
+        self.MC.set_detector_function(detector)
+        data = self.MC.run('compressed_shots', data_dtype='i2',
+                           data_compression='shuffle+lzf')
+        self.assertEqual(data.dtype, np.int16)
+        with h5py.File(self.MC.data_object.filepath, 'r') as f:
+            dset = f['Experimental Data']['Data']
+            self.assertEqual(dset.dtype, np.int16)
+            self.assertEqual(dset.compression, 'lzf')
+            self.assertTrue(dset.shuffle)
+            # 2**17 bytes per chunk
+            self.assertEqual(dset.chunks, (21845, 3))
+        a = ma.MeasurementAnalysis(folder=self.MC.data_object.folder,
+                                   auto=False)
+        try:
+            values = a.get_values('I')
+            self.assertEqual(values.dtype, np.float64)
+            np.testing.assert_array_equal(values, detector.shots[0])
+            np.testing.assert_array_equal(
+                a.get_values('Upload_Counting_Hard_Sweep'), np.arange(30000))
+        finally:
+            a.finish()
+        # the settings only apply to that run
+        self.assertEqual(self.MC.data_dtype, 'f4')
+        self.assertIsNone(self.MC.data_compression)
+
+    def test_gzip_soft_2D(self):
+        self.MC.data_compression = 'gzip'
+        self.MC.data_chunks = 16
+        try:
+            self.MC.set_sweep_function(swf.None_Sweep())
+            self.MC.set_sweep_points(np.arange(10))
+            self.MC.set_sweep_function_2D(swf.None_Sweep())
+            self.MC.set_sweep_points_2D(np.arange(5))
+            self.MC.set_detector_function(det.Dummy_Detector_Soft())
+            self.MC.run_2D('gzip_soft_2D')
+        finally:
+            self.MC.data_compression = None
+            self.MC.data_chunks = None
+        with h5py.File(self.MC.data_object.filepath, 'r') as f:
+            dset = f['Experimental Data']['Data']
+            self.assertEqual(dset.compression, 'gzip')
+            self.assertEqual(dset.chunks, (16, 4))
+            data = dset[()]
+        self.assertEqual(data.shape, (50, 4))
+        np.testing.assert_array_equal(data[:, 1], np.repeat(np.arange(5), 10))
+
+    def test_unknown_compression_raises(self):
+        self.MC.set_sweep_function(swf.None_Sweep())
+        self.MC.set_sweep_points(np.arange(5))
+        self.MC.set_detector_function(det.Dummy_Detector_Soft())
+        with self.assertRaises(ValueError):
+            self.MC.run('unknown_compression', data_compression='zstd')
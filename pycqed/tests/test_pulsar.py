@@ -0,0 +1,248 @@
+import pickle
+import numpy as np
+from copy import deepcopy
+from unittest import TestCase
+
+from pycqed.measurement.waveform_control.pulsar import (
+    Pulsar, pack_element_waveforms, pack_elements_parallel,
+    pack_awg5014_waveform, _dumps_elements)
+from pycqed.measurement.pulse_sequences import single_qubit_tek_seq_elts as sqs
+from pycqed.instrument_drivers.virtual_instruments.mock_AWG5014 import (
+    Mock_AWG5014, read_sequence_table)
+
+
+class MockStation:
+    def __init__(self):
+        self.AWG = Mock_AWG5014(timestamp=(2016, 1, 4, 1, 12, 0, 0, 0, 0))
+        self.pulsar = Pulsar()
+        self.pulsar.AWG = self.AWG
+        for i in range(4):
+            self.pulsar.define_channel(
+                id='ch{}'.format(i+1), name='ch{}'.format(i+1),
+                type='analog', high=1, low=-1, offset=0.0, delay=0,
+                active=True)
+            for j in range(2):
+                self.pulsar.define_channel(
+                    id='ch{}_marker{}'.format(i+1, j+1),
+                    name='ch{}_marker{}'.format(i+1, j+1),
+                    type='marker', high=2.0, low=0, offset=0., delay=0,
+                    active=True)
+        self.components = {'AWG': self.AWG}
+
+
+pulse_pars = {'I_channel': 'ch1', 'Q_channel': 'ch2',
+              'amplitude': 0.5, 'amp90_scale': 0.5,
+              'sigma': 5e-9, 'nr_sigma': 4, 'motzoi': 0.1,
+              'mod_frequency': -50e6, 'phase': 0, 'phi_skew': 0,
+              'alpha': 1, 'pulse_delay': 30e-9,
+              'pulse_type': 'SSB_DRAG_pulse'}
+
+RO_pars = {'I_channel': 'ch3', 'Q_channel': 'ch4',
+           'RO_pulse_marker_channel': 'ch3_marker1',
+           'amplitude': 0.1, 'length': 300e-9, 'pulse_delay': 20e-9,
+           'mod_frequency': 25e6, 'fixed_point_frequency': 50e6,
+           'acq_marker_delay': 0, 'acq_marker_channel': 'ch1_marker1',
+           'phase': 0, 'pulse_type': 'MW_IQmod_pulse_tek'}
+
+
+class TestWaveformDeduplication(TestCase):
+    def setUp(self):
+        self.station = MockStation()
+        sqs.station = self.station
+
+    def assert_sequences_equivalent(self, awg_file_a, awg_file_b):
+        seq_a = read_sequence_table(awg_file_a)
+        seq_b = read_sequence_table(awg_file_b)
+        self.assertEqual(len(seq_a), len(seq_b))
+        for el_a, el_b in zip(seq_a, seq_b):
+            self.assertEqual(set(el_a.keys()), set(el_b.keys()))
+            for key in el_a:
+                np.testing.assert_array_equal(el_a[key], el_b[key])
+
+    def program_awg(self, seq, el_list, deduplicate):
+        return self.station.pulsar.program_awg(seq, *el_list,
+                                               deduplicate=deduplicate)
+
+    def test_AllXY(self):
+        seq, el_list = sqs.AllXY_seq(pulse_pars, RO_pars, double_points=True,
+                                     return_seq=True)
+        awg_file_dedup = self.program_awg(seq, el_list, True)
+        stats = self.station.pulsar.dedup_statistics
+        awg_file = self.program_awg(seq, el_list, False)
+
+        self.assertLess(len(awg_file_dedup), len(awg_file))
+        self.assert_sequences_equivalent(awg_file_dedup, awg_file)
+        # 42 elements on 4 channels, the readout channels are identical for
+        # all elements and the drive channels are pairwise identical.
+        self.assertEqual(stats['nr_waveforms'], 42*4)
+        self.assertEqual(stats['nr_unique_waveforms'], 21*2 + 2)
+        self.assertGreater(stats['dedup_ratio'], 3)
+        self.assertGreater(stats['bytes_saved'], 0)
+
+    def test_randomized_benchmarking(self):
+        np.random.seed(0)
+        seq, el_list = sqs.Randomized_Benchmarking_seq(
+            pulse_pars, RO_pars, nr_cliffords=[1, 2, 3], nr_seeds=3,
+            upload=False)
+        awg_file_dedup = self.program_awg(seq, el_list, True)
+        stats = self.station.pulsar.dedup_statistics
+        awg_file = self.program_awg(seq, el_list, False)
+
+        self.assertLess(len(awg_file_dedup), len(awg_file))
+        self.assertGreaterEqual(len(awg_file) - len(awg_file_dedup),
+                                stats['bytes_saved'])
+        self.assert_sequences_equivalent(awg_file_dedup, awg_file)
+        # without deduplication every waveform is uploaded
+        stats_no_dedup = self.station.pulsar.dedup_statistics
+        self.assertEqual(stats_no_dedup['nr_unique_waveforms'],
+                         stats['nr_waveforms'])
+        self.assertEqual(stats_no_dedup['bytes_saved'], 0)
+
+    def test_waveform_names_end_with_channel(self):
+        seq, el_list = sqs.AllXY_seq(pulse_pars, RO_pars, return_seq=True)
+        awg_file = self.program_awg(seq, el_list, True)
+        for seq_el in read_sequence_table(awg_file):
+            self.assertEqual(set(seq_el.keys()),
+                             {'WAIT', 'LOOP', 'JUMP', 'GOTO',
+                              'ch1', 'ch2', 'ch3', 'ch4'})
+
+
+class TestParallelPacking(TestCase):
+    def setUp(self):
+        self.station = MockStation()
+        sqs.station = self.station
+
+    def test_awg_file_identical_to_serial(self):
+        np.random.seed(0)
+        seq, el_list = sqs.Randomized_Benchmarking_seq(
+            pulse_pars, RO_pars, nr_cliffords=[1, 5, 20], nr_seeds=4,
+            upload=False)
+        for deduplicate in [True, False]:
+            awg_file = self.station.pulsar.program_awg(
+                seq, *el_list, deduplicate=deduplicate)
+            stats = self.station.pulsar.dedup_statistics
+            awg_file_parallel = self.station.pulsar.program_awg(
+                seq, *el_list, deduplicate=deduplicate, processes=2)
+            self.assertEqual(awg_file_parallel, awg_file)
+            self.assertEqual(self.station.pulsar.dedup_statistics, stats)
+
+    def test_pack_elements_parallel(self):
+        seq, el_list = sqs.AllXY_seq(pulse_pars, RO_pars, return_seq=True)
+        pulsar = self.station.pulsar
+        chan_groups = {id: pulsar.get_channel_names_by_id(id)
+                       for id in pulsar.get_used_channel_ids()}
+        packed = pack_elements_parallel(el_list, chan_groups, processes=2,
+                                        chunks_per_process=3)
+        self.assertEqual(len(packed), len(el_list))
+        for el, (packed_wfs, non_zero_first_point) in zip(el_list, packed):
+            ref_wfs, ref_non_zero = pack_element_waveforms(
+                el, chan_groups, self.station.AWG.pack_waveform)
+            self.assertEqual(non_zero_first_point, ref_non_zero)
+            self.assertEqual(list(packed_wfs), list(ref_wfs))
+            for id in ref_wfs:
+                self.assertEqual(packed_wfs[id].dtype, np.uint16)
+                np.testing.assert_array_equal(packed_wfs[id], ref_wfs[id])
+
+    def test_pack_awg5014_waveform(self):
+        rng = np.random.RandomState(0)
+        wf = rng.uniform(-1, 1, 1000)
+        m1, m2 = rng.randint(0, 2, (2, 1000))
+        np.testing.assert_array_equal(
+            pack_awg5014_waveform(wf, m1, m2),
+            self.station.AWG.pack_waveform(wf, m1, m2))
+        with self.assertRaises(TypeError):
+            pack_awg5014_waveform(wf*2, m1, m2)
+
+    def test_pickled_for_workers(self):
+        seq, el_list = sqs.AllXY_seq(pulse_pars, RO_pars, return_seq=True)
+        el = el_list[0]
+        el_pickled = pickle.loads(_dumps_elements([el]))[0]
+        self.assertIsNone(el_pickled.pulsar)
+        self.assertEqual(list(el_pickled.pulses), list(el.pulses))
+        # pulses of classes of reloaded modules are pickled by name
+        self.assertEqual(type(el_pickled).__name__, type(el).__name__)
+        # the element itself and its copies keep the pulsar
+        self.assertIs(el.pulsar, self.station.pulsar)
+        el_copy = deepcopy(el)
+        self.assertIsInstance(el_copy.pulsar, Pulsar)
+        self.assertEqual(list(el_copy.pulses), list(el.pulses))
+
+
+class TestIncrementalUpload(TestCase):
+    def setUp(self):
+        self.station = MockStation()
+        self.station.pulsar.incremental_upload = True
+        sqs.station = self.station
+        self.amps = np.linspace(0, 0.5, 11)
+
+    def upload_rabi(self, amps, station=None):
+        if station is not None:
+            sqs.station = station
+        try:
+            sqs.Rabi_seq(amps, pulse_pars, RO_pars)
+        finally:
+            sqs.station = self.station
+        return sqs.station.pulsar.upload_statistics
+
+    def assert_same_as_full_upload(self, amps):
+        # compares the AWG with an AWG the sequence was uploaded to in full
+        station = MockStation()
+        self.upload_rabi(amps, station)
+        AWG, ref_AWG = self.station.AWG, station.AWG
+        self.assertEqual(set(AWG.waveforms), set(ref_AWG.waveforms))
+        seq, ref_seq = AWG.sequence_table(), ref_AWG.sequence_table()
+        self.assertEqual(len(seq), len(ref_seq))
+        for seq_el, ref_seq_el in zip(seq, ref_seq):
+            self.assertEqual(set(seq_el), set(ref_seq_el))
+            for key in ref_seq_el:
+                np.testing.assert_array_equal(seq_el[key], ref_seq_el[key])
+
+    def test_only_changed_waveforms_uploaded(self):
+        AWG = self.station.AWG
+        self.assertFalse(self.upload_rabi(self.amps)['incremental'])
+        bytes_full = AWG.bytes_transferred
+
+        amps = self.amps.copy()
+        amps[3] = 0.42
+        AWG.bytes_transferred = 0
+        stats = self.upload_rabi(amps)
+        self.assertTrue(stats['incremental'])
+        # the drive channels of a single element changed
+        self.assertEqual(stats['nr_uploaded_waveforms'], 2)
+        self.assertLess(AWG.bytes_transferred, bytes_full/4)
+        self.assertEqual(AWG.nr_uploads, 1)
+        self.assertEqual(AWG.errors, [])
+        self.assert_same_as_full_upload(amps)
+
+        # unused waveforms are deleted
+        stats = self.upload_rabi(amps[:5])
+        self.assertTrue(stats['incremental'])
+        self.assertEqual(stats['nr_uploaded_waveforms'], 0)
+        self.assert_same_as_full_upload(amps[:5])
+
+    def test_full_upload_if_manifest_invalid(self):
+        pulsar = self.station.pulsar
+        AWG = self.station.AWG
+        self.upload_rabi(self.amps)
+
+        # the waveforms were deleted on the AWG, it reports an error
+        AWG.delete_all_waveforms_from_list()
+        with self.assertLogs(level='WARNING'):
+            stats = self.upload_rabi(self.amps)
+        self.assertFalse(stats['incremental'])
+        self.assert_same_as_full_upload(self.amps)
+        self.assertTrue(self.upload_rabi(self.amps)['incremental'])
+
+        pulsar.invalidate_awg_manifest()
+        self.assertFalse(self.upload_rabi(self.amps)['incremental'])
+        seq, el_list = sqs.Rabi_seq(self.amps, pulse_pars, RO_pars,
+                                    return_seq=True)
+        self.assertIsNotNone(pulsar.program_awg(seq, *el_list,
+                                                incremental=False))
+        # the channel settings are part of the .awg file
+        AWG.ch1_amp(1.)
+        self.assertFalse(self.upload_rabi(self.amps)['incremental'])
+        self.assertTrue(self.upload_rabi(self.amps)['incremental'])
+
+        pulsar.AWG = Mock_AWG5014()
+        self.assertFalse(self.upload_rabi(self.amps)['incremental'])
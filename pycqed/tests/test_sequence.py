@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from pycqed.measurement.waveform_control.sequence import Sequence
+
+
+class TestSequence(TestCase):
+    def setUp(self):
+        self.seq = Sequence('test_seq')
+        for i in range(5):
+            self.seq.append('el{}'.format(i), wfname='wf{}'.format(i))
+
+    def assert_indices_consistent(self):
+        for i, elt in enumerate(self.seq.elements):
+            self.assertEqual(self.seq.element_index(elt['name']), i+1)
+            self.assertEqual(
+                self.seq.element_index(elt['name'], start_idx=0), i)
+
+    def test_element_index(self):
+        self.assertEqual(self.seq.element_index('el0'), 1)
+        self.assertEqual(self.seq.element_index('el4'), 5)
+        self.assertEqual(self.seq.element_index('el2', start_idx=0), 2)
+        with self.assertRaises(ValueError):
+            self.seq.element_index('not_an_element')
+
+    def test_names_must_be_unique(self):
+        self.assertFalse(self.seq.insert_element('el3', wfname='wf'))
+        self.assertEqual(self.seq.element_count(), 5)
+
+    def test_insert(self):
+        self.seq.insert_element('first', wfname='wf', pos=0)
+        self.seq.insert_element('middle', wfname='wf', pos=3)
+        self.seq.insert_element('before_last', wfname='wf', pos=-1)
+        self.seq.insert_element('last', wfname='wf', pos=100)
+        self.assertEqual([elt['name'] for elt in self.seq.elements],
+                         ['first', 'el0', 'el1', 'middle', 'el2', 'el3',
+                          'before_last', 'el4', 'last'])
+        self.assert_indices_consistent()
+
+    def test_remove(self):
+        self.seq.remove_element('el1')
+        self.assertFalse(self.seq.has_element('el1'))
+        self.assertEqual(self.seq.element_count(), 4)
+        self.assert_indices_consistent()
+        self.seq.append('el1', wfname='wf1')
+        self.assertEqual(self.seq.element_index('el1'), 5)
+
+    def test_elements_modified_directly(self):
+        self.seq.elements.reverse()
+        self.assert_indices_consistent()
+        del self.seq.elements[0]
+        self.assertFalse(self.seq.has_element('el4'))
+        self.assert_indices_consistent()
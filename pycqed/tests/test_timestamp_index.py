@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.analysis.tools.file_handling import TimestampIndex
+from pycqed.measurement import hdf5_data as h5d
+
+
+def make_measurement(datadir, day, dirname):
+    folder = os.path.join(datadir, day, dirname)
+    os.makedirs(folder)
+    open(os.path.join(folder, dirname+'.hdf5'), 'w').close()
+    return folder
+
+
+class TestTimestampIndex(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.old_datadir = a_tools.datadir
+        a_tools.datadir = self.datadir
+        for day, dirname in [('20160101', '120000_Rabi_qubit1'),
+                             ('20160101', '130000_Ramsey_qubit1'),
+                             ('20160102', '090000_Rabi_qubit2'),
+                             ('20160102', '100000_T1_qubit1'),
+                             ('20160103', '080000_Ramsey_qubit2')]:
+            make_measurement(self.datadir, day, dirname)
+        # folders that do not follow the naming convention are ignored
+        os.makedirs(os.path.join(self.datadir, 'analysis'))
+        os.makedirs(os.path.join(self.datadir, '20160103', 'plots'))
+
+    def tearDown(self):
+        a_tools.datadir = self.old_datadir
+        shutil.rmtree(self.datadir)
+
+    def test_latest_data(self):
+        self.assertEqual(a_tools.latest_data(), os.path.join(
+            self.datadir, '20160103', '080000_Ramsey_qubit2'))
+        self.assertEqual(a_tools.latest_data('Rabi'), os.path.join(
+            self.datadir, '20160102', '090000_Rabi_qubit2'))
+        self.assertEqual(a_tools.latest_data('Rabi', return_timestamp=True),
+                         ('20160102090000', os.path.join(
+                             self.datadir, '20160102', '090000_Rabi_qubit2')))
+        self.assertFalse(a_tools.latest_data('Spectroscopy'))
+        with self.assertRaises(Exception):
+            a_tools.latest_data('Spectroscopy', raise_exc=True)
+
+    def test_latest_data_older_newer(self):
+        self.assertEqual(
+            a_tools.latest_data('qubit1', older_than='20160102_100000'),
+            os.path.join(self.datadir, '20160101', '130000_Ramsey_qubit1'))
+        self.assertEqual(
+            a_tools.latest_data('qubit1', older_than='20160102_100000',
+                                or_equal=True),
+            os.path.join(self.datadir, '20160102', '100000_T1_qubit1'))
+        self.assertEqual(
+            a_tools.latest_data(newer_than='20160101120000',
+                                older_than='20160101130000', or_equal=True),
+            os.path.join(self.datadir, '20160101', '130000_Ramsey_qubit1'))
+        self.assertFalse(a_tools.latest_data(newer_than='20160103080000'))
+
+    def test_latest_data_return_all(self):
+        search_dir, daydir, measdirs = a_tools.latest_data(
+            'qubit', older_than='20160103000000', return_all=True)
+        self.assertEqual(daydir, '20160102')
+        self.assertEqual(measdirs, ['090000_Rabi_qubit2', '100000_T1_qubit1'])
+
+    def test_data_from_time(self):
+        self.assertEqual(a_tools.data_from_time('20160102_100000'),
+                         os.path.join(self.datadir, '20160102',
+                                      '100000_T1_qubit1'))
+        with self.assertRaises(KeyError):
+            a_tools.data_from_time('20160104_100000')
+        with self.assertRaises(KeyError):
+            a_tools.data_from_time('20160102_100001')
+        make_measurement(self.datadir, '20160102', '100000_T2_qubit1')
+        with self.assertRaises(NameError):
+            a_tools.data_from_time('20160102_100000')
+
+    def test_get_timestamps_in_range(self):
+        self.assertEqual(
+            a_tools.get_timestamps_in_range('20160101_130000',
+                                            '20160102_100000', label=''),
+            ['20160101_130000', '20160102_090000', '20160102_100000'])
+        self.assertEqual(
+            a_tools.get_timestamps_in_range('20160101_000000', label='Rabi'),
+            ['20160101_120000', '20160102_090000'])
+        self.assertEqual(
+            a_tools.get_timestamps_in_range(
+                '20160101_000000', label=['Ramsey', 'qubit2'],
+                exact_label_match=False),
+            ['20160103_080000'])
+
+    def test_return_last_n_timestamps(self):
+        self.assertEqual(a_tools.return_last_n_timestamps(3),
+                         ['20160103080000', '20160102100000',
+                          '20160102090000'])
+        self.assertEqual(a_tools.return_last_n_timestamps(2, 'qubit1'),
+                         ['20160102100000', '20160101130000'])
+
+    def test_incremental_refresh(self):
+        index = TimestampIndex(self.datadir)
+        index.refresh()
+        self.assertEqual(len(index), 5)
+        make_measurement(self.datadir, '20160103', '090000_Rabi_qubit3')
+        make_measurement(self.datadir, '20160104', '090000_Rabi_qubit4')
+        index.refresh()
+        self.assertEqual(len(index), 7)
+        # old days are only checked for changes by a full refresh
+        make_measurement(self.datadir, '20160101', '140000_Rabi_qubit1')
+        make_measurement(self.datadir, '20160104', '100000_Rabi_qubit4')
+        index.refresh(full=False)
+        self.assertEqual(len(index), 8)
+        index.refresh(full=True)
+        self.assertEqual(len(index), 9)
+        shutil.rmtree(os.path.join(self.datadir, '20160101'))
+        index.refresh()
+        self.assertEqual(len(index), 6)
+        self.assertFalse(index.has_day('20160101'))
+        # the index is persistent
+        index.close()
+        index = TimestampIndex(self.datadir)
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.filepath('20160104', '090000_Rabi_qubit4'),
+                         os.path.join(self.datadir, '20160104',
+                                      '090000_Rabi_qubit4',
+                                      '090000_Rabi_qubit4.hdf5'))
+        index.close()
+
+    def test_data_object_adds_to_index(self):
+        old_datadir = h5d.qc_config['datadir']
+        h5d.qc_config['datadir'] = self.datadir
+        try:
+            data_object = h5d.Data(name='new_measurement')
+            data_object.close()
+        finally:
+            h5d.qc_config['datadir'] = old_datadir
+        index = a_tools.get_timestamp_index(self.datadir, refresh=False)
+        day, dirname = index.find(contains='new_measurement')[0]
+        self.assertEqual(index.filepath(day, dirname),
+                         os.path.abspath(data_object.filepath))
+        self.assertEqual(a_tools.latest_data('new_measurement'),
+                         os.path.dirname(data_object.filepath))
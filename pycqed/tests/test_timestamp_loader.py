@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+
+from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.analysis.tools.file_handling import (
+    extract_data_from_file, get_timestamp_index)
+
+
+def make_MC_file(datadir, timestamp, name, nr_points=11, frequency=5e9):
+    '''
+    Writes a file in the format of MeasurementControl using plain h5py.
+    '''
+    day, time_str = timestamp.split('_')
+    dirname = time_str + '_' + name
+    folder = os.path.join(datadir, day, dirname)
+    os.makedirs(folder)
+    filepath = os.path.join(folder, dirname + '.hdf5')
+    with h5py.File(filepath, 'w') as f:
+        exp_data = f.create_group('Experimental Data')
+        x = np.linspace(0, 1, nr_points)
+        exp_data.create_dataset('Data', data=np.array(
+            [x, x**2, np.sin(x)]).T)
+        exp_data.attrs['sweep_parameter_names'] = [b'amp']
+        exp_data.attrs['sweep_parameter_units'] = [b'V']
+        exp_data.attrs['value_names'] = [b'I', b'Q']
+        exp_data.attrs['value_units'] = [b'V', b'V']
+        qubit = f.create_group('Instrument settings').create_group('qubit')
+        qubit.attrs['f_qubit'] = str(frequency)
+        qubit.attrs['name'] = 'qubit'
+        fit = f.create_group('Analysis').create_group('Fit')
+        fit.attrs['T1'] = 20e-6
+    return filepath
+
+
+class TestTimestampLoader(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.old_datadir = a_tools.datadir
+        a_tools.datadir = self.datadir
+        self.timestamps = ['20160101_1200{:02d}'.format(i) for i in range(6)]
+        for i, timestamp in enumerate(self.timestamps):
+            make_MC_file(self.datadir, timestamp, 'T1_qubit',
+                         frequency=5e9+i*1e6)
+        # a file that is not a valid hdf5 file
+        folder = os.path.join(self.datadir, '20160101', '130000_T1_qubit')
+        os.makedirs(folder)
+        with open(os.path.join(folder, '130000_T1_qubit.hdf5'), 'wb') as f:
+            f.write(b'corrupted')
+        self.corrupted = '20160101_130000'
+        self.missing = '20160101_140000'
+
+    def tearDown(self):
+        a_tools.datadir = self.old_datadir
+        shutil.rmtree(self.datadir)
+
+    def test_extract_data_from_file(self):
+        filepath = a_tools.measurement_filename(
+            a_tools.data_from_time(self.timestamps[0]))
+        data = extract_data_from_file(
+            filepath, ['amp', 'Q', 'sweep_points', 'measured_values',
+                       'qubit.f_qubit', 'Fit.T1', 'value_names',
+                       'qubit.T2', 'does_not_exist'])
+        x = np.linspace(0, 1, 11)
+        np.testing.assert_array_almost_equal(data['amp'], x)
+        np.testing.assert_array_almost_equal(data['Q'], np.sin(x))
+        np.testing.assert_array_almost_equal(data['sweep_points'], x)
+        np.testing.assert_array_almost_equal(data['measured_values'],
+                                             [x**2, np.sin(x)])
+        self.assertEqual(data['qubit.f_qubit'], '5000000000.0')
+        self.assertEqual(data['Fit.T1'], 20e-6)
+        self.assertEqual(data['value_names'], ['I', 'Q'])
+        self.assertIsNone(data['qubit.T2'])
+        self.assertIsNone(data['does_not_exist'])
+
+    def test_serial_equals_parallel(self):
+        timestamps = self.timestamps + [self.corrupted, self.missing]
+        param_names = {'frequency': 'qubit.f_qubit', 'T1': 'Fit.T1',
+                       'I': 'I'}
+        data_serial, errors_serial = a_tools.get_data_from_timestamps(
+            timestamps, param_names, nr_processes=1)
+        data_parallel, errors_parallel = a_tools.get_data_from_timestamps(
+            timestamps, param_names, nr_processes=2)
+        self.assertEqual(list(data_serial.keys()),
+                         ['timestamps', 'frequency', 'T1', 'I'])
+        self.assertEqual(data_serial['timestamps'], self.timestamps)
+        self.assertEqual(data_serial['frequency'],
+                         [str(5e9+i*1e6) for i in range(6)])
+        np.testing.assert_array_equal(data_serial['T1'], [20e-6]*6)
+        for key in data_serial:
+            for val_s, val_p in zip(data_serial[key], data_parallel[key]):
+                np.testing.assert_array_equal(val_s, val_p)
+        self.assertEqual(errors_serial.keys(), errors_parallel.keys())
+
+    def test_errors_are_collected(self):
+        data, errors = a_tools.get_data_from_timestamps(
+            [self.corrupted] + self.timestamps + [self.missing], ['Fit.T1'],
+            nr_processes=2)
+        self.assertEqual(data['timestamps'], self.timestamps)
+        self.assertEqual(list(errors.keys()), [self.corrupted, self.missing])
+        self.assertIn('OSError', errors[self.corrupted])
+        self.assertIn('KeyError', errors[self.missing])
+
+    def test_return_dataframe(self):
+        df, errors = a_tools.get_data_from_timestamps(
+            self.timestamps, ['Fit.T1', 'qubit.name'], nr_processes=1,
+            return_dataframe=True, max_files=4)
+        self.assertIsInstance(df, pd.DataFrame)
+        self.assertEqual(len(df), 4)
+        self.assertEqual(list(df['timestamps']), self.timestamps[:4])
+        self.assertEqual(list(df['qubit.name']), ['qubit']*4)
+        self.assertEqual(errors, {})
+
+    def test_index_refreshed_once(self):
+        index = get_timestamp_index(self.datadir)
+        refreshes = []
+        refresh = index.refresh
+
+        def counting_refresh(*args, **kw):
+            refreshes.append(1)
+            return refresh(*args, **kw)
+        index.refresh = counting_refresh
+        try:
+            data, errors = a_tools.get_data_from_timestamps(
+                self.timestamps, ['Fit.T1'], nr_processes=1)
+        finally:
+            del index.refresh
+        self.assertEqual(len(refreshes), 1)
+        self.assertEqual(data['timestamps'], self.timestamps)
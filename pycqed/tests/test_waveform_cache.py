@@ -0,0 +1,146 @@
+import numpy as np
+from unittest import TestCase
+
+from pycqed.measurement.waveform_control import element
+from pycqed.measurement.waveform_control import pulse
+from pycqed.measurement.waveform_control import pulse_library as pl
+from pycqed.measurement.waveform_control.waveform_cache import (
+    WaveformCache, waveform_cache, pulse_hash)
+
+
+def make_element(name, amplitude=0.5, motzoi=0.1):
+    el = element.Element(name)
+    for ch in ['ch1', 'ch2', 'ch3', 'ch4']:
+        el.define_channel(ch, delay=0)
+    el.define_channel('ch1_marker1', type='marker', high=2, low=0)
+    last = el.add(pulse.SquarePulse(channel='ch3', amplitude=0.2,
+                                    length=100e-9))
+    for i in range(3):
+        last = el.add(pl.SSB_DRAG_pulse(name='drag', I_channel='ch1',
+                                        Q_channel='ch2',
+                                        amplitude=amplitude, sigma=5e-9,
+                                        motzoi=motzoi, mod_frequency=-50e6),
+                      start=20e-9, refpulse=last)
+    el.add(pulse.SquarePulse(channel='ch1_marker1', amplitude=1,
+                             length=50e-9), refpulse=last)
+    return el
+
+
+class TestWaveformCache(TestCase):
+    def setUp(self):
+        self.cache = WaveformCache()
+        self.pulse = pl.SSB_DRAG_pulse(name='drag', I_channel='ch1',
+                                       Q_channel='ch2', amplitude=0.3,
+                                       sigma=5e-9)
+        self.tvals = np.arange(20)*1e-9
+
+    def test_hit_equals_direct_evaluation(self):
+        wfs_direct = self.pulse.get_wfs(self.tvals)
+        wfs_miss = self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        wfs_hit = self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 1)
+        for ch in ['ch1', 'ch2']:
+            np.testing.assert_array_equal(wfs_direct[ch], wfs_miss[ch])
+            np.testing.assert_array_equal(wfs_direct[ch], wfs_hit[ch])
+
+    def test_cached_waveforms_are_read_only(self):
+        wfs = self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        with self.assertRaises(ValueError):
+            wfs['ch1'][0] = 1
+
+    def test_key_includes_parameters_and_tvals(self):
+        self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.cache.get_wfs(self.pulse, self.tvals+1e-9, 1e9)
+        self.assertEqual(self.cache.misses, 2)
+        self.pulse.amplitude = 0.4
+        self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.assertEqual(self.cache.misses, 3)
+        # pulses with different names but equal parameters share waveforms
+        other = pl.SSB_DRAG_pulse(name='other', I_channel='ch1',
+                                  Q_channel='ch2', amplitude=0.4,
+                                  sigma=5e-9)
+        other._t0 = 5e-9
+        self.cache.get_wfs(other, self.tvals, 1e9)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_uncacheable_pulse(self):
+        self.pulse.instrument = object()
+        self.assertIsNone(pulse_hash(self.pulse))
+        self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_memory_budget(self):
+        # each channel of a 20 sample waveform is 160 bytes
+        cache = WaveformCache(max_bytes=1000)
+        for i in range(10):
+            self.pulse.amplitude = i/10
+            cache.get_wfs(self.pulse, self.tvals, 1e9)
+            self.assertLessEqual(cache.nbytes, 1000)
+        self.assertEqual(len(cache), 6)
+        # least recently used waveforms are removed first
+        self.pulse.amplitude = 0.9
+        cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.assertEqual(cache.hits, 1)
+        self.pulse.amplitude = 0.
+        cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.assertEqual(cache.hits, 1)
+
+    def test_disabled(self):
+        self.cache.enabled = False
+        self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.cache.get_wfs(self.pulse, self.tvals, 1e9)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.hits, 0)
+
+
+class TestElementWaveformCache(TestCase):
+    def tearDown(self):
+        waveform_cache.enabled = True
+
+    def test_element_waveforms_unchanged(self):
+        waveform_cache.enabled = False
+        tvals_ref, wfs_ref = make_element('el').normalized_waveforms()
+        waveform_cache.enabled = True
+        waveform_cache.clear()
+        for i in range(2):
+            tvals, wfs = make_element('el').normalized_waveforms()
+            np.testing.assert_array_equal(tvals, tvals_ref)
+            self.assertEqual(set(wfs.keys()), set(wfs_ref.keys()))
+            for ch in wfs_ref:
+                np.testing.assert_array_equal(wfs[ch], wfs_ref[ch])
+        self.assertGreater(waveform_cache.hits, 0)
+
+    def test_parameter_change_invalidates(self):
+        waveform_cache.clear()
+        tvals, wfs_a = make_element('el', amplitude=0.5).ideal_waveforms()
+        tvals, wfs_b = make_element('el', amplitude=0.25).ideal_waveforms()
+        np.testing.assert_allclose(wfs_b['ch1'], wfs_a['ch1']/2,
+                                   atol=1e-12)
+
+    def test_elements_do_not_keep_rendered_waveforms(self):
+        max_bytes = waveform_cache.max_bytes
+        waveform_cache.max_bytes = 1e5
+        waveform_cache.clear()
+        try:
+            elements = [make_element('el{}'.format(i), amplitude=i/100)
+                        for i in range(50)]
+            for el in elements:
+                tvals, wfs = el.normalized_waveforms()
+            self.assertLessEqual(waveform_cache.nbytes, 1e5)
+            # rendered waveforms of all channels: 8 bytes per sample
+            rendered_nbytes = 8*len(tvals)*len(wfs)
+            for el in elements:
+                values = list(vars(el).values())
+                for v in list(values):
+                    if isinstance(v, dict):
+                        values += v.values()
+                    elif isinstance(v, tuple):
+                        values += v
+                self.assertFalse(any(
+                    isinstance(v, np.ndarray) and
+                    v.nbytes >= rendered_nbytes for v in values))
+        finally:
+            waveform_cache.max_bytes = max_bytes
+            waveform_cache.clear()
@@ -2,6 +2,7 @@ import os
 # import qt
 import h5py
 from pycqed.analysis import analysis_toolbox as a_tools
+from pycqed.measurement.instrument_settings import read_instrument_settings
 import errno
 
 import sys
@@ -91,8 +92,7 @@ def load_settings_onto_instrument(instrument, load_from_instr=None, folder=None,
                 else:
                     folder = folder
                 filepath = a_tools.measurement_filename(folder)
-                f = h5py.File(filepath, 'r')
-                sets_group = f['Instrument settings']
+                sets_group = read_instrument_settings(filepath)
                 if load_from_instr is None:
                     ins_group = sets_group[instrument_name]
                 else:
@@ -111,7 +111,7 @@ def load_settings_onto_instrument(instrument, load_from_instr=None, folder=None,
                 instrument_name))
             return False
 
-        for parameter, value in ins_group.attrs.items():
+        for parameter, value in ins_group.items():
             """
             try:
                 if value != 'None':  # None is saved as string in hdf5
@@ -130,7 +130,8 @@ def load_settings_onto_instrument(instrument, load_from_instr=None, folder=None,
                 print('Could not set parameter: "%s" to "%s" for instrument "%s"' % (
                     parameter, value, instrument_name))
             """
-            if value != 'None':  # None is saved as string in hdf5
+            # None is saved as string in older hdf5 files
+            if value is not None and value != 'None':
                 if type(value) == str:
                     if value == 'False':
                         instrument.set(parameter, False)
@@ -151,7 +152,6 @@ def load_settings_onto_instrument(instrument, load_from_instr=None, folder=None,
                                     parameter, value, instrument_name))
                 else:
                     instrument.set(parameter, value)
-        f.close()
         return True
 
 